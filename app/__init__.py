@@ -8,13 +8,18 @@ import os
 import streamlit as st
 
 @st.cache_resource(show_spinner="🔍 Loading FAISS Index…")
-def get_faiss_index(path=".cache/faiss_index.index"):
-	import faiss
-	return faiss.read_index(path)
+def get_faiss_index(path=None):
+	from app.similarity_search import check_index_meta, get_default_index, read_index
+	if path is None:
+		return get_default_index()
+	index = read_index(path)
+	check_index_meta(path, index)
+	return index
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
 load_dotenv(os.path.join(ROOT, ".env"))
 
+from typing import Optional
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 
@@ -24,7 +29,49 @@ class Settings(BaseSettings):
 	openai_api_key: str = Field(..., env="OPENAI_API_KEY")
 	openai_chat_model: str = Field("gpt-5", env="OPENAI_CHAT_MODEL")
 	openai_embed_model: str = Field("text-embedding-3-small", env="OPENAI_EMBED_MODEL")
-
+	openai_base_url: Optional[str] = Field(None, env="OPENAI_BASE_URL")
+	openai_fast_model: Optional[str] = Field(None, env="OPENAI_FAST_MODEL")  # cheaper reasoning tier for long lists / tight SLOs
+	llm_effort: str = Field("auto", env="LLM_EFFORT")  # auto | minimal | low | medium | high
+	llm_latency_slo_ms: float = Field(15000.0, env="LLM_LATENCY_SLO_MS")  # target explanation latency for LLM_EFFORT=auto
+	llm_context_tokens: int = Field(4000, env="LLM_CONTEXT_TOKENS")  # user-prompt budget for the paper list
+
+	# --- Embeddings ---
+	embed_provider: str = Field("openai", env="EMBED_PROVIDER")  # openai | fastembed
+	local_embed_model: str = Field("BAAI/bge-small-en-v1.5", env="LOCAL_EMBED_MODEL")
+	embed_threads: Optional[int] = Field(None, env="EMBED_THREADS")
+	embed_storage: str = Field("float32", env="EMBED_STORAGE")  # float32 | float16 | int8
+
+	# --- Retrieval ---
+	search_mode: str = Field("dense", env="SEARCH_MODE")  # dense | hybrid | lexical
+	query_embed_timeout: float = Field(10.0, env="QUERY_EMBED_TIMEOUT")
+	search_deadline_ms: float = Field(0.0, env="SEARCH_DEADLINE_MS")  # overall search budget; 0 = no deadline
+	truncate_dim: int = Field(0, env="TRUNCATE_DIM")  # >0: two-stage search on truncated vectors
+	two_stage_pool: int = Field(8, env="TWO_STAGE_POOL")  # coarse pool = two_stage_pool * k
+	shard_scheme: str = Field("", env="SHARD_SCHEME")  # "" (single index) | year | hash
+	shard_count: int = Field(8, env="SHARD_COUNT")  # hash buckets for SHARD_SCHEME=hash
+	search_threads: Optional[int] = Field(None, env="SEARCH_THREADS")  # shard fan-out pool size
+	result_cache_size: int = Field(256, env="RESULT_CACHE_SIZE")  # 0 disables the search result cache
+	collapse_duplicates: bool = Field(True, env="COLLAPSE_DUPLICATES")  # needs `python -m scripts.dedup`
+	dedup_similarity: float = Field(0.97, env="DEDUP_SIMILARITY")  # cosine floor for near-duplicates
+	user_interests: int = Field(4, env="USER_INTERESTS")  # max interest centroids per user profile (1 = mean of likes)
+	interest_recall_k: int = Field(0, env="INTEREST_RECALL_K")  # >0: extra candidates fetched per user interest
+	rerank_chain: str = Field("personalization,recency,pdf,citations", env="RERANK_CHAIN")  # scorers applied to the candidate pool, in order
+	recency_weight: float = Field(0.0, env="RECENCY_WEIGHT")  # relevance bonus of a paper published today (decays with age); 0 = off
+	recency_half_life_days: float = Field(730.0, env="RECENCY_HALF_LIFE_DAYS")
+	pdf_weight: float = Field(0.0, env="PDF_WEIGHT")  # relevance bonus for papers with a PDF link; 0 = off
+	citations_weight: float = Field(0.0, env="CITATIONS_WEIGHT")  # needs a citations column in the parquet
+
+	# --- Serving ---
+	shared_mmap: bool = Field(False, env="SHARED_MMAP")  # mmap embeddings + indexes read-only, shared across processes
+	retrieval_server: str = Field("", env="RETRIEVAL_SERVER")  # socket path or host:port of app.serving; "" = search in-process
+	retrieval_authkey: str = Field("", env="RETRIEVAL_AUTHKEY")
+	index_poll_seconds: float = Field(5.0, env="INDEX_POLL_SECONDS")  # how often to check versions/CURRENT for a new index
+	admin_token: str = Field("", env="ADMIN_TOKEN")  # enables /admin/* on the API; "" = disabled
+	warmup_queries: int = Field(50, env="WARMUP_QUERIES")  # most frequent recent searches pre-run at startup; 0 = page-touch only
+	warmup_days: float = Field(7.0, env="WARMUP_DAYS")  # how far back search_history counts
+	warmup_seconds: float = Field(60.0, env="WARMUP_SECONDS")  # startup warmup time budget
+	warmup_llm_calls: int = Field(0, env="WARMUP_LLM_CALLS")  # explanations pre-generated for the top queries (cost budget)
+	warmup_threads: int = Field(4, env="WARMUP_THREADS")
 
 	# --- Paths / IO ---
 	root: str = ROOT
@@ -34,6 +81,11 @@ class Settings(BaseSettings):
 	log_level: str = Field("INFO", env="LOG_LEVEL")
 	seed: int = Field(42, env="SEED")
 
+	# --- Telemetry ---
+	metrics_enabled: bool = Field(True, env="METRICS_ENABLED")
+	trace_queries: bool = Field(False, env="TRACE_QUERIES")  # per-query span log (JSON lines)
+	trace_file: str = Field("query_traces.jsonl", env="TRACE_FILE")  # relative to cache_dir
+
 	# --- App ---
 	port: int = Field(8501, env="PORT")
 
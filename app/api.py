@@ -1,9 +1,12 @@
+import hmac
 import os
 import time
+from contextlib import asynccontextmanager
 import numpy as np
 from openai import OpenAI
 from app import settings
-from fastapi import FastAPI, HTTPException
+from app import metrics
+from fastapi import FastAPI, Header, HTTPException
 from tqdm import tqdm
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
@@ -24,18 +27,61 @@ rpm = tpm_limit//(200 * batch_size)         # fixed requests/minute; tune based
 max_retries = 2   # small, constant retry count
 embed_model = "text-embedding-3-small"
 
-def get_client():
-	return OpenAI(api_key=API_KEY, base_url=getattr(settings, 'openai_base_url', None) or None, timeout=120.0)
+def get_client(timeout=120.0, max_retries=2):
+	return OpenAI(api_key=API_KEY, base_url=getattr(settings, 'openai_base_url', None) or None, timeout=timeout, max_retries=max_retries)
 
-def create_embeddings(data, model=embed_model, use_cache=True, batch_size=batch_size, rpm=rpm, max_retries=max_retries):
+
+def _retry_after_seconds(err):
+	try:
+		hdrs = getattr(getattr(err, "response", None), "headers", {}) or {}
+		ra = hdrs.get("retry-after") or hdrs.get("Retry-After")
+		return float(ra) if ra is not None else None
+	except Exception:
+		return None
+
+
+def _count_failure(err, op):
+	metrics.incr("openai_errors_total", op=op)
+	if getattr(err, "status_code", None) == 429:
+		metrics.incr("openai_429_total", op=op)
+
+
+def call_with_retries(fn, op, max_retries=2, backoff=0.5):
+	"""
+	Call `fn()` and retry transient failures (honouring Retry-After, capped at 3s).
+	Use with a client built with max_retries=0 so every retry and 429 shows up in the metrics.
+	"""
+	attempt = 0
+	while True:
+		try:
+			return fn()
+		except Exception as e:
+			_count_failure(e, op)
+			attempt += 1
+			if attempt > max_retries:
+				raise
+			metrics.incr("openai_retries_total", op=op)
+			server_wait = _retry_after_seconds(e)
+			time.sleep(min(3, server_wait if server_wait is not None else backoff * attempt))
+
+def create_embeddings(data, model=None, use_cache=True, batch_size=batch_size, rpm=rpm, max_retries=max_retries, provider=None):
 	"""
 	Sync embedding creator with batching and a simple fixed RPM limiter.
 	- `batch_size`: number of texts per request
 	- `rpm`: fixed requests per minute budget
 	- Retries on transient failures with fixed delay.
+	- `provider`: embedding provider name/instance (default `settings.embed_provider`);
+	  local providers encode on CPU instead of calling OpenAI.
 	"""
+	from app.embeddings import get_provider, embedding_cache_path, embed_corpus
+	provider = get_provider(provider, model)
+	if provider.name != "openai":
+		print(f"Creating embeddings with {provider.name} ({provider.model}, local)...")
+		return embed_corpus(provider, data["content"].tolist(), use_cache=use_cache)
+
+	model = provider.model
 	print("Creating embeddings with OpenAI (sync, batched)...")
-	cache_path = os.path.join(CACHE_PATH, f"openai_{model.replace('-', '_')}.npy")
+	cache_path = embedding_cache_path(provider)
 	embeddings, start = None, 0
 	if use_cache and os.path.exists(cache_path):
 		embeddings = np.load(cache_path)
@@ -55,14 +101,6 @@ def create_embeddings(data, model=embed_model, use_cache=True, batch_size=batch_
 	interval = _interval(rpm)
 	last_request_time = 0.0
 
-	def _retry_after_seconds(err):
-		try:
-			hdrs = getattr(getattr(err, "response", None), "headers", {}) or {}
-			ra = hdrs.get("retry-after") or hdrs.get("Retry-After")
-			return float(ra) if ra is not None else None
-		except Exception:
-			return None
-
 	results = []
 	if embeddings is not None and start > 0:
 		results.extend(embeddings[:start].tolist())
@@ -88,9 +126,11 @@ def create_embeddings(data, model=embed_model, use_cache=True, batch_size=batch_
 				last_request_time = time.time()
 				break
 			except Exception as e:
+				_count_failure(e, "embeddings_batch")
 				attempt += 1
 				if attempt > max_retries:
 					raise
+				metrics.incr("openai_retries_total", op="embeddings_batch")
 				server_wait = _retry_after_seconds(e)
 				fixed = server_wait if server_wait is not None else 2.0
 				time.sleep(min(3, fixed))
@@ -101,7 +141,95 @@ def create_embeddings(data, model=embed_model, use_cache=True, batch_size=batch_
 	return embeddings
 
 
-def get_query_embedding(query, model=embed_model, api_key=API_KEY):
-	client = OpenAI(api_key=api_key, base_url=getattr(settings, 'openai_base_url', None) or None, timeout=60.0)
-	resp = client.embeddings.create(model=model, input=query)
+def get_query_embedding(query, model=None, api_key=API_KEY, timeout=60.0, max_retries=2, provider=None):
+	from app.embeddings import get_provider
+	provider = get_provider(provider, model)
+	if provider.name != "openai":
+		return provider.embed_query(query)
+	return _openai_query_embedding(query, model=provider.model, api_key=api_key, timeout=timeout, max_retries=max_retries)
+
+
+def _openai_query_embedding(query, model=embed_model, api_key=API_KEY, timeout=60.0, max_retries=2):
+	client = OpenAI(api_key=api_key, base_url=getattr(settings, 'openai_base_url', None) or None, timeout=timeout, max_retries=0)
+	resp = call_with_retries(lambda: client.embeddings.create(model=model, input=query), "query_embedding", max_retries=max_retries)
 	return np.array(resp.data[0].embedding, dtype=np.float32)
+
+
+@asynccontextmanager
+async def lifespan(app):
+	"""Warm the corpus and caches from the query log in the background; GET /ready says when it's done."""
+	from app import warmup
+	warmup.start()
+	yield
+
+
+app = FastAPI(title="Research Paper Recommender", lifespan=lifespan)
+
+
+@app.get("/ready")
+def ready_endpoint():
+	"""200 once startup warmup has finished (see app.warmup), 503 while the caches are still cold."""
+	from fastapi.responses import JSONResponse
+	from app import warmup
+	status = warmup.status()
+	return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics_endpoint(format: str = "prometheus"):
+	"""Stage latency histograms and counters: Prometheus text (default) or `?format=json`."""
+	from fastapi.responses import JSONResponse, PlainTextResponse
+	if format == "json":
+		return JSONResponse(metrics.snapshot())
+	if format != "prometheus":
+		raise HTTPException(status_code=400, detail="format must be 'prometheus' or 'json'")
+	return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/suggest")
+def suggest_endpoint(q: str, user: str = None, k: int = 8):
+	"""Typeahead completions of `q` from the user's history, popular searches, title phrases and titles."""
+	from app.typeahead import suggest
+	if k < 1:
+		raise HTTPException(status_code=400, detail="k must be at least 1")
+	return suggest(q, user=user, k=k)
+
+
+@app.get("/similar/{uid}")
+def similar_endpoint(uid: int, k: int = 10):
+	"""Papers most similar to row `uid`, from the precomputed neighbor graph (scripts.build_neighbors)."""
+	from app.query import has_neighbor_graph, related_papers
+	if not has_neighbor_graph():
+		raise HTTPException(status_code=503, detail="neighbor graph not built; run python -m scripts.build_neighbors")
+	return related_papers(uid, k)
+
+
+def _check_admin(token):
+	if not settings.admin_token:
+		raise HTTPException(status_code=403, detail="admin endpoints are disabled; set ADMIN_TOKEN")
+	if not hmac.compare_digest(str(token or "").encode(), settings.admin_token.encode()):
+		raise HTTPException(status_code=403, detail="bad admin token")
+
+
+@app.get("/admin/index")
+def index_status_endpoint(x_admin_token: str = Header(None)):
+	"""Active / loading / published index versions and in-flight searches on the active one."""
+	from app import versions
+	_check_admin(x_admin_token)
+	return versions.status()
+
+
+@app.post("/admin/index/reload")
+def index_reload_endpoint(version: str = None, x_admin_token: str = Header(None)):
+	"""
+	Point CURRENT at `version` (if given) and hot-swap this process to it in the background;
+	other processes follow within INDEX_POLL_SECONDS.
+	"""
+	from app import versions
+	_check_admin(x_admin_token)
+	try:
+		if version:
+			versions.set_current(version)
+		return versions.reload(version)
+	except ValueError as e:
+		raise HTTPException(status_code=404, detail=str(e))
@@ -0,0 +1,72 @@
+import re
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(query: str) -> str:
+	"""Case/whitespace-insensitive cache key for a query string."""
+	return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+
+class LRUCache:
+	"""
+	Thread-safe bounded LRU map that also tracks hit rate and the time hits saved.
+	`put` takes the milliseconds the value cost to compute; every later hit adds that to `saved_ms`.
+	"""
+
+	def __init__(self, maxsize=256):
+		self.maxsize = maxsize
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.saved_ms = 0.0
+
+	def get(self, key, default=None):
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is None:
+				self.misses += 1
+				return default
+			self._data.move_to_end(key)
+			self.hits += 1
+			self.saved_ms += entry[1]
+			return entry[0]
+
+	def put(self, key, value, cost_ms=0.0):
+		if self.maxsize <= 0:
+			return
+		with self._lock:
+			self._data[key] = (value, cost_ms)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def replace(self, key, value, extra_cost_ms=0.0):
+		"""Swap the value of a cached entry (keeping its place), adding extra_cost_ms to what a hit saves; no-op if evicted."""
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is not None:
+				self._data[key] = (value, entry[1] + extra_cost_ms)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self):
+		return len(self._data)
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def stats(self):
+		total = self.hits + self.misses
+		return {
+			"size": len(self._data),
+			"maxsize": self.maxsize,
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": round(self.hits / total, 4) if total else 0.0,
+			"saved_ms": round(self.saved_ms, 1),
+		}
+
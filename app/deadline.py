@@ -0,0 +1,108 @@
+import contextvars
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from app import metrics
+from app.metrics import span
+
+# share of the overall deadline a remote call may use; local stages just get what's left
+STAGE_SHARES = {"embed": 0.4, "llm": 1.0}
+_EWMA_ALPHA = 0.2
+_stage_ms = {}  # stage -> EWMA of its observed duration (ms), to predict overruns before starting
+# remote calls run here so the caller can stop waiting at the budget. A call that overruns
+# finishes in the background without holding up the search, and its result is kept only through
+# the caller's `on_late` (or a cache the call fills itself, like query_embeddings); one still
+# queued behind busy workers is cancelled instead, so at most max_workers calls are ever wasted
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="deadline")
+
+
+class DeadlineExceeded(TimeoutError):
+	pass
+
+
+def expected_ms(stage):
+	return _stage_ms.get(stage, 0.0)
+
+
+def _deliver_late(stage, future, on_late):
+	if future.exception() is not None:
+		return
+	try:
+		on_late(future.result())
+		metrics.incr("deadline_late_results_total", stage=stage)
+	except Exception as e:
+		print(f"Late {stage} result dropped: {e}")
+
+
+class Deadline:
+	"""
+	Overall time budget for one search, passed down to every stage:
+
+	- `call(stage, fn, on_late)` runs a remote call (embedding, LLM) with at most its STAGE_SHARES
+	  share of the total, capped by what's left; raises DeadlineExceeded when it doesn't return in
+	  time, and hands the result to `on_late` if it still arrives
+	- `fits(stage)` says whether a local stage (MMR, personalization) is expected, from its recent
+	  durations, to finish before the deadline
+	- `skip(stage)` records a stage that was degraded or dropped (deadline_skips_total{stage})
+
+	`Deadline(None)` (or 0) never expires, so the same code path runs without a deadline.
+	"""
+
+	def __init__(self, total_ms=None, shares=None):
+		self.total_ms = total_ms or None
+		self.start = time.perf_counter()
+		self.shares = dict(STAGE_SHARES, **(shares or {}))
+		self.skipped = []
+
+	@property
+	def enabled(self):
+		return self.total_ms is not None
+
+	@property
+	def degraded(self):
+		return bool(self.skipped)
+
+	def elapsed_ms(self):
+		return (time.perf_counter() - self.start) * 1000
+
+	def remaining_ms(self):
+		if not self.enabled:
+			return math.inf
+		return max(0.0, self.total_ms - self.elapsed_ms())
+
+	def budget_ms(self, stage):
+		if not self.enabled:
+			return math.inf
+		return min(self.shares.get(stage, 1.0) * self.total_ms, self.remaining_ms())
+
+	def fits(self, stage, reserve_ms=0.0):
+		return not self.enabled or expected_ms(stage) + reserve_ms <= self.remaining_ms()
+
+	@contextmanager
+	def stage(self, name):
+		"""`span(name)` that also updates the stage's expected duration used by `fits`."""
+		start = time.perf_counter()
+		with span(name):
+			yield
+		ms = (time.perf_counter() - start) * 1000
+		_stage_ms[name] = ms if name not in _stage_ms else _stage_ms[name] + _EWMA_ALPHA * (ms - _stage_ms[name])
+
+	def call(self, stage, fn, on_late=None):
+		if not self.enabled:
+			return fn()
+		budget = self.budget_ms(stage)
+		if budget <= 0:
+			raise DeadlineExceeded(f"no time left for {stage}")
+		future = _executor.submit(contextvars.copy_context().run, fn)
+		try:
+			return future.result(timeout=budget / 1000)
+		except FutureTimeout:
+			if not future.cancel() and on_late is not None:
+				future.add_done_callback(lambda f: _deliver_late(stage, f, on_late))
+			raise DeadlineExceeded(f"{stage} missed its {budget:.0f} ms budget") from None
+
+	def skip(self, stage):
+		self.skipped.append(stage)
+		metrics.incr("deadline_skips_total", stage=stage)
+		metrics.annotate(degraded=list(self.skipped))
@@ -0,0 +1,124 @@
+import os
+import time
+from functools import lru_cache
+import faiss
+import numpy as np
+from app import settings
+
+CACHE_PATH = settings.cache_dir
+CANONICAL_FILE = "canonical_ids.npy"
+
+
+def similarity_radius(min_similarity):
+	"""Squared-L2 radius equivalent to a cosine-similarity floor for unit vectors: |a-b|^2 = 2 - 2cos."""
+	return 2.0 * (1.0 - min_similarity)
+
+
+def near_duplicate_pairs(index, embeddings, min_similarity=0.97, batch_size=4096, threads=None, progress=True):
+	"""
+	(a, b) row pairs, a < b, whose embeddings are at least `min_similarity` cosine-similar,
+	from batched `index.range_search` (FAISS spreads each batch over `threads` OpenMP threads).
+	"""
+	from tqdm import tqdm
+	faiss.omp_set_num_threads(threads or os.cpu_count() or 1)
+	radius = similarity_radius(min_similarity)
+	n = len(embeddings)
+	src, dst = [], []
+	for s in tqdm(range(0, n, batch_size), desc="Range search", unit="batch", disable=not progress):
+		xq = np.ascontiguousarray(embeddings[s:s + batch_size], dtype=np.float32)
+		lims, _, I = index.range_search(xq, radius)
+		rows = np.repeat(np.arange(s, s + len(xq)), np.diff(lims.astype(np.int64)))
+		keep = I > rows  # each pair once, no self matches
+		src.append(rows[keep])
+		dst.append(I[keep])
+	return np.concatenate(src).astype(np.int64), np.concatenate(dst).astype(np.int64)
+
+
+def cluster_labels(n, src, dst):
+	"""
+	Connected components of the duplicate graph as min-row-id labels (vectorized union-find:
+	propagate the smaller label across every edge, then pointer-jump until nothing changes).
+	"""
+	labels = np.arange(n, dtype=np.int64)
+	if not len(src):
+		return labels
+	while True:
+		lo = np.minimum(labels[src], labels[dst])
+		before = labels.copy()
+		np.minimum.at(labels, src, lo)
+		np.minimum.at(labels, dst, lo)
+		# path compression: point every row at its label's label until stable
+		while True:
+			jumped = labels[labels]
+			if np.array_equal(jumped, labels):
+				break
+			labels = jumped
+		if np.array_equal(labels, before):
+			return labels
+
+
+def cluster_stats(canonical):
+	"""Cluster-size summary of a canonical-id array."""
+	sizes = np.bincount(canonical, minlength=len(canonical))
+	dup_sizes = sizes[sizes > 1]
+	hist = np.bincount(np.minimum(dup_sizes, 10))
+	return {
+		"papers": int(len(canonical)),
+		"clusters": int((sizes > 0).sum()),
+		"duplicate_clusters": int(len(dup_sizes)),
+		"collapsed_rows": int(dup_sizes.sum() - len(dup_sizes)),
+		"largest_cluster": int(sizes.max()) if len(sizes) else 0,
+		"size_histogram": {("10+" if s == 10 else str(s)): int(c) for s, c in enumerate(hist) if s >= 2 and c},
+	}
+
+
+def build_canonical_ids(index, embeddings, min_similarity=0.97, batch_size=4096, threads=None):
+	"""canonical[i] = lowest row id in row i's near-duplicate cluster (i itself for unique papers)."""
+	start = time.perf_counter()
+	src, dst = near_duplicate_pairs(index, embeddings, min_similarity, batch_size, threads)
+	canonical = cluster_labels(len(embeddings), src, dst).astype(np.int32)
+	print(f"Near-duplicate pass: {len(src)} pairs >= {min_similarity} cosine in {time.perf_counter() - start:.1f}s")
+	return canonical
+
+
+def save_canonical_ids(canonical, min_similarity, file_name=CANONICAL_FILE):
+	"""Write the mapping plus a sidecar with cluster stats and fingerprints of the embeddings/parquet it came from."""
+	from app.similarity_search import write_sources_meta
+	path = os.path.join(CACHE_PATH, file_name)
+	np.save(path + ".tmp.npy", canonical)
+	os.replace(path + ".tmp.npy", path)
+	return write_sources_meta(path, **cluster_stats(canonical), min_similarity=min_similarity)
+
+
+@lru_cache(maxsize=1)
+def get_canonical_ids(file_name=CANONICAL_FILE):
+	"""
+	The mapping written by `python -m scripts.dedup`, or None if the pass hasn't been run or was
+	run against different embeddings/parquet (its row ids would no longer line up).
+	"""
+	from app.similarity_search import stale_sources
+	path = os.path.join(CACHE_PATH, file_name)
+	if not os.path.exists(path):
+		return None
+	stale = stale_sources(path)
+	if stale:
+		print(f"Ignoring {path}: built from different {' and '.join(stale)} than the current files; "
+			  f"rerun `python -m scripts.dedup`")
+		return None
+	return np.load(path, mmap_mode="r" if settings.shared_mmap else None)
+
+
+def collapse(ids, *columns, canonical=None):
+	"""
+	Keep only the first (best-ranked) member of each near-duplicate cluster in a ranked id array.
+	Extra arrays aligned with `ids` (distances, ...) are filtered the same way.
+	"""
+	canonical = get_canonical_ids() if canonical is None else canonical
+	ids = np.asarray(ids)
+	if canonical is None or not len(ids):
+		return (ids,) + columns
+	valid = (ids >= 0) & (ids < len(canonical))
+	keys = np.where(valid, canonical[np.clip(ids, 0, len(canonical) - 1)], -1 - np.arange(len(ids)))
+	_, first = np.unique(keys, return_index=True)
+	keep = np.sort(first)
+	return (ids[keep],) + tuple(np.asarray(c)[keep] for c in columns)
@@ -0,0 +1,201 @@
+import os
+import shutil
+import time
+from functools import lru_cache
+import numpy as np
+from app import settings
+
+CACHE_PATH = settings.cache_dir
+
+OPENAI_DIMS = {
+	"text-embedding-3-small": 1536,
+	"text-embedding-3-large": 3072,
+	"text-embedding-ada-002": 1536,
+}
+
+
+class EmbeddingProvider:
+	"""
+	Common interface behind `get_query_embedding` / `create_embeddings`.
+	Providers return float32 arrays: (d,) for a query, (n, d) for a batch of texts.
+	"""
+	name = "base"
+
+	def __init__(self, model):
+		self.model = model
+
+	@property
+	def dim(self) -> int:
+		raise NotImplementedError
+
+	@property
+	def cache_name(self) -> str:
+		# e.g. openai_text_embedding_3_small -> .cache/openai_text_embedding_3_small.npy
+		return f"{self.name}_{self.model.replace('-', '_').replace('/', '_')}"
+
+	def embed(self, texts) -> np.ndarray:
+		raise NotImplementedError
+
+	def embed_query(self, text, **kwargs) -> np.ndarray:
+		return self.embed([text])[0]
+
+	def metadata(self) -> dict:
+		return {"provider": self.name, "model": self.model, "dim": self.dim}
+
+
+class OpenAIProvider(EmbeddingProvider):
+	name = "openai"
+
+	def __init__(self, model=None):
+		super().__init__(model or settings.openai_embed_model)
+
+	@property
+	def dim(self):
+		return OPENAI_DIMS.get(self.model, 1536)
+
+	def embed(self, texts):
+		from app.api import get_client
+		resp = get_client().embeddings.create(model=self.model, input=list(texts))
+		return np.asarray([item.embedding for item in resp.data], dtype=np.float32)
+
+	def embed_query(self, text, timeout=60.0, max_retries=2):
+		from app.api import _openai_query_embedding
+		return _openai_query_embedding(text, model=self.model, timeout=timeout, max_retries=max_retries)
+
+
+class FastEmbedProvider(EmbeddingProvider):
+	"""
+	CPU-only local ONNX encoder via FastEmbed (`pip install fastembed`).
+
+	- `threads`: onnxruntime intra-op threads per session
+	- `parallel`: data-parallel worker processes for corpus encoding (0 = all cores)
+	- `quantize`: use an int8 model; FastEmbed already ships the default bge-small as a quantized
+	  ONNX build, other models are dynamically quantized once and cached next to the original
+	"""
+	name = "fastembed"
+
+	def __init__(self, model=None, threads=None, parallel=0, batch_size=256, quantize=True):
+		super().__init__(model or settings.local_embed_model)
+		self.threads = threads or settings.embed_threads
+		self.parallel = parallel
+		self.batch_size = batch_size
+		self.quantize = quantize
+		self._encoder = None
+		# dim, model file and sources; looked up once, `dim` / `cache_name` are read on every search
+		self._description = self._describe(self.model)
+
+	@staticmethod
+	def _describe(model):
+		from fastembed import TextEmbedding
+		for desc in TextEmbedding.list_supported_models():
+			if desc["model"] == model:
+				return desc
+		raise ValueError(f"FastEmbed does not support model {model!r}")
+
+	@property
+	def cache_name(self):
+		return super().cache_name + ("_int8" if self._needs_quantization() else "")
+
+	def _needs_quantization(self):
+		if not self.quantize:
+			return False
+		source = (self._description.get("sources") or {}).get("hf") or ""
+		model_file = self._description.get("model_file", "")
+		return not (source.endswith("-Q") or "quantized" in model_file)
+
+	@property
+	def dim(self):
+		return int(self._description["dim"])
+
+	def _model_dir(self, cache_dir):
+		"""Local snapshot of the model's Hugging Face repo, where FastEmbed downloaded it."""
+		from huggingface_hub import snapshot_download
+		repo = (self._description.get("sources") or {}).get("hf")
+		if not repo:
+			raise ValueError(f"FastEmbed has no Hugging Face source for {self.model!r}; use quantize=False")
+		return snapshot_download(repo_id=repo, cache_dir=cache_dir, local_files_only=True)
+
+	def _quantized_model_dir(self, model_dir):
+		from onnxruntime.quantization import QuantType, quantize_dynamic
+		model_file = self._description["model_file"]
+		out_dir = os.path.join(CACHE_PATH, "fastembed", self.cache_name)
+		if not os.path.exists(os.path.join(out_dir, model_file)):
+			print(f"Quantizing {self.model} to int8...")
+			shutil.copytree(model_dir, out_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns("*.onnx"))
+			os.makedirs(os.path.dirname(os.path.join(out_dir, model_file)), exist_ok=True)
+			quantize_dynamic(os.path.join(model_dir, model_file), os.path.join(out_dir, model_file), weight_type=QuantType.QInt8)
+		return out_dir
+
+	def _load(self):
+		if self._encoder is None:
+			from fastembed import TextEmbedding
+			kwargs = dict(cache_dir=os.path.join(CACHE_PATH, "fastembed"), threads=self.threads,
+				providers=["CPUExecutionProvider"])
+			if self._needs_quantization():
+				TextEmbedding(self.model, lazy_load=True, **kwargs)  # downloads the fp32 model if needed
+				kwargs["specific_model_path"] = self._quantized_model_dir(self._model_dir(kwargs["cache_dir"]))
+			self._encoder = TextEmbedding(self.model, **kwargs)
+		return self._encoder
+
+	def embed(self, texts, parallel=None):
+		texts = list(texts)
+		if not texts:
+			return np.empty((0, self.dim), dtype=np.float32)
+		# worker processes only pay off for big batches; queries stay in-process
+		parallel = self.parallel if parallel is None and len(texts) >= 4 * self.batch_size else parallel
+		vecs = self._load().embed(texts, batch_size=self.batch_size, parallel=parallel)
+		return np.asarray(list(vecs), dtype=np.float32)
+
+	def embed_query(self, text, **kwargs):
+		return self.embed([text], parallel=None)[0]
+
+
+PROVIDERS = {
+	OpenAIProvider.name: OpenAIProvider,
+	FastEmbedProvider.name: FastEmbedProvider,
+}
+
+
+@lru_cache(maxsize=None)
+def _cached_provider(name, model):
+	if name not in PROVIDERS:
+		raise ValueError(f"Unknown embedding provider {name!r}; expected one of {sorted(PROVIDERS)}")
+	return PROVIDERS[name](model)
+
+
+def get_provider(provider=None, model=None) -> EmbeddingProvider:
+	"""Resolve a provider instance from a name (default `settings.embed_provider`) or pass one through."""
+	if isinstance(provider, EmbeddingProvider):
+		return provider
+	return _cached_provider(provider or settings.embed_provider, model)
+
+
+def embedding_cache_path(provider=None):
+	return os.path.join(CACHE_PATH, f"{get_provider(provider).cache_name}.npy")
+
+
+def embed_corpus(provider, texts, use_cache=True, chunk_size=20000):
+	"""Encode a corpus with a local provider, checkpointing to the .npy cache every chunk."""
+	provider = get_provider(provider)
+	cache_path = embedding_cache_path(provider)
+	done = []
+	if use_cache and os.path.exists(cache_path):
+		cached = np.load(cache_path)
+		if cached.shape[0] >= len(texts):
+			print(f"Loaded {len(cached)} cached embeddings from {cache_path}")
+			return cached
+		print(f"Resuming from {cached.shape[0]} cached embeddings from {cache_path}")
+		done.append(cached)
+
+	start = sum(len(d) for d in done)
+	t0 = time.perf_counter()
+	for i in range(start, len(texts), chunk_size):
+		done.append(provider.embed(texts[i:i + chunk_size]))
+		n = i + len(done[-1])
+		np.save(cache_path, np.concatenate(done))
+		print(f"Embedded {n}/{len(texts)} texts ({(n - start) / (time.perf_counter() - t0):.0f} texts/s)")
+
+	embeddings = np.concatenate(done) if done else np.empty((0, provider.dim), dtype=np.float32)
+	np.save(cache_path, embeddings)
+	print(f"Saved embeddings to {cache_path}")
+	return embeddings
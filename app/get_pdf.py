@@ -1,6 +1,7 @@
 import requests
 import os
 from app import settings
+from app.metrics import timed
 from PyPDF2 import PdfReader
 import io
 
@@ -18,6 +19,7 @@ def is_valid_pdf(data: bytes) -> bool:
 		return False
 
 
+@timed("get_pdf")
 def get_pdf(url: str) -> bytes:
 	# delete all existing pdfs in DOWNLOAD_PATH
 	for file in os.listdir(DOWNLOAD_PATH):
@@ -0,0 +1,185 @@
+import os
+import re
+import time
+from array import array
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+from app import settings
+
+CACHE_PATH = settings.cache_dir
+LEXICAL_FILE = "bm25_index.npz"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+	"a an and are as at be been by can for from has have in into is it its of on or our "
+	"that the their this to using via we which with".split()
+)
+
+
+def tokenize(text):
+	"""Lowercase alphanumeric tokens; keeps digits so "gpt 2", "resnet 50" stay searchable."""
+	if not isinstance(text, str):
+		return []
+	return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+	"""
+	Okapi BM25 over an inverted index stored as flat postings arrays (CSR layout).
+
+	- `indptr[t]:indptr[t+1]` is the postings slice of term id `t`
+	- `doc_ids` (int32) are row positions in the parquet, i.e. the same ids FAISS returns
+	- `tfs` (uint8, clipped at 255) are term frequencies
+	"""
+
+	def __init__(self, indptr, doc_ids, tfs, doc_len, terms, k1=1.2, b=0.75):
+		self.indptr = indptr
+		self.doc_ids = doc_ids
+		self.tfs = tfs
+		self.doc_len = doc_len
+		self.terms = terms
+		self.vocab = {t: i for i, t in enumerate(terms)}
+		self.k1 = k1
+		self.b = b
+
+		n_docs = len(doc_len)
+		avgdl = float(doc_len.mean()) if n_docs else 0.0
+		doc_freq = np.diff(indptr).astype(np.float32)
+		self.idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+		# per-doc length normalisation, precomputed once: k1 * (1 - b + b * dl / avgdl)
+		self._norm = (k1 * (1.0 - b + b * doc_len / max(avgdl, 1e-9))).astype(np.float32)
+
+	@property
+	def n_docs(self):
+		return len(self.doc_len)
+
+	@property
+	def nbytes(self):
+		return int(self.indptr.nbytes + self.doc_ids.nbytes + self.tfs.nbytes + self.doc_len.nbytes
+			+ self.idf.nbytes + self._norm.nbytes)
+
+	@classmethod
+	def build(cls, texts, **kwargs):
+		"""Build from an iterable of strings; document i gets id i."""
+		vocab = {}
+		term_col, doc_col, tf_col = array("i"), array("i"), array("B")
+		doc_len = array("i")
+		for doc, text in enumerate(texts):
+			toks = tokenize(text)
+			doc_len.append(len(toks))
+			for tok, tf in Counter(toks).items():
+				term_col.append(vocab.setdefault(tok, len(vocab)))
+				doc_col.append(doc)
+				tf_col.append(min(tf, 255))
+
+		term_col = np.frombuffer(term_col, dtype=np.int32)
+		# stable sort keeps doc ids ascending inside each postings list
+		order = np.argsort(term_col, kind="stable")
+		doc_ids = np.frombuffer(doc_col, dtype=np.int32)[order]
+		tfs = np.frombuffer(tf_col, dtype=np.uint8)[order]
+		indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+		np.cumsum(np.bincount(term_col, minlength=len(vocab)), out=indptr[1:])
+
+		terms = [None] * len(vocab)
+		for tok, tid in vocab.items():
+			terms[tid] = tok
+		return cls(indptr, doc_ids, tfs, np.frombuffer(doc_len, dtype=np.int32).copy(), terms, **kwargs)
+
+	def save(self, path):
+		vocab_blob = np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8)
+		tmp = path + ".tmp.npz"
+		np.savez(tmp, indptr=self.indptr, doc_ids=self.doc_ids, tfs=self.tfs, doc_len=self.doc_len, vocab=vocab_blob)
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path, **kwargs):
+		with np.load(path) as z:
+			blob = z["vocab"].tobytes().decode("utf-8")
+			terms = blob.split("\n") if blob else []
+			return cls(z["indptr"], z["doc_ids"], z["tfs"], z["doc_len"], terms, **kwargs)
+
+	def search(self, query, k=10):
+		"""Return (scores, ids) of the top-k documents, best first."""
+		term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+		if not term_ids or k <= 0:
+			return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+		doc_parts, score_parts = [], []
+		for t in term_ids:
+			s, e = self.indptr[t], self.indptr[t + 1]
+			docs = self.doc_ids[s:e]
+			tf = self.tfs[s:e].astype(np.float32)
+			score_parts.append(self.idf[t] * tf * (self.k1 + 1.0) / (tf + self._norm[docs]))
+			doc_parts.append(docs)
+		docs = np.concatenate(doc_parts)
+		scores = np.concatenate(score_parts)
+
+		if len(term_ids) > 1:
+			# accumulate per doc: dense bincount is cheaper once postings cover a good chunk of the corpus
+			if len(docs) * 8 > self.n_docs:
+				scores = np.bincount(docs, weights=scores, minlength=self.n_docs).astype(np.float32)
+				docs = np.flatnonzero(scores).astype(np.int32)
+				scores = scores[docs]
+			else:
+				docs, inv = np.unique(docs, return_inverse=True)
+				scores = np.bincount(inv, weights=scores).astype(np.float32)
+
+		k = min(k, len(docs))
+		top = np.argpartition(-scores, k - 1)[:k]
+		top = top[np.argsort(-scores[top], kind="stable")]
+		return scores[top], docs[top].astype(np.int64)
+
+
+def _document_texts(df, fields=("title", "abstract")):
+	texts = df[fields[0]].fillna("").astype(str)
+	for field in fields[1:]:
+		texts = texts + " " + df[field].fillna("").astype(str)
+	return texts
+
+
+def build_bm25_index(df, file_name=LEXICAL_FILE, save=True, data_path=None):
+	"""Build over `df` and (with `save`) write it plus a sidecar fingerprinting the parquet (`data_path`) it came from."""
+	start = time.perf_counter()
+	index = BM25Index.build(_document_texts(df))
+	print(f"Built BM25 index over {index.n_docs} docs / {len(index.terms)} terms in {time.perf_counter() - start:.1f}s")
+	if save:
+		from app.similarity_search import write_sources_meta
+		path = os.path.join(CACHE_PATH, file_name)
+		index.save(path)
+		write_sources_meta(path, names=("data",), data_path=data_path, n_docs=int(index.n_docs), terms=len(index.terms))
+	return index
+
+
+@lru_cache(maxsize=1)
+def get_bm25_index(file_name=LEXICAL_FILE):
+	"""Load the cached BM25 index, (re)building it from the parquet on first use or once the parquet changed."""
+	from app.similarity_search import load_data, stale_sources
+	path = os.path.join(CACHE_PATH, file_name)
+	if os.path.exists(path):
+		if stale_sources(path):
+			print(f"BM25 index {path} was built from a different parquet; rebuilding")
+		else:
+			try:
+				return BM25Index.load(path)
+			except Exception as e:
+				print(f"Error loading BM25 index from {path}: {e}")
+	return build_bm25_index(load_data(), file_name=file_name)
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=60):
+	"""
+	Fuse several ranked id lists with RRF: score(d) = sum 1 / (rrf_k + rank(d)).
+	Returns (ids, scores) of the top-k fused ids, best first.
+	"""
+	fused = {}
+	for ranking in rankings:
+		for rank, idx in enumerate(ranking):
+			idx = int(idx)
+			if idx < 0:  # FAISS pads with -1 when it has fewer than k results
+				continue
+			fused[idx] = fused.get(idx, 0.0) + 1.0 / (rrf_k + rank + 1)
+	best = sorted(fused.items(), key=lambda kv: -kv[1])[:k]
+	ids = np.array([i for i, _ in best], dtype=np.int64)
+	scores = np.array([s for _, s in best], dtype=np.float32)
+	return ids, scores
@@ -1,44 +1,16 @@
+import hashlib
+import time
+from datetime import date
+from functools import lru_cache
 from app import settings
-from app.api import get_client
+from app import metrics
+from app.api import get_client, call_with_retries
+from app.metrics import timed
 
-
-def _clip(text: str, limit: int = 800) -> str:
-	if not isinstance(text, str):
-		return ""
-	if len(text) <= limit:
-		return text
-	# avoid cutting mid-word
-	cut = text[:limit].rsplit(" ", 1)[0]
-	return cut + "…"
-
-
-def _extract_text(response) -> str:
-	"""Extract plain text from Responses API output items safely."""
-	chunks = []
-	for item in getattr(response, "output", []) or []:
-		for c in getattr(item, "content", []) or []:
-			t = getattr(c, "text", None)
-			if t:
-				chunks.append(t)
-	return "".join(chunks).strip()
-
-
-def llm_explain(query, items):
-    client = get_client()
-
-    # Build compact context for the model (reduce token use, preserve signal)
-    rows = []
-    for it in items:
-        title = it.get("title", "None")
-        abstract = _clip(it.get("abstract", ""), 1500)
-        url = it.get("paper_url") or  "None"
-        date = it.get("date") or "None"
-        rows.append(f"Title: {title} | Date: {date}\nAbstract: {abstract}\nURL: {url}\n")
-
-    context = "\n\n".join(rows)
-
-    # NOTE: This is a system prompt I generated with GPT-4 and changed some parts to my liking; it doesn't need to be this elaborate.
-    system_prompt = """You are an expert explainer for a NON-INTERACTIVE paper list.
+# NOTE: This is a system prompt I generated with GPT-4 and changed some parts to my liking; it doesn't need to be this elaborate.
+# It is static (the date goes in the user message), so every call sends a byte-identical prefix
+# and the provider's prompt cache can reuse it.
+SYSTEM_PROMPT = """You are an expert explainer for a NON-INTERACTIVE paper list.
 
 INPUT
 • A query string (context only).
@@ -59,7 +31,7 @@ RULES (strict)
 • Use ONLY Title/Abstract/URL. Do NOT invent authors, venues, years, datasets, metrics, or results.
 • No talk of “intent,” scores, confidence, or ranking.
 • If an abstract is missing/empty, say “(No abstract provided; inference from title only)” and keep the summary conservative.
-• Keep duplicates as-is (order is fixed); if two are near-duplicates, briefly note the overlap in their *Why it belongs* line.
+• Near-duplicate versions of a paper are already collapsed upstream; if two entries still overlap heavily, keep both (order is fixed) and briefly note the overlap in their *Why it belongs* line.
 
 STYLE
 • Plain Markdown (no code fences, no emojis), crisp and graduate-level.
@@ -79,23 +51,189 @@ Offer refinements when papers are sparsely connected to query; this is to be exp
 When offering refinements, suggest an alternative query that could yield better results with FAISS on PwC database. 
 Do not explicity state this, only state the refined query, which should attempt to achieve the same goal as the query. 
 
-It is currently 09/2025. Use this, along with the publication dates of the papers, if appropriate, to talk about recency and relevance.
+The current month is given at the top of the user message. Use it, along with the publication dates of the papers, if appropriate, to talk about recency and relevance.
 
 Remember, your output is shown on a web page before the candidate papers - as an LLM-Powered Summary/Guide for the user. Format accordingly."""
+PROMPT_CACHE_KEY = "explain-" + hashlib.blake2b(SYSTEM_PROMPT.encode(), digest_size=6).hexdigest()
+
+# per-abstract cap when the token budget is loose (~1500 characters, the old fixed clip)
+MAX_ABSTRACT_TOKENS = 375
+# LLM_EFFORT=auto tries these in order; it never goes above the old fixed "medium"
+EFFORTS = ("medium", "low", "minimal")
+# latency model priors per effort: (fixed ms, ms per listed paper); calls refine the per-paper part
+_LATENCY_PRIOR = {"medium": (3000.0, 1800.0), "low": (2000.0, 1000.0), "minimal": (1500.0, 600.0)}
+_FAST_MODEL_FACTOR = 0.5
+_EWMA_ALPHA = 0.2
+_latency = {}  # (model, effort) -> (fixed ms, ms per paper)
+
+
+def _clip(text: str, limit: int = 800) -> str:
+	if not isinstance(text, str):
+		return ""
+	if len(text) <= limit:
+		return text
+	# avoid cutting mid-word
+	cut = text[:limit].rsplit(" ", 1)[0]
+	return cut + "…"
+
+
+def _extract_text(response) -> str:
+	"""Extract plain text from Responses API output items safely."""
+	chunks = []
+	for item in getattr(response, "output", []) or []:
+		for c in getattr(item, "content", []) or []:
+			t = getattr(c, "text", None)
+			if t:
+				chunks.append(t)
+	return "".join(chunks).strip()
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+	"""tiktoken's o200k_base (the GPT-4o / GPT-5 vocabulary), or None without tiktoken (then ~4 chars per token)."""
+	try:
+		import tiktoken
+		return tiktoken.get_encoding("o200k_base")
+	except Exception:
+		return None
 
-    user_prompt = (
+
+def count_tokens(text: str) -> int:
+	enc = _encoding()
+	if enc is None:
+		return (len(text) + 3) // 4
+	return len(enc.encode(text, disallowed_special=()))
+
+
+def clip_tokens(text: str, limit: int) -> str:
+	"""`text` cut to at most `limit` tokens on a word boundary (… appended when clipped)."""
+	if not isinstance(text, str) or limit <= 0:
+		return ""
+	enc = _encoding()
+	if enc is None:
+		return _clip(text, limit * 4)
+	tokens = enc.encode(text, disallowed_special=())
+	if len(tokens) <= limit:
+		return text
+	return enc.decode(tokens[:limit]).rsplit(" ", 1)[0] + "…"
+
+
+def _abstract_budgets(lengths, budget, cap=MAX_ABSTRACT_TOKENS):
+	"""
+	Split `budget` tokens over abstracts of the given token lengths: each gets an equal share
+	(at most `cap`), and whatever short abstracts leave unused goes to the longer ones.
+	"""
+	order = sorted(range(len(lengths)), key=lambda j: lengths[j])
+	budgets = [0] * len(lengths)
+	remaining = max(0, budget)
+	for i, j in enumerate(order):
+		budgets[j] = min(lengths[j], cap, remaining // (len(order) - i))
+		remaining -= budgets[j]
+	return budgets
+
+
+def build_prompt(query, items, budget=None, today=None):
+	"""
+	User message for `items` fitted to `budget` tokens (LLM_CONTEXT_TOKENS): titles, dates and
+	URLs always go in, abstracts share what's left. Returns (prompt, prompt tokens).
+	"""
+	budget = settings.llm_context_tokens if budget is None else budget
+	header = (
+		f"Current month: {(today or date.today()):%m/%Y}\n"
 		f"User query: {query}\n\n"
-		f"Retrieved papers (metadata only):\n\n{context}\n"
+		f"Retrieved papers (metadata only):\n\n"
 	)
-
-    resp = client.responses.create(
-		model=settings.openai_chat_model, 
+	heads, tails, abstracts = [], [], []
+	for it in items:
+		title = it.get("title", "None")
+		url = it.get("paper_url") or "None"
+		pub_date = it.get("date") or "None"
+		heads.append(f"Title: {title} | Date: {pub_date}\nAbstract: ")
+		tails.append(f"\nURL: {url}\n")
+		abstract = it.get("abstract", "")
+		abstracts.append(abstract if isinstance(abstract, str) else "")
+	fixed = count_tokens(header) + sum(count_tokens(h) + count_tokens(t) + 1 for h, t in zip(heads, tails))
+	budgets = _abstract_budgets([count_tokens(a) for a in abstracts], budget - fixed)
+	rows = [h + clip_tokens(a, n) + t for h, a, n, t in zip(heads, abstracts, budgets, tails)]
+	prompt = header + "\n\n".join(rows) + "\n"
+	return prompt, count_tokens(prompt)
+
+
+def _latency_model(model, effort):
+	if (model, effort) not in _latency:
+		fixed, per_paper = _LATENCY_PRIOR.get(effort, _LATENCY_PRIOR["medium"])
+		if model != settings.openai_chat_model:
+			fixed, per_paper = fixed * _FAST_MODEL_FACTOR, per_paper * _FAST_MODEL_FACTOR
+		_latency[(model, effort)] = (fixed, per_paper)
+	return _latency[(model, effort)]
+
+
+def expected_ms(model, effort, n):
+	fixed, per_paper = _latency_model(model, effort)
+	return fixed + per_paper * n
+
+
+def choose_plan(n, slo_ms=None):
+	"""
+	(model, reasoning effort) for explaining n papers. LLM_EFFORT=auto picks the most thorough
+	effort whose expected latency fits LLM_LATENCY_SLO_MS, on the main model first and then on
+	OPENAI_FAST_MODEL (if set); if nothing fits, the fastest option. A fixed LLM_EFFORT always
+	runs on the main model.
+
+	With the _LATENCY_PRIOR estimates and the default 15 s SLO, "medium" fits up to 6 papers and
+	7 or more drop to "low"; observed calls then move the per-paper estimates (and that cutoff).
+	"""
+	model = settings.openai_chat_model
+	if settings.llm_effort != "auto":
+		return model, settings.llm_effort
+	slo_ms = settings.llm_latency_slo_ms if slo_ms is None else slo_ms
+	models = [model] + ([settings.openai_fast_model] if settings.openai_fast_model else [])
+	for m in models:
+		for effort in EFFORTS:
+			if expected_ms(m, effort, n) <= slo_ms:
+				return m, effort
+	return models[-1], EFFORTS[-1]
+
+
+def _record(model, effort, n, ms, prompt_tokens, usage):
+	# refine the per-paper latency estimate for this plan (EWMA over observed calls)
+	fixed, per_paper = _latency_model(model, effort)
+	observed = max(0.0, ms - fixed) / max(n, 1)
+	_latency[(model, effort)] = (fixed, per_paper + _EWMA_ALPHA * (observed - per_paper))
+
+	details = getattr(usage, "input_tokens_details", None)
+	tokens = {
+		"input": getattr(usage, "input_tokens", None) or prompt_tokens,
+		"cached": getattr(details, "cached_tokens", None) or 0,
+		"output": getattr(usage, "output_tokens", None) or 0,
+	}
+	metrics.observe("llm_response_ms", ms, model=model, effort=effort)
+	for kind, value in tokens.items():
+		metrics.incr("llm_tokens_total", value, kind=kind, model=model)
+	metrics.annotate(llm={"model": model, "effort": effort, "papers": n, "ms": round(ms, 1),
+						  "prompt_tokens_est": prompt_tokens, **tokens})
+	return tokens
+
+
+@timed("llm_explain")
+def llm_explain(query, items, slo_ms=None):
+    client = get_client(max_retries=0)
+
+    # Compact context fitted to the token budget; the system prompt stays byte-identical for prompt caching
+    user_prompt, prompt_tokens = build_prompt(query, items)
+    model, effort = choose_plan(len(items), slo_ms)
+
+    start = time.perf_counter()
+    resp = call_with_retries(lambda: client.responses.create(
+		model=model,
 		input=[
-			{"role": "system", "content": [{"type": "input_text", "text": system_prompt}]},
+			{"role": "system", "content": [{"type": "input_text", "text": SYSTEM_PROMPT}]},
 			{"role": "user", "content": [{"type": "input_text", "text": user_prompt}]},
 		],
-		reasoning={"effort":"medium"}
-	)
+		reasoning={"effort": effort},
+		prompt_cache_key=PROMPT_CACHE_KEY,
+	), "responses")
+    _record(model, effort, len(items), (time.perf_counter() - start) * 1000, prompt_tokens, getattr(resp, "usage", None))
 
     return resp.output_text
     # return _extract_text(resp)
@@ -0,0 +1,210 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from app import settings
+
+# latency histogram buckets (ms)
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count], sum, count
+_counters = {}    # (name, labels) -> float
+_gauges = {}      # (name, labels) -> float
+_enabled = settings.metrics_enabled
+_trace = contextvars.ContextVar("query_trace", default=None)
+_NOOP = nullcontext()
+
+
+def _key(name, labels):
+	return name, tuple(sorted(labels.items()))
+
+
+def enabled():
+	return _enabled
+
+
+def set_enabled(on: bool):
+	global _enabled
+	_enabled = bool(on)
+
+
+def observe(name, ms, **labels):
+	"""Record one latency sample (milliseconds) into histogram `name`."""
+	if not _enabled:
+		return
+	key = _key(name, labels)
+	with _lock:
+		hist = _histograms.get(key)
+		if hist is None:
+			hist = _histograms[key] = [[0] * (len(BUCKETS_MS) + 1), 0.0, 0]
+		buckets = hist[0]
+		for i, upper in enumerate(BUCKETS_MS):
+			if ms <= upper:
+				buckets[i] += 1
+				break
+		else:
+			buckets[-1] += 1
+		hist[1] += ms
+		hist[2] += 1
+	trace = _trace.get()
+	if trace is not None:
+		trace["spans"].append({"metric": name, **labels, "ms": round(ms, 3)})
+
+
+def incr(name, value=1, **labels):
+	if not _enabled:
+		return
+	key = _key(name, labels)
+	with _lock:
+		_counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+	if not _enabled:
+		return
+	with _lock:
+		_gauges[_key(name, labels)] = value
+
+
+class _Span:
+	__slots__ = ("name", "labels", "start")
+
+	def __init__(self, name, labels):
+		self.name = name
+		self.labels = labels
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		observe(self.name, (time.perf_counter() - self.start) * 1000, **self.labels)
+		return False
+
+
+def span(name, **labels):
+	"""`with span("mmr"): ...` times the block into histogram `stage_ms{stage=name}`; a no-op when disabled."""
+	if not _enabled:
+		return _NOOP
+	return _Span("stage_ms", dict(labels, stage=name))
+
+
+def timed(name):
+	"""Decorator form of `span`."""
+	def wrap(fn):
+		@wraps(fn)
+		def inner(*args, **kwargs):
+			with span(name):
+				return fn(*args, **kwargs)
+		return inner
+	return wrap
+
+
+@contextmanager
+def trace_query(query, **fields):
+	"""
+	Collect every span recorded inside the block into one per-query trace and append it to
+	TRACE_FILE as a JSON line. Only active with TRACE_QUERIES=true; otherwise a no-op.
+	"""
+	if not (_enabled and settings.trace_queries) or _trace.get() is not None:
+		yield None
+		return
+	trace = {"ts": time.time(), "query": query, **fields, "spans": []}
+	token = _trace.set(trace)
+	start = time.perf_counter()
+	try:
+		yield trace
+	finally:
+		_trace.reset(token)
+		trace["total_ms"] = round((time.perf_counter() - start) * 1000, 3)
+		path = os.path.join(settings.cache_dir, settings.trace_file)
+		with _lock, open(path, "a") as f:
+			f.write(json.dumps(trace, default=str) + "\n")
+
+
+def annotate(**fields):
+	"""Attach fields (cache hit, fallback mode, ...) to the current query trace, if any."""
+	trace = _trace.get()
+	if trace is not None:
+		trace.update(fields)
+
+
+def _escape(value):
+	# label values are quoted strings in the exposition format: escape \, " and newlines
+	return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+	items = list(labels) + list(extra)
+	if not items:
+		return ""
+	return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+	"""All metrics in Prometheus text exposition format (histograms in seconds, per convention)."""
+	lines = []
+	with _lock:
+		seen = set()
+		for (name, labels), (buckets, total, count) in sorted(_histograms.items()):
+			metric = name.replace("_ms", "_seconds")
+			if metric not in seen:
+				lines.append(f"# TYPE {metric} histogram")
+				seen.add(metric)
+			cumulative = 0
+			for upper, n in zip(BUCKETS_MS, buckets):
+				cumulative += n
+				lines.append(f"{metric}_bucket{_fmt_labels(labels, [('le', upper / 1000)])} {cumulative}")
+			lines.append(f"{metric}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {count}")
+			lines.append(f"{metric}_sum{_fmt_labels(labels)} {total / 1000}")
+			lines.append(f"{metric}_count{_fmt_labels(labels)} {count}")
+		for (name, labels), value in sorted(_counters.items()):
+			if name not in seen:
+				lines.append(f"# TYPE {name} counter")
+				seen.add(name)
+			lines.append(f"{name}{_fmt_labels(labels)} {value}")
+		for (name, labels), value in sorted(_gauges.items()):
+			if name not in seen:
+				lines.append(f"# TYPE {name} gauge")
+				seen.add(name)
+			lines.append(f"{name}{_fmt_labels(labels)} {value}")
+	return "\n".join(lines) + "\n"
+
+
+def _quantile(buckets, count, q):
+	# upper bound of the bucket holding the q-th sample (what Prometheus' histogram_quantile approximates)
+	target, seen = q * count, 0
+	for upper, n in zip(BUCKETS_MS + (float("inf"),), buckets):
+		seen += n
+		if seen >= target:
+			return upper
+	return float("inf")
+
+
+def snapshot():
+	"""JSON-friendly view: per-histogram count/mean/p50/p95/p99 (ms, bucket upper bounds), counters, gauges."""
+	with _lock:
+		hists = {}
+		for (name, labels), (buckets, total, count) in _histograms.items():
+			label = ",".join(f"{k}={v}" for k, v in labels)
+			hists[f"{name}{{{label}}}" if label else name] = {
+				"count": count,
+				"mean_ms": round(total / count, 3) if count else 0.0,
+				"p50_ms": _quantile(buckets, count, 0.5),
+				"p95_ms": _quantile(buckets, count, 0.95),
+				"p99_ms": _quantile(buckets, count, 0.99),
+			}
+		counters = {f"{n}{dict(l) if l else ''}": v for (n, l), v in _counters.items()}
+		gauges = {f"{n}{dict(l) if l else ''}": v for (n, l), v in _gauges.items()}
+	return {"histograms": hists, "counters": counters, "gauges": gauges}
+
+
+def reset():
+	with _lock:
+		_histograms.clear()
+		_counters.clear()
+		_gauges.clear()
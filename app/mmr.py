@@ -1,3 +1,4 @@
+import threading
 import numpy as np
 
 def l2_normalize(x, axis=1, eps=1e-12):
@@ -5,7 +6,144 @@ def l2_normalize(x, axis=1, eps=1e-12):
     norm = np.maximum(norm, eps)
     return x / norm
 
-def maximal_marginal_relevance(query_vec, doc_vecs, lambda_param=0.7, top_k=5):
+
+class MMREngine:
+    """
+    Batched greedy MMR with reusable work buffers, for callers that diversify many candidate
+    blocks at once: `batched_mmr` (app.rerank.rerank, used by the nightly recommendations job)
+    and `maximal_marginal_relevance`. Interactive searches rank one session pool at a time with
+    the resumable `MMRState` instead (app.pool), so "more results" continues the greedy pass.
+
+    Inputs are (B, d) query vectors and a (B, n, d) candidate block (one row of candidates
+    per query; pad short rows and pass `valid`). Two ways to get candidate-candidate similarity:
+      - incremental: one (B, n, d) x (B, d) product per greedy step, O(k*n*d)
+      - gram: precompute the (B, n, n) Gram matrix once, then each step is a row lookup;
+        worth it when top_k is a large fraction of n
+    Buffers grow to the largest shape seen and are reused, so steady-state calls don't allocate
+    the big blocks. Not thread-safe; use one engine per thread (see `get_engine`).
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def _buffer(self, name, shape, dtype=np.float32):
+        size = int(np.prod(shape))
+        buf = self._buffers.get(name)
+        if buf is None or buf.size < size or buf.dtype != dtype:
+            buf = np.empty(size, dtype=dtype)
+            self._buffers[name] = buf
+        return buf[:size].reshape(shape)
+
+    def _prepare(self, query_vecs, doc_vecs, normalized):
+        Q = np.asarray(query_vecs, dtype=np.float32)
+        X = np.asarray(doc_vecs, dtype=np.float32)
+        if normalized:
+            return Q, X
+        q = self._buffer("q", Q.shape)
+        np.divide(Q, np.maximum(np.linalg.norm(Q, axis=-1, keepdims=True), 1e-12), out=q)
+        norms = np.sqrt(np.einsum("bnd,bnd->bn", X, X))[:, :, None]
+        x = self._buffer("x", X.shape)
+        np.divide(X, np.maximum(norms, 1e-12), out=x)
+        return q, x
+
+    def select(self, query_vecs, doc_vecs, top_k=5, lambda_param=0.7, normalized=False, valid=None, use_gram=None,
+               relevance=None):
+        """
+        Returns a (B, k) int array of selected positions into each candidate row, k = min(top_k, n).
+        `normalized=True` skips the normalize-and-copy pass for pre-normalized stores.
+        Rows with fewer than k valid candidates are padded with -1.
+        `relevance` (B, n) replaces query similarity as the relevance term (e.g. re-ranked scores).
+        """
+        if doc_vecs.ndim != 3:
+            raise ValueError("doc_vecs must be 3D (B, n, d)")
+        B, n, _ = doc_vecs.shape
+        k = min(top_k, n)
+        if n == 0 or k <= 0:
+            return np.empty((B, 0), dtype=np.int64)
+        q, X = self._prepare(query_vecs, doc_vecs, normalized)
+        rows = np.arange(B)
+
+        sim_q = np.matmul(X, q[:, :, None])[:, :, 0] if relevance is None else np.asarray(relevance, dtype=np.float32)
+        alive = self._buffer("alive", (B, n), bool)
+        alive[:] = True if valid is None else valid
+        s_max = self._buffer("s_max", (B, n))
+        s_max.fill(-np.inf)
+        scores = self._buffer("scores", (B, n))
+
+        if use_gram is None:
+            use_gram = 4 * k >= n
+        if use_gram:
+            G = self._buffer("gram", (B, n, n))
+            np.matmul(X, X.transpose(0, 2, 1), out=G)
+
+        out = np.full((B, k), -1, dtype=np.int64)
+        for t in range(k):
+            if t == 0:
+                # first pick: purely by query similarity
+                np.copyto(scores, sim_q)
+            else:
+                # fold in similarity to the previous pick only (incremental max)
+                last = out[:, t - 1]
+                np.maximum(s_max, G[rows, last] if use_gram else np.matmul(X, X[rows, last][:, :, None])[:, :, 0], out=s_max)
+                np.multiply(sim_q, lambda_param, out=scores)
+                scores -= (1.0 - lambda_param) * s_max
+            scores[~alive] = -np.inf
+            i = np.argmax(scores, axis=1)
+            ok = alive[rows, i]
+            out[:, t] = np.where(ok, i, -1)
+            alive[rows, i] = False
+            if not ok.any():
+                break
+        return out
+
+
+class MMRState:
+    """
+    Greedy MMR over one candidate block that can be resumed: `extend(20)` after `extend(5)`
+    continues the same greedy sequence instead of restarting, giving the same result as a
+    fresh top-20 selection.
+    """
+
+    def __init__(self, query_vec, doc_vecs, lambda_param=0.7, normalized=False, relevance=None):
+        q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+        X = np.asarray(doc_vecs, dtype=np.float32)
+        if not normalized:
+            q = l2_normalize(q.reshape(1, -1))[0]
+            X = l2_normalize(X)
+        self.X = X
+        self.lambda_param = lambda_param
+        self.sim_q = X @ q if relevance is None else np.asarray(relevance, dtype=np.float32)
+        self.s_max = np.full(len(X), -np.inf, dtype=np.float32)
+        self.alive = np.ones(len(X), dtype=bool)
+        self.selected = []
+
+    def extend(self, top_k):
+        """Grow the selection to min(top_k, n) items; returns all selected positions so far."""
+        k = min(top_k, len(self.X))
+        while len(self.selected) < k:
+            if self.selected:
+                np.maximum(self.s_max, self.X @ self.X[self.selected[-1]], out=self.s_max)
+                scores = self.lambda_param * self.sim_q - (1.0 - self.lambda_param) * self.s_max
+            else:
+                scores = self.sim_q.copy()
+            scores[~self.alive] = -np.inf
+            i = int(np.argmax(scores))
+            self.alive[i] = False
+            self.selected.append(i)
+        return self.selected[:k]
+
+
+_local = threading.local()
+
+def get_engine():
+    """Per-thread engine, so threads running batches in parallel don't share buffers."""
+    engine = getattr(_local, "engine", None)
+    if engine is None:
+        engine = _local.engine = MMREngine()
+    return engine
+
+
+def maximal_marginal_relevance(query_vec, doc_vecs, lambda_param=0.7, top_k=5, normalized=False):
     """
     Vectorized MMR.
 
@@ -14,6 +152,7 @@ def maximal_marginal_relevance(query_vec, doc_vecs, lambda_param=0.7, top_k=5):
         doc_vecs: np.ndarray of shape (n, d)
         lambda_param: float between 0 and 1
         top_k: number of results to return
+        normalized: inputs are already unit-norm (skips the normalize + copy)
         fetch_k (not a parameter explicity) = n (number of documents passed in from search)
     Returns:
         indices of selected documents in doc_vecs
@@ -23,55 +162,12 @@ def maximal_marginal_relevance(query_vec, doc_vecs, lambda_param=0.7, top_k=5):
     n, d = doc_vecs.shape
     if n == 0:
         return []
+    q = np.asarray(query_vec).reshape(1, -1)
+    sel = get_engine().select(q, doc_vecs[None], top_k=top_k, lambda_param=lambda_param, normalized=normalized)
+    return [int(i) for i in sel[0] if i >= 0]
 
-    # Normalize once (in-place-safe copy as float32 for speed/memory)
-    q = l2_normalize(query_vec.reshape(1, -1).astype(np.float32, copy=False), axis=1)
-    X = l2_normalize(doc_vecs.astype(np.float32, copy=False), axis=1)
-
-    # Cosine similarity to query (n,)
-    sim_q = (X @ q.T).ravel()
-
-    fk = n
-    cand_idx = np.arange(n)
-
-    # Work in the candidate subspace
-    C = X[cand_idx]                   
-    sim_q_c = sim_q[cand_idx].copy()  
-
-
-    s_max = np.full(fk, -np.inf, dtype=np.float32)
-
-    # Keep a mask of available candidates
-    alive = np.ones(fk, dtype=bool)
-
-    out = []
-    k = min(top_k, fk)
-
-    # Greedy selection
-    last_sel_local = None
-    for t in range(k):
-        if t == 0:
-            # First pick: purely by query similarity
-            # Masked argmax
-            masked = np.where(alive, sim_q_c, -np.inf)
-            i = int(np.argmax(masked))
-        else:
-            # Update s_max using ONLY the newly added vector (incremental, O(fk*d))
-            # Then take elementwise max with previous s_max
-            s_max = np.maximum(s_max, C @ C[last_sel_local])
-
-            # Compute MMR scores for alive items, ignore removed by setting -inf
-            mmr = lambda_param * sim_q_c - (1.0 - lambda_param) * s_max
-            masked = np.where(alive, mmr, -np.inf)
-            i = int(np.argmax(masked))
-
-        # Map back to global index and record
-        out.append(int(cand_idx[i]))
-
-        # Remove from future consideration
-        alive[i] = False
-        sim_q_c[i] = -np.inf
-        s_max[i] = np.inf
-        last_sel_local = i
 
-    return out
\ No newline at end of file
+def batched_mmr(query_vecs, doc_vecs, lambda_param=0.7, top_k=5, normalized=False, valid=None, relevance=None):
+    """Multi-query MMR: (B, d) queries, (B, n, d) candidates -> (B, k) selected positions (-1 padded)."""
+    return get_engine().select(query_vecs, doc_vecs, top_k=top_k, lambda_param=lambda_param,
+                               normalized=normalized, valid=valid, relevance=relevance)
@@ -0,0 +1,196 @@
+import os
+import time
+from functools import lru_cache
+import faiss
+import numpy as np
+from app import settings
+
+CACHE_PATH = settings.cache_dir
+NEIGHBORS_FILE = "neighbors.npz"
+
+
+class NeighborGraph:
+	"""
+	Precomputed k-nearest-neighbor lists for every paper, stored CSR-style like the BM25 postings:
+
+	- `indptr[i]:indptr[i+1]` is the neighbor slice of row `i` (int64, n + 1 entries)
+	- `indices` (int32) are neighbor row ids, nearest first
+	- `distances` (float16) are the index's distances to them
+
+	`neighbors(i)` is two array lookups and a slice, so "more like this" never touches FAISS.
+	"""
+
+	def __init__(self, indptr, indices, distances, k):
+		self.indptr = indptr
+		self.indices = indices
+		self.distances = distances
+		self.k = k
+
+	@property
+	def n(self):
+		return len(self.indptr) - 1
+
+	@property
+	def nbytes(self):
+		return int(self.indptr.nbytes + self.indices.nbytes + self.distances.nbytes)
+
+	def neighbors(self, i, k=None):
+		"""(ids, distances) of row i's nearest papers; empty for rows added after the graph was built."""
+		if not 0 <= i < self.n:
+			return self.indices[:0], self.distances[:0]
+		s, e = self.indptr[i], self.indptr[i + 1]
+		if k is not None:
+			e = min(e, s + k)
+		return self.indices[s:e], self.distances[s:e]
+
+	@classmethod
+	def from_dense(cls, I, D, k):
+		"""Build from (n, k) FAISS-style id/distance arrays; -1 padding is dropped."""
+		keep = I >= 0
+		indptr = np.zeros(len(I) + 1, dtype=np.int64)
+		np.cumsum(keep.sum(axis=1), out=indptr[1:])
+		return cls(indptr, I[keep].astype(np.int32), D[keep].astype(np.float16), k)
+
+	def to_dense(self):
+		"""(n, k) id / distance arrays padded with -1 / inf (the inverse of `from_dense`)."""
+		I = np.full((self.n, self.k), -1, dtype=np.int64)
+		D = np.full((self.n, self.k), np.inf, dtype=np.float32)
+		lengths = np.diff(self.indptr)
+		rows = np.repeat(np.arange(self.n), lengths)
+		cols = np.arange(len(self.indices)) - np.repeat(self.indptr[:-1], lengths)
+		I[rows, cols] = self.indices
+		D[rows, cols] = self.distances
+		return I, D
+
+	def save(self, path):
+		tmp = path + ".tmp.npz"
+		np.savez(tmp, indptr=self.indptr, indices=self.indices, distances=self.distances, k=np.int64(self.k))
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path) as z:
+			return cls(z["indptr"], z["indices"], z["distances"], int(z["k"]))
+
+
+def _knn(index, embeddings, ids, k, batch_size):
+	"""k nearest neighbors (self excluded) of embeddings[ids], searched in batches."""
+	I = np.full((len(ids), k), -1, dtype=np.int64)
+	D = np.full((len(ids), k), np.inf, dtype=np.float32)
+	for s in range(0, len(ids), batch_size):
+		batch = ids[s:s + batch_size]
+		Db, Ib = index.search(np.ascontiguousarray(embeddings[batch], dtype=np.float32), k + 1)
+		# drop each row's own id (usually, but not always with ties/duplicates, in column 0)
+		self_hit = Ib == batch[:, None]
+		Ib = np.where(self_hit, -1, Ib)
+		order = np.argsort(self_hit, axis=1, kind="stable")[:, :k]
+		I[s:s + len(batch)] = np.take_along_axis(Ib, order, axis=1)
+		D[s:s + len(batch)] = np.take_along_axis(Db, order, axis=1)
+	return I, D
+
+
+def build_neighbor_graph(index, embeddings, k=20, batch_size=4096, threads=None, progress=True):
+	"""
+	k-NN of every row via batched `index.search` (FAISS parallelizes each batch over
+	`threads` OpenMP threads, default all cores).
+	"""
+	from tqdm import tqdm
+	faiss.omp_set_num_threads(threads or os.cpu_count() or 1)
+	n = len(embeddings)
+	I = np.full((n, k), -1, dtype=np.int64)
+	D = np.full((n, k), np.inf, dtype=np.float32)
+	start = time.perf_counter()
+	step = batch_size * 8
+	for s in tqdm(range(0, n, step), desc="Neighbor graph", unit="block", disable=not progress):
+		ids = np.arange(s, min(n, s + step))
+		I[ids], D[ids] = _knn(index, embeddings, ids, k, batch_size)
+	print(f"Neighbor graph: {n} papers x {k} neighbors in {time.perf_counter() - start:.1f}s")
+	return NeighborGraph.from_dense(I, D, k)
+
+
+def update_neighbor_graph(graph, index, embeddings, batch_size=4096):
+	"""
+	Extend the graph to rows appended since it was built (graph.n .. len(embeddings) - 1):
+	new rows get their own k-NN lists, and each new paper is inserted into the lists of its
+	neighbors where it beats their current k-th neighbor (an approximate reverse update that
+	avoids re-searching the old rows).
+	"""
+	n_old, n = graph.n, len(embeddings)
+	if n <= n_old:
+		return graph
+	k = graph.k
+	new_ids = np.arange(n_old, n)
+	I_new, D_new = _knn(index, embeddings, new_ids, k, batch_size)
+	I_old, D_old = graph.to_dense()
+	I = np.concatenate([I_old, I_new])
+	D = np.concatenate([D_old, D_new])
+
+	# reverse edges: new paper p is a candidate neighbor of every q in p's list
+	rows = I_new.ravel()
+	valid = rows >= 0
+	src = np.repeat(new_ids, k)[valid]
+	rows, dist = rows[valid], D_new.ravel()[valid]
+	for q, p, d in zip(rows.tolist(), src.tolist(), dist.tolist()):
+		if d < D[q, -1] and p not in I[q]:
+			pos = int(np.searchsorted(D[q], d))
+			I[q, pos + 1:] = I[q, pos:-1].copy()
+			D[q, pos + 1:] = D[q, pos:-1].copy()
+			I[q, pos], D[q, pos] = p, d
+	return NeighborGraph.from_dense(I, D, k)
+
+
+def save_neighbor_graph(graph, file_name=NEIGHBORS_FILE):
+	"""Write the graph plus a sidecar fingerprinting the embeddings/parquet its row ids refer to."""
+	from app.similarity_search import write_sources_meta
+	path = os.path.join(CACHE_PATH, file_name)
+	graph.save(path)
+	return write_sources_meta(path, n=graph.n, k=graph.k, edges=len(graph.indices))
+
+
+@lru_cache(maxsize=1)
+def get_neighbor_graph(file_name=NEIGHBORS_FILE):
+	"""
+	The graph written by `python -m scripts.build_neighbors`, or None if it hasn't been built or
+	was built from different embeddings/parquet (its row ids would no longer line up).
+	"""
+	from app.similarity_search import stale_sources
+	path = os.path.join(CACHE_PATH, file_name)
+	if not os.path.exists(path):
+		return None
+	stale = stale_sources(path)
+	if stale:
+		print(f"Ignoring {path}: built from different {' and '.join(stale)} than the current files; "
+			  f"rerun `python -m scripts.build_neighbors` (--update after appending papers)")
+		return None
+	return NeighborGraph.load(path)
+
+
+def similar_papers(uid, k=10, graph=None):
+	"""Row ids of the k papers most similar to row `uid` (empty if there's no graph or no entry)."""
+	graph = graph or get_neighbor_graph()
+	if graph is None:
+		return np.empty(0, dtype=np.int32)
+	return graph.neighbors(int(uid), k)[0]
+
+
+def feed_from_papers(uids, k=20, graph=None, exclude=None):
+	"""
+	"Because you liked ..." feed: union of the neighbor lists of `uids`, each neighbor scored
+	by sum(1 / (rank + 1)) over the lists it appears in, so papers near several likes rise.
+	Returns up to k row ids, best first, excluding `uids` and `exclude`.
+	"""
+	graph = graph or get_neighbor_graph()
+	if graph is None or len(uids) == 0:
+		return np.empty(0, dtype=np.int64)
+	lists = [graph.neighbors(int(u))[0] for u in uids]
+	ids = np.concatenate(lists).astype(np.int64)
+	if not len(ids):
+		return ids
+	weights = np.concatenate([1.0 / np.arange(1, len(l) + 1) for l in lists])
+	uniq, inv = np.unique(ids, return_inverse=True)
+	scores = np.zeros(len(uniq))
+	np.add.at(scores, inv, weights)
+	drop = np.isin(uniq, np.concatenate([np.asarray(uids, dtype=np.int64), np.asarray(exclude or [], dtype=np.int64)]))
+	scores[drop] = -np.inf
+	top = np.argsort(-scores, kind="stable")[:k]
+	return uniq[top[np.isfinite(scores[top])]]
@@ -0,0 +1,99 @@
+import numpy as np
+from app.cache import normalize_query
+from app.metrics import span
+from app.mmr import MMRState
+from app.rerank import default_chain, features_for, score
+
+# session key `search(session=...)` keeps the pool under
+POOL_KEY = "candidate_pool"
+# a session pool fetches at least this many candidates, so toggles and "more results" stay local
+POOL_SIZE = 50
+
+
+class CandidatePool:
+	"""
+	Everything one query fetched, kept per session: candidate ids and base distances in
+	retrieval order, their gathered vectors and the query vector. `rank` re-derives any
+	result list from it locally:
+
+	- growing top_k continues each resumable MMRState instead of restarting the greedy pass
+	- personalization on/off (or a new blend weight) re-scores the gathered vectors through
+	  the re-ranking chain (app.rerank); the user's interest centroids are kept per profile version
+	"""
+
+	def __init__(self, query, mode, index_version, q_embedding, ids, distances, vectors, widened_for=None, n_widened=0,
+				 corpus=None):
+		self.query = normalize_query(query)
+		self.mode = mode
+		self.index_version = index_version
+		self.corpus = corpus  # corpus_version of the context it was fetched from (keys interest centroids)
+		self.q_embedding = q_embedding
+		self.ids = np.asarray(ids, dtype=np.int64)
+		self.distances = np.asarray(distances, dtype=np.float32)
+		self.vectors = np.asarray(vectors, dtype=np.float32)
+		self.widened_for = widened_for  # (user, profile version) whose interests widened the fetch, if any
+		self.n_widened = n_widened      # interest candidates appended after the query's own
+		self._user_vectors = {}  # (user, profile version) -> interest centroids (k, d) or None
+		self._orders = {}        # (n, profile, blend_weight) -> (candidate order, their relevance scores)
+		self._mmr = {}           # (n, profile, blend_weight, lambda_param) -> MMRState
+
+	def __len__(self):
+		return len(self.ids)
+
+	def matches(self, query, mode, index_version, n, widened_for=None):
+		"""Same query, retrieval mode, index and interest widening, and at least n candidates deep."""
+		return (self.query == normalize_query(query) and self.mode == mode and self.widened_for == widened_for
+				and self.index_version == index_version and n <= len(self.ids))
+
+	def _user_vector(self, user, df, embeddings, profile=None):
+		if profile is not None:
+			key = (user, profile[0])
+			self._user_vectors.setdefault(key, profile[1])
+			return key, self._user_vectors[key]
+		from app.users import get_user_interests
+		version, interests = get_user_interests(user, embeddings, df, corpus=self.corpus)
+		return (user, version), self._user_vectors.setdefault((user, version), interests)
+
+	def _order(self, n, user, blend_weight, df, embeddings, features, profile=None):
+		"""
+		Candidate positions (within the first n) sorted by re-ranked relevance (RERANK_CHAIN,
+		personalized if `user`), with their scores; retrieval order and the base relevance
+		(rerank.base_relevance) if no scorer applies.
+		"""
+		profile, user_vector = self._user_vector(user, df, embeddings, profile) if user else (None, None)
+		key = (n, profile, blend_weight if user_vector is not None else None)
+		if key not in self._orders:
+			features = features if features is not None else features_for(df)
+			scores, changed = score(self.ids[None, :n], self.distances[None, :n], features, default_chain(blend_weight),
+									self.mode, vectors=self.vectors[None, :n], query=self.q_embedding,
+									interests=user_vector)
+			if changed:
+				order = np.argsort(-scores[0], kind="stable")
+				self._orders[key] = (order, scores[0][order])
+			else:
+				self._orders[key] = (np.arange(n), scores[0])
+		return key, self._orders[key]
+
+	def rank(self, top_k, n, use_mmr=True, lambda_param=0.7, user=None, blend_weight=0.25, df=None, embeddings=None,
+			 features=None, stage=span, profile=None):
+		"""
+		Row ids of the top_k results drawn from the first n candidates (n = the non-pooled search depth).
+		`stage(name)` times each step (default `span`; a search passes `Deadline.stage`). `profile`:
+		`user`'s (profile version, interest centroids) when the caller already has them; otherwise
+		they are looked up here.
+		"""
+		n = min(n, len(self.ids))
+		if n == 0:
+			return self.ids[:0]
+		# personalization and MMR are timed as separate stages (the chain's scorers also as rerank_<name>)
+		with stage("personalize" if user else "rank"):
+			key, (order, scores) = self._order(n, user, blend_weight, df, embeddings, features, profile)
+		if not use_mmr:
+			return self.ids[order[:top_k]]
+		with stage("mmr"):
+			state_key = key + (lambda_param,)
+			state = self._mmr.get(state_key)
+			if state is None:
+				# MMR trades the relevance (the BM25 / fused order for lexical and hybrid pools) against redundancy
+				state = self._mmr[state_key] = MMRState(self.q_embedding, self.vectors[order], lambda_param, relevance=scores)
+			return self.ids[order[state.extend(top_k)]]
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+
+class QuantizedEmbeddings:
+	"""
+	Read-only (n, d) embedding matrix stored as float16 or int8 codes.
+
+	int8 uses per-dimension affine scaling (x ~= code * scale + offset, code in [-128, 127]),
+	the same scheme as FAISS' QT_8bit. Indexing (`X[ids]`, `X[a:b]`) returns float32 rows,
+	so callers that only gather small candidate sets never materialize the full matrix.
+	"""
+
+	def __init__(self, codes, scale=None, offset=None):
+		self.codes = codes
+		self.scale = scale
+		self.offset = offset
+
+	@property
+	def storage(self):
+		return "int8" if self.codes.dtype == np.int8 else "float16"
+
+	@property
+	def shape(self):
+		return self.codes.shape
+
+	@property
+	def ndim(self):
+		return 2
+
+	@property
+	def dtype(self):
+		return np.dtype(np.float32)
+
+	@property
+	def nbytes(self):
+		extra = 0 if self.scale is None else self.scale.nbytes + self.offset.nbytes
+		return int(self.codes.nbytes + extra)
+
+	def __len__(self):
+		return self.codes.shape[0]
+
+	def __getitem__(self, idx):
+		rows = np.asarray(self.codes[idx], dtype=np.float32)
+		if self.scale is not None:
+			rows *= self.scale
+			rows += self.offset
+		return rows
+
+	def __array__(self, dtype=None, copy=None):
+		# full dequantization; only for callers that really need the whole float32 matrix
+		return self[:].astype(dtype or np.float32, copy=False)
+
+
+def _int8_params(embeddings, chunk_size):
+	lo = np.full(embeddings.shape[1], np.inf, dtype=np.float32)
+	hi = np.full(embeddings.shape[1], -np.inf, dtype=np.float32)
+	for i in range(0, len(embeddings), chunk_size):
+		block = np.asarray(embeddings[i:i + chunk_size], dtype=np.float32)
+		lo = np.minimum(lo, block.min(axis=0))
+		hi = np.maximum(hi, block.max(axis=0))
+	scale = np.maximum(hi - lo, 1e-12) / 255.0
+	offset = lo + 128.0 * scale
+	return scale.astype(np.float32), offset.astype(np.float32)
+
+
+def quantize_embeddings(embeddings, storage, chunk_size=100000):
+	"""Quantize a float32 (n, d) array (or memmap) chunk by chunk into a QuantizedEmbeddings."""
+	if storage == "float16":
+		codes = np.empty(embeddings.shape, dtype=np.float16)
+		for i in range(0, len(embeddings), chunk_size):
+			codes[i:i + chunk_size] = embeddings[i:i + chunk_size]
+		return QuantizedEmbeddings(codes)
+	if storage == "int8":
+		scale, offset = _int8_params(embeddings, chunk_size)
+		codes = np.empty(embeddings.shape, dtype=np.int8)
+		for i in range(0, len(embeddings), chunk_size):
+			block = (np.asarray(embeddings[i:i + chunk_size], dtype=np.float32) - offset) / scale
+			codes[i:i + chunk_size] = np.clip(np.rint(block), -128, 127)
+		return QuantizedEmbeddings(codes, scale, offset)
+	raise ValueError(f"storage must be one of {STORAGE_TYPES[1:]}, got {storage!r}")
+
+
+def compressed_path(embed_path, storage):
+	# .cache/openai_text_embedding_3_small.npy -> .cache/openai_text_embedding_3_small.int8.npy
+	return embed_path[:-len(".npy")] + f".{storage}.npy"
+
+
+def save_quantized(q, embed_path):
+	"""
+	Write the codes (and int8 scales) next to `embed_path` via temp file + rename, so processes
+	mapping the previous codes keep a consistent file, plus a sidecar fingerprinting `embed_path`.
+	"""
+	from app.similarity_search import write_sources_meta
+	path = compressed_path(embed_path, q.storage)
+	np.save(path + ".tmp.npy", q.codes)
+	os.replace(path + ".tmp.npy", path)
+	if q.scale is not None:
+		scales = path[:-len(".npy")] + ".scales.npz"
+		np.savez(scales + ".tmp.npz", scale=q.scale, offset=q.offset)
+		os.replace(scales + ".tmp.npz", scales)
+	write_sources_meta(path, names=("embeddings",), embed_path=embed_path, storage=q.storage, shape=list(q.shape))
+	return path
+
+
+def quantized_path(embed_path, storage):
+	"""
+	Path of the `storage` codes for `embed_path`, (re)building them first when they are missing or
+	were not compressed from the current `embed_path` (per their sidecar; codes without one are
+	rebuilt once, since nothing says which matrix they came from).
+	"""
+	from app.similarity_search import stale_sources
+	path = compressed_path(embed_path, storage)
+	if os.path.exists(path):
+		stale = stale_sources(path, embed_path=embed_path)
+		if stale == []:
+			return path
+		print(f"{path} was not compressed from the current {embed_path}; compressing it again...")
+	else:
+		print(f"Compressing {embed_path} to {storage}...")
+	save_quantized(quantize_embeddings(np.load(embed_path, mmap_mode="r"), storage), embed_path)
+	return path
+
+
+def load_quantized(embed_path, storage, mmap=True):
+	"""
+	Load the compressed matrix for `embed_path`, building it from the float32 file on first use
+	and again whenever that file changes. Codes are memory-mapped by default so only gathered
+	rows are paged in.
+	"""
+	path = quantized_path(embed_path, storage)
+	codes = np.load(path, mmap_mode="r" if mmap else None)
+	if storage == "float16":
+		return QuantizedEmbeddings(codes)
+	with np.load(path[:-len(".npy")] + ".scales.npz") as z:
+		return QuantizedEmbeddings(codes, z["scale"], z["offset"])
@@ -1,41 +1,315 @@
 from app import settings
 from app.api import get_query_embedding
-from app.similarity_search import get_lookup_table
-from app.mmr import maximal_marginal_relevance as mmr
+from app.similarity_search import get_lookup_table, index_version
+from app.neighbors import feed_from_papers, similar_papers
+from app.dedup import collapse
+from app.cache import LRUCache, normalize_query
+from app.deadline import Deadline, DeadlineExceeded, expected_ms
+from app import metrics
+from app.metrics import span
+from app.lexical import reciprocal_rank_fusion
+from app.pool import CandidatePool, POOL_KEY, POOL_SIZE
 from app.llm import llm_explain
+from app.typeahead import record_query
+from app.versions import GlobalContext, use_context
 import pandas as pd
 import numpy as np
 import os
+import time
 
+SEARCH_MODES = ("dense", "hybrid", "lexical")
 
-def search(query: str, top_k: int = 5, index=None, filename="faiss_index.index", use_mmr=True, fetch_k = 25, llm=True, user=None, use_personalization=True):
-	from app.users import personalize_scores, add_search_history
+# whole-result cache shared by all sessions in this process; see `search`
+results_cache = LRUCache(settings.result_cache_size)
+# query vectors by normalized query, so a query whose embedding call misses its deadline can
+# still run dense if it (or an earlier call that finished in the background) was embedded before
+query_embeddings = LRUCache(1024)
 
-	q_embedding = get_query_embedding(query)
-	df, embeddings, faiss_index = get_lookup_table(index=index, filename=filename)
 
-	search_k = fetch_k if use_mmr else top_k
+def _lexical_candidates(query, q_embedding, faiss_index, search_k, mode, bm25):
+	"""BM25 (optionally fused with FAISS via RRF) candidates as a FAISS-shaped (D, I) pair."""
+	_, lex_ids = bm25.search(query, search_k)
+	if mode == "hybrid":
+		_, dense_I = faiss_index.search(np.array([q_embedding], dtype=np.float32), search_k)
+		ids, scores = reciprocal_rank_fusion([dense_I[0], lex_ids], search_k)
+	else:
+		ids, scores = reciprocal_rank_fusion([lex_ids], search_k)
+	# fused score -> distance-like value in [0, 1) so personalization can blend it like an L2 distance
+	D = 1.0 - scores / scores.max() if len(scores) else scores
+	return D[None, :].astype(np.float32), ids[None, :]
+
+
+def search(query: str, top_k: int = 5, index=None, filename=None, use_mmr=True, fetch_k = 25, llm=True, user=None, use_personalization=True, mode=None,
+		   lambda_param=0.7, blend_weight=0.25, query_embedding=None, session=None, deadline_ms=None, record=True):
+	"""
+	mode: "dense" (FAISS only), "hybrid" (BM25 + FAISS fused with RRF) or "lexical" (BM25 only).
+	If the query embedding call fails or times out, falls back to lexical retrieval.
+	lambda_param: MMR relevance/diversity trade-off; blend_weight: share of the user-profile score.
+	query_embedding: precomputed query vector (skips the embedding call; used by scripts.evaluate).
+	session: dict-like (e.g. st.session_state) that keeps this query's candidate pool, so a
+	  larger top_k or changed toggles re-rank it locally instead of searching again (see _search).
+	deadline_ms: overall time budget (default SEARCH_DEADLINE_MS; 0 = none). A query embedding that
+	  misses its share falls back to a cached vector or lexical search; MMR/personalization that
+	  would overrun is skipped (FAISS order); a late LLM call returns no explanation. Fallback or
+	  trimmed results are not cached; results whose explanation was late are, and the explanation
+	  is added to their entry if the call still finishes.
+	record: count the query toward typeahead history / popularity (startup warmup replays don't).
+
+	Results are cached on (normalized query, top_k, use_mmr, fetch_k, mode, lambda_param,
+	blend_weight, the user's profile version when personalizing by their likes, index version);
+	likes/unlikes bump the profile version and a rebuilt or swapped index has a new version, so
+	hits are never stale. `llm` is not part of the key: a hit on an entry cached without an
+	explanation (e.g. by warmup) generates one and stores it with the entry.
+
+	With published index versions (app.versions) the search holds the active RetrievalContext
+	until it returns, so a hot-swap mid-search never mixes rows from two corpora.
+	"""
+	mode = mode or settings.search_mode
+	if mode not in SEARCH_MODES:
+		raise ValueError(f"mode must be one of {SEARCH_MODES}, got {mode!r}")
+
+	deadline = Deadline(settings.search_deadline_ms if deadline_ms is None else deadline_ms)
+	with metrics.trace_query(query, top_k=top_k, mode=mode, use_mmr=use_mmr, fetch_k=fetch_k), span("search_total"), use_context() as ctx:
+		return _cached_search(query, top_k, index, filename, use_mmr, fetch_k, llm, user, use_personalization, mode,
+							  lambda_param, blend_weight, query_embedding, session, deadline, ctx, record)
+
+
+def _cached_search(query, top_k, index, filename, use_mmr, fetch_k, llm, user, use_personalization, mode,
+				   lambda_param, blend_weight, query_embedding, session, deadline=None, ctx=None, record=True):
+	from app.users import add_search_history, get_user_interests
+
+	ctx = ctx or GlobalContext()
+	with span("load"):
+		if index is None and filename is None:
+			df, embeddings, faiss_index = ctx.lookup()
+		else:
+			df, embeddings, faiss_index = get_lookup_table(index=index, filename=filename)
+
+	# (profile version, interest centroids), read once per search; a user without interests (no
+	# likes) gets the anonymous results, so they share its cache entry
+	profile = None
 	if user and use_personalization:
+		version, interests = get_user_interests(user, embeddings, df, corpus=ctx.corpus_version)
+		profile = (version, interests) if interests is not None else None
+	key = (normalize_query(query), top_k, use_mmr, fetch_k, mode, lambda_param, blend_weight,
+		   (user, profile[0]) if profile else None, index_version(faiss_index, ctx))
+	cached = results_cache.get(key)
+	metrics.incr("result_cache_total", result="miss" if cached is None else "hit")
+	metrics.annotate(cache_hit=cached is not None)
+	if cached is None:
+		start = time.perf_counter()
+		deadline = deadline or Deadline()
+		results, I, used_mode = _search(query, top_k, df, embeddings, faiss_index, use_mmr, fetch_k, user if profile else None, mode,
+										lambda_param, blend_weight, query_embedding, session, deadline, ctx, profile)
+		explanation = None
+		# a lexical fallback or a deadline-trimmed ranking is degraded; don't pin it in the cache
+		if used_mode == mode and not deadline.degraded:
+			results_cache.put(key, (results, I, None), cost_ms=(time.perf_counter() - start) * 1000)
+			if llm and results:
+				explanation = _explain_entry(key, query, results, I, deadline)
+		else:
+			if used_mode != mode:
+				metrics.incr("search_fallback_total", requested=mode, used=used_mode)
+				metrics.annotate(fallback=used_mode)
+			if llm and results:
+				explanation = _explain(query, results, deadline)
+	else:
+		results, I, explanation = cached
+		results = [dict(r) for r in results]
+		if llm and explanation is None and results:
+			# cached without an explanation (warmup, an earlier llm=False search or a late LLM call): add one
+			explanation = _explain_entry(key, query, cached[0], I, deadline or Deadline())
+	if not llm:
+		explanation = None
+
+	if user:
+		with span("history_write"):
+			add_search_history(user, query, results)
+	if record:
+		record_query(user, query)
+	return results, df, I, explanation
+
+
+def _explain(query, results, deadline, on_late=None):
+	"""
+	LLM explanation of `results` within what's left of the deadline; None if it would overrun
+	(a call already running then finishes in the background and passes its text to `on_late`).
+	"""
+	slo_ms = deadline.budget_ms("llm") if deadline.enabled else None
+	try:
+		return deadline.call("llm", lambda: llm_explain(query, results, slo_ms=slo_ms), on_late=on_late)
+	except DeadlineExceeded as e:
+		print(f"Explanation: {e}; returning results without it.")
+		deadline.skip("llm")
+		return None
+
+
+def _explain_entry(key, query, results, I, deadline):
+	"""`_explain` for the results cached under `key`, storing the explanation with them (even a late one)."""
+	start = time.perf_counter()
+
+	def store(explanation):
+		if explanation is not None:
+			results_cache.replace(key, (results, I, explanation), extra_cost_ms=(time.perf_counter() - start) * 1000)
+
+	explanation = _explain(query, results, deadline, on_late=store)
+	store(explanation)
+	return explanation
+
+
+def _interest_candidates(faiss_index, embeddings, q_embedding, interests, exclude, extra_k):
+	"""
+	Widen recall toward a user's interests: one batched index search with the query shifted
+	toward each interest centroid; up to extra_k new candidates per interest, with their
+	squared L2 distance to the query itself so they rank alongside the query's own hits.
+	"""
+	q = np.asarray(q_embedding, dtype=np.float32)
+	q_norm = np.linalg.norm(q)
+	shifted = q[None] + interests / (np.linalg.norm(interests, axis=1, keepdims=True) + 1e-12) * q_norm
+	shifted *= q_norm / (np.linalg.norm(shifted, axis=1, keepdims=True) + 1e-12)
+	_, I = faiss_index.search(np.ascontiguousarray(shifted, dtype=np.float32), extra_k)
+	ids = np.unique(I[I >= 0])
+	ids = ids[~np.isin(ids, exclude)]
+	D = ((np.asarray(embeddings[ids], dtype=np.float32) - q) ** 2).sum(axis=1).astype(np.float32)
+	order = np.argsort(D, kind="stable")
+	return ids[order], D[order]
+
+
+def _embed_query(query, key):
+	q_embedding = get_query_embedding(query, timeout=settings.query_embed_timeout, max_retries=1)
+	query_embeddings.put(key, q_embedding)
+	return q_embedding
+
+
+def _fetch_pool(query, mode, faiss_index, embeddings, search_k, q_embedding, version, deadline=None, ctx=None,
+				interests=None, widened_for=None):
+	"""
+	Embed (unless given), retrieve search_k candidates and gather their vectors into a CandidatePool.
+	With `interests` (a user's centroids) dense retrieval also appends INTEREST_RECALL_K
+	candidates per interest (see _interest_candidates).
+	"""
+	deadline = deadline or Deadline()
+	ctx = ctx or GlobalContext()
+	if mode == "lexical":
+		q_embedding = None
+	elif q_embedding is None:
+		key = (normalize_query(query), settings.embed_provider, settings.openai_embed_model)
+		q_embedding = query_embeddings.get(key)
+		if q_embedding is None:
+			try:
+				with span("embed"):
+					q_embedding = deadline.call("embed", lambda: _embed_query(query, key))
+			except DeadlineExceeded as e:
+				print(f"Query embedding: {e}; falling back to lexical search.")
+				deadline.skip("embed")
+				mode = "lexical"
+			except Exception as e:
+				print(f"Query embedding failed ({e}); falling back to lexical search.")
+				mode = "lexical"
+
+	if mode == "dense":
+		with span("faiss"):
+			D, I = faiss_index.search(np.array([q_embedding], dtype=np.float32), search_k)
+	else:
+		with span("lexical" if mode == "lexical" else "hybrid"):
+			D, I = _lexical_candidates(query, q_embedding, faiss_index, search_k, mode, ctx.bm25)
+		if q_embedding is None and I.shape[1]:
+			# no query vector: use the centroid of the top lexical hits as a pseudo-query for MMR
+			q_embedding = embeddings[I[0][:5]].mean(axis=0).astype(np.float32)
+
+	keep = I[0] >= 0
+	ids, D = I[0][keep], D[0][keep]
+	widened = np.zeros(len(ids), dtype=bool)
+	if mode == "dense" and interests is not None and settings.interest_recall_k > 0:
+		with span("interest_recall"):
+			extra_ids, extra_D = _interest_candidates(faiss_index, embeddings, q_embedding, interests, ids, settings.interest_recall_k)
+		ids, D = np.concatenate([ids, extra_ids]), np.concatenate([D, extra_D])
+		widened = np.concatenate([widened, np.ones(len(extra_ids), dtype=bool)])
+	else:
+		widened_for = None
+	canonical = ctx.canonical if settings.collapse_duplicates else None
+	if canonical is not None:
+		# one slot per near-duplicate cluster (its best-ranked version), before MMR sees them
+		with span("dedup"):
+			ids, D, widened = collapse(ids, D, widened, canonical=canonical)
+	with span("gather"):
+		vectors = embeddings[ids]
+	return CandidatePool(query, mode, version, q_embedding, ids, D, vectors, widened_for, int(widened.sum()),
+						 ctx.corpus_version)
+
+
+def _search(query, top_k, df, embeddings, faiss_index, use_mmr, fetch_k, user, mode,
+			lambda_param=0.7, blend_weight=0.25, q_embedding=None, session=None, deadline=None, ctx=None, profile=None):
+	"""
+	`profile`: the user's (profile version, interest centroids) as read by `_cached_search`.
+	With a `session` (any dict-like, e.g. st.session_state) the fetched candidate pool is kept
+	there, so the same query with a larger top_k, other toggles or weights is re-ranked locally:
+	no embedding call, no index scan, and MMR continues from where it stopped.
+
+	`deadline` (app.deadline.Deadline) is checked before each stage; see `search`. Personalization
+	must fit in what's left on its own, MMR together with personalization; whichever doesn't is
+	skipped (MMR first, so a personalized list can still come back without diversification).
+	"""
+	deadline = deadline or Deadline()
+	search_k = fetch_k if use_mmr else top_k
+	if user:
 		search_k = max(search_k, 50)
+	# "more results" can ask for more than search_k: fetch and rank at least top_k deep
+	depth = max(search_k, top_k)
 
-	D, I = faiss_index.search(np.array([q_embedding], dtype=np.float32), search_k)
+	version = index_version(faiss_index, ctx)
+	if user and profile is None:
+		from app.users import get_user_interests
+		profile = get_user_interests(user, embeddings, df, corpus=(ctx or GlobalContext()).corpus_version)
+	widened_for = None
+	if user and mode == "dense" and settings.interest_recall_k > 0:
+		widened_for = (user, profile[0])
+	pool = session.get(POOL_KEY) if session is not None else None
+	if pool is not None and pool.matches(query, mode, version, depth, widened_for):
+		metrics.incr("candidate_pool_total", result="reuse")
+	else:
+		# a session pool is fetched wide enough that toggles and "more results" stay local
+		size = max(depth, POOL_SIZE) if session is not None else depth
+		interests = profile[1] if widened_for is not None else None
+		pool = _fetch_pool(query, mode, faiss_index, embeddings, size, q_embedding, version, deadline, ctx,
+						   interests, widened_for)
+		if session is not None:
+			metrics.incr("candidate_pool_total", result="fetch")
+			session[POOL_KEY] = pool
 
-	if user and use_personalization:
-		candidate_embeddings = embeddings[I[0]]
-		D[0] = personalize_scores(user, q_embedding, candidate_embeddings, D[0], df, embeddings, blend_weight=0.25)
-		sorted_indices = np.argsort(D[0])
-		I[0] = I[0][sorted_indices]
-		D[0] = D[0][sorted_indices]
+	if user and not deadline.fits("personalize"):
+		# re-scoring would overrun: keep the retrieval order
+		deadline.skip("personalize")
+		user = None
+	if use_mmr and not deadline.fits("mmr", reserve_ms=expected_ms("personalize") if user else 0.0):
+		deadline.skip("mmr")
+		use_mmr = False
+	# interest-widened candidates sit after all of the query's own and are ranked with them, so
+	# with any the whole pool is ranked; otherwise its first search_k
+	own = len(pool) - pool.n_widened
+	n = len(pool) if pool.n_widened else min(search_k, own)
+	features = (ctx or GlobalContext()).features
+	# pool.rank times personalize / mmr / rank through the deadline, which learns their durations for `fits`
+	ids = pool.rank(top_k, n, use_mmr, lambda_param, user, blend_weight, df, embeddings, features, stage=deadline.stage,
+					profile=profile)
+	if len(ids) < top_k and n < len(pool):
+		# past search_k ("more results"): keep that list and continue from a ranking of the whole
+		# pool (fetched at least top_k deep); its depth doesn't move with top_k, so neither do earlier pages
+		deeper = pool.rank(top_k, len(pool), use_mmr, lambda_param, user, blend_weight, df, embeddings, features,
+						   stage=deadline.stage, profile=profile)
+		ids = np.concatenate([ids, deeper[~np.isin(deeper, ids)]])[:top_k]
 
-	if use_mmr:
-		print("MMR Re-ranking Candidates...")
-		selected_idx = mmr(q_embedding, embeddings[I[0]], top_k=top_k)
-		I = I[:, selected_idx]
+	with span("rows"):
+		results = _rows(df, ids)
+	return results, ids, pool.mode
 
+
+def _rows(df, ids):
 	results = []
-	for idx in I[0]:
+	for idx in ids:
 		row = df.iloc[int(idx)]
 		item = {
+			"idx": int(idx),
 			"title": row["title"],
 			"abstract": row["abstract"],
 			"url_pdf": row.get("url_pdf") if hasattr(row, "get") else row["url_pdf"],
@@ -43,17 +317,77 @@ def search(query: str, top_k: int = 5, index=None, filename="faiss_index.index",
 			"date": row.get("date") if hasattr(row, "get") else row["date"]
 		}
 		results.append(item)
+	return results
+
+
+def has_neighbor_graph():
+	"""Whether the serving corpus has a precomputed neighbor graph (scripts.build_neighbors)."""
+	with use_context() as ctx:
+		return ctx.graph is not None
+
+
+def related_papers(uid, k=5):
+	"""Result items for the k papers nearest to row `uid`, from the precomputed neighbor graph (no index search)."""
+	return related_papers_many([uid], k)[0]
+
+
+def related_papers_many(uids, k=5):
+	"""`related_papers` for each of `uids` under one context hold (one sidecar round trip for a page of results)."""
+	with use_context() as ctx, span("related"):
+		graph = ctx.graph
+		if graph is None:
+			return [[] for _ in uids]
+		canonical = ctx.canonical if settings.collapse_duplicates else None
+		out = []
+		for uid in uids:
+			ids = similar_papers(uid, k * 2 if canonical is not None else k, graph=graph)
+			if canonical is not None and uid < len(canonical):
+				# other versions of the paper itself aren't "similar papers"
+				ids = collapse(ids[canonical[ids] != canonical[uid]], canonical=canonical)[0]
+			out.append(_rows(ctx.df, ids[:k]))
+		return out
+
+
+def liked_feed(username, k=10):
+	"""Papers near the user's liked papers (neighbor-graph lookups only), liked ones excluded."""
+	from app.users import get_liked_papers
+	with use_context() as ctx, span("liked_feed"):
+		graph, url_index = ctx.graph, ctx.url_index
+		if graph is None:
+			return []
+		uids = [url_index[p["paper_url"]] for p in get_liked_papers(username) if p.get("paper_url") in url_index]
+		ids = feed_from_papers(uids, k, graph=graph)
+		canonical = ctx.canonical if settings.collapse_duplicates else None
+		if canonical is not None:
+			ids = collapse(ids, canonical=canonical)[0]
+		return _rows(ctx.df, ids)
 
-	if user:
-		add_search_history(user, query, results)
 
-	explanation = None
-	if llm:
-		explanation = llm_explain(query, results)
-	return results, df, I[0], explanation
+def recommended_papers(username):
+	"""
+	The user's nightly "new papers for you" list resolved to result items (with their score), or None.
+	Row ids are used as stored when the list was computed on the serving corpus; after a corpus
+	change they are re-resolved by paper URL and papers no longer present are dropped.
+	"""
+	from app.users import get_recommendations
+	recs = get_recommendations(username)
+	if not recs or not recs.get("papers"):
+		return None
+	with use_context() as ctx:
+		papers = recs["papers"]
+		if recs.get("corpus") == ctx.corpus_version:
+			ids = [p["idx"] for p in papers]
+		else:
+			url_index = ctx.url_index
+			papers = [p for p in papers if p.get("paper_url") in url_index]
+			ids = [url_index[p["paper_url"]] for p in papers]
+		items = _rows(ctx.df, ids)
+	for item, paper in zip(items, papers):
+		item["score"] = paper.get("score")
+	return dict(recs, papers=items)
 
 
-def _test_search(query=None, use_mmr=True, filename="faiss_index.index"):
+def _test_search(query=None, use_mmr=True, filename=None):
 	if query is None:
 		query = input("Enter a search query: ")
 	results, df, indices, explanation = search(query, use_mmr=use_mmr, filename=filename)
@@ -0,0 +1,231 @@
+"""
+Offline "new papers for you" lists for every user (run nightly by scripts.recommend_users).
+
+The parent process loads the active corpus version once (parquet, embeddings, FAISS index,
+url index, BM25); forked workers inherit all of it copy-on-write, so adding workers adds no
+loads. Each worker takes a chunk of users, builds their query vectors (interest
+centroids from likes, plus pseudo-queries for recent searches) and runs ONE batched index
+search for the whole chunk, then ONE batched re-ranking pass (app.rerank: RERANK_CHAIN, then
+MMR) over the chunk's fused lists, so a list isn't k near-copies of one interest.
+
+Forking is only safe while the parent has never started an OpenMP thread pool (FAISS's libgomp
+doesn't re-create it in the child, whose first parallel search can then hang), so the parent
+loads and warms the corpus with OpenMP pinned to one thread. Run the job in its own process
+(scripts.recommend_users); a process that already ran multi-threaded searches should use workers=1.
+"""
+import multiprocessing as mp
+import os
+import time
+import faiss
+import numpy as np
+from app import settings
+from app.rerank import rerank
+
+HISTORY_QUERIES = 10   # most recent distinct searches that feed a profile
+HISTORY_WEIGHT = 0.5   # vote weight of a search-history vector relative to a liked-papers interest
+_job = {}              # corpus shared with forked workers (set in the parent before the pool starts)
+
+
+def _history_vector(query, bm25, embeddings, hits=5):
+	"""Pseudo-query vector for a past search: mean of its top BM25 hits (no embedding API calls offline)."""
+	_, ids = bm25.search(query, hits)
+	if not len(ids):
+		return None
+	v = np.asarray(embeddings[np.sort(ids)], dtype=np.float32).mean(axis=0)
+	return v / (np.linalg.norm(v) + 1e-12)
+
+
+def profile_vectors(username, embeddings, df, bm25, history_queries=HISTORY_QUERIES, corpus=None):
+	"""(vectors, weights, liked rows) for one user: interest centroids, then recent-search vectors."""
+	from app import users
+	user_data = users.get_user_data(username) or {}
+	liked = users._liked_rows(user_data, df)
+	vectors, weights = [], []
+	interests = users.compute_user_interests(username, embeddings, df, corpus=corpus) if liked else None
+	if interests is not None:
+		vectors.extend(interests / (np.linalg.norm(interests, axis=1, keepdims=True) + 1e-12))
+		weights.extend([1.0] * len(interests))
+	seen = set()
+	for entry in reversed(user_data.get("search_history", [])):
+		if len(seen) >= history_queries:
+			break
+		q = (entry.get("query") or "").strip().lower()
+		if not q or q in seen:
+			continue
+		seen.add(q)
+		v = _history_vector(q, bm25, embeddings)
+		if v is not None:
+			vectors.append(v)
+			weights.append(HISTORY_WEIGHT)
+	return np.asarray(vectors, dtype=np.float32).reshape(-1, embeddings.shape[1]), np.asarray(weights), liked
+
+
+def _merge(I, weights, exclude, k, canonical=None):
+	"""
+	Fuse one user's per-vector result lists: each candidate scores sum(weight / (rank + 1)),
+	as in the liked-papers feed. Liked papers (and their near-duplicates) are excluded.
+	"""
+	ids = I.ravel()
+	w = (weights[:, None] / np.arange(1, I.shape[1] + 1)[None, :]).ravel()
+	valid = ids >= 0
+	if len(exclude):
+		valid &= ~np.isin(ids, exclude)
+		if canonical is not None:
+			valid &= ~np.isin(canonical[np.clip(ids, 0, len(canonical) - 1)], canonical[exclude])
+	ids, w = ids[valid], w[valid]
+	if not len(ids):
+		return ids, w
+	uniq, inv = np.unique(ids, return_inverse=True)
+	scores = np.zeros(len(uniq))
+	np.add.at(scores, inv, w)
+	if canonical is not None:
+		# one version per near-duplicate cluster: the best-scored one
+		order = np.argsort(-scores, kind="stable")
+		_, first = np.unique(canonical[uniq[order]], return_index=True)
+		keep = order[np.sort(first)]
+		uniq, scores = uniq[keep], scores[keep]
+	top = np.argsort(-scores, kind="stable")[:k]
+	return uniq[top], scores[top]
+
+
+def _rerank_lists(lists, profiles, k, embeddings, features, use_mmr, lambda_param):
+	"""
+	One batched `rerank` over the users' fused lists (padded to a (B, n) block): rank-fusion
+	scores as hybrid pseudo-distances, each user's weighted mean profile vector as the query.
+	Returns per user the top k (ids, fused scores) in re-ranked order.
+	"""
+	n = max(len(ids) for ids, _ in lists)
+	I = np.full((len(lists), n), -1, dtype=np.int64)
+	D = np.ones((len(lists), n), dtype=np.float32)
+	for b, (ids, scores) in enumerate(lists):
+		I[b, :len(ids)] = ids
+		D[b, :len(ids)] = 1.0 - scores / scores[0]
+	Q = np.stack([(w[:, None] * v).sum(axis=0) for v, w, _ in profiles]).astype(np.float32)
+	V = np.asarray(embeddings[np.maximum(I, 0)], dtype=np.float32)
+	out = rerank(I, D, V, Q, k, features, use_mmr=use_mmr, lambda_param=lambda_param, mode="hybrid")
+	ranked = []
+	for (ids, scores), row in zip(lists, out):
+		row = row[row >= 0]
+		sorter = np.argsort(ids)
+		ranked.append((row, scores[sorter[np.searchsorted(ids, row, sorter=sorter)]]))
+	return ranked
+
+
+def _recommend_chunk(args):
+	"""
+	Worker: profile vectors for a chunk of users, one batched index search, per-user fused lists,
+	one batched re-ranking pass over them.
+	"""
+	usernames, k, per_vector, history, use_mmr, lambda_param = args
+	embeddings, df, bm25, index = _job["embeddings"], _job["df"], _job["bm25"], _job["index"]
+	start = time.perf_counter()
+	profiles = [profile_vectors(u, embeddings, df, bm25, history, _job["corpus"]) for u in usernames]
+	profile_s = time.perf_counter() - start
+	Q = [p[0] for p in profiles]
+	out = []
+	if sum(len(q) for q in Q):
+		depth = per_vector + max(len(p[2]) for p in profiles)  # room for liked papers that get excluded
+		_, I = index.search(np.ascontiguousarray(np.concatenate(Q)), min(depth, index.ntotal))
+	offset, fused = 0, []
+	for u, (vectors, weights, liked) in zip(usernames, profiles):
+		if not len(vectors):
+			out.append((u, None, None))
+			continue
+		rows = I[offset:offset + len(vectors)]
+		offset += len(vectors)
+		# fuse a deeper list than k: the re-ranking pass picks the k from it
+		ids, scores = _merge(rows, weights, np.asarray(liked, dtype=np.int64), max(k, per_vector), _job.get("canonical"))
+		out.append((u, ids, scores))
+		if len(ids):
+			fused.append(len(out) - 1)
+	if fused:
+		ranked = _rerank_lists([out[i][1:] for i in fused], [profiles[i] for i in fused], k, embeddings, _job["features"],
+							   use_mmr, lambda_param)
+		for i, (ids, scores) in zip(fused, ranked):
+			out[i] = (out[i][0], ids, scores)
+	return out, profile_s, time.perf_counter() - start - profile_s
+
+
+def _init_worker(threads):
+	faiss.omp_set_num_threads(threads)
+
+
+def recommend_all(usernames=None, k=20, per_vector=50, history=HISTORY_QUERIES, workers=None, chunk_size=64,
+				  write=True, progress=True, use_mmr=True, lambda_param=0.7):
+	"""
+	Recommendation lists for `usernames` (default: every user), written to the user store
+	unless write=False. Returns a report with users/sec and the time split per phase.
+	use_mmr / lambda_param: MMR in the re-ranking pass and its relevance/diversity trade-off,
+	as in `search`.
+	"""
+	from app import users
+	from app.versions import use_context
+
+	t0 = time.perf_counter()
+	omp_threads = faiss.omp_get_max_threads()
+	# no OpenMP thread pool in the parent before the fork (see the module docstring)
+	faiss.omp_set_num_threads(1)
+	try:
+		with use_context() as ctx:
+			df, embeddings, index = ctx.lookup()
+			users._liked_rows({}, df)  # builds the paper_url -> row map once here, inherited by the workers
+			_job.update(df=df, embeddings=embeddings, index=index, bm25=ctx.bm25, corpus=ctx.corpus_version,
+						features=ctx.features, canonical=ctx.canonical if settings.collapse_duplicates else None)
+			load_s = time.perf_counter() - t0
+			try:
+				return _run(usernames, k, per_vector, history, workers, chunk_size, write, progress, t0, load_s, omp_threads,
+							use_mmr, lambda_param)
+			finally:
+				_job.clear()
+	finally:
+		faiss.omp_set_num_threads(omp_threads)
+
+
+def _run(usernames, k, per_vector, history, workers, chunk_size, write, progress, t0, load_s, omp_threads, use_mmr,
+		 lambda_param):
+	from tqdm import tqdm
+	from app import users
+
+	df = _job["df"]
+	usernames = list(usernames or users.list_users())
+	workers = workers or os.cpu_count() or 1
+	chunks = [(usernames[i:i + chunk_size], k, per_vector, history, use_mmr, lambda_param)
+			  for i in range(0, len(usernames), chunk_size)]
+	t1 = time.perf_counter()
+	results, profile_s, search_s = [], 0.0, 0.0
+	if workers > 1 and len(chunks) > 1:
+		# fork: workers share the parent's DataFrame, BM25 arrays and mapped vectors copy-on-write
+		threads = max(1, omp_threads // workers)
+		with mp.get_context("fork").Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+			for out, p_s, s_s in tqdm(pool.imap_unordered(_recommend_chunk, chunks), total=len(chunks),
+									  desc="Recommending", unit="chunk", disable=not progress):
+				results.extend(out)
+				profile_s, search_s = profile_s + p_s, search_s + s_s
+	else:
+		faiss.omp_set_num_threads(omp_threads)  # no fork follows: search with every thread
+		for chunk in tqdm(chunks, desc="Recommending", unit="chunk", disable=not progress):
+			out, p_s, s_s = _recommend_chunk(chunk)
+			results.extend(out)
+			profile_s, search_s = profile_s + p_s, search_s + s_s
+	compute_s = time.perf_counter() - t1
+
+	t2 = time.perf_counter()
+	written = 0
+	urls = df["paper_url"].to_numpy()
+	for username, ids, scores in results:
+		if ids is None:
+			continue
+		papers = [{"idx": int(i), "paper_url": urls[i], "score": round(float(score), 4)} for i, score in zip(ids, scores)]
+		if write and users.set_recommendations(username, papers, users.get_profile_version(username), _job["corpus"]):
+			written += 1
+	write_s = time.perf_counter() - t2
+
+	total_s = time.perf_counter() - t0
+	return {
+		"users": len(usernames), "with_profile": sum(ids is not None for _, ids, _ in results), "written": written,
+		"workers": workers, "load_s": round(load_s, 2), "compute_s": round(compute_s, 2), "write_s": round(write_s, 2),
+		"total_s": round(total_s, 2),
+		"profile_cpu_s": round(profile_s, 2), "search_cpu_s": round(search_s, 2),
+		"users_per_s": round(len(usernames) / compute_s, 1) if compute_s else None,
+		"users_per_s_end_to_end": round(len(usernames) / total_s, 1) if total_s else None,
+	}
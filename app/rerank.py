@@ -0,0 +1,254 @@
+"""
+Re-ranking over a candidate pool: a chain of vectorized scorers applied to (B, n) arrays of
+candidate ids and relevance scores, so one query (B = 1, `CandidatePool.rank`) and a batch of
+queries (`rerank`, e.g. a chunk of users' nightly recommendation lists) take the same path.
+
+Relevance starts on the cosine scale MMR compares against: 1 - D / 2 for dense retrieval (the
+cosine similarity for unit vectors under squared L2); lexical / hybrid distances are rank-fusion
+pseudo-distances, so their fused order is spread over the range of the candidates' cosine
+similarity to the query instead. Then each scorer in RERANK_CHAIN adjusts it in one pass over
+the whole block:
+
+- `personalization`: blend with the similarity to the user's closest interest (blend_weight)
+- `recency`: + RECENCY_WEIGHT * 0.5 ** (age / RECENCY_HALF_LIFE_DAYS)
+- `pdf`: + PDF_WEIGHT for papers with a PDF link
+- `citations`: + CITATIONS_WEIGHT * log1p(citations) / log1p(max), if the parquet has the column
+
+Diversity (MMR) is the last step and selects from the re-scored block. The per-row inputs
+the scorers read are precomputed once per corpus as typed NumPy columns (`Features`).
+Each scorer is timed as stage `rerank_<name>`. Recency and PDF weights default to 0, so out of
+the box only personalization re-scores and rankings match the pre-chain ones.
+"""
+from datetime import date
+import numpy as np
+import pandas as pd
+from app import settings
+from app.metrics import span
+from app.mmr import batched_mmr
+
+EPOCH = date(1970, 1, 1)
+CITATION_COLUMNS = ("citations", "n_citations", "citation_count")
+
+
+class Features:
+	"""
+	Per-row columns the scorers read, aligned with the parquet / FAISS ids:
+
+	- `days` (int32): publication date as days since 1970-01-01, -1 if unknown
+	- `has_pdf` (bool): a PDF link is present
+	- `citations` (float32): citation count, only if the parquet has one of CITATION_COLUMNS
+	"""
+
+	def __init__(self, columns):
+		self.columns = columns
+
+	def __contains__(self, name):
+		return name in self.columns
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	@property
+	def nbytes(self):
+		return int(sum(c.nbytes for c in self.columns.values()))
+
+	@classmethod
+	def from_df(cls, df):
+		dates = _to_days(df["date"]) if "date" in df else np.full(len(df), -1, dtype=np.int32)
+		columns = {"days": dates}
+		if "url_pdf" in df:
+			pdf = df["url_pdf"]
+			columns["has_pdf"] = (pdf.notna() & (pdf.astype(str).str.len() > 0)).to_numpy()
+		for name in CITATION_COLUMNS:
+			if name in df:
+				columns["citations"] = df[name].fillna(0).to_numpy(dtype=np.float32)
+				break
+		return cls(columns)
+
+
+def _to_days(dates):
+	"""Publication dates (strings or timestamps) -> int32 days since 1970-01-01, -1 where unparseable."""
+	parsed = pd.to_datetime(dates, errors="coerce")
+	days = (parsed.to_numpy(dtype="datetime64[D]") - np.datetime64(EPOCH, "D")).astype(np.float64)
+	days[parsed.isna().to_numpy()] = -1
+	return days.astype(np.int32)
+
+
+_features = {}  # id(df) -> (df, Features) for callers without a context
+
+
+def features_for(df):
+	"""Features of `df`, computed once per DataFrame (contexts keep their own, see versions.py)."""
+	cached = _features.get(id(df))
+	if cached is None or cached[0] is not df:
+		_features.clear()
+		cached = _features[id(df)] = (df, Features.from_df(df))
+	return cached[1]
+
+
+class Scorer:
+	"""One step of the chain: adjusts `scores` (B, n) in place for candidate `ids` (B, n)."""
+
+	name = "scorer"
+
+	def __init__(self, weight):
+		self.weight = weight
+
+	@property
+	def active(self):
+		return self.weight > 0
+
+	def __call__(self, scores, ids, features, inputs):
+		raise NotImplementedError
+
+
+class TimeDecay(Scorer):
+	name = "recency"
+
+	def __init__(self, weight, half_life_days):
+		super().__init__(weight)
+		self.half_life_days = half_life_days
+
+	def __call__(self, scores, ids, features, inputs):
+		days = features["days"][ids]
+		age = np.maximum((inputs.get("today") or date.today()).toordinal() - EPOCH.toordinal() - days, 0)
+		decay = np.exp2(-age / self.half_life_days).astype(np.float32)
+		scores += self.weight * np.where(days >= 0, decay, 0.0)
+
+
+class HasPdf(Scorer):
+	name = "pdf"
+
+	def __call__(self, scores, ids, features, inputs):
+		if "has_pdf" in features:
+			scores += self.weight * features["has_pdf"][ids]
+
+
+class Citations(Scorer):
+	name = "citations"
+
+	def __call__(self, scores, ids, features, inputs):
+		if "citations" in features:
+			c = np.log1p(features["citations"])
+			scores += self.weight * c[ids] / max(float(c.max()), 1e-9)
+
+
+class Personalization(Scorer):
+	"""
+	(1 - w) * relevance + w * (1 + s) / 2, with s the cosine similarity to the user's closest
+	interest: the old distance blend (1 - w) * D + w * (1 - s) on the same scale, so the
+	order without MMR is unchanged.
+	"""
+
+	name = "personalization"
+
+	def __call__(self, scores, ids, features, inputs):
+		interests, vectors = inputs.get("interests"), inputs.get("vectors")
+		if interests is None or vectors is None:
+			return
+		U = np.atleast_2d(interests).astype(np.float32)
+		U = U / (np.linalg.norm(U, axis=1, keepdims=True) + 1e-12)
+		X = vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+		s = (X @ U.T).max(axis=-1)
+		scores *= 1.0 - self.weight
+		scores += self.weight * (1.0 + s) / 2.0
+
+
+SCORERS = {"personalization": Personalization, "recency": TimeDecay, "pdf": HasPdf, "citations": Citations}
+
+
+def default_chain(blend_weight=0.25):
+	"""The RERANK_CHAIN scorers with their configured weights (personalization uses blend_weight)."""
+	chain = []
+	for name in (n.strip() for n in settings.rerank_chain.split(",")):
+		if not name:
+			continue
+		if name not in SCORERS:
+			raise ValueError(f"unknown re-ranking scorer {name!r}; choose from {sorted(SCORERS)}")
+		if name == "personalization":
+			chain.append(Personalization(blend_weight))
+		elif name == "recency":
+			chain.append(TimeDecay(settings.recency_weight, settings.recency_half_life_days))
+		elif name == "pdf":
+			chain.append(HasPdf(settings.pdf_weight))
+		else:
+			chain.append(Citations(settings.citations_weight))
+	return chain
+
+
+def _row_range(x, valid):
+	lo = np.where(valid, x, np.inf).min(axis=1, keepdims=True)
+	hi = np.where(valid, x, -np.inf).max(axis=1, keepdims=True)
+	ok = np.isfinite(lo)
+	return np.where(ok, lo, 0.0), np.where(ok, hi, 0.0)
+
+
+def base_relevance(distances, valid, mode="dense", vectors=None, query=None):
+	"""
+	(B, n) relevance before the chain, on the cosine scale MMR's redundancy term uses. Dense:
+	1 - D / 2. Lexical / hybrid (D = 1 - fused / max fused): the fused scores min-max scaled onto
+	[min, max] of the candidates' cosine similarity to `query` (B, d), so the fused order is kept;
+	1 - D without vectors.
+	"""
+	D = np.atleast_2d(distances).astype(np.float32)
+	if mode == "dense":
+		return 1.0 - D / 2.0
+	fused = 1.0 - D
+	if vectors is None or query is None:
+		return fused
+	Q = np.atleast_2d(query).astype(np.float32)
+	Q = Q / (np.linalg.norm(Q, axis=1, keepdims=True) + 1e-12)
+	X = vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+	sim = np.einsum("bnd,bd->bn", X, Q)
+	f_lo, f_hi = _row_range(fused, valid)
+	s_lo, s_hi = _row_range(sim, valid)
+	spread = f_hi - f_lo
+	t = np.divide(fused - f_lo, spread, out=np.ones_like(fused), where=spread > 0)
+	return (s_lo + t * (s_hi - s_lo)).astype(np.float32)
+
+
+def score(ids, distances, features, chain, mode="dense", **inputs):
+	"""
+	Relevance of (B, n) candidates after the chain; returns (scores, changed) where `changed`
+	says whether any scorer ran. Padding ids (-1) score -inf. `mode` is the retrieval mode the
+	distances come from (see base_relevance). `inputs`: vectors (B, n, d), query (B, d),
+	interests (k, d), today (date).
+	"""
+	ids = np.atleast_2d(ids)
+	valid = ids >= 0
+	safe = np.where(valid, ids, 0)
+	scores = base_relevance(distances, valid, mode, inputs.get("vectors"), inputs.get("query"))
+	changed = False
+	for scorer in chain:
+		if not scorer.active or (scorer.name == "personalization" and inputs.get("interests") is None):
+			continue
+		with span(f"rerank_{scorer.name}"):
+			scorer(scores, safe, features, inputs)
+		changed = True
+	scores[~valid] = -np.inf
+	return scores, changed
+
+
+def rerank(ids, distances, vectors, query_vecs, top_k, features, use_mmr=True, lambda_param=0.7,
+		   interests=None, blend_weight=0.25, chain=None, today=None, mode="dense"):
+	"""
+	Batched re-ranking: (B, n) candidate ids / distances and their (B, n, d) vectors for (B, d)
+	queries -> (B, top_k) re-ranked ids (-1 padded). One chain pass over the whole block, then
+	either a sort or batched MMR over the re-scored relevance; per row the same ids as
+	`CandidatePool.rank` on that row's candidates.
+	"""
+	ids = np.atleast_2d(ids)
+	chain = default_chain(blend_weight) if chain is None else chain
+	scores, _ = score(ids, distances, features, chain, mode, vectors=vectors, query=query_vecs,
+							interests=interests, today=today)
+	k = min(top_k, ids.shape[1])
+	if not use_mmr:
+		with span("rerank_sort"):
+			order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+	else:
+		with span("rerank_diversity"):
+			order = batched_mmr(query_vecs, vectors, lambda_param=lambda_param, top_k=k, valid=ids >= 0,
+								relevance=scores)
+	out = np.take_along_axis(ids, np.maximum(order, 0), axis=1)
+	out[(order < 0) | ~np.isfinite(np.take_along_axis(scores, np.maximum(order, 0), axis=1))] = -1
+	return out
@@ -0,0 +1,247 @@
+"""
+Retrieval sidecar: one process loads the DataFrame, embeddings and FAISS index and serves
+`search` over a local socket; Streamlit / API workers connect as thin clients and keep none
+of the corpus in memory.
+
+	python -m app.serving                          # listens on RETRIEVAL_SERVER (default .cache/retrieval.sock)
+	RETRIEVAL_SERVER=.cache/retrieval.sock streamlit run app/ui_app.py
+
+Combine with SHARED_MMAP=true to also let several sidecars (or in-process workers) share
+one page-cache copy of the vectors.
+
+Requests are pickled, so a host:port address needs RETRIEVAL_AUTHKEY (connections are
+authenticated before anything is unpickled); `index` and `reload` also need ADMIN_TOKEN.
+
+A client's `session` (e.g. st.session_state) never crosses the socket: the client keeps a
+random token in it and the server keeps that session's candidate pool under the token, so
+"more results" and toggles re-rank the pool in the sidecar as they would in-process.
+"""
+import argparse
+import hmac
+import os
+import threading
+import time
+import traceback
+import uuid
+from multiprocessing.connection import Client, Listener
+from app import settings
+from app.cache import LRUCache
+
+DEFAULT_ADDRESS = os.path.join(settings.cache_dir, "retrieval.sock")
+SESSION_TOKEN_KEY = "retrieval_session"  # where a RetrievalClient keeps its token in a caller's session
+MAX_SESSIONS = 1024  # sidecar-side session pools kept (least recently used dropped first)
+
+
+def parse_address(address=None):
+	"""'host:port' -> AF_INET tuple, anything else is a unix socket path."""
+	address = address or settings.retrieval_server or DEFAULT_ADDRESS
+	host, sep, port = address.rpartition(":")
+	if sep and port.isdigit() and "/" not in address:
+		return (host or "127.0.0.1", int(port))
+	return address
+
+
+def _authkey(authkey=None):
+	key = authkey if authkey is not None else settings.retrieval_authkey
+	return key.encode() if key else None
+
+
+def _check_admin(token):
+	"""Same rule as the API's /admin/* endpoints: ADMIN_TOKEN must be set and match."""
+	if not settings.admin_token:
+		raise PermissionError("admin requests are disabled; set ADMIN_TOKEN")
+	if not hmac.compare_digest(str(token or "").encode(), settings.admin_token.encode()):
+		raise PermissionError("bad admin token")
+
+
+class RetrievalServer:
+	"""
+	Serves `search`, `suggest`, `similar` / `similar_many` / `feed` (neighbor graph), `recommendations` (nightly lists),
+	`stats`, `index` / `reload` (index versions, admin token required), `ready` (warmup) and `ping`
+	requests; one thread per connected client, so a slow request (e.g. one waiting on the LLM)
+	doesn't block the other workers.
+	"""
+
+	def __init__(self, address=None, authkey=None):
+		self.address = parse_address(address)
+		self.authkey = _authkey(authkey)
+		if isinstance(self.address, tuple) and not self.authkey:
+			# requests are unpickled: an unauthenticated TCP listener runs whatever it's sent
+			raise ValueError(f"refusing to listen on {self.address[0]}:{self.address[1]} without RETRIEVAL_AUTHKEY; "
+							 "set one or use a unix socket path")
+		self.started = time.time()
+		self.requests = 0
+		self.sessions = LRUCache(MAX_SESSIONS)  # client session token -> dict holding its candidate pool
+
+	def _session(self, token):
+		if not token:
+			return None
+		session = self.sessions.get(token)
+		if session is None:
+			session = {}
+			self.sessions.put(token, session)
+		return session
+
+	def warm(self):
+		"""Load data, embeddings and the index, and warm the caches (app.warmup), before accepting connections."""
+		from app import warmup
+		from app.versions import GlobalContext, active_context
+		df, embeddings, index = (active_context() or GlobalContext()).lookup()
+		print(f"Retrieval server loaded {len(df)} papers, {index.ntotal} vectors")
+		warmup.run()
+
+	def handle(self, method, kwargs):
+		from app.query import liked_feed, recommended_papers, related_papers, related_papers_many, search, results_cache
+		from app.typeahead import suggest
+		from app import metrics, versions, warmup
+		if method == "search":
+			session = self._session(kwargs.pop("session", None))
+			results, _, I, explanation = search(session=session, **kwargs)
+			return results, [int(i) for i in I], explanation
+		if method == "suggest":
+			return suggest(**kwargs)
+		if method == "similar":
+			return related_papers(**kwargs)
+		if method == "similar_many":
+			return related_papers_many(**kwargs)
+		if method == "feed":
+			return liked_feed(**kwargs)
+		if method == "recommendations":
+			return recommended_papers(**kwargs)
+		if method == "stats":
+			return {"cache": results_cache.stats(), "metrics": metrics.snapshot(), "pid": os.getpid(),
+					"uptime_s": round(time.time() - self.started, 1), "requests": self.requests, "sessions": len(self.sessions)}
+		if method == "reload":
+			_check_admin(kwargs.get("token"))
+			if kwargs.get("version"):
+				versions.set_current(kwargs["version"])
+			return versions.reload(kwargs.get("version"))
+		if method == "index":
+			_check_admin(kwargs.get("token"))
+			return versions.status()
+		if method == "ready":
+			return warmup.status()
+		if method == "ping":
+			return "pong"
+		raise ValueError(f"unknown method {method!r}")
+
+	def _serve_connection(self, conn):
+		with conn:
+			while True:
+				try:
+					method, kwargs = conn.recv()
+				except (EOFError, OSError):
+					return
+				self.requests += 1
+				try:
+					conn.send(("ok", self.handle(method, kwargs)))
+				except Exception as e:
+					conn.send(("error", f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+	def serve_forever(self):
+		if isinstance(self.address, str) and os.path.exists(self.address):
+			os.remove(self.address)  # stale socket from a previous run
+		with Listener(self.address, authkey=self.authkey) as listener:
+			print(f"Retrieval server listening on {self.address}")
+			while True:
+				conn = listener.accept()
+				threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class RetrievalClient:
+	"""
+	Drop-in for `app.query.search` that forwards to a RetrievalServer. One connection per
+	calling thread (Streamlit runs each session on its own thread); reconnects once on a
+	broken connection.
+	"""
+
+	def __init__(self, address=None, authkey=None):
+		self.address = parse_address(address)
+		self.authkey = _authkey(authkey)
+		self._local = threading.local()
+
+	def _conn(self):
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = self._local.conn = Client(self.address, authkey=self.authkey)
+		return conn
+
+	def call(self, method, **kwargs):
+		for attempt in (0, 1):
+			try:
+				conn = self._conn()
+				conn.send((method, kwargs))
+				status, payload = conn.recv()
+				break
+			except (EOFError, OSError):
+				self._local.conn = None
+				if attempt:
+					raise
+		if status == "error":
+			raise RuntimeError(f"retrieval server: {payload}")
+		return payload
+
+	def search(self, query, index=None, session=None, **kwargs):
+		"""
+		Same signature and return shape as `app.query.search`; `df` comes back as None (it lives in
+		the server). A dict-like `session` gets a token (SESSION_TOKEN_KEY) naming its pool in the server.
+		"""
+		if index is not None:
+			raise ValueError("a remote search uses the server's index; don't pass one")
+		if session is not None:
+			if SESSION_TOKEN_KEY not in session:
+				session[SESSION_TOKEN_KEY] = uuid.uuid4().hex
+			kwargs["session"] = session[SESSION_TOKEN_KEY]
+		results, I, explanation = self.call("search", query=query, **kwargs)
+		return results, None, I, explanation
+
+	def suggest(self, prefix, user=None, k=8):
+		return self.call("suggest", prefix=prefix, user=user, k=k)
+
+	def similar(self, uid, k=5):
+		return self.call("similar", uid=uid, k=k)
+
+	def similar_many(self, uids, k=5):
+		return self.call("similar_many", uids=list(uids), k=k)
+
+	def feed(self, username, k=10):
+		return self.call("feed", username=username, k=k)
+
+	def recommendations(self, username):
+		return self.call("recommendations", username=username)
+
+	def stats(self):
+		return self.call("stats")
+
+	def index_status(self, token):
+		return self.call("index", token=token)
+
+	def reload(self, version=None, token=None):
+		return self.call("reload", version=version, token=token)
+
+	def close(self):
+		conn = getattr(self._local, "conn", None)
+		if conn is not None:
+			conn.close()
+			self._local.conn = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_retrieval_client():
+	"""Process-wide client for RETRIEVAL_SERVER."""
+	global _client
+	with _client_lock:
+		if _client is None:
+			_client = RetrievalClient()
+		return _client
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--address", help="unix socket path or host:port (default RETRIEVAL_SERVER or .cache/retrieval.sock)")
+	args = parser.parse_args()
+	server = RetrievalServer(args.address)
+	server.warm()
+	server.serve_forever()
@@ -0,0 +1,229 @@
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+import faiss
+import numpy as np
+import pandas as pd
+from app import settings
+from app.embeddings import get_provider
+from app.similarity_search import read_index, source_fingerprints
+
+CACHE_PATH = settings.cache_dir
+SHARD_DIR = os.path.join(CACHE_PATH, "shards")
+MANIFEST = "manifest.json"
+
+
+def shard_keys(df, scheme="year", n_shards=8):
+	"""Shard name for every row: publication year ("unknown" if missing) or a stable hash bucket."""
+	if scheme == "year":
+		years = pd.to_datetime(df["date"], errors="coerce").dt.year
+		return years.map(lambda y: "unknown" if pd.isna(y) else str(int(y))).to_numpy()
+	if scheme == "hash":
+		key = df["paper_url"].fillna(df["title"]) if "paper_url" in df else df["title"]
+		buckets = pd.util.hash_pandas_object(key, index=False).to_numpy() % n_shards
+		return np.array([f"h{b:03d}" for b in buckets])
+	raise ValueError(f"scheme must be 'year' or 'hash', got {scheme!r}")
+
+
+def _write_json_atomic(path, obj):
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(obj, f, indent=2)
+	os.replace(tmp, path)
+
+
+def read_manifest(shard_dir=SHARD_DIR):
+	with open(os.path.join(shard_dir, MANIFEST)) as f:
+		return json.load(f)
+
+
+def build_shard(name, ids, embeddings, shard_dir=SHARD_DIR, chunk_size=100000):
+	"""Build one shard's index + global-id map and write both atomically. Returns its manifest entry."""
+	ids = np.asarray(ids, dtype=np.int64)
+	index = faiss.IndexFlatL2(embeddings.shape[1])
+	for i in range(0, len(ids), chunk_size):
+		index.add(np.ascontiguousarray(embeddings[ids[i:i + chunk_size]], dtype=np.float32))
+	# fresh file names per build, so a live process keeps reading the old files until it swaps
+	stamp = uuid.uuid4().hex[:10]
+	index_file, ids_file = f"shard_{name}.{stamp}.index", f"shard_{name}.{stamp}.ids.npy"
+	faiss.write_index(index, os.path.join(shard_dir, index_file))
+	np.save(os.path.join(shard_dir, ids_file), ids)
+	return {"name": name, "index": index_file, "ids": ids_file, "count": int(len(ids)), "built_at": datetime.now().isoformat()}
+
+
+def _stale(recorded, current):
+	return [name for name, fp in (recorded or {}).items() if name in current and current[name] != fp]
+
+
+def build_shards(df, embeddings, scheme="year", n_shards=8, shard_dir=SHARD_DIR, only=None, provider=None, sources=None):
+	"""
+	Build (or, with `only=[names]`, rebuild just those) shards and update the manifest.
+	Replaced shard files are removed after the manifest points at the new ones.
+
+	The manifest records fingerprints of the embedding file and parquet (`sources`, default the
+	current ones). A partial rebuild is refused unless they still match: its new shards would hold
+	row ids of the current corpus next to untouched shards holding ids of the old one.
+	"""
+	os.makedirs(shard_dir, exist_ok=True)
+	sources = source_fingerprints() if sources is None else sources
+	keys = shard_keys(df, scheme, n_shards)
+	manifest_path = os.path.join(shard_dir, MANIFEST)
+	manifest = read_manifest(shard_dir) if only and os.path.exists(manifest_path) else None
+	if manifest is None:
+		manifest = dict(get_provider(provider).metadata(), scheme=scheme, n_shards=n_shards, sources=sources, shards={})
+	elif manifest["scheme"] != scheme:
+		raise ValueError(f"Manifest uses scheme {manifest['scheme']!r}; rebuild all shards to change it")
+	elif not manifest.get("sources"):
+		raise ValueError(f"Shard manifest in {shard_dir} doesn't record the embeddings/parquet it was built from; "
+						 f"rebuild all shards (without --rebuild)")
+	elif _stale(manifest["sources"], sources):
+		raise ValueError(f"Shards in {shard_dir} were built from different {' and '.join(_stale(manifest['sources'], sources))} "
+						 f"than the current files; rebuild all shards (without --rebuild)")
+
+	names = sorted(set(keys)) if not only else list(only)
+	stale = []
+	for name in names:
+		ids = np.flatnonzero(keys == name)
+		entry = build_shard(name, ids, embeddings, shard_dir)
+		old = manifest["shards"].get(name)
+		entry["version"] = (old or {}).get("version", 0) + 1
+		manifest["shards"][name] = entry
+		if old:
+			stale.append(old)
+		print(f"Built shard {name}: {entry['count']} vectors")
+	if not only:
+		manifest["shards"] = {n: manifest["shards"][n] for n in names}
+	manifest["ntotal"] = sum(s["count"] for s in manifest["shards"].values())
+	_write_json_atomic(manifest_path, manifest)
+
+	for old in stale:
+		for f in (old["index"], old["ids"]):
+			try:
+				os.remove(os.path.join(shard_dir, f))
+			except OSError:
+				pass
+	return manifest
+
+
+class ShardedIndex:
+	"""
+	Fan-out search over per-shard FAISS indexes on a thread pool (FAISS releases the GIL),
+	merging each query's per-shard top-k lists with a heap. Exposes FAISS' `search(xq, k)`
+	with global row ids, so it drops in for the monolithic index.
+
+	`refresh()` (also run from `search` every `refresh_interval` seconds) reloads only shards
+	whose manifest entry changed; a search in flight keeps the shard snapshot it started with,
+	so a swapped-out shard is never half-visible.
+	"""
+
+	def __init__(self, shards, d, max_workers=None, shard_dir=SHARD_DIR, refresh_interval=5.0, sources=None):
+		self._shards = dict(shards)  # name -> (entry, index, ids)
+		self.d = d
+		self.sources = sources  # manifest fingerprints of the corpus the loaded shards index
+		self.shard_dir = shard_dir
+		self.refresh_interval = refresh_interval
+		self._next_refresh = time.monotonic() + refresh_interval
+		self._lock = threading.Lock()
+		self._manifest_mtime = None
+		self._pool = ThreadPoolExecutor(max_workers=max_workers or min(len(self._shards), os.cpu_count() or 1) or 1)
+
+	@classmethod
+	def load(cls, shard_dir=SHARD_DIR, max_workers=None, provider=None, check_sources=True, sources=None):
+		"""
+		Open every shard in the manifest. Raises ValueError if the shards were built with another
+		embedding provider or (when the manifest records them) from other embedding/parquet files
+		than the current ones (or `sources`), like `check_index_meta` for the monolithic index.
+		"""
+		manifest = read_manifest(shard_dir)
+		expected = get_provider(provider).metadata()
+		if any(manifest.get(k) != v for k, v in expected.items()):
+			raise ValueError(f"Shard manifest in {shard_dir} does not match the current embedding provider: {expected}")
+		if check_sources and manifest.get("sources"):
+			stale = _stale(manifest["sources"], source_fingerprints() if sources is None else sources)
+			if stale:
+				raise ValueError(f"Shards in {shard_dir} were built from different {' and '.join(stale)} than the current files; "
+								 f"rebuild them with `python -m scripts.build_shards`")
+		shards = {name: cls._load_shard(shard_dir, entry) for name, entry in manifest["shards"].items()}
+		sharded = cls(shards, manifest["dim"], max_workers=max_workers, shard_dir=shard_dir, sources=manifest.get("sources"))
+		sharded._manifest_mtime = os.path.getmtime(os.path.join(shard_dir, MANIFEST))
+		return sharded
+
+	@staticmethod
+	def _load_shard(shard_dir, entry):
+		index = read_index(os.path.join(shard_dir, entry["index"]))
+		ids = np.load(os.path.join(shard_dir, entry["ids"]), mmap_mode="r" if settings.shared_mmap else None)
+		return entry, index, ids
+
+	@property
+	def ntotal(self):
+		return sum(index.ntotal for _, index, _ in self._shards.values())
+
+	@property
+	def version(self):
+		"""Changes whenever any shard is hot-swapped."""
+		return ",".join(f"{n}:{e.get('version', 0)}" for n, (e, _, _) in sorted(self._shards.items()))
+
+	@property
+	def shard_names(self):
+		return sorted(self._shards)
+
+	def refresh(self):
+		"""Hot-swap shards whose manifest entry changed since load. Returns the swapped shard names."""
+		path = os.path.join(self.shard_dir, MANIFEST)
+		mtime = os.path.getmtime(path) if os.path.exists(path) else None
+		if mtime is None or mtime == self._manifest_mtime:
+			return []
+		manifest = read_manifest(self.shard_dir)
+		if manifest.get("sources") != self.sources:
+			# rebuilt from another corpus: its row ids don't match the parquet this process serves
+			print(f"Not hot-swapping shards from {self.shard_dir}: they index a different corpus; restart to load it")
+			self._manifest_mtime = mtime
+			return []
+		changed = [n for n, e in manifest["shards"].items() if self._shards.get(n, (None,))[0] != e]
+		loaded = {n: self._load_shard(self.shard_dir, manifest["shards"][n]) for n in changed}
+		with self._lock:
+			shards = {n: s for n, s in self._shards.items() if n in manifest["shards"]}
+			shards.update(loaded)
+			self._shards = shards
+			self._manifest_mtime = mtime
+		return changed
+
+	def _search_shard(self, shard, xq, k):
+		_, index, ids = shard
+		if index.ntotal == 0:
+			return np.empty((len(xq), 0), dtype=np.float32), np.empty((len(xq), 0), dtype=np.int64)
+		D, I = index.search(xq, min(k, index.ntotal))
+		return D, np.where(I >= 0, ids[np.maximum(I, 0)], -1)
+
+	def search(self, xq, k):
+		if self.refresh_interval and time.monotonic() >= self._next_refresh:
+			self._next_refresh = time.monotonic() + self.refresh_interval
+			swapped = self.refresh()
+			if swapped:
+				print(f"Hot-swapped shards: {swapped}")
+		xq = np.ascontiguousarray(xq, dtype=np.float32)
+		shards = list(self._shards.values())  # snapshot
+		results = list(self._pool.map(lambda s: self._search_shard(s, xq, k), shards))
+
+		D = np.full((len(xq), k), np.inf, dtype=np.float32)
+		I = np.full((len(xq), k), -1, dtype=np.int64)
+		for b in range(len(xq)):
+			# each shard's list is already sorted, so a k-way heap merge is enough
+			runs = [zip(Ds[b].tolist(), Is[b].tolist()) for Ds, Is in results]
+			for j, (dist, idx) in enumerate(islice(heapq.merge(*runs), k)):
+				D[b, j], I[b, j] = dist, idx
+		return D, I
+
+
+def get_sharded_index(df, embeddings, scheme=None, n_shards=None, shard_dir=SHARD_DIR):
+	"""Load the sharded layout, building every shard first if there is no manifest yet."""
+	if not os.path.exists(os.path.join(shard_dir, MANIFEST)):
+		print("No shard manifest found. Building shards...")
+		build_shards(df, embeddings, scheme or settings.shard_scheme, n_shards or settings.shard_count, shard_dir)
+	return ShardedIndex.load(shard_dir, max_workers=settings.search_threads)
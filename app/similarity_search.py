@@ -1,72 +1,362 @@
 import os
-from re import A
-from IPython import embed
+import json
+import hashlib
+from datetime import datetime
+from functools import lru_cache
 import numpy as np
 import faiss
 import pandas as pd
 from app import settings
-from scripts.quick_filter import FILE
+from app.embeddings import get_provider, embedding_cache_path
+from app.quantize import load_quantized
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
 DATA_PATH = settings.data_dir
 CACHE_PATH = settings.cache_dir
 LOAD_PATH = os.path.join(DATA_PATH, "paperswithcode.parquet")
 
-embedding_cache = "openai_text_embedding_3_small.npy"
+EMBED_PATH = embedding_cache_path()
 
-EMBED_PATH = os.path.join(CACHE_PATH, embedding_cache)
+# FAISS index type matching each embedding storage: exact flat for float32, scalar quantizer otherwise
+SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+INDEX_FILES = {"float32": "faiss_index.index", "float16": "faiss_index_fp16.index", "int8": "faiss_index_sq8.index"}
 
+
+def index_file_name(storage=None):
+	return INDEX_FILES[storage or settings.embed_storage]
+
+@lru_cache(maxsize=1)
 def load_data():
 	df = pd.read_parquet(LOAD_PATH)
 	return df
 
-def load_embeddings():
-	embeddings = np.load(EMBED_PATH)
+@lru_cache(maxsize=1)
+def get_url_index():
+	"""paper_url -> row id in the loaded parquet (first occurrence wins)."""
+	urls = load_data()["paper_url"].tolist()
+	return {u: i for i, u in reversed(list(enumerate(urls))) if isinstance(u, str) and u}
+
+@lru_cache(maxsize=1)
+def load_embeddings(storage=None):
+	"""float32 matrix, or a QuantizedEmbeddings (float16/int8 codes, rows dequantized on gather) per EMBED_STORAGE."""
+	storage = storage or settings.embed_storage
+	if storage != "float32":
+		return load_quantized(EMBED_PATH, storage)
+	# SHARED_MMAP: map the file read-only so every worker process shares one copy in the page cache
+	embeddings = np.load(EMBED_PATH, mmap_mode="r" if settings.shared_mmap else None)
 	return embeddings
 
 
-def get_faiss_index(embeddings, use_cache=True, file_name="faiss_index.index"):
-	"""Create a FAISS L2 index and add numpy float32 embeddings."""
-	# (Optional) keep FAISS single-threaded on macOS/Apple Silicon
-	# try:
-	# 	faiss.omp_set_num_threads(1)
-	# except Exception:
-	# 	pass
-
-	def load_faiss_index(index_path):
-		if os.path.exists(index_path):
-			try:
-				index = faiss.read_index(index_path)
-				return index
-			except Exception as e:
-				print(f"Error loading FAISS index from {index_path}: {e}")
+# zero-copy mapping of the stored vectors (IO_FLAG_MMAP_IFC, faiss >= 1.9); older faiss falls back to IO_FLAG_MMAP
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def read_index(path, mmap=None):
+	"""faiss.read_index; with SHARED_MMAP (or mmap=True) the index is mapped read-only instead of copied into RAM."""
+	if settings.shared_mmap if mmap is None else mmap:
+		return faiss.read_index(path, MMAP_FLAGS)
+	return faiss.read_index(path)
+
+
+def _meta_path(index_path):
+	return index_path + ".json"
+
+
+def _write_json_atomic(path, obj):
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(obj, f, indent=2)
+	os.replace(tmp, path)
+
+
+CHECKSUM_MEMO = os.path.join(CACHE_PATH, "checksums.json")
+_checksums = {}  # path -> (stamp, checksum): this process's view of CHECKSUM_MEMO
+
+
+def file_checksum(path, block_size=1 << 23):
+	"""
+	blake2b of a file, memoized in CHECKSUM_MEMO on (size, mtime) so multi-GB embedding
+	files are only hashed again after they change. Within a process a hit only costs a stat
+	(per-search callers like GlobalContext.corpus_version don't re-read the memo file).
+	"""
+	st = os.stat(path)
+	stamp = [st.st_size, st.st_mtime_ns]
+	key = os.path.abspath(path)
+	if key in _checksums and _checksums[key][0] == stamp:
+		return _checksums[key][1]
+	try:
+		with open(CHECKSUM_MEMO) as f:
+			memo = json.load(f)
+	except (OSError, ValueError):
+		memo = {}
+	if memo.get(key, {}).get("stamp") == stamp:
+		_checksums[key] = (stamp, memo[key]["checksum"])
+		return memo[key]["checksum"]
+	h = hashlib.blake2b(digest_size=16)
+	with open(path, "rb") as f:
+		for block in iter(lambda: f.read(block_size), b""):
+			h.update(block)
+	memo[key] = {"stamp": stamp, "checksum": h.hexdigest()}
+	try:
+		_write_json_atomic(CHECKSUM_MEMO, memo)
+	except OSError:
+		pass
+	_checksums[key] = (stamp, memo[key]["checksum"])
+	return memo[key]["checksum"]
+
+
+def source_fingerprints(embed_path=None, data_path=None):
+	"""Size + checksum of the embedding matrix and the parquet an index was built from (missing files skipped)."""
+	out = {}
+	for name, path in (("embeddings", embed_path or EMBED_PATH), ("data", data_path or LOAD_PATH)):
+		if os.path.exists(path):
+			out[name] = {"file": os.path.basename(path), "size": os.path.getsize(path), "checksum": file_checksum(path)}
+	return out
+
+
+def write_index_meta(index_path, index, provider=None, sources=None):
+	"""
+	Sidecar next to the index recording which embedding provider/model/dimension built it,
+	how many vectors it holds and checksums of the embedding file and parquet behind it.
+	"""
+	meta = dict(get_provider(provider).metadata(), ntotal=int(index.ntotal), index_dim=int(index.d), index_type=type(index).__name__,
+				sources=source_fingerprints() if sources is None else sources, built_at=datetime.now().isoformat())
+	_write_json_atomic(_meta_path(index_path), meta)
+	return meta
+
+
+def check_index_meta(index_path, index, provider=None, expected_dim=None, check_sources=True, embed_path=None, data_path=None):
+	"""
+	Raise ValueError if the index was built with a different provider/model/dimension, or
+	(when the sidecar has checksums) from a different embedding file or parquet than the current
+	ones (or `embed_path` / `data_path`, e.g. the copies in a published version).
+	"""
+	provider = get_provider(provider)
+	expected = provider.metadata()
+	expected_dim = expected_dim or provider.dim
+	meta_path = _meta_path(index_path)
+	if not os.path.exists(meta_path):
+		# pre-sidecar index (e.g. downloaded): the dimension is all we can check
+		if index.d != expected_dim:
+			raise ValueError(f"FAISS index {index_path} has dimension {index.d}, expected {expected_dim} for provider {provider.name}/{provider.model}")
 		return None
+	with open(meta_path) as f:
+		meta = json.load(f)
+	mismatched = {k: (meta.get(k), v) for k, v in expected.items() if meta.get(k) != v}
+	if mismatched or meta.get("index_dim", index.d) != index.d or index.d != expected_dim:
+		raise ValueError(f"FAISS index {index_path} does not match the current embedding provider: {mismatched or meta}")
+	if meta.get("ntotal", index.ntotal) != index.ntotal:
+		raise ValueError(f"FAISS index {index_path} holds {index.ntotal} vectors but its sidecar says {meta['ntotal']}; rebuild it")
+	if check_sources and meta.get("sources"):
+		current = source_fingerprints(embed_path, data_path)
+		stale = [name for name, fp in meta["sources"].items() if name in current and current[name] != fp]
+		if stale:
+			raise ValueError(f"FAISS index {index_path} was built from different {' and '.join(stale)} than the current files; "
+							 f"rebuild it with `python -m scripts.build_index --force`")
+	return meta
+
+
+def write_sources_meta(path, names=("embeddings", "data"), embed_path=None, data_path=None, **extra):
+	"""
+	Sidecar `<path>.json` for a cache derived from the corpus (BM25, neighbor graph, canonical ids, ...):
+	`extra` fields plus fingerprints of the source files in `names` it was built from.
+	"""
+	current = source_fingerprints(embed_path, data_path)
+	meta = dict(extra, sources={name: current[name] for name in names if name in current}, built_at=datetime.now().isoformat())
+	_write_json_atomic(_meta_path(path), meta)
+	return meta
+
+
+def stale_sources(path, embed_path=None, data_path=None):
+	"""
+	Names of the source files that changed since the cache at `path` was built, per its
+	`write_sources_meta` sidecar ([] if none did, None if there's no sidecar to check).
+	"""
+	try:
+		with open(_meta_path(path)) as f:
+			recorded = json.load(f).get("sources")
+	except (OSError, ValueError):
+		return None
+	if not recorded:
+		return None
+	current = source_fingerprints(embed_path, data_path)
+	return [name for name, fp in recorded.items() if name in current and current[name] != fp]
+
+
+def build_index(embeddings, index_path, storage="float32", chunk_size=100000, threads=None, train_size=100000,
+				resume=True, checkpoint_every=10, provider=None, progress=True):
+	"""
+	Stream `embeddings` (an array or np.load(..., mmap_mode="r")) into a new FAISS index chunk by chunk.
 
+	- trained index types (scalar quantizer) are trained on a `train_size` random sample
+	- `threads`: FAISS OpenMP threads (default: all cores)
+	- every `checkpoint_every` chunks the partial index is saved to `<index_path>.partial`;
+	  with `resume=True` an interrupted build over the same source files continues from there
+	- the finished index and its sidecar are written to temp files and renamed into place,
+	  so readers never see a half-written index
+	"""
+	from tqdm import tqdm
+	faiss.omp_set_num_threads(threads or os.cpu_count() or 1)
+	n, d = embeddings.shape
+	sources = source_fingerprints()
+	partial, partial_meta = index_path + ".partial", index_path + ".partial.json"
 
-	faiss_file = os.path.join(CACHE_PATH, file_name)
-	index = load_faiss_index(faiss_file)
-	if use_cache and index is not None:
+	index = None
+	if resume and os.path.exists(partial) and os.path.exists(partial_meta):
+		with open(partial_meta) as f:
+			state = json.load(f)
+		if state.get("sources") == sources and state.get("storage") == storage and state.get("n") == n:
+			index = faiss.read_index(partial)
+			print(f"Resuming index build at {index.ntotal}/{n} vectors")
+	if index is None:
+		if storage == "float32":
+			index = faiss.IndexFlatL2(d)
+		else:
+			index = faiss.IndexScalarQuantizer(d, SQ_TYPES[storage], faiss.METRIC_L2)
+			sample = np.random.default_rng(settings.seed).choice(n, min(n, train_size), replace=False)
+			# sorted sample: sequential reads from an mmap
+			index.train(np.ascontiguousarray(embeddings[np.sort(sample)], dtype=np.float32))
+
+	starts = range(index.ntotal, n, chunk_size)
+	for j, i in enumerate(tqdm(starts, desc="Adding vectors", unit="chunk", disable=not progress)):
+		# one chunk in RAM at a time; compressed storage is dequantized per block
+		index.add(np.ascontiguousarray(embeddings[i:i + chunk_size], dtype=np.float32))
+		if checkpoint_every and (j + 1) % checkpoint_every == 0 and index.ntotal < n:
+			faiss.write_index(index, partial + ".tmp")
+			os.replace(partial + ".tmp", partial)
+			_write_json_atomic(partial_meta, {"sources": sources, "storage": storage, "n": n, "ntotal": int(index.ntotal)})
+
+	tmp = index_path + ".tmp"
+	faiss.write_index(index, tmp)
+	os.replace(tmp, index_path)
+	write_index_meta(index_path, index, provider, sources=sources)
+	for f in (partial, partial_meta):
+		if os.path.exists(f):
+			os.remove(f)
+	return index
+
+
+def get_faiss_index(embeddings, use_cache=True, file_name=None, provider=None, storage=None, chunk_size=100000):
+	"""
+	Load the cached FAISS L2 index, or build it from numpy float32 embeddings (see `build_index`).
+	`storage` float16/int8 builds a matching scalar-quantizer index (IndexScalarQuantizer).
+	A cached index that can't be read or whose sidecar doesn't match the current provider,
+	embedding file or parquet raises instead of being silently rebuilt.
+	"""
+	storage = storage or settings.embed_storage
+	faiss_file = os.path.join(CACHE_PATH, file_name or index_file_name(storage))
+	if use_cache and os.path.exists(faiss_file):
+		try:
+			index = read_index(faiss_file)
+		except Exception as e:
+			raise ValueError(f"Could not read FAISS index {faiss_file} ({e}); rebuild it with `python -m scripts.build_index --force`") from e
+		check_index_meta(faiss_file, index, provider)
 		print(f"Loaded existing FAISS index with {index.ntotal} vectors.")
 		return index
 
 	print("No existing FAISS index found. Creating a new one...")
-
-	d = embeddings.shape[1]
-	index = faiss.IndexFlatL2(d)
-	index.add(embeddings)
-
-	# Save index to file
-	faiss.write_index(index, faiss_file)
+	index = build_index(embeddings, faiss_file, storage, chunk_size, provider=provider)
 	print(
-		f"FAISS index with {index.ntotal} vectors of dimension {d} created and saved to {os.path.join(CACHE_PATH, 'faiss_index.index')}"
+		f"FAISS index with {index.ntotal} vectors of dimension {index.d} created and saved to {faiss_file}"
 	)
 
 	return index
 
-def get_lookup_table(index=None, filename="faiss_index.index"):
+def _truncate(x, dim):
+	x = np.array(np.asarray(x)[..., :dim], dtype=np.float32, order="C")  # always a copy: normalized in place below
+	x /= np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+	return x
+
+
+def get_truncated_index(embeddings, dim, use_cache=True, chunk_size=100000, provider=None):
+	"""
+	Inner-product index over the first `dim` components of each embedding, re-normalized
+	(Matryoshka truncation; text-embedding-3 vectors keep most of their ranking quality).
+	"""
+	faiss_file = os.path.join(CACHE_PATH, f"faiss_index_d{dim}.index")
+	if use_cache and os.path.exists(faiss_file):
+		index = read_index(faiss_file)
+		check_index_meta(faiss_file, index, provider, expected_dim=dim)
+		print(f"Loaded truncated FAISS index ({dim} dims) with {index.ntotal} vectors.")
+		return index
+
+	print(f"Creating truncated FAISS index ({dim} of {embeddings.shape[1]} dims)...")
+	index = faiss.IndexFlatIP(dim)
+	for i in range(0, len(embeddings), chunk_size):
+		index.add(_truncate(embeddings[i:i + chunk_size], dim))
+	faiss.write_index(index, faiss_file + ".tmp")
+	os.replace(faiss_file + ".tmp", faiss_file)
+	write_index_meta(faiss_file, index, provider)
+	return index
+
+
+def index_version(index, ctx=None):
+	"""
+	Identity of an index's contents for cache keys: the published version when `index` is that
+	versioned context's index, else `index.version` if it has one, else object id + size.
+	"""
+	if ctx is not None and ctx.version is not None and getattr(ctx, "index", None) is index:
+		return ctx.version
+	version = getattr(index, "version", None)
+	return version if version is not None else f"{id(index)}:{index.ntotal}"
+
+
+class TwoStageIndex:
+	"""
+	Coarse search on the truncated index for a wide pool (`pool_factor * k`), then an exact
+	L2 re-score on full vectors for only those candidates. Exposes the FAISS `search`
+	signature and returns squared L2 distances, so it drops in for IndexFlatL2.
+	"""
+
+	def __init__(self, coarse_index, embeddings, pool_factor=8):
+		self.coarse = coarse_index
+		self.embeddings = embeddings
+		self.dim = coarse_index.d
+		self.pool_factor = pool_factor
+		self.d = embeddings.shape[1]
+		self.ntotal = coarse_index.ntotal
+
+	@property
+	def version(self):
+		return f"two-stage:{self.dim}:{id(self.coarse)}:{self.ntotal}"
+
+	def search(self, xq, k):
+		xq = np.asarray(xq, dtype=np.float32)
+		pool = min(max(k * self.pool_factor, k), self.ntotal)
+		_, C = self.coarse.search(_truncate(xq, self.dim), pool)
+		valid = C >= 0
+		cand = self.embeddings[np.where(valid, C, 0).ravel()].reshape(C.shape[0], pool, self.d)
+		dist = ((cand - xq[:, None, :]) ** 2).sum(axis=2)
+		dist[~valid] = np.inf
+		order = np.argsort(dist, axis=1)[:, :k]
+		D = np.take_along_axis(dist, order, axis=1).astype(np.float32)
+		I = np.take_along_axis(C, order, axis=1)
+		I[~np.isfinite(D)] = -1
+		return D, I
+
+
+def get_two_stage_index(embeddings, dim=None, pool_factor=None):
+	dim = dim or settings.truncate_dim
+	coarse = get_truncated_index(embeddings, dim)
+	return TwoStageIndex(coarse, embeddings, pool_factor or settings.two_stage_pool)
+
+
+@lru_cache(maxsize=4)
+def get_default_index(filename=None):
+	"""The index `search` uses when none is passed in: sharded, two-stage or monolithic per settings."""
+	embeddings = load_embeddings()
+	if settings.shard_scheme:
+		from app.shards import get_sharded_index
+		return get_sharded_index(load_data(), embeddings)
+	if settings.truncate_dim:
+		return get_two_stage_index(embeddings)
+	return get_faiss_index(embeddings, file_name=filename)
+
+
+def get_lookup_table(index=None, filename=None):
 	df = load_data()
 	embeddings = load_embeddings()
 	if index is not None:
 		return df, embeddings, index
-	faiss_index = get_faiss_index(embeddings, file_name=filename)
+	faiss_index = get_default_index(filename)
 	return df, embeddings, faiss_index
\ No newline at end of file
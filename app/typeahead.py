@@ -0,0 +1,242 @@
+"""
+Query typeahead: completions of what the user has typed so far, from (best first)
+
+- the user's own search_history (most recent first),
+- popular searches across all users (the queries startup warmup pre-runs, so they hit the caches),
+- common title phrases and paper titles: a compact sorted prefix index built once per corpus.
+
+History and popularity are loaded lazily and updated incrementally by `record_query` as
+searches come in; the title/phrase index is rebuilt only with the corpus (it's saved next
+to it, like the BM25 index).
+"""
+import bisect
+import heapq
+import os
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache
+import numpy as np
+from app import settings
+from app.cache import normalize_query
+from app.lexical import STOPWORDS
+
+CACHE_PATH = settings.cache_dir
+TYPEAHEAD_FILE = "typeahead_index.npz"
+MIN_PREFIX = 2           # shorter prefixes match too much to be useful
+HISTORY_SIZE = 100       # per user, like users.add_search_history
+POPULAR_SIZE = 5000      # distinct popular queries kept in memory
+
+# entry kinds in the packed index
+TITLE, PHRASE = 0, 1
+
+
+class PrefixIndex:
+	"""
+	Sorted normalized strings packed into one UTF-8 buffer (`blob`, `offsets`), with per-entry
+	`kinds` (TITLE / PHRASE), `weights` (phrase frequency; titles prefer short ones) and `rows`
+	(parquet row of a title, -1 for phrases). A prefix maps to one contiguous range, found with
+	two binary searches; the best entries in it are picked with argpartition.
+	"""
+
+	def __init__(self, blob, offsets, kinds, weights, rows):
+		self.blob = blob
+		self.offsets = offsets
+		self.kinds = kinds
+		self.weights = weights
+		self.rows = rows
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	@property
+	def nbytes(self):
+		return int(len(self.blob) + self.offsets.nbytes + self.kinds.nbytes + self.weights.nbytes + self.rows.nbytes)
+
+	def key(self, i):
+		return self.blob[self.offsets[i]:self.offsets[i + 1]].decode()
+
+	def _bisect(self, target):
+		lo, hi = 0, len(self)
+		blob, offsets = self.blob, self.offsets
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if blob[offsets[mid]:offsets[mid + 1]] < target:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	def prefix_range(self, prefix):
+		p = prefix.encode()
+		return self._bisect(p), self._bisect(p + b"\xff")  # 0xff never occurs in UTF-8
+
+	def complete(self, prefix, k=8):
+		"""Up to k (key, kind, row) completions of a normalized prefix: phrases by frequency, then short titles."""
+		lo, hi = self.prefix_range(prefix)
+		if lo >= hi or k < 1:
+			return []
+		w = self.weights[lo:hi]
+		top = np.argpartition(-w, k - 1)[:k] if hi - lo > k else np.arange(hi - lo)
+		top = top[np.lexsort((top, -w[top]))]
+		return [(self.key(lo + i), int(self.kinds[lo + i]), int(self.rows[lo + i])) for i in top]
+
+	@classmethod
+	def build(cls, titles, min_phrase_count=5, max_phrases=200000):
+		keys, kinds, weights, rows = [], [], [], []
+		phrases = Counter()
+		for row, title in enumerate(titles):
+			key = normalize_query(title) if isinstance(title, str) else ""
+			if not key:
+				continue
+			keys.append(key)
+			rows.append(row)
+			words = key.split()
+			# 2- and 3-word phrases that neither start nor end with a stopword
+			for n in (2, 3):
+				for i in range(len(words) - n + 1):
+					if words[i] not in STOPWORDS and words[i + n - 1] not in STOPWORDS:
+						phrases[" ".join(words[i:i + n])] += 1
+		# a 2-word phrase that only ever occurs as the start of one 3-word phrase adds nothing
+		for phrase, count in list(phrases.items()):
+			head = phrase.rsplit(" ", 1)[0]
+			if head != phrase and phrase.count(" ") == 2 and phrases.get(head) == count:
+				del phrases[head]
+		kinds = [TITLE] * len(keys)
+		# titles rank below any phrase; among themselves, shorter (closer to the prefix) first
+		weights = [1.0 / len(k) for k in keys]
+		for phrase, count in phrases.most_common(max_phrases):
+			if count < min_phrase_count:
+				break
+			keys.append(phrase)
+			kinds.append(PHRASE)
+			weights.append(float(count))
+			rows.append(-1)
+		order = sorted(range(len(keys)), key=keys.__getitem__)
+		encoded = [keys[i].encode() for i in order]
+		offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+		np.cumsum([len(e) for e in encoded], out=offsets[1:])
+		return cls(b"".join(encoded), offsets, np.asarray(kinds, dtype=np.uint8)[order],
+				   np.asarray(weights, dtype=np.float32)[order], np.asarray(rows, dtype=np.int32)[order])
+
+	def save(self, path):
+		tmp = path + ".tmp.npz"
+		np.savez(tmp, blob=np.frombuffer(self.blob, dtype=np.uint8), offsets=self.offsets, kinds=self.kinds,
+				 weights=self.weights, rows=self.rows)
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path) as z:
+			return cls(z["blob"].tobytes(), z["offsets"], z["kinds"], z["weights"], z["rows"])
+
+
+def build_typeahead_index(df, file_name=TYPEAHEAD_FILE, save=True, data_path=None):
+	start = time.perf_counter()
+	index = PrefixIndex.build(df["title"].tolist())
+	print(f"Built typeahead index: {len(index)} titles + phrases, {index.nbytes / 2**20:.0f} MB "
+		  f"in {time.perf_counter() - start:.1f}s")
+	if save:
+		from app.similarity_search import write_sources_meta
+		path = os.path.join(CACHE_PATH, file_name)
+		index.save(path)
+		write_sources_meta(path, names=("data",), data_path=data_path, entries=len(index))
+	return index
+
+
+@lru_cache(maxsize=1)
+def get_typeahead_index(file_name=TYPEAHEAD_FILE):
+	"""Load the cached title/phrase index, (re)building it from the parquet on first use or once the parquet changed."""
+	from app.similarity_search import load_data, stale_sources
+	path = os.path.join(CACHE_PATH, file_name)
+	if os.path.exists(path):
+		if stale_sources(path):
+			print(f"Typeahead index {path} was built from a different parquet; rebuilding")
+		else:
+			try:
+				return PrefixIndex.load(path)
+			except Exception as e:
+				print(f"Error loading typeahead index from {path}: {e}")
+	return build_typeahead_index(load_data(), file_name=file_name)
+
+
+_lock = threading.Lock()
+_history = {}            # username -> deque of normalized queries, oldest first
+_popular = Counter()     # normalized query -> searches (all users)
+_popular_keys = []       # sorted keys of _popular, for prefix ranges
+_popular_loaded = False
+
+
+def _user_history(username):
+	history = _history.get(username)
+	if history is None:
+		from app.users import get_search_history
+		history = deque((normalize_query(e.get("query")) for e in get_search_history(username) if e.get("query")),
+						maxlen=HISTORY_SIZE)
+		_history[username] = history
+	return history
+
+
+def _load_popular():
+	global _popular_loaded
+	from app.warmup import popular_queries
+	for query, count in popular_queries(POPULAR_SIZE):
+		_popular[normalize_query(query)] += count
+	_popular_keys[:] = sorted(_popular)
+	_popular_loaded = True
+
+
+def record_query(username, query):
+	"""Fold a submitted search into the history / popularity sources (called by `query.search`)."""
+	key = normalize_query(query)
+	if not key:
+		return
+	with _lock:
+		if username:
+			history = _user_history(username)
+			if key in history:
+				history.remove(key)
+			history.append(key)
+		if _popular_loaded:
+			if key not in _popular and len(_popular) < POPULAR_SIZE:
+				bisect.insort(_popular_keys, key)
+			if key in _popular or len(_popular) < POPULAR_SIZE:
+				_popular[key] += 1
+
+
+def suggest(prefix, user=None, k=8, index=None):
+	"""
+	Up to k completions of `prefix` as {"text", "source", "idx"} (idx: parquet row of a title
+	suggestion): the user's history, then popular searches, then title phrases, then titles.
+	"""
+	if k < 1:
+		raise ValueError(f"k must be at least 1, got {k}")
+	key = normalize_query(prefix)
+	if len(key) < MIN_PREFIX:
+		return []
+	if index is None:
+		from app.versions import use_context
+		with use_context() as ctx:
+			index = ctx.typeahead
+	out, seen = [], {key}
+
+	def add(text, source, idx=None):
+		if text not in seen:
+			seen.add(text)
+			out.append({"text": text, "source": source, "idx": idx})
+
+	with _lock:
+		if not _popular_loaded:
+			_load_popular()
+		if user:
+			for q in reversed(_user_history(user)):
+				if q.startswith(key):
+					add(q, "history")
+		lo = bisect.bisect_left(_popular_keys, key)
+		hi = bisect.bisect_left(_popular_keys, key + "\U0010ffff")
+		for q in heapq.nlargest(k, _popular_keys[lo:hi], key=_popular.__getitem__):
+			add(q, "popular")
+	if len(out) < k:
+		for text, kind, row in index.complete(key, k):
+			add(text, "phrase" if kind == PHRASE else "title", row if row >= 0 else None)
+	return out[:k]
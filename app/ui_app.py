@@ -3,21 +3,29 @@
 import os
 import sys
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 if __package__:
     from . import settings, get_faiss_index
     from .get_pdf import get_pdf
-    from .query import search as search_papers
-    from . import users
+    from .query import search as search_papers, SEARCH_MODES, results_cache
+    from .serving import get_retrieval_client
+    from .query import related_papers_many, liked_feed, recommended_papers
+    from .typeahead import suggest
+    from .versions import versioned, status as index_status
+    from . import users, metrics, warmup
 else:
     repo_root = Path(__file__).resolve().parent.parent
     if str(repo_root) not in sys.path:
         sys.path.insert(0, str(repo_root))
     from app import settings, get_faiss_index
     from app.get_pdf import get_pdf
-    from app.query import search as search_papers
-    from app import users
+    from app.query import search as search_papers, SEARCH_MODES, results_cache
+    from app.serving import get_retrieval_client
+    from app.query import related_papers_many, liked_feed, recommended_papers
+    from app.typeahead import suggest
+    from app.versions import versioned, status as index_status
+    from app import users, metrics, warmup
 
 import streamlit as st
 
@@ -109,6 +117,9 @@ if "search_results" not in st.session_state:
 if "last_explanation" not in st.session_state:
     st.session_state.last_explanation = None
 
+if "extra_k" not in st.session_state:
+    st.session_state.extra_k = 0
+
 def login_page():
     st.markdown('<h1 class="main-header">Research Paper Recommender</h1>', unsafe_allow_html=True)
 
@@ -150,7 +161,35 @@ def login_page():
                     st.markdown('<div class="error-message">Username already exists</div>', unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
-def render_paper_card(item: Dict, idx: int, show_like_button: bool = True):
+def similar_papers_for(items: List[Dict], k: int = 5) -> List[List[Dict]]:
+    # neighbor-graph lookups run where the corpus lives: in the sidecar when there is one,
+    # batched so a page of cards costs one round trip instead of one per card
+    uids = [item.get("idx") for item in items]
+    known = [uid for uid in uids if uid is not None]
+    if not known:
+        return [[] for _ in items]
+    if settings.retrieval_server:
+        lists = get_retrieval_client().similar_many(known, k=k)
+    else:
+        lists = related_papers_many(known, k=k)
+    by_uid = dict(zip(known, lists))
+    return [by_uid.get(uid, []) if uid is not None else [] for uid in uids]
+
+def papers_from_likes(username: str, k: int = 10) -> List[Dict]:
+    if settings.retrieval_server:
+        return get_retrieval_client().feed(username, k=k)
+    return liked_feed(username, k=k)
+
+def new_papers_for(username: str) -> Optional[Dict]:
+    if settings.retrieval_server:
+        return get_retrieval_client().recommendations(username)
+    return recommended_papers(username)
+
+def render_paper_cards(items: List[Dict], start: int = 1, show_like_button: bool = True):
+    for i, (item, related) in enumerate(zip(items, similar_papers_for(items))):
+        render_paper_card(item, start + i, show_like_button=show_like_button, related=related)
+
+def render_paper_card(item: Dict, idx: int, show_like_button: bool = True, related: Optional[List[Dict]] = None):
     title = item.get("title", "(Untitled)")
     abstract = item.get("abstract", "(No abstract available)")
     url_pdf = item.get("url_pdf")
@@ -183,6 +222,14 @@ def render_paper_card(item: Dict, idx: int, show_like_button: bool = True):
     with st.expander("Abstract"):
         st.write(abstract)
 
+    if related is None:
+        related = similar_papers_for([item])[0]
+    if related:
+        with st.expander("Similar papers"):
+            for rel in related:
+                link = rel.get("paper_url")
+                st.markdown(f"- [{rel['title']}]({link})" if link else f"- {rel['title']}")
+
     if url_pdf:
         with st.expander("View PDF"):
             if pdf_viewer is not None and st.session_state.get("enable_pdf", True):
@@ -225,33 +272,92 @@ def search_page():
         st.markdown("---")
         st.markdown("### Search Settings")
         st.session_state.top_k = st.slider("Number of Papers", min_value=1, max_value=20, value=5, step=1)
+        st.session_state.search_mode = st.selectbox("Retrieval Mode", SEARCH_MODES, index=SEARCH_MODES.index(settings.search_mode), help="Hybrid fuses keyword (BM25) and embedding matches; lexical works without the embedding API")
         st.session_state.use_mmr = st.checkbox("Use MMR Re-ranking", value=True)
         st.session_state.use_personalization = st.checkbox("Use Personalization", value=True, help="Tailor results based on your liked papers")
         st.session_state.llm = st.checkbox("LLM Explanations", value=True)
         st.session_state.enable_pdf = st.checkbox("Enable PDF Viewer", value=True)
 
+        cache = get_retrieval_client().stats()["cache"] if settings.retrieval_server else results_cache.stats()
+        st.caption(f"Result cache: {cache['hit_rate']:.0%} hit rate, {cache['saved_ms'] / 1000:.1f}s saved")
+        if not settings.retrieval_server and not warmup.ready():
+            st.caption("Warming caches from recent searches...")
+        if versioned() and not settings.retrieval_server:
+            index_info = index_status()
+            loading = f" (loading {index_info['loading']})" if index_info["loading"] else ""
+            st.caption(f"Index version: {index_info['active'] or index_info['current']}{loading}")
+        if metrics.enabled():
+            with st.expander("Latency"):
+                stages = {k: v for k, v in metrics.snapshot()["histograms"].items() if k.startswith("stage_ms")}
+                st.dataframe(
+                    [{"stage": k[len("stage_ms{stage="):-1], **v} for k, v in sorted(stages.items())],
+                    hide_index=True,
+                )
+
     query = st.text_input("Search for research papers", placeholder="e.g., graph neural networks for molecule property prediction", key="search_query")
 
+    def use_suggestion(text):
+        st.session_state.search_query = text
+        st.session_state.submit_suggestion = True
+
+    if query and query != st.session_state.get("last_query"):
+        # completions from your history, popular searches and titles: those queries are likely cached
+        if settings.retrieval_server:
+            suggestions = get_retrieval_client().suggest(query, user=st.session_state.username, k=5)
+        else:
+            suggestions = suggest(query, user=st.session_state.username, k=5)
+        if suggestions:
+            cols = st.columns(len(suggestions))
+            for i, (col, item) in enumerate(zip(cols, suggestions)):
+                with col:
+                    st.button(item["text"], key=f"suggest_{i}", help=item["source"], use_container_width=True,
+                              on_click=use_suggestion, args=(item["text"],))
+
     col1, col2, col3 = st.columns([1, 1, 4])
     with col1:
         search_button = st.button("Search", type="primary", use_container_width=True)
-
-    if search_button and query:
+        search_button = search_button or st.session_state.pop("submit_suggestion", False)
+    with col2:
+        more_button = st.button("More results", use_container_width=True, disabled=not st.session_state.search_results,
+                                help="Five more papers for the same query, continuing from the current list")
+
+    def run_search(query, top_k, llm):
+        # with RETRIEVAL_SERVER set, the sidecar holds the corpus and index; this process holds neither
+        remote = bool(settings.retrieval_server)
+        kwargs = dict(
+            top_k=top_k,
+            use_mmr=st.session_state.use_mmr,
+            llm=llm,
+            user=st.session_state.username,
+            use_personalization=st.session_state.use_personalization,
+            mode=st.session_state.search_mode
+        )
+        # the session keeps the query's candidate pool (in the sidecar, under a token kept in the
+        # session): re-slicing and toggles don't search again
+        if remote:
+            return get_retrieval_client().search(query, session=st.session_state, **kwargs)
+        # published index versions are hot-swapped by app.versions; don't pin the startup index
+        index = None if versioned() else get_faiss_index()
+        return search_papers(query, index=index, session=st.session_state, **kwargs)
+
+    if (search_button and query) or (more_button and st.session_state.get("last_query")):
         try:
-            index = get_faiss_index()
+            if search_button:
+                st.session_state.extra_k = 0
+                st.session_state.last_query = query
+            else:
+                st.session_state.extra_k += 5
             with st.spinner("Searching for papers..."):
-                results, df, indices, explanation = search_papers(
-                    query,
-                    top_k=st.session_state.top_k,
-                    index=index,
-                    use_mmr=st.session_state.use_mmr,
-                    llm=st.session_state.llm,
-                    user=st.session_state.username,
-                    use_personalization=st.session_state.use_personalization
+                # "more" keeps the analysis: the list grows at the end, the papers it describes stay on top
+                results, df, indices, explanation = run_search(
+                    st.session_state.last_query,
+                    st.session_state.top_k + st.session_state.extra_k,
+                    st.session_state.llm and bool(search_button)
                 )
 
             st.session_state.search_results = results
-            st.session_state.last_explanation = explanation
+            if search_button:
+                st.session_state.last_explanation = explanation
 
         except Exception as e:
             st.error(f"Search failed: {e}")
@@ -270,8 +376,7 @@ def search_page():
 
         st.markdown(f"### Results ({len(results)} papers)")
 
-        for i, item in enumerate(results):
-            render_paper_card(item, i + 1, show_like_button=True)
+        render_paper_cards(results)
 
 def liked_papers_page():
     st.markdown('<h1 class="main-header">Your Liked Papers</h1>', unsafe_allow_html=True)
@@ -307,10 +412,30 @@ def liked_papers_page():
     st.markdown(f"### You have {len(liked_papers)} liked papers")
     st.markdown("---")
 
-    for i, item in enumerate(liked_papers):
-        render_paper_card(item, i + 1, show_like_button=True)
+    render_paper_cards(liked_papers)
+
+    shown = len(liked_papers)
+    recommendations = new_papers_for(st.session_state.username)
+    if recommendations and recommendations.get("papers"):
+        liked_urls = {p.get("paper_url") for p in liked_papers}
+        fresh = [p for p in recommendations["papers"] if p.get("paper_url") not in liked_urls]
+        if fresh:
+            st.markdown("---")
+            st.markdown("### New papers for you")
+            st.caption(f"From your likes and recent searches, updated {recommendations['generated_at'][:16].replace('T', ' ')}")
+            render_paper_cards(fresh, start=shown + 1)
+            shown += len(fresh)
+
+    feed = papers_from_likes(st.session_state.username, k=10)
+    if feed:
+        st.markdown("---")
+        st.markdown("### Recommended from your likes")
+        render_paper_cards(feed, start=shown + 1)
 
 def main():
+    if not settings.retrieval_server:
+        # pre-runs the most frequent recent searches once per process (the sidecar warms itself)
+        warmup.start()
     if not st.session_state.authenticated:
         login_page()
     else:
@@ -2,9 +2,10 @@ import json
 import os
 import hashlib
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 from app import settings
+from app.metrics import timed
 
 USERS_DIR = os.path.join(settings.root, ".users")
 os.makedirs(USERS_DIR, exist_ok=True)
@@ -47,6 +48,7 @@ def authenticate_user(username: str, password: str) -> bool:
 
     return user_data["password"] == _hash_password(password)
 
+@timed("user_store_read")
 def get_user_data(username: str) -> Optional[Dict]:
     user_file = _get_user_file(username)
     if not os.path.exists(user_file):
@@ -55,11 +57,22 @@ def get_user_data(username: str) -> Optional[Dict]:
     with open(user_file, 'r') as f:
         return json.load(f)
 
+@timed("user_store_write")
 def _save_user_data(username: str, user_data: Dict) -> None:
     user_file = _get_user_file(username)
     with open(user_file, 'w') as f:
         json.dump(user_data, f, indent=2)
 
+def _bump_profile_version(user_data: Dict) -> None:
+    # anything that changes personalization bumps this; search result caches key on it
+    user_data["profile_version"] = user_data.get("profile_version", 0) + 1
+
+def get_profile_version(username: str) -> int:
+    user_data = get_user_data(username)
+    if not user_data:
+        return 0
+    return user_data.get("profile_version", 0)
+
 def like_paper(username: str, paper: Dict) -> bool:
     user_data = get_user_data(username)
     if not user_data:
@@ -87,6 +100,7 @@ def like_paper(username: str, paper: Dict) -> bool:
     }
 
     user_data["liked_papers"].append(liked_paper)
+    _bump_profile_version(user_data)
     _save_user_data(username, user_data)
     return True
 
@@ -100,6 +114,7 @@ def unlike_paper(username: str, paper_url: str) -> bool:
         if p.get("paper_url") != paper_url
     ]
 
+    _bump_profile_version(user_data)
     _save_user_data(username, user_data)
     return True
 
@@ -143,43 +158,209 @@ def get_search_history(username: str) -> List[Dict]:
 
     return user_data.get("search_history", [])
 
+def list_users() -> List[str]:
+    return sorted(f[:-len(".json")] for f in os.listdir(USERS_DIR) if f.endswith(".json") and not f.endswith(".recs.json"))
+
+def _get_recommendations_file(username: str) -> str:
+    return os.path.join(USERS_DIR, f"{username}.recs.json")
+
+def set_recommendations(username: str, papers: List[Dict], profile_version: Optional[int] = None,
+                        corpus: Optional[str] = None) -> bool:
+    """
+    Store a precomputed "new papers for you" list (scripts.recommend_users) as `[{idx, paper_url, score}]`
+    in its own file, replaced atomically: the user file (likes, history) is never rewritten here, so a
+    nightly run can't clobber a like made meanwhile. `corpus` is the corpus version the row ids refer to.
+    """
+    if not os.path.exists(_get_user_file(username)):
+        return False
+
+    path = _get_recommendations_file(username)
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump({
+            "generated_at": datetime.now().isoformat(),
+            "profile_version": profile_version,
+            "corpus": corpus,
+            "papers": [{"idx": int(p["idx"]), "paper_url": p.get("paper_url"), "score": p.get("score")} for p in papers]
+        }, f)
+    os.replace(tmp, path)
+    return True
+
+def get_recommendations(username: str) -> Optional[Dict]:
+    """The stored list (row ids + URLs; `query.recommended_papers` resolves them to papers), or None."""
+    path = _get_recommendations_file(username)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+_url_rows = {}  # id(df) -> (df, paper_url -> row) for corpora other than the global one
+
+def _liked_rows(user_data: Dict, df) -> List[int]:
+    """Row ids of the liked papers in `df` via a paper_url -> row map (built once per corpus, not scanned per like)."""
+    from app.similarity_search import get_url_index, load_data
+    if load_data.cache_info().currsize and df is load_data():
+        url_rows = get_url_index()
+    else:
+        cached = _url_rows.get(id(df))
+        if cached is None or cached[0] is not df:
+            urls = df["paper_url"].tolist()
+            _url_rows.clear()
+            cached = _url_rows[id(df)] = (df, {u: i for i, u in reversed(list(enumerate(urls))) if isinstance(u, str) and u})
+        url_rows = cached[1]
+    return [url_rows[p["paper_url"]] for p in user_data.get("liked_papers", []) if p.get("paper_url") in url_rows]
+
 def compute_user_preference_vector(username: str, embeddings_array: np.ndarray, df, indices_map: Dict) -> Optional[np.ndarray]:
     user_data = get_user_data(username)
     if not user_data or not user_data.get("liked_papers"):
         return None
 
-    liked_indices = []
-    for liked_paper in user_data["liked_papers"]:
-        paper_url = liked_paper.get("paper_url")
-        if not paper_url:
-            continue
-
-        matching_rows = df[df["paper_url"] == paper_url]
-        if not matching_rows.empty:
-            idx = matching_rows.index[0]
-            liked_indices.append(idx)
-
+    liked_indices = _liked_rows(user_data, df)
     if not liked_indices:
         return None
 
-    liked_embeddings = embeddings_array[liked_indices]
+    liked_embeddings = embeddings_array[sorted(liked_indices)]
     user_vector = np.mean(liked_embeddings, axis=0)
 
     return user_vector
 
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)
+
+def _get_interests_file(username: str) -> str:
+    return os.path.join(USERS_DIR, f"{username}.interests.npz")
+
+_interests = {}  # username -> interest state (also persisted next to the user file)
+REFIT_LIKES_PER_INTEREST = 5  # below max_interests * this many likes every change refits (cheap at that size)
+
+def _load_interests(username: str) -> Optional[Dict]:
+    path = _get_interests_file(username)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as z:
+        # files saved before the embedding space was recorded never match one
+        return {"urls": z["urls"].tolist(), "centroids": z["centroids"], "counts": z["counts"],
+                "version": int(z["version"]), "max_interests": int(z["max_interests"]),
+                "space": str(z["space"]) if "space" in z else None}
+
+def _save_interests(username: str, state: Dict) -> None:
+    path = _get_interests_file(username)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, urls=np.array(state["urls"], dtype=str), centroids=state["centroids"], counts=state["counts"],
+             version=state["version"], max_interests=state["max_interests"], space=state["space"])
+    os.replace(tmp, path)
+
+def _embedding_space(embeddings_array: np.ndarray, corpus: Optional[str]) -> str:
+    # centroids are only valid for the provider / model, dimension and corpus they were fitted on
+    from app.embeddings import get_provider
+    return f"{get_provider().cache_name}:{embeddings_array.shape[1]}:{corpus or ''}"
+
+def _fit_interests(X: np.ndarray, max_interests: int):
+    """Spherical mini-batch k-means over liked vectors: (centroids, member counts), k = min(max_interests, likes)."""
+    k = min(max_interests, len(X))
+    if k <= 1:
+        return X.mean(axis=0, keepdims=True), np.array([len(X)], dtype=np.int64)
+    from sklearn.cluster import MiniBatchKMeans
+    km = MiniBatchKMeans(n_clusters=k, batch_size=256, n_init=3, random_state=settings.seed).fit(X)
+    counts = np.bincount(km.labels_, minlength=k)
+    keep = counts > 0
+    return km.cluster_centers_[keep].astype(np.float32), counts[keep].astype(np.int64)
+
+def _fold_in(centroids: np.ndarray, counts: np.ndarray, X: np.ndarray):
+    """
+    Incremental k-means step for newly liked vectors: each joins the most similar interest,
+    which moves toward it by 1 / (its member count), as in MiniBatchKMeans.partial_fit.
+    """
+    centroids, counts = centroids.copy(), counts.copy()
+    for x in X:
+        j = int(np.argmax(_normalize_rows(centroids) @ x))
+        counts[j] += 1
+        centroids[j] += (x - centroids[j]) / counts[j]
+    return centroids, counts
+
+def compute_user_interests(username: str, embeddings_array: np.ndarray, df, max_interests: Optional[int] = None,
+                           corpus: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    The user's interests as a (k, d) matrix of centroids over their liked papers (USER_INTERESTS
+    caps k), so someone who likes RL and protein folding gets one direction for each instead of
+    a mean that matches neither. Once there are REFIT_LIKES_PER_INTEREST likes per interest,
+    new likes are folded into the stored centroids; before that, and after an unlike (or a
+    changed cap), it refits from scratch. Cached per profile version and embedding space
+    (provider, dimension and `corpus`, the serving context's corpus_version by default) and
+    saved next to the user file.
+    """
+    return _user_interests(username, get_user_data(username), embeddings_array, df, max_interests, corpus)
+
+def get_user_interests(username: str, embeddings_array: np.ndarray, df, corpus: Optional[str] = None) -> Tuple[int, Optional[np.ndarray]]:
+    """
+    (profile version, compute_user_interests centroids or None) from a single read of the user
+    file: what one search keys its caches on and personalizes with.
+    """
+    user_data = get_user_data(username)
+    version = user_data.get("profile_version", 0) if user_data else 0
+    return version, _user_interests(username, user_data, embeddings_array, df, None, corpus)
+
+@timed("user_interests")
+def _user_interests(username: str, user_data: Optional[Dict], embeddings_array: np.ndarray, df,
+                    max_interests: Optional[int], corpus: Optional[str]) -> Optional[np.ndarray]:
+    max_interests = max_interests or settings.user_interests
+    if not user_data or not user_data.get("liked_papers"):
+        return None
+    if corpus is None:
+        from app.versions import GlobalContext, active_context
+        corpus = (active_context() or GlobalContext()).corpus_version
+    version = user_data.get("profile_version", 0)
+    space = _embedding_space(embeddings_array, corpus)
+    state = _interests.get(username) or _load_interests(username)
+    if state and state["space"] != space:
+        state = None  # another provider, dimension or corpus: nothing carries over
+    if state and state["version"] == version and state["max_interests"] == max_interests:
+        _interests[username] = state
+        return state["centroids"]
+
+    liked = [p for p in user_data["liked_papers"] if p.get("paper_url")]
+    urls = [p["paper_url"] for p in liked]
+    rows = _liked_rows({"liked_papers": liked}, df)
+    if not rows:
+        return None
+    # fold in only once the stored centroids come from a real fit over enough likes; until then
+    # one-like-at-a-time growth would freeze the first likes as the interests
+    incremental = (state is not None and state["max_interests"] == max_interests
+                   and max_interests * REFIT_LIKES_PER_INTEREST <= len(state["urls"]) <= len(urls)
+                   and urls[:len(state["urls"])] == state["urls"])
+    if incremental:
+        new = _liked_rows({"liked_papers": liked[len(state["urls"]):]}, df)
+        X_new = _normalize_rows(embeddings_array[sorted(new)]) if new else np.empty((0, state["centroids"].shape[1]), np.float32)
+        centroids, counts = _fold_in(state["centroids"], state["counts"], X_new)
+    else:
+        centroids, counts = _fit_interests(_normalize_rows(embeddings_array[sorted(rows)]), max_interests)
+
+    state = {"urls": urls, "centroids": centroids.astype(np.float32), "counts": counts,
+             "version": version, "max_interests": max_interests, "space": space}
+    _interests[username] = state
+    _save_interests(username, state)
+    return state["centroids"]
+
 def personalize_scores(username: str, query_embedding: np.ndarray, candidate_embeddings: np.ndarray,
                        distances: np.ndarray, df, full_embeddings: np.ndarray, blend_weight: float = 0.3) -> np.ndarray:
-    user_vector = compute_user_preference_vector(username, full_embeddings, df, {})
+    user_vector = compute_user_interests(username, full_embeddings, df)
 
     if user_vector is None:
         return distances
 
-    user_vector = user_vector / (np.linalg.norm(user_vector) + 1e-12)
+    return blend_user_scores(user_vector, candidate_embeddings, distances, blend_weight)
+
+def blend_user_scores(user_vector: np.ndarray, candidate_embeddings: np.ndarray, distances: np.ndarray,
+                      blend_weight: float = 0.3) -> np.ndarray:
+    # one preference vector (d,) or interest centroids (k, d): a candidate scores by its closest interest
+    user_vectors = _normalize_rows(np.atleast_2d(user_vector))
 
     candidate_norms = np.linalg.norm(candidate_embeddings, axis=1, keepdims=True)
     candidate_normalized = candidate_embeddings / (candidate_norms + 1e-12)
 
-    user_similarities = candidate_normalized @ user_vector
+    user_similarities = (candidate_normalized @ user_vectors.T).max(axis=1)
     user_distances = 1.0 - user_similarities
 
     personalized_distances = (1 - blend_weight) * distances + blend_weight * user_distances
@@ -0,0 +1,449 @@
+"""
+Versioned corpus + index snapshots and blue/green hot-swap of the one a process searches.
+
+Layout (all under CACHE_DIR/versions):
+
+	<version>/manifest.json     files, vector count, storage, created_at
+	<version>/...               parquet, embedding matrix, FAISS index (+ sidecars, BM25, neighbors)
+	CURRENT                     name of the version processes should serve
+
+`python -m scripts.publish_version --activate` snapshots the current build outputs into a new
+version (hard links, no copy) and flips CURRENT. Each process notices the new pointer, loads
+and warms the new RetrievalContext on a background thread while the old one keeps serving,
+then swaps them atomically; the old context is released once its last in-flight search ends.
+Without a CURRENT file nothing changes: search uses the global loaders as before.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from app import settings
+from app import metrics
+
+CACHE_PATH = settings.cache_dir
+VERSIONS_DIR = os.path.join(CACHE_PATH, "versions")
+CURRENT_FILE = os.path.join(VERSIONS_DIR, "CURRENT")
+MANIFEST = "manifest.json"
+
+
+def _source_files(storage=None):
+	"""role -> path of every build output a version snapshots (optional ones only if present)."""
+	from app.dedup import CANONICAL_FILE
+	from app.lexical import LEXICAL_FILE
+	from app.neighbors import NEIGHBORS_FILE
+	from app.typeahead import TYPEAHEAD_FILE
+	from app.quantize import compressed_path
+	from app.similarity_search import EMBED_PATH, LOAD_PATH, index_file_name, stale_sources
+	storage = storage or settings.embed_storage
+	index_path = os.path.join(CACHE_PATH, index_file_name(storage))
+	files = {"data": LOAD_PATH, "embeddings": EMBED_PATH, "index": index_path, "index_meta": index_path + ".json"}
+	if storage != "float32":
+		codes = compressed_path(EMBED_PATH, storage)
+		files["embeddings_codes"] = codes
+		if storage == "int8":
+			files["embeddings_scales"] = codes[:-len(".npy")] + ".scales.npz"
+		if os.path.exists(codes + ".json"):
+			files["embeddings_codes_meta"] = codes + ".json"
+	optional = {"bm25": LEXICAL_FILE, "neighbors": NEIGHBORS_FILE, "canonical": CANONICAL_FILE, "typeahead": TYPEAHEAD_FILE}
+	for role, name in optional.items():
+		path = os.path.join(CACHE_PATH, name)
+		if not os.path.exists(path):
+			continue
+		if stale_sources(path):
+			# built from an older corpus: its row ids would not match this snapshot
+			print(f"Not snapshotting {path}: built from different source files")
+			continue
+		files[role] = path
+		if os.path.exists(path + ".json"):
+			files[role + "_meta"] = path + ".json"
+	return files
+
+
+def _link_or_copy(src, dst):
+	try:
+		os.link(src, dst)
+	except OSError:
+		shutil.copy2(src, dst)
+
+
+def list_versions():
+	"""Published versions, oldest first."""
+	if not os.path.isdir(VERSIONS_DIR):
+		return []
+	names = [n for n in os.listdir(VERSIONS_DIR) if os.path.exists(os.path.join(VERSIONS_DIR, n, MANIFEST))]
+	return sorted(names, key=lambda n: os.path.getmtime(os.path.join(VERSIONS_DIR, n, MANIFEST)))
+
+
+def current_version():
+	try:
+		with open(CURRENT_FILE) as f:
+			return f.read().strip() or None
+	except OSError:
+		return None
+
+
+def set_current(version):
+	"""Point CURRENT at `version` (atomic rename, so readers never see a partial name)."""
+	if not os.path.exists(os.path.join(VERSIONS_DIR, version, MANIFEST)):
+		raise ValueError(f"unknown index version {version!r}; published: {list_versions()}")
+	tmp = CURRENT_FILE + ".tmp"
+	with open(tmp, "w") as f:
+		f.write(version + "\n")
+	os.replace(tmp, CURRENT_FILE)
+
+
+def publish_version(version=None, storage=None, activate=False):
+	"""
+	Snapshot the current parquet, embeddings and index (plus BM25 / neighbor / dedup files when
+	built) into VERSIONS_DIR/<version>. Files are hard-linked, so publishing is instant and the
+	next rebuild (which replaces files via rename) doesn't touch the snapshot.
+	"""
+	storage = storage or settings.embed_storage
+	version = version or datetime.now().strftime("%Y%m%d-%H%M%S")
+	final = os.path.join(VERSIONS_DIR, version)
+	if os.path.exists(final):
+		raise ValueError(f"index version {version!r} already exists")
+	if storage != "float32":
+		# never snapshot codes compressed from an older embedding file
+		from app.quantize import quantized_path
+		from app.similarity_search import EMBED_PATH
+		if os.path.exists(EMBED_PATH):
+			quantized_path(EMBED_PATH, storage)
+	files = _source_files(storage)
+	missing = [p for p in files.values() if not os.path.exists(p)]
+	if missing:
+		raise FileNotFoundError(f"cannot publish, missing build outputs: {missing} (run python -m scripts.build_index)")
+	with open(files["index_meta"]) as f:
+		ntotal = json.load(f).get("ntotal")
+
+	staging = final + ".partial"
+	shutil.rmtree(staging, ignore_errors=True)
+	os.makedirs(staging)
+	for path in files.values():
+		_link_or_copy(path, os.path.join(staging, os.path.basename(path)))
+	manifest = {
+		"version": version, "storage": storage, "ntotal": ntotal, "created_at": datetime.now().isoformat(),
+		"files": {role: {"file": os.path.basename(p), "size": os.path.getsize(p)} for role, p in files.items()},
+	}
+	with open(os.path.join(staging, MANIFEST), "w") as f:
+		json.dump(manifest, f, indent=2)
+	os.replace(staging, final)
+	if activate:
+		set_current(version)
+	return manifest
+
+
+def prune_versions(keep=3):
+	"""Delete all but the newest `keep` versions (never CURRENT). Processes still mapping a deleted file keep their copy."""
+	current = current_version()
+	versions = list_versions()
+	old = [v for v in versions[:max(0, len(versions) - keep)] if v != current]
+	for v in old:
+		shutil.rmtree(os.path.join(VERSIONS_DIR, v), ignore_errors=True)
+	return old
+
+
+class RetrievalContext:
+	"""
+	Everything one search needs that is tied to a corpus version: DataFrame, embedding
+	matrix, FAISS index, and (lazily) the row-aligned BM25 index, neighbor graph and dedup
+	mapping. Searches hold a reference (`acquire` / `release`) for their whole duration;
+	a retired context frees its arrays once the last reference is released.
+	"""
+
+	def __init__(self, version, path=None):
+		self.version = version
+		self.path = path or os.path.join(VERSIONS_DIR, version)
+		with open(os.path.join(self.path, MANIFEST)) as f:
+			self.manifest = json.load(f)
+		self.refs = 0
+		self.retired = False
+		self.closed = False
+		self._lock = threading.Lock()
+
+	def _file(self, role):
+		entry = self.manifest["files"].get(role)
+		return os.path.join(self.path, entry["file"]) if entry else None
+
+	def load(self):
+		from app.quantize import QuantizedEmbeddings
+		from app.similarity_search import check_index_meta, read_index
+		storage = self.manifest["storage"]
+		self.df = pd.read_parquet(self._file("data"))
+		if storage == "float32":
+			self.embeddings = np.load(self._file("embeddings"), mmap_mode="r" if settings.shared_mmap else None)
+		else:
+			codes = np.load(self._file("embeddings_codes"), mmap_mode="r")
+			if storage == "int8":
+				with np.load(self._file("embeddings_scales")) as z:
+					self.embeddings = QuantizedEmbeddings(codes, z["scale"], z["offset"])
+			else:
+				self.embeddings = QuantizedEmbeddings(codes)
+		self.index = read_index(self._file("index"))
+		check_index_meta(self._file("index"), self.index, embed_path=self._file("embeddings"), data_path=self._file("data"))
+		if len(self.embeddings) != self.index.ntotal:
+			raise ValueError(f"index version {self.version}: {len(self.embeddings)} vectors but {self.index.ntotal} indexed")
+		if len(self.df) != self.index.ntotal:
+			print(f"Warning: index version {self.version} has {len(self.df)} parquet rows for {self.index.ntotal} vectors")
+		return self
+
+	def warm(self, n_queries=8):
+		"""Page in the index and the structures the first searches touch before taking traffic."""
+		rng = np.random.default_rng(0)
+		rows = rng.choice(len(self.embeddings), size=min(n_queries, len(self.embeddings)), replace=False)
+		self.index.search(np.ascontiguousarray(self.embeddings[np.sort(rows)], dtype=np.float32), 10)
+		for name in ("url_index", "features", "canonical", "graph"):
+			getattr(self, name)
+		return self
+
+	def lookup(self):
+		return self.df, self.embeddings, self.index
+
+	def files(self):
+		return {role: self._file(role) for role in self.manifest["files"]}
+
+	@property
+	def corpus_version(self):
+		"""Identity of this corpus for state saved across processes (e.g. user interest centroids)."""
+		return self.version
+
+	@cached_property
+	def url_index(self):
+		urls = self.df["paper_url"].tolist()
+		return {u: i for i, u in reversed(list(enumerate(urls))) if isinstance(u, str) and u}
+
+	@cached_property
+	def bm25(self):
+		from app.lexical import BM25Index, build_bm25_index
+		path = self._file("bm25")
+		if path:
+			return BM25Index.load(path)
+		return build_bm25_index(self.df, file_name=os.path.abspath(os.path.join(self.path, "bm25_index.npz")), data_path=self._file("data"))
+
+	@cached_property
+	def features(self):
+		from app.rerank import Features
+		return Features.from_df(self.df)
+
+	@cached_property
+	def typeahead(self):
+		from app.typeahead import PrefixIndex, build_typeahead_index
+		path = self._file("typeahead")
+		if path:
+			return PrefixIndex.load(path)
+		return build_typeahead_index(self.df, file_name=os.path.abspath(os.path.join(self.path, "typeahead_index.npz")),
+									 data_path=self._file("data"))
+
+	@cached_property
+	def graph(self):
+		from app.neighbors import NeighborGraph
+		path = self._file("neighbors")
+		return NeighborGraph.load(path) if path else None
+
+	@cached_property
+	def canonical(self):
+		path = self._file("canonical")
+		return np.load(path, mmap_mode="r" if settings.shared_mmap else None) if path else None
+
+	def acquire(self):
+		with self._lock:
+			self.refs += 1
+		return self
+
+	def release(self):
+		with self._lock:
+			self.refs -= 1
+			done = self.retired and self.refs == 0
+		if done:
+			self._close()
+
+	def retire(self):
+		with self._lock:
+			self.retired = True
+			done = self.refs == 0
+		if done:
+			self._close()
+
+	def _close(self):
+		if self.closed:
+			return
+		self.closed = True
+		for name in ("df", "embeddings", "index", "url_index", "features", "bm25", "typeahead", "graph", "canonical"):
+			self.__dict__.pop(name, None)
+		print(f"Released index version {self.version}")
+
+
+class GlobalContext:
+	"""The unversioned layout behind the same interface: the process-wide cached loaders."""
+
+	version = None
+
+	def lookup(self):
+		from app.similarity_search import get_lookup_table
+		return get_lookup_table()
+
+	def files(self):
+		return _source_files()
+
+	@property
+	def corpus_version(self):
+		"""
+		Checksum of the embedding matrix: stable across processes, changes with every rebuild.
+		Read per search, so it relies on file_checksum's in-process memo (a stat per call).
+		"""
+		from app.similarity_search import EMBED_PATH, file_checksum
+		return file_checksum(EMBED_PATH) if os.path.exists(EMBED_PATH) else None
+
+	@property
+	def df(self):
+		from app.similarity_search import load_data
+		return load_data()
+
+	@property
+	def url_index(self):
+		from app.similarity_search import get_url_index
+		return get_url_index()
+
+	@property
+	def bm25(self):
+		from app.lexical import get_bm25_index
+		return get_bm25_index()
+
+	@property
+	def features(self):
+		from app.rerank import features_for
+		return features_for(self.df)
+
+	@property
+	def typeahead(self):
+		from app.typeahead import get_typeahead_index
+		return get_typeahead_index()
+
+	@property
+	def graph(self):
+		from app.neighbors import get_neighbor_graph
+		return get_neighbor_graph()
+
+	@property
+	def canonical(self):
+		from app.dedup import get_canonical_ids
+		return get_canonical_ids()
+
+
+_lock = threading.Lock()
+_first_load = threading.Lock()
+_active = None
+_status = {"active": None, "loading": None, "error": None, "swapped_at": None, "load_ms": None}
+_pointer = {"mtime": None, "checked": 0.0}
+
+
+def versioned():
+	return os.path.exists(CURRENT_FILE)
+
+
+def _activate(ctx):
+	global _active
+	with _lock:
+		old, _active = _active, ctx
+		_status.update(active=ctx.version, swapped_at=datetime.now().isoformat())
+	metrics.set_gauge("index_active_version", 1, version=ctx.version)
+	if old is not None:
+		metrics.set_gauge("index_active_version", 0, version=old.version)
+		metrics.incr("index_swaps_total")
+		old.retire()
+
+
+def _load(version):
+	start = time.perf_counter()
+	ctx = RetrievalContext(version).load().warm()
+	_status["load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+	metrics.observe("index_load_ms", _status["load_ms"], version=version)
+	return ctx
+
+
+def reload(version=None, wait=False):
+	"""
+	Load `version` (default: CURRENT) next to the active context and swap to it when warm.
+	Runs on a background thread unless `wait`; a reload already in progress is not restarted.
+	"""
+	version = version or current_version()
+	if version is None:
+		raise ValueError("no index version published; run python -m scripts.publish_version --activate")
+	with _lock:
+		busy = _status["loading"] or (_active is not None and _active.version == version)
+		if not busy:
+			_status.update(loading=version, error=None)
+	if busy:
+		return status()  # takes _lock itself
+
+	def run():
+		try:
+			_activate(_load(version))
+		except Exception as e:
+			_status["error"] = f"{version}: {type(e).__name__}: {e}"
+			print(f"Index reload failed, still serving {_status['active']}: {_status['error']}")
+		finally:
+			_status["loading"] = None
+
+	if wait:
+		run()
+	else:
+		threading.Thread(target=run, name=f"index-reload-{version}", daemon=True).start()
+	return status()
+
+
+def _poll_pointer():
+	"""Start a background reload when CURRENT changed (checked at most every INDEX_POLL_SECONDS)."""
+	now = time.monotonic()
+	if now - _pointer["checked"] < settings.index_poll_seconds:
+		return
+	_pointer["checked"] = now
+	try:
+		mtime = os.stat(CURRENT_FILE).st_mtime_ns
+	except OSError:
+		return
+	if mtime != _pointer["mtime"]:
+		_pointer["mtime"] = mtime
+		if _active is not None and current_version() != _active.version:
+			reload()
+
+
+def active_context():
+	"""The context new searches should use (loaded synchronously the first time), or None without versions."""
+	if _active is None:
+		if not versioned():
+			return None
+		with _first_load:
+			if _active is None:
+				_pointer["mtime"] = os.stat(CURRENT_FILE).st_mtime_ns
+				reload(wait=True)
+				if _active is None:
+					raise RuntimeError(f"could not load index version {current_version()}: {_status['error']}")
+	_poll_pointer()
+	return _active
+
+
+@contextmanager
+def use_context():
+	"""Hold the active context for the duration of a search (a GlobalContext in the unversioned layout)."""
+	if active_context() is None:
+		yield GlobalContext()
+		return
+	with _lock:
+		ctx = _active.acquire()
+	try:
+		yield ctx
+	finally:
+		ctx.release()
+
+
+def status():
+	with _lock:
+		refs = _active.refs if _active is not None else 0
+	return dict(_status, current=current_version(), published=list_versions(), in_flight=refs)
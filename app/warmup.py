@@ -0,0 +1,162 @@
+"""
+Startup cache warming from the query log: before a process reports ready it
+
+1. loads the active corpus and reads the memory-mapped index / embedding files through the
+   page cache (and faults in the mapped arrays), so the first searches don't pay for disk;
+2. ranks the recent searches of all users (search_history) by frequency and pre-runs the top
+   WARMUP_QUERIES in parallel: query embedding, retrieval and result cache, plus an explanation
+   for the WARMUP_LLM_CALLS most frequent ones; all within WARMUP_SECONDS.
+
+`run()` warms synchronously, `start()` on a background thread; `ready()` / `status()` back
+GET /ready on the API and the sidecar's "ready" request.
+"""
+import mmap
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+import numpy as np
+from app import settings
+from app import metrics
+from app.cache import normalize_query
+
+# files mapped rather than copied into RAM (EMBED_STORAGE codes are always mapped)
+MAPPED_ROLES = ("index", "embeddings", "neighbors", "canonical")
+
+_lock = threading.Lock()
+_thread = None
+_status = {"ready": False, "state": "cold", "started_at": None, "finished_at": None, "report": None}
+
+
+def ready():
+	return _status["ready"]
+
+
+def status():
+	with _lock:
+		return dict(_status)
+
+
+def popular_queries(n, days=None):
+	"""The n most frequent searches of the last `days` across all users, as (query, count), most frequent first."""
+	from app import users
+	days = settings.warmup_days if days is None else days
+	cutoff = (datetime.now() - timedelta(days=days)).isoformat() if days else ""
+	counts, display = Counter(), {}
+	for username in users.list_users():
+		for entry in users.get_search_history(username):
+			query = entry.get("query")
+			if not query or (entry.get("timestamp") or "") < cutoff:
+				continue
+			key = normalize_query(query)
+			counts[key] += 1
+			display.setdefault(key, query)
+	return [(display[key], count) for key, count in counts.most_common(n)]
+
+
+def _read_file(path):
+	"""Read a file once so its pages sit in the page cache every mapping of it shares."""
+	fd = os.open(path, os.O_RDONLY)
+	try:
+		if hasattr(os, "posix_fadvise"):
+			os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+		size = 0
+		while chunk := os.read(fd, 1 << 22):
+			size += len(chunk)
+	finally:
+		os.close(fd)
+	return size
+
+
+def _touch_array(a):
+	"""Fault in every page of a memory-mapped array (one byte per page) so the mapping itself is warm."""
+	a = getattr(a, "codes", a)  # QuantizedEmbeddings keeps its mapped codes here
+	if isinstance(a, np.memmap) and a.flags.c_contiguous:
+		np.asarray(a).reshape(-1).view(np.uint8)[::mmap.PAGESIZE].max()
+
+
+def touch_pages(ctx):
+	"""Page in the mapped build outputs of `ctx`; returns (MB read, ms)."""
+	start = time.perf_counter()
+	files = ctx.files()
+	roles = [r for r in MAPPED_ROLES if settings.shared_mmap] + ["embeddings_codes"]
+	size = sum(_read_file(files[r]) for r in roles if files.get(r) and os.path.exists(files[r]))
+	_, embeddings, index = ctx.lookup()
+	for a in (embeddings, ctx.canonical):
+		if a is not None:
+			_touch_array(a)
+	# a few exhaustive searches fault in whatever the index maps (and its search code paths)
+	rows = np.random.default_rng(0).choice(len(embeddings), size=min(8, len(embeddings)), replace=False)
+	index.search(np.ascontiguousarray(embeddings[np.sort(rows)], dtype=np.float32), 10)
+	return round(size / 2**20, 1), round((time.perf_counter() - start) * 1000, 1)
+
+
+def _warm_query(query, llm, stop_at):
+	from app.query import search
+	remaining_ms = (stop_at - time.perf_counter()) * 1000
+	if remaining_ms <= 0:
+		return "skipped"
+	# a default UI search's arguments, so its result cache entry is the one the UI hits (llm isn't in
+	# the key; a hit only adds the explanation). No user (no history write), and record=False: a
+	# replay isn't a search, counting it would inflate the popularity warmup and typeahead rank by
+	_, _, _, explanation = search(query, llm=llm, deadline_ms=remaining_ms, record=False)
+	return "explained" if explanation else "searched"
+
+
+def run(n=None, seconds=None, llm_calls=None, threads=None, days=None):
+	"""Warm this process (see module docstring) and mark it ready; returns the report."""
+	from app.versions import use_context
+	n = settings.warmup_queries if n is None else n
+	seconds = settings.warmup_seconds if seconds is None else seconds
+	llm_calls = settings.warmup_llm_calls if llm_calls is None else llm_calls
+	threads = threads or settings.warmup_threads
+	with _lock:
+		_status.update(ready=False, state="warming", started_at=datetime.now().isoformat(), finished_at=None)
+
+	start = time.perf_counter()
+	stop_at = start + seconds
+	report = {"queries": 0, "searched": 0, "explained": 0, "skipped": 0, "errors": 0}
+	try:
+		with use_context() as ctx:
+			report["pages_mb"], report["pages_ms"] = touch_pages(ctx)
+			ctx.typeahead  # load (or build) the title/phrase typeahead index before the first keystroke
+		queries = popular_queries(n, days) if n > 0 else []
+		report["queries"] = len(queries)
+		if queries:
+			pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="warmup")
+			futures = [pool.submit(_warm_query, q, rank < llm_calls, stop_at) for rank, (q, _) in enumerate(queries)]
+			done, not_done = wait(futures, timeout=max(0.0, stop_at - time.perf_counter()))
+			# whatever is still running finishes in the background (and still fills the caches)
+			pool.shutdown(wait=False, cancel_futures=True)
+			report["skipped"] += len(not_done)
+			for f in done:
+				if f.exception() is not None:
+					report["errors"] += 1
+					print(f"Warmup query failed: {f.exception()}")
+				else:
+					report[f.result()] += 1
+			for key in ("searched", "explained", "skipped", "errors"):
+				metrics.incr("warmup_queries_total", report[key], result=key)
+	except Exception as e:
+		# a failed warmup only costs latency; still report ready
+		print(f"Warmup failed: {e}")
+		report["error"] = f"{type(e).__name__}: {e}"
+	report["seconds"] = round(time.perf_counter() - start, 2)
+	metrics.observe("warmup_ms", report["seconds"] * 1000)
+	metrics.set_gauge("service_ready", 1)
+	with _lock:
+		_status.update(ready=True, state="ready", finished_at=datetime.now().isoformat(), report=report)
+	print(f"Warmup done: {report}")
+	return report
+
+
+def start(**kwargs):
+	"""`run` on a background thread (once per process); `ready()` turns true when it finishes."""
+	global _thread
+	with _lock:
+		if _thread is None:
+			_thread = threading.Thread(target=run, kwargs=kwargs, name="warmup", daemon=True)
+			_thread.start()
+	return _thread
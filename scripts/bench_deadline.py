@@ -0,0 +1,83 @@
+"""
+Search tail latency against a slow upstream, with and without a deadline. A local fake OpenAI
+server answers embeddings and responses after --latency-ms, and a --slow-rate share of requests
+stalls for another --slow-ms (the tail that used to hold a search up to the client timeouts).
+
+	python -m scripts.bench_deadline --queries 200 --slow-rate 0.1 --slow-ms 4000 --deadline-ms 0 1500 3000
+
+Per deadline: p50/p95/p99/max search latency, and how many searches were degraded
+(embedding -> cached vector or lexical, re-ranking skipped, explanation dropped).
+Runs on a synthetic corpus in a temp dir; the result cache is off so every query searches.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+
+def _percentiles(ms):
+	ms = np.asarray(ms)
+	return {f"p{q}_ms": round(float(np.percentile(ms, q)), 1) for q in (50, 95, 99)} | {"max_ms": round(float(ms.max()), 1)}
+
+
+def main(args):
+	workdir = tempfile.mkdtemp(prefix="bench_deadline_")
+	os.environ.update({
+		"DATA_DIR": os.path.join(workdir, "data"), "CACHE_DIR": os.path.join(workdir, "cache"),
+		"OPENAI_API_KEY": "fake-key", "EMBED_PROVIDER": "openai", "EMBED_STORAGE": "float32",
+		"SHARD_SCHEME": "", "TRUNCATE_DIM": "0", "RESULT_CACHE_SIZE": "0", "RETRIEVAL_SERVER": "",
+		"LLM_EFFORT": "auto",
+	})
+	from scripts.fake_openai import FakeOpenAI
+	from scripts.synth_corpus import write_corpus
+	server = FakeOpenAI(latency_ms=args.latency_ms, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+						dim=args.dim, seed=args.seed).start()
+	os.environ["OPENAI_BASE_URL"] = server.base_url
+	write_corpus(workdir, args.n, args.dim, seed=args.seed)
+	subprocess.run([sys.executable, "-m", "scripts.build_index"], check=True, stdout=subprocess.DEVNULL)
+
+	from app import metrics
+	from app.query import query_embeddings, search
+	search("warm-up", top_k=args.top_k, llm=False, deadline_ms=0)  # load corpus + index outside the timings
+
+	queries = [f"benchmark query {i % args.distinct}" for i in range(args.queries)]
+	report = {"n": args.n, "latency_ms": args.latency_ms, "slow_rate": args.slow_rate, "slow_ms": args.slow_ms,
+			  "llm": args.llm, "deadlines": {}}
+	for deadline_ms in args.deadline_ms:
+		metrics.reset()
+		query_embeddings.clear()
+		timings, explained = [], 0
+		for q in queries:
+			start = time.perf_counter()
+			_, _, _, explanation = search(q, top_k=args.top_k, llm=args.llm, deadline_ms=deadline_ms)
+			timings.append((time.perf_counter() - start) * 1000)
+			explained += explanation is not None
+		counters = metrics.snapshot()["counters"]
+		row = dict(_percentiles(timings), explained=explained,
+				   degraded={k: v for k, v in counters.items() if k.startswith(("deadline_skips_total", "search_fallback_total"))})
+		report["deadlines"][str(deadline_ms or "none")] = row
+		print(f"[deadline={deadline_ms or 'none'}] {json.dumps(row)}", file=sys.stderr)
+	report["upstream_requests"] = server.counts
+	server.stop()
+	return report
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--n", type=int, default=20000)
+	parser.add_argument("--dim", type=int, default=1536)
+	parser.add_argument("--queries", type=int, default=200)
+	parser.add_argument("--distinct", type=int, default=50, help="distinct query strings (repeats hit the query-embedding cache)")
+	parser.add_argument("--deadline-ms", type=float, nargs="+", default=[0, 1500, 3000], help="0 = no deadline")
+	parser.add_argument("--latency-ms", type=float, default=80.0)
+	parser.add_argument("--slow-rate", type=float, default=0.1)
+	parser.add_argument("--slow-ms", type=float, default=4000.0)
+	parser.add_argument("--llm", action=argparse.BooleanOptionalAction, default=True)
+	parser.add_argument("--top-k", type=int, default=10)
+	parser.add_argument("--seed", type=int, default=42)
+	args = parser.parse_args()
+	print(json.dumps(main(args), indent=2))
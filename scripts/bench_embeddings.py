@@ -0,0 +1,58 @@
+"""
+CPU throughput of the local embedding provider across thread / process / batch settings.
+
+	python -m scripts.bench_embeddings --texts 5000 --threads 1 4 --parallel 0 --batch 64 256
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from app.embeddings import FastEmbedProvider
+
+
+def synthetic_texts(n, words_per_text=180, seed=42):
+	import numpy as np
+	rng = np.random.default_rng(seed)
+	vocab = [f"token{i}" for i in range(20000)]
+	return [" ".join(rng.choice(vocab, words_per_text)) for _ in range(n)]
+
+
+def run(texts, model=None, threads=(None,), parallel=(None,), batch_sizes=(256,), quantize=True):
+	rows = []
+	for th, par, bs in itertools.product(threads, parallel, batch_sizes):
+		provider = FastEmbedProvider(model, threads=th, parallel=par, batch_size=bs, quantize=quantize)
+		provider.embed(texts[:bs])  # warm up: model load + session init
+		start = time.perf_counter()
+		vecs = provider.embed(texts, parallel=par)
+		elapsed = time.perf_counter() - start
+		start = time.perf_counter()
+		for t in texts[:50]:
+			provider.embed_query(t)
+		query_ms = (time.perf_counter() - start) / 50 * 1000
+		rows.append({
+			"model": provider.model,
+			"quantized": quantize,
+			"threads": th,
+			"parallel": par,
+			"batch_size": bs,
+			"dim": int(vecs.shape[1]),
+			"texts_per_s": round(len(texts) / elapsed, 1),
+			"query_ms": round(query_ms, 2),
+		})
+		print(json.dumps(rows[-1]))
+	return {"cpu_count": os.cpu_count(), "n_texts": len(texts), "runs": rows}
+
+
+if __name__ == "__main__":
+	none_or_int = lambda v: None if v.lower() == "none" else int(v)
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--texts", type=int, default=2000)
+	parser.add_argument("--model", default=None)
+	parser.add_argument("--threads", type=none_or_int, nargs="+", default=[None])
+	parser.add_argument("--parallel", type=none_or_int, nargs="+", default=[None, 0])
+	parser.add_argument("--batch", type=int, nargs="+", default=[256])
+	parser.add_argument("--no-quantize", action="store_true")
+	args = parser.parse_args()
+	result = run(synthetic_texts(args.texts), args.model, args.threads, args.parallel, args.batch, not args.no_quantize)
+	print(json.dumps(result, indent=2))
@@ -0,0 +1,78 @@
+"""
+Benchmark the BM25 inverted index: build time, index size and query latency.
+
+	python -m scripts.bench_lexical                      # real parquet
+	python -m scripts.bench_lexical --synthetic 200000   # random Zipfian corpus
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from app.lexical import BM25Index, _document_texts
+
+
+def synthetic_corpus(n_docs, vocab_size=50000, doc_len=120, seed=42):
+	rng = np.random.default_rng(seed)
+	words = np.array([f"w{i}" for i in range(vocab_size)])
+	lengths = rng.integers(doc_len // 2, doc_len * 3 // 2, size=n_docs)
+	tokens = np.minimum(rng.zipf(1.2, size=int(lengths.sum())) - 1, vocab_size - 1)
+	docs, pos = [], 0
+	for n in lengths:
+		docs.append(" ".join(words[tokens[pos:pos + n]]))
+		pos += n
+	return pd.DataFrame({"title": [d[:60] for d in docs], "abstract": docs})
+
+
+def run(df=None, n_queries=500, k=50, seed=42):
+	if df is None:
+		from app.similarity_search import load_data
+		df = load_data()
+	texts = _document_texts(df)
+
+	start = time.perf_counter()
+	index = BM25Index.build(texts)
+	build_s = time.perf_counter() - start
+
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "bm25.npz")
+		index.save(path)
+		file_mb = os.path.getsize(path) / 2**20
+		start = time.perf_counter()
+		BM25Index.load(path)
+		load_s = time.perf_counter() - start
+
+	# queries: the first few words of random titles, the kind of exact-term query BM25 is for
+	rng = np.random.default_rng(seed)
+	titles = df["title"].fillna("").astype(str).to_numpy()
+	queries = [" ".join(titles[i].split()[:4]) for i in rng.integers(0, len(titles), size=n_queries)]
+	lat = []
+	for q in queries:
+		t0 = time.perf_counter()
+		index.search(q, k)
+		lat.append((time.perf_counter() - t0) * 1000)
+
+	return {
+		"n_docs": index.n_docs,
+		"n_terms": len(index.terms),
+		"n_postings": int(len(index.doc_ids)),
+		"build_s": round(build_s, 2),
+		"load_s": round(load_s, 2),
+		"memory_mb": round(index.nbytes / 2**20, 1),
+		"file_mb": round(file_mb, 1),
+		"query_ms_p50": round(float(np.percentile(lat, 50)), 3),
+		"query_ms_p95": round(float(np.percentile(lat, 95)), 3),
+		"query_ms_p99": round(float(np.percentile(lat, 99)), 3),
+	}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--synthetic", type=int, default=0, help="number of synthetic docs (0 = use the parquet)")
+	parser.add_argument("--queries", type=int, default=500)
+	parser.add_argument("-k", type=int, default=50)
+	args = parser.parse_args()
+	df = synthetic_corpus(args.synthetic) if args.synthetic else None
+	print(json.dumps(run(df, n_queries=args.queries, k=args.k), indent=2))
@@ -0,0 +1,84 @@
+"""
+MMR latency at large fetch_k: the engine (incremental and Gram paths, single and batched
+queries, pre-normalized inputs) against the previous per-query implementation.
+
+	python -m scripts.bench_mmr --fetch-k 25 100 500 1000 --top-k 20 --batch 8
+"""
+import argparse
+import json
+import time
+import numpy as np
+from app.mmr import MMREngine, l2_normalize
+
+
+def legacy_mmr(query_vec, doc_vecs, lambda_param=0.7, top_k=5):
+    """The single-query implementation this engine replaced, kept as the benchmark baseline."""
+    q = l2_normalize(query_vec.reshape(1, -1).astype(np.float32, copy=False), axis=1)
+    C = l2_normalize(doc_vecs.astype(np.float32, copy=False), axis=1)
+    sim_q_c = (C @ q.T).ravel().copy()
+    fk = len(C)
+    s_max = np.full(fk, -np.inf, dtype=np.float32)
+    alive = np.ones(fk, dtype=bool)
+    out, last = [], None
+    for t in range(min(top_k, fk)):
+        if t == 0:
+            i = int(np.argmax(np.where(alive, sim_q_c, -np.inf)))
+        else:
+            s_max = np.maximum(s_max, C @ C[last])
+            mmr = lambda_param * sim_q_c - (1.0 - lambda_param) * s_max
+            i = int(np.argmax(np.where(alive, mmr, -np.inf)))
+        out.append(i)
+        alive[i] = False
+        sim_q_c[i] = -np.inf
+        s_max[i] = np.inf
+        last = i
+    return out
+
+
+def _time_ms(fn, repeat):
+    fn()  # warm-up (and buffer allocation for the engine)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def run(fetch_ks=(25, 100, 500, 1000), top_k=20, batch=8, d=1536, repeat=20, seed=42):
+    rng = np.random.default_rng(seed)
+    engine = MMREngine()
+    report = {"d": d, "top_k": top_k, "batch": batch, "runs": []}
+    for n in fetch_ks:
+        Q = rng.standard_normal((batch, d)).astype(np.float32)
+        X = rng.standard_normal((batch, n, d)).astype(np.float32)
+        Qn, Xn = l2_normalize(Q), l2_normalize(X, axis=2)
+
+        legacy = [legacy_mmr(Q[b], X[b], top_k=top_k) for b in range(batch)]
+        for use_gram in (False, True):
+            got = engine.select(Q, X, top_k=top_k, use_gram=use_gram)
+            assert all(got[b].tolist() == legacy[b] for b in range(batch)), "engine disagrees with legacy MMR"
+
+        row = {
+            "fetch_k": n,
+            "legacy_ms": _time_ms(lambda: legacy_mmr(Q[0], X[0], top_k=top_k), repeat),
+            "engine_ms": _time_ms(lambda: engine.select(Q[:1], X[:1], top_k=top_k, use_gram=False), repeat),
+            "engine_gram_ms": _time_ms(lambda: engine.select(Q[:1], X[:1], top_k=top_k, use_gram=True), repeat),
+            "engine_prenormalized_ms": _time_ms(lambda: engine.select(Qn[:1], Xn[:1], top_k=top_k, normalized=True), repeat),
+            # batched: total time for `batch` queries, divided per query
+            "batched_per_query_ms": _time_ms(lambda: engine.select(Q, X, top_k=top_k), repeat) / batch,
+            "batched_prenormalized_per_query_ms": _time_ms(lambda: engine.select(Qn, Xn, top_k=top_k, normalized=True), repeat) / batch,
+        }
+        row = {k: round(v, 3) if isinstance(v, float) else v for k, v in row.items()}
+        row["speedup_batched_prenormalized"] = round(row["legacy_ms"] / row["batched_prenormalized_per_query_ms"], 2)
+        report["runs"].append(row)
+        print(json.dumps(row))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[25, 100, 500, 1000])
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.fetch_k, args.top_k, args.batch, repeat=args.repeat), indent=2))
@@ -0,0 +1,96 @@
+"""
+Memory saved by float16 / int8 embedding storage, and what it does to ranking quality:
+recall of the matching FAISS SQ index vs IndexFlatL2, and agreement of MMR and
+personalization orderings computed from dequantized vs float32 candidate rows.
+
+	python -m scripts.bench_quantize                 # cached corpus embeddings
+	python -m scripts.bench_quantize --synthetic 100000
+"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from app.mmr import maximal_marginal_relevance as mmr
+from app.quantize import quantize_embeddings
+from app.similarity_search import SQ_TYPES
+from app.users import blend_user_scores
+
+
+def synthetic_embeddings(n, d=1536, n_clusters=256, noise=0.35, seed=42):
+	"""Clustered unit vectors; closer to real text embeddings than iid Gaussian noise."""
+	rng = np.random.default_rng(seed)
+	centers = rng.standard_normal((n_clusters, d)).astype(np.float32)
+	X = centers[rng.integers(0, n_clusters, size=n)] + noise * rng.standard_normal((n, d)).astype(np.float32)
+	X /= np.linalg.norm(X, axis=1, keepdims=True)
+	return X
+
+
+def _overlap(a, b):
+	return len(set(a) & set(b)) / max(1, len(a))
+
+
+def run(X, n_queries=200, fetch_k=100, top_k=10, n_liked=20, storages=("float16", "int8"), seed=42):
+	rng = np.random.default_rng(seed)
+	n, d = X.shape
+	Q = X[rng.integers(0, n, size=n_queries)] + 0.05 * rng.standard_normal((n_queries, d)).astype(np.float32)
+	Q /= np.linalg.norm(Q, axis=1, keepdims=True)
+	user_vec = X[rng.integers(0, n, size=n_liked)].mean(axis=0)
+
+	flat = faiss.IndexFlatL2(d)
+	flat.add(X)
+	start = time.perf_counter()
+	D0, I0 = flat.search(Q, fetch_k)
+	flat_ms = (time.perf_counter() - start) / n_queries * 1000
+	base_mmr = [mmr(Q[i], X[I0[i]], top_k=top_k) for i in range(n_queries)]
+	base_pers = [np.argsort(blend_user_scores(user_vec, X[I0[i]], D0[i], 0.25))[:top_k] for i in range(n_queries)]
+
+	report = {"n": n, "d": d, "float32_mb": round(X.nbytes / 2**20, 1), "flat_query_ms": round(flat_ms, 3), "storages": {}}
+	for storage in storages:
+		Xq = quantize_embeddings(X, storage)
+		sq = faiss.IndexScalarQuantizer(d, SQ_TYPES[storage], faiss.METRIC_L2)
+		sq.train(X[rng.choice(n, min(n, 100000), replace=False)])
+		sq.add(X)
+		start = time.perf_counter()
+		_, Isq = sq.search(Q, fetch_k)
+		sq_ms = (time.perf_counter() - start) / n_queries * 1000
+
+		mmr_overlap, mmr_exact, pers_overlap, gather_ms = [], [], [], []
+		for i in range(n_queries):
+			t0 = time.perf_counter()
+			cand = Xq[I0[i]]
+			gather_ms.append((time.perf_counter() - t0) * 1000)
+			sel = mmr(Q[i], cand, top_k=top_k)
+			mmr_overlap.append(_overlap(sel, base_mmr[i]))
+			mmr_exact.append(sel == base_mmr[i])
+			pers = np.argsort(blend_user_scores(user_vec, cand, D0[i], 0.25))[:top_k]
+			pers_overlap.append(_overlap(pers.tolist(), base_pers[i].tolist()))
+
+		report["storages"][storage] = {
+			"matrix_mb": round(Xq.nbytes / 2**20, 1),
+			"saved_mb": round((X.nbytes - Xq.nbytes) / 2**20, 1),
+			"index_mb": round(sq.sa_code_size() * n / 2**20, 1),
+			"max_abs_error": float(np.abs(Xq[:1000] - X[:1000]).max()),
+			f"sq_recall@{top_k}": round(float(np.mean([_overlap(Isq[i, :top_k], I0[i, :top_k]) for i in range(n_queries)])), 4),
+			"sq_query_ms": round(sq_ms, 3),
+			f"mmr_overlap@{top_k}": round(float(np.mean(mmr_overlap)), 4),
+			"mmr_identical_order": round(float(np.mean(mmr_exact)), 4),
+			f"personalization_overlap@{top_k}": round(float(np.mean(pers_overlap)), 4),
+			"gather_ms": round(float(np.mean(gather_ms)), 4),
+		}
+	return report
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--synthetic", type=int, default=0, help="number of synthetic vectors (0 = cached corpus)")
+	parser.add_argument("--queries", type=int, default=200)
+	parser.add_argument("--fetch-k", type=int, default=100)
+	parser.add_argument("--top-k", type=int, default=10)
+	args = parser.parse_args()
+	if args.synthetic:
+		X = synthetic_embeddings(args.synthetic)
+	else:
+		from app.similarity_search import EMBED_PATH
+		X = np.load(EMBED_PATH)
+	print(json.dumps(run(X, args.queries, args.fetch_k, args.top_k), indent=2))
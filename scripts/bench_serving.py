@@ -0,0 +1,137 @@
+"""
+Memory per worker and aggregate throughput as front-end workers are added, for three layouts:
+
+	standalone  every worker loads its own DataFrame, embedding matrix and FAISS index
+	mmap        SHARED_MMAP=true: embeddings + index mapped read-only, shared via the page cache
+	sidecar     one app.serving process holds everything; workers are thin RetrievalClients
+
+	python -m scripts.bench_serving --n 100000 --workers 1 2 4 8 --duration 10
+
+Runs on a synthetic corpus in a temp dir with precomputed query vectors (no OpenAI calls).
+RSS counts shared pages in every process; PSS splits them between sharers, so sum(PSS) is
+the real footprint; USS is what each process holds privately.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+MODES = ("standalone", "mmap", "sidecar")
+
+
+def memory_mb(pid="self"):
+	"""Rss / Pss / Uss (private clean + dirty) in MiB from /proc/<pid>/smaps_rollup (Linux)."""
+	fields = {}
+	with open(f"/proc/{pid}/smaps_rollup") as f:
+		for line in f:
+			parts = line.split()
+			if len(parts) >= 3 and parts[1].isdigit():
+				fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+	return {"rss_mb": round(fields.get("Rss", 0), 1), "pss_mb": round(fields.get("Pss", 0), 1),
+			"uss_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1)}
+
+
+def _worker(mode, q_vecs, start, duration, top_k, out):
+	from app.query import search
+	if mode == "sidecar":
+		from app.serving import RetrievalClient
+		fn = RetrievalClient().search
+	else:
+		fn = search
+	fn("warm-up", top_k=top_k, llm=False, query_embedding=q_vecs[0])  # loads everything this worker will hold
+	start.wait()
+	deadline, n = time.perf_counter() + duration, 0
+	while time.perf_counter() < deadline:
+		fn(f"q{n}", top_k=top_k, llm=False, query_embedding=q_vecs[n % len(q_vecs)])
+		n += 1
+	out.put(dict(memory_mb(), queries=n))
+
+
+def _run(mode, n_workers, q_vecs, duration, top_k):
+	ctx = mp.get_context("spawn")  # fresh interpreters: nothing inherited copy-on-write from this process
+	start, out = ctx.Event(), ctx.Queue()
+	procs = [ctx.Process(target=_worker, args=(mode, q_vecs, start, duration, top_k, out)) for _ in range(n_workers)]
+	for p in procs:
+		p.start()
+	time.sleep(0.5)
+	start.set()
+	rows = [out.get() for _ in procs]
+	for p in procs:
+		p.join()
+	return {
+		"workers": n_workers,
+		"qps": round(sum(r["queries"] for r in rows) / duration, 1),
+		"rss_mb_per_worker": round(float(np.mean([r["rss_mb"] for r in rows])), 1),
+		"uss_mb_per_worker": round(float(np.mean([r["uss_mb"] for r in rows])), 1),
+		"pss_mb_total": round(sum(r["pss_mb"] for r in rows), 1),
+	}
+
+
+def _start_sidecar(address):
+	proc = subprocess.Popen([sys.executable, "-m", "app.serving", "--address", address])
+	for _ in range(600):
+		if os.path.exists(address):
+			return proc
+		if proc.poll() is not None:
+			raise RuntimeError("retrieval server exited during start-up")
+		time.sleep(0.1)
+	proc.kill()
+	raise RuntimeError("retrieval server did not start")
+
+
+def main(args):
+	workdir = tempfile.mkdtemp(prefix="bench_serving_")
+	os.environ.update({
+		"DATA_DIR": os.path.join(workdir, "data"), "CACHE_DIR": os.path.join(workdir, "cache"),
+		"OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key", "EMBED_PROVIDER": "openai",
+		"EMBED_STORAGE": "float32", "SHARD_SCHEME": "", "TRUNCATE_DIM": "0", "RESULT_CACHE_SIZE": "0",
+		"RETRIEVAL_SERVER": "",
+	})
+	from scripts.synth_corpus import write_corpus
+	write_corpus(workdir, args.n, args.dim, seed=args.seed)
+	subprocess.run([sys.executable, "-m", "scripts.build_index"], check=True, stdout=subprocess.DEVNULL)
+
+	rng = np.random.default_rng(args.seed)
+	q_vecs = rng.standard_normal((256, args.dim)).astype(np.float32)
+	q_vecs /= np.linalg.norm(q_vecs, axis=1, keepdims=True)
+
+	report = {"n": args.n, "dim": args.dim, "duration_s": args.duration, "modes": {}}
+	for mode in args.modes:
+		os.environ["SHARED_MMAP"] = "true" if mode in ("mmap", "sidecar") else "false"
+		sidecar = None
+		if mode == "sidecar":
+			address = os.path.join(workdir, "retrieval.sock")
+			sidecar = _start_sidecar(address)
+			os.environ["RETRIEVAL_SERVER"] = address
+		rows = []
+		for n_workers in args.workers:
+			row = _run(mode, n_workers, q_vecs, args.duration, args.top_k)
+			if sidecar is not None:
+				row["sidecar"] = memory_mb(sidecar.pid)
+				row["pss_mb_total"] = round(row["pss_mb_total"] + row["sidecar"]["pss_mb"], 1)
+			rows.append(row)
+			print(f"[{mode}] {json.dumps(row)}", file=sys.stderr)
+		if sidecar is not None:
+			sidecar.terminate()
+			sidecar.wait()
+			os.environ["RETRIEVAL_SERVER"] = ""
+		report["modes"][mode] = rows
+	return report
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--n", type=int, default=100000)
+	parser.add_argument("--dim", type=int, default=1536)
+	parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+	parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+	parser.add_argument("--duration", type=float, default=5.0)
+	parser.add_argument("--top-k", type=int, default=10)
+	parser.add_argument("--seed", type=int, default=42)
+	args = parser.parse_args()
+	print(json.dumps(main(args), indent=2))
@@ -0,0 +1,76 @@
+"""
+Sharded fan-out search: single-query latency and concurrent throughput as shard count and
+fan-out threads grow, against one monolithic IndexFlatL2.
+
+	python -m scripts.bench_shards --synthetic 200000 --shards 1 2 4 8 --threads 1 2 4 8
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from app.shards import ShardedIndex
+
+
+def build_in_memory(X, n_shards):
+	shards = {}
+	for s, ids in enumerate(np.array_split(np.arange(len(X)), n_shards)):
+		index = faiss.IndexFlatL2(X.shape[1])
+		index.add(X[ids])
+		shards[f"h{s:03d}"] = ({"name": f"h{s:03d}"}, index, ids.astype(np.int64))
+	return shards
+
+
+def run(X, shard_counts=(1, 2, 4, 8), threads=(1, 2, 4), k=50, n_queries=200, clients=8, seed=42):
+	rng = np.random.default_rng(seed)
+	Q = X[rng.integers(0, len(X), size=n_queries)]
+	flat = faiss.IndexFlatL2(X.shape[1])
+	flat.add(X)
+	_, truth = flat.search(Q, k)
+
+	report = {"n": len(X), "cpu_count": os.cpu_count(), "k": k, "runs": []}
+	for n_shards in shard_counts:
+		shards = build_in_memory(X, n_shards)
+		for th in threads:
+			index = ShardedIndex(shards, X.shape[1], max_workers=th, refresh_interval=0)
+			lat = []
+			for q in Q:
+				t0 = time.perf_counter()
+				_, I = index.search(q[None, :], k)
+				lat.append((time.perf_counter() - t0) * 1000)
+			# throughput with `clients` concurrent single-query callers
+			t0 = time.perf_counter()
+			with ThreadPoolExecutor(clients) as ex:
+				list(ex.map(lambda q: index.search(q[None, :], k), Q))
+			qps = n_queries / (time.perf_counter() - t0)
+			_, I = index.search(Q, k)
+			report["runs"].append({
+				"shards": n_shards,
+				"threads": th,
+				"ms_p50": round(float(np.percentile(lat, 50)), 3),
+				"ms_p99": round(float(np.percentile(lat, 99)), 3),
+				"qps": round(qps, 1),
+				"exact": bool(np.array_equal(np.sort(I, axis=1), np.sort(truth, axis=1))),
+			})
+			print(json.dumps(report["runs"][-1]))
+			index._pool.shutdown()
+	return report
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--synthetic", type=int, default=0, help="number of synthetic vectors (0 = cached corpus)")
+	parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+	parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+	parser.add_argument("-k", type=int, default=50)
+	parser.add_argument("--queries", type=int, default=200)
+	args = parser.parse_args()
+	if args.synthetic:
+		from scripts.bench_quantize import synthetic_embeddings
+		X = synthetic_embeddings(args.synthetic)
+	else:
+		from app.similarity_search import EMBED_PATH
+		X = np.load(EMBED_PATH)
+	print(json.dumps(run(X, args.shards, args.threads, args.k, args.queries), indent=2))
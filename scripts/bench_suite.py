@@ -0,0 +1,324 @@
+"""
+Offline benchmark suite: builds a synthetic corpus, serves the OpenAI endpoints from
+scripts.fake_openai, and times the real code paths against them — FAISS index build,
+`search` end to end (dense / hybrid, with and without the LLM summary), MMR, the
+re-ranking chain (single vs. batched), personalization, the JSON user store and
+`create_embeddings` throughput.
+
+Results go to bench_results/<commit>.json so runs can be compared across commits:
+
+	python -m scripts.bench_suite --n 100000 --queries 200
+	python -m scripts.bench_suite --n 20000 --latency-ms 40 --rate-429 0.05 --only search ingest
+	python -m scripts.bench_suite --compare bench_results/abc1234.json bench_results/def5678.json
+
+Nothing touches the real data, cache or user directories; everything runs in a temp dir.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+
+BENCHES = ("index", "search", "mmr", "rerank", "personalize", "users", "ingest")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench_results")
+
+
+def _latency(samples_ms):
+	a = np.asarray(samples_ms, dtype=np.float64)
+	return {
+		"p50_ms": round(float(np.percentile(a, 50)), 3),
+		"p95_ms": round(float(np.percentile(a, 95)), 3),
+		"p99_ms": round(float(np.percentile(a, 99)), 3),
+		"mean_ms": round(float(a.mean()), 3),
+		"qps_per_s": round(1000 * len(a) / float(a.sum()), 2) if a.sum() else 0.0,
+	}
+
+
+def _timed(fn, n):
+	out = []
+	for i in range(n):
+		t0 = time.perf_counter()
+		fn(i)
+		out.append((time.perf_counter() - t0) * 1000)
+	return _latency(out)
+
+
+def _git_commit():
+	try:
+		sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+		dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip())
+		return sha, dirty
+	except (OSError, subprocess.CalledProcessError):
+		return "unknown", False
+
+
+def bench_index(ctx):
+	from app.similarity_search import get_faiss_index
+	t0 = time.perf_counter()
+	index = get_faiss_index(ctx["embeddings"], use_cache=False)
+	build_s = time.perf_counter() - t0
+	ctx["index"] = index
+	return {"build_s": round(build_s, 3), "ntotal": index.ntotal}
+
+
+def bench_search(ctx):
+	from app.query import search
+	queries, n = ctx["queries"], len(ctx["queries"])
+	index = ctx.get("index")
+	out = {}
+	for label, kwargs in (
+		("dense", dict(mode="dense", llm=False)),
+		("dense_no_mmr", dict(mode="dense", llm=False, use_mmr=False)),
+		("hybrid", dict(mode="hybrid", llm=False)),
+		("dense_personalized", dict(mode="dense", llm=False, user=ctx["user"])),
+		("dense_llm", dict(mode="dense", llm=True)),
+	):
+		search(queries[0], index=index, **kwargs)  # warm-up: loads data, BM25, buffers
+		out[label] = _timed(lambda i: search(queries[i], index=index, **kwargs), n)
+	return out
+
+
+def bench_mmr(ctx):
+	from app.mmr import maximal_marginal_relevance, batched_mmr
+	X, rng = ctx["embeddings"], np.random.default_rng(ctx["seed"])
+	out = {}
+	for fetch_k in (25, 100, 500):
+		ids = rng.integers(0, len(X), size=(16, fetch_k))
+		cand = X[ids]
+		out[f"fetch_k={fetch_k}"] = {
+			"single": _timed(lambda i: maximal_marginal_relevance(X[ids[i % 16, 0]], cand[i % 16], top_k=10), 100),
+			"batch16_ms": _timed(lambda i: batched_mmr(X[ids[:, 0]], cand, top_k=10), 20)["mean_ms"],
+		}
+	return out
+
+
+def bench_rerank(ctx):
+	"""
+	The re-ranking chain + MMR for 16 queries' candidate pools: one CandidatePool.rank per query
+	vs. one batched app.rerank.rerank call (same ids), personalized for the bench user.
+	"""
+	from app import users
+	from app.pool import CandidatePool
+	from app.rerank import HasPdf, Personalization, TimeDecay, features_for, rerank
+	from app.similarity_search import load_data
+	X, df, rng = ctx["embeddings"], load_data(), np.random.default_rng(ctx["seed"])
+	features = features_for(df)
+	interests = users.compute_user_interests(ctx["user"], X, df)
+	out = {"features_ms": _timed(lambda i: type(features).from_df(df), 3)["mean_ms"]}
+	for n in (50, 200):
+		Q = np.asarray(X[rng.integers(0, len(X), size=16)], dtype=np.float32)
+		I = rng.integers(0, len(X), size=(16, n))
+		V = np.asarray(X[I.ravel()], dtype=np.float32).reshape(16, n, -1)
+		D = ((V - Q[:, None]) ** 2).sum(axis=2).astype(np.float32)
+		order = np.argsort(D, axis=1, kind="stable")
+		I, D = np.take_along_axis(I, order, axis=1), np.take_along_axis(D, order, axis=1)
+		V = np.take_along_axis(V, order[:, :, None], axis=1)
+
+		def single(i):
+			return [CandidatePool("q", "dense", 0, Q[b], I[b], D[b], V[b]).rank(10, n, True, user=ctx["user"], df=df,
+																				   embeddings=X, features=features)
+					for b in range(16)]
+
+		batched = rerank(I, D, V, Q, 10, features, interests=interests)
+		assert all((s == batched[b]).all() for b, s in enumerate(single(0))), "batched re-ranking disagrees with the pool"
+		full_chain = [Personalization(0.25), TimeDecay(0.02, 730), HasPdf(0.005)]
+		out[f"n={n}"] = {
+			"single_x16_ms": _timed(single, 10)["mean_ms"],
+			"batch16_ms": _timed(lambda i: rerank(I, D, V, Q, 10, features, interests=interests), 20)["mean_ms"],
+			"batch16_recency_pdf_ms": _timed(lambda i: rerank(I, D, V, Q, 10, features, interests=interests,
+															  chain=full_chain), 20)["mean_ms"],
+		}
+	return out
+
+
+def bench_personalize(ctx):
+	from app import users
+	from app.users import personalize_scores, blend_user_scores
+	from app.similarity_search import load_data
+	X, df, rng = ctx["embeddings"], load_data(), np.random.default_rng(ctx["seed"])
+	q = X[0]
+	ids = rng.integers(0, len(X), size=50)
+	D = rng.random(50).astype(np.float32)
+	user_vec = X[:20].mean(axis=0)
+	out = {
+		# includes reading the profile and mapping liked URLs back to rows
+		"personalize_scores": _timed(lambda i: personalize_scores(ctx["user"], q, X[ids], D, df, X, 0.25), 50),
+		"blend_only": _timed(lambda i: blend_user_scores(user_vec, X[ids], D, 0.25), 500),
+	}
+	# interest profiles as likes grow: full k-means fit, folding in one new like, cached lookup, scoring
+	rows = df.to_dict("records")
+	for n_likes in (10, 100, 1000):
+		user = f"bench_likes_{n_likes}"
+		users.create_user(user, "x")
+		for r in rng.choice(len(rows), size=min(n_likes, len(rows)), replace=False):
+			users.like_paper(user, rows[r])
+		t0 = time.perf_counter()
+		centroids = users.compute_user_interests(user, X, df)
+		fit_ms = (time.perf_counter() - t0) * 1000
+		fold = []
+		for i in range(5):
+			users.like_paper(user, rows[int(rng.integers(len(rows)))])
+			t0 = time.perf_counter()
+			users.compute_user_interests(user, X, df)
+			fold.append((time.perf_counter() - t0) * 1000)
+		out[f"interests_{n_likes}_likes"] = {
+			"fit_ms": round(fit_ms, 3),
+			"fold_in_ms": round(float(np.mean(fold)), 3),
+			"cached": _timed(lambda i: users.compute_user_interests(user, X, df), 50),
+			"blend": _timed(lambda i: blend_user_scores(centroids, X[ids], D, 0.25), 500),
+		}
+	return out
+
+
+def bench_users(ctx):
+	from app import users
+	from app.similarity_search import load_data
+	df = load_data()
+	users.create_user("bench_writer", "x")
+	rows = df.iloc[:200].to_dict("records")
+	return {
+		"get_user_data": _timed(lambda i: users.get_user_data(ctx["user"]), 500),
+		"add_search_history": _timed(lambda i: users.add_search_history("bench_writer", f"q{i}", rows[:5]), 200),
+		"like_paper": _timed(lambda i: users.like_paper("bench_writer", rows[i]), 200),
+		"is_paper_liked": _timed(lambda i: users.is_paper_liked("bench_writer", rows[i]["paper_url"]), 200),
+	}
+
+
+def bench_ingest(ctx):
+	from app.api import create_embeddings
+	from app.similarity_search import load_data
+	data = load_data().iloc[:ctx["ingest_docs"]]
+	t0 = time.perf_counter()
+	# rpm lifted so this measures the API round trips, not the account-level limiter
+	create_embeddings(data, use_cache=False, batch_size=ctx["ingest_batch"], rpm=10**6)
+	elapsed = time.perf_counter() - t0
+	return {"docs": len(data), "batch_size": ctx["ingest_batch"], "elapsed_s": round(elapsed, 3),
+			"docs_per_s": round(len(data) / elapsed, 1)}
+
+
+def run(args):
+	from scripts.fake_openai import FakeOpenAI
+
+	workdir = tempfile.mkdtemp(prefix="bench_suite_")
+	server = FakeOpenAI(latency_ms=args.latency_ms, per_item_ms=args.per_item_ms, rate_429=args.rate_429, dim=args.dim).start()
+	# settings are read when `app` is first imported, so the environment has to be in place before
+	# any app (or app-importing script) import
+	os.environ.update({
+		"DATA_DIR": os.path.join(workdir, "data"), "CACHE_DIR": os.path.join(workdir, "cache"),
+		"OPENAI_BASE_URL": server.base_url, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+		"EMBED_PROVIDER": "openai", "EMBED_STORAGE": "float32", "SHARD_SCHEME": "", "TRUNCATE_DIM": "0",
+		"RESULT_CACHE_SIZE": "0", "TRACE_QUERIES": "false",
+	})
+	from scripts.synth_corpus import write_corpus
+	t0 = time.perf_counter()
+	write_corpus(workdir, args.n, args.dim, args.kind, args.seed)
+	corpus_s = time.perf_counter() - t0
+
+	from app import metrics, users
+	from app.similarity_search import load_data, load_embeddings
+	users.USERS_DIR = os.path.join(workdir, "users")
+	os.makedirs(users.USERS_DIR, exist_ok=True)
+
+	df = load_data()
+	users.create_user("bench_user", "x")
+	for row in df.iloc[:: max(1, len(df) // 20)].head(20).to_dict("records"):
+		users.like_paper("bench_user", row)
+
+	rng = np.random.default_rng(args.seed)
+	titles = df["title"].astype(str).to_numpy()
+	ctx = {
+		"embeddings": load_embeddings(), "user": "bench_user", "seed": args.seed,
+		"queries": [" ".join(titles[i].split()[:5]) for i in rng.integers(0, len(df), size=args.queries)],
+		"ingest_docs": min(args.ingest_docs, len(df)), "ingest_batch": args.ingest_batch,
+	}
+
+	results = {}
+	only = args.only or BENCHES
+	for name in BENCHES:
+		if name not in only:
+			continue
+		print(f"[bench] {name}...", file=sys.stderr)
+		results[name] = globals()[f"bench_{name}"](ctx)
+	server.stop()
+
+	sha, dirty = _git_commit()
+	return {
+		"commit": sha, "dirty": dirty, "timestamp": datetime.now().isoformat(timespec="seconds"),
+		"machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+		"config": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+		"corpus_build_s": round(corpus_s, 3),
+		"fake_openai": dict(server.counts),
+		"openai_counters": {k: v for k, v in metrics.snapshot()["counters"].items() if k.startswith("openai_")},
+		"results": results,
+	}
+
+
+def _flatten(d, prefix=""):
+	out = {}
+	for k, v in d.items():
+		key = f"{prefix}.{k}" if prefix else k
+		if isinstance(v, dict):
+			out.update(_flatten(v, key))
+		elif isinstance(v, (int, float)) and not isinstance(v, bool):
+			out[key] = v
+	return out
+
+
+def compare(base, new, threshold=0.10):
+	"""
+	Per-metric change from `base` to `new` result files. `*_ms` / `*_s` are lower-is-better,
+	`*_per_s` higher-is-better; a change worse than `threshold` is flagged as a regression.
+	Returns the number of regressions.
+	"""
+	a, b = _flatten(base["results"]), _flatten(new["results"])
+	print(f"{'metric':60s} {base['commit']:>12s} {new['commit']:>12s} {'change':>9s}")
+	regressions = 0
+	for key in sorted(set(a) & set(b)):
+		if key.endswith("_per_s"):
+			better = 1
+		elif key.endswith(("_ms", "_s")):
+			better = -1
+		else:
+			continue
+		change = (b[key] - a[key]) / a[key] if a[key] else 0.0
+		flag = ""
+		if better * change < -threshold:
+			flag, regressions = "  REGRESSION", regressions + 1
+		print(f"{key:60s} {a[key]:12.3f} {b[key]:12.3f} {change:+8.1%}{flag}")
+	return regressions
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--n", type=int, default=20000, help="corpus size (10k-1M)")
+	parser.add_argument("--dim", type=int, default=1536)
+	parser.add_argument("--kind", choices=("clustered", "random"), default="clustered")
+	parser.add_argument("--queries", type=int, default=100)
+	parser.add_argument("--latency-ms", type=float, default=0.0, help="fake OpenAI per-request latency")
+	parser.add_argument("--per-item-ms", type=float, default=0.0, help="extra fake latency per embedded text")
+	parser.add_argument("--rate-429", type=float, default=0.0, help="share of fake OpenAI requests rejected with 429")
+	parser.add_argument("--ingest-docs", type=int, default=5000)
+	parser.add_argument("--ingest-batch", type=int, default=400)
+	parser.add_argument("--seed", type=int, default=42)
+	parser.add_argument("--only", nargs="+", choices=BENCHES)
+	parser.add_argument("--out", help="result file (default bench_results/<commit>.json)")
+	parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="diff two result files and exit")
+	parser.add_argument("--threshold", type=float, default=0.10)
+	args = parser.parse_args()
+
+	if args.compare:
+		with open(args.compare[0]) as f0, open(args.compare[1]) as f1:
+			sys.exit(1 if compare(json.load(f0), json.load(f1), args.threshold) else 0)
+
+	report = run(args)
+	out = args.out or os.path.join(RESULTS_DIR, f"{report['commit']}{'-dirty' if report['dirty'] else ''}.json")
+	os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+	with open(out, "w") as f:
+		json.dump(report, f, indent=2)
+	print(json.dumps(report["results"], indent=2))
+	print(f"Wrote {out}", file=sys.stderr)
@@ -0,0 +1,74 @@
+"""
+Recall and latency of two-stage (truncated coarse search + exact full-vector re-score)
+retrieval against a single IndexFlatL2 over all dimensions.
+
+	python -m scripts.bench_two_stage --synthetic 200000 --dims 128 256 512 --pool 4 8 16
+"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from app.similarity_search import TwoStageIndex, _truncate
+
+
+def _per_query_ms(index, Q, k):
+	lat = []
+	for q in Q:
+		t0 = time.perf_counter()
+		index.search(q[None, :], k)
+		lat.append((time.perf_counter() - t0) * 1000)
+	return lat
+
+
+def run(X, dims=(128, 256, 512), pool_factors=(4, 8, 16), k=50, n_queries=200, seed=42):
+	rng = np.random.default_rng(seed)
+	n, d = X.shape
+	Q = X[rng.integers(0, n, size=n_queries)] + 0.05 * rng.standard_normal((n_queries, d)).astype(np.float32)
+	Q /= np.linalg.norm(Q, axis=1, keepdims=True)
+
+	flat = faiss.IndexFlatL2(d)
+	flat.add(X)
+	_, truth = flat.search(Q, k)
+	flat_lat = _per_query_ms(flat, Q, k)
+	report = {"n": n, "d": d, "k": k, "flat_ms_p50": round(float(np.median(flat_lat)), 3), "runs": []}
+
+	for dim in dims:
+		coarse = faiss.IndexFlatIP(dim)
+		coarse.add(_truncate(X, dim))
+		for pf in pool_factors:
+			index = TwoStageIndex(coarse, X, pool_factor=pf)
+			_, I = index.search(Q, k)
+			recall = np.mean([len(set(I[i]) & set(truth[i])) / k for i in range(n_queries)])
+			# recall of the coarse stage alone, i.e. without the exact re-score
+			_, Ic = coarse.search(_truncate(Q, dim), k)
+			coarse_recall = np.mean([len(set(Ic[i]) & set(truth[i])) / k for i in range(n_queries)])
+			lat = _per_query_ms(index, Q, k)
+			report["runs"].append({
+				"dim": dim,
+				"pool_factor": pf,
+				f"recall@{k}": round(float(recall), 4),
+				f"coarse_only_recall@{k}": round(float(coarse_recall), 4),
+				"ms_p50": round(float(np.percentile(lat, 50)), 3),
+				"ms_p99": round(float(np.percentile(lat, 99)), 3),
+				"speedup_p50": round(float(np.median(flat_lat) / np.percentile(lat, 50)), 2),
+			})
+			print(json.dumps(report["runs"][-1]))
+	return report
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--synthetic", type=int, default=0, help="number of synthetic vectors (0 = cached corpus)")
+	parser.add_argument("--dims", type=int, nargs="+", default=[128, 256, 512])
+	parser.add_argument("--pool", type=int, nargs="+", default=[4, 8, 16])
+	parser.add_argument("-k", type=int, default=50)
+	parser.add_argument("--queries", type=int, default=200)
+	args = parser.parse_args()
+	if args.synthetic:
+		from scripts.bench_quantize import synthetic_embeddings
+		X = synthetic_embeddings(args.synthetic)
+	else:
+		from app.similarity_search import EMBED_PATH
+		X = np.load(EMBED_PATH)
+	print(json.dumps(run(X, args.dims, args.pool, args.k, args.queries), indent=2))
@@ -0,0 +1,119 @@
+"""
+Typeahead latency: build time and size of the title/phrase prefix index, and `suggest` latency
+per prefix length (history + popular searches + titles), on a synthetic title corpus.
+
+	python -m scripts.bench_typeahead --n 1000000 --queries 2000
+	python -m scripts.bench_typeahead --parquet            # the app's parquet instead
+
+Prefixes are cut from random titles and logged searches at 2-30 characters, as typed.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+
+def synthetic_titles(n, seed=42):
+	from scripts.bench_lexical import synthetic_corpus
+	from scripts.synth_corpus import TOPICS
+	rng = np.random.default_rng(seed)
+	titles = synthetic_corpus(n, doc_len=12, seed=seed)["title"]
+	topics = np.array(TOPICS)[rng.integers(0, len(TOPICS), size=n)]
+	return pd.DataFrame({"title": [f"{t} {w}" for t, w in zip(topics, titles.str.slice(0, 40))]})
+
+
+def main(args):
+	from app import users
+	from app import typeahead
+	from app.cache import normalize_query
+	from app.typeahead import PrefixIndex, record_query, suggest
+	rng = np.random.default_rng(args.seed)
+	if args.parquet:
+		from app.similarity_search import load_data
+		df = load_data()
+	else:
+		df = synthetic_titles(args.n, args.seed)
+	titles = df["title"].fillna("").astype(str).to_numpy()
+
+	start = time.perf_counter()
+	index = PrefixIndex.build(titles.tolist())
+	build_s = time.perf_counter() - start
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "typeahead.npz")
+		index.save(path)
+		file_mb = os.path.getsize(path) / 2**20
+		start = time.perf_counter()
+		PrefixIndex.load(path)
+		load_s = time.perf_counter() - start
+
+		# a query log: each user re-runs variants of a few title-like queries
+		users.USERS_DIR = tmp
+		now = datetime.now().isoformat()
+		logged = [" ".join(titles[i].split()[:rng.integers(2, 6)]) for i in rng.integers(0, len(titles), size=args.distinct)]
+		for u in range(args.users):
+			history = [{"query": logged[i], "timestamp": now} for i in rng.integers(0, len(logged), size=100)]
+			with open(os.path.join(tmp, f"user{u}.json"), "w") as f:
+				json.dump({"username": f"user{u}", "search_history": history}, f)
+
+		sources = [titles[i] for i in rng.integers(0, len(titles), size=args.queries // 2)]
+		sources += [logged[i] for i in rng.integers(0, len(logged), size=args.queries - len(sources))]
+		cuts = rng.integers(2, 31, size=len(sources))
+		prefixes = [s[:c] for s, c in zip(sources, cuts)]
+		suggest("warm-up", user="user0", index=index)  # loads history / popular searches once
+
+		lat, lengths, empty = [], [], 0
+		for p in prefixes:
+			user = f"user{rng.integers(0, args.users)}"
+			t0 = time.perf_counter()
+			out = suggest(p, user=user, k=args.k, index=index)
+			lat.append((time.perf_counter() - t0) * 1000)
+			lengths.append(len(p))
+			empty += not out
+		# the packed title/phrase index alone (what a prefix nobody has searched before costs)
+		index_lat = []
+		for p in prefixes:
+			key = normalize_query(p)
+			t0 = time.perf_counter()
+			index.complete(key, args.k)
+			index_lat.append((time.perf_counter() - t0) * 1000)
+		t0 = time.perf_counter()
+		for q in logged[:1000]:
+			record_query("user0", q + " variant")
+		record_us = (time.perf_counter() - t0) / min(1000, len(logged)) * 1e6
+
+	lat, lengths = np.asarray(lat), np.asarray(lengths)
+	by_length = {}
+	for lo, hi in ((2, 4), (4, 8), (8, 16), (16, 31)):
+		sel = lat[(lengths >= lo) & (lengths < hi)]
+		if len(sel):
+			by_length[f"{lo}-{hi - 1}_chars"] = {"p50_ms": round(float(np.percentile(sel, 50)), 3),
+												 "p99_ms": round(float(np.percentile(sel, 99)), 3)}
+	return {
+		"titles": len(titles), "entries": len(index), "phrases": int((index.kinds == typeahead.PHRASE).sum()),
+		"build_s": round(build_s, 1), "load_s": round(load_s, 2),
+		"memory_mb": round(index.nbytes / 2**20, 1), "file_mb": round(file_mb, 1),
+		"queries": len(prefixes), "no_suggestion": empty,
+		"p50_ms": round(float(np.percentile(lat, 50)), 3), "p95_ms": round(float(np.percentile(lat, 95)), 3),
+		"p99_ms": round(float(np.percentile(lat, 99)), 3), "max_ms": round(float(lat.max()), 3),
+		"by_prefix_length": by_length,
+		"index_only_p50_ms": round(float(np.percentile(index_lat, 50)), 3),
+		"index_only_p99_ms": round(float(np.percentile(index_lat, 99)), 3),
+		"record_query_us": round(record_us, 1),
+	}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--n", type=int, default=1000000, help="synthetic titles")
+	parser.add_argument("--parquet", action="store_true", help="use the app's parquet titles")
+	parser.add_argument("--queries", type=int, default=2000)
+	parser.add_argument("--users", type=int, default=50)
+	parser.add_argument("--distinct", type=int, default=2000, help="distinct logged searches")
+	parser.add_argument("-k", type=int, default=8)
+	parser.add_argument("--seed", type=int, default=42)
+	args = parser.parse_args()
+	print(json.dumps(main(args), indent=2))
@@ -0,0 +1,140 @@
+"""
+Cold vs. warm start: the first searches after a restart, with and without the startup warmup
+(app.warmup). Each run is a fresh process (empty query-embedding and result caches) whose
+index and embedding files are first dropped from the page cache; it then replays --replay
+searches drawn from the same Zipf-distributed query log the warmup learns from.
+
+	python -m scripts.bench_warmup --users 50 --history 40 --distinct 500 --replay 200 --warmup-queries 0 100 300
+
+A local fake OpenAI server answers embeddings (and explanations with --llm) after --latency-ms.
+Per run (cold = load only, then warmup sizes): time to ready, warmup report, p50/p90/p99/max and
+the first-20 mean of the replayed searches.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+
+
+def _zipf_queries(rng, n, distinct, s):
+	weights = 1.0 / np.arange(1, distinct + 1) ** s
+	return [f"warmup benchmark query {i}" for i in rng.choice(distinct, size=n, p=weights / weights.sum())]
+
+
+def _write_users(users_dir, args):
+	rng = np.random.default_rng(args.seed)
+	now = datetime.now().isoformat()
+	for u in range(args.users):
+		history = [{"query": q, "timestamp": now, "results_count": 5, "top_result": None}
+				   for q in _zipf_queries(rng, args.history, args.distinct, args.zipf)]
+		with open(os.path.join(users_dir, f"user{u}.json"), "w") as f:
+			json.dump({"username": f"user{u}", "password": "", "liked_papers": [], "search_history": history}, f)
+
+
+def _drop_page_cache(paths):
+	for path in paths:
+		fd = os.open(path, os.O_RDONLY)
+		try:
+			os.fdatasync(fd)
+			os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+		finally:
+			os.close(fd)
+
+
+def child(args):
+	"""One fresh process: optional warmup, then the replayed searches."""
+	start = time.perf_counter()
+	from app import users, warmup
+	users.USERS_DIR = args.users_dir
+	from app.query import results_cache, search
+	if args.cold:
+		from app.similarity_search import get_lookup_table
+		get_lookup_table()  # load only: what a restart without warmup does before its first search
+		report = None
+	else:
+		report = warmup.run()
+	ready_s = time.perf_counter() - start
+
+	queries = _zipf_queries(np.random.default_rng(args.seed + 1), args.replay, args.distinct, args.zipf)
+	timings = []
+	for q in queries:
+		t = time.perf_counter()
+		search(q, llm=args.llm)
+		timings.append((time.perf_counter() - t) * 1000)
+	ms = np.asarray(timings)
+	first = ms[:min(20, len(ms))]
+	print(json.dumps({
+		"ready_s": round(ready_s, 2), "warmup": report,
+		**{f"p{q}_ms": round(float(np.percentile(ms, q)), 1) for q in (50, 90, 99)},
+		"max_ms": round(float(ms.max()), 1), "first20_mean_ms": round(float(first.mean()), 1),
+		"result_cache_hit_rate": round(results_cache.stats()["hit_rate"], 3),
+	}))
+
+
+def main(args):
+	workdir = tempfile.mkdtemp(prefix="bench_warmup_")
+	users_dir = os.path.join(workdir, "users")
+	os.makedirs(users_dir)
+	os.environ.update({
+		"DATA_DIR": os.path.join(workdir, "data"), "CACHE_DIR": os.path.join(workdir, "cache"),
+		"OPENAI_API_KEY": "fake-key", "EMBED_PROVIDER": "openai", "EMBED_STORAGE": "float32",
+		"SHARD_SCHEME": "", "TRUNCATE_DIM": "0", "RETRIEVAL_SERVER": "", "SEARCH_DEADLINE_MS": "0",
+		"SHARED_MMAP": "true", "WARMUP_SECONDS": str(args.warmup_seconds),
+		"WARMUP_LLM_CALLS": str(args.llm_calls), "WARMUP_THREADS": str(args.threads),
+	})
+	from scripts.fake_openai import FakeOpenAI
+	from scripts.synth_corpus import write_corpus
+	server = FakeOpenAI(latency_ms=args.latency_ms, dim=args.dim, seed=args.seed).start()
+	os.environ["OPENAI_BASE_URL"] = server.base_url
+	write_corpus(workdir, args.n, args.dim, seed=args.seed)
+	subprocess.run([sys.executable, "-m", "scripts.build_index"], check=True, stdout=subprocess.DEVNULL)
+	_write_users(users_dir, args)
+	cache_files = [os.path.join(root, f) for root, _, files in os.walk(os.environ["CACHE_DIR"]) for f in files]
+
+	report = {"n": args.n, "users": args.users, "history": args.history, "distinct": args.distinct,
+			  "replay": args.replay, "latency_ms": args.latency_ms, "llm": args.llm, "runs": {}}
+	for n in [None] + args.warmup_queries:
+		_drop_page_cache(cache_files)
+		cmd = [sys.executable, "-m", "scripts.bench_warmup", "--child", "--users-dir", users_dir,
+			   "--replay", str(args.replay), "--distinct", str(args.distinct), "--zipf", str(args.zipf),
+			   "--seed", str(args.seed), "--llm" if args.llm else "--no-llm"] + (["--cold"] if n is None else [])
+		out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=dict(os.environ, WARMUP_QUERIES=str(n or 0)))
+		row = json.loads(out.stdout.strip().splitlines()[-1])
+		name = "cold" if n is None else f"warmup_{n}" if n else "pages_only"
+		report["runs"][name] = row
+		print(f"[{name}] {json.dumps(row)}", file=sys.stderr)
+	report["upstream_requests"] = server.counts
+	server.stop()
+	return report
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--n", type=int, default=20000)
+	parser.add_argument("--dim", type=int, default=1536)
+	parser.add_argument("--users", type=int, default=50)
+	parser.add_argument("--history", type=int, default=40, help="logged searches per user")
+	parser.add_argument("--distinct", type=int, default=500, help="distinct queries in the log")
+	parser.add_argument("--zipf", type=float, default=1.1, help="query popularity exponent")
+	parser.add_argument("--replay", type=int, default=200, help="searches after startup")
+	parser.add_argument("--warmup-queries", type=int, nargs="+", default=[0, 100, 300],
+						help="warmed runs to compare with the cold one (0 = page touch only)")
+	parser.add_argument("--warmup-seconds", type=float, default=120.0)
+	parser.add_argument("--llm-calls", type=int, default=0)
+	parser.add_argument("--threads", type=int, default=4)
+	parser.add_argument("--latency-ms", type=float, default=80.0)
+	parser.add_argument("--llm", action=argparse.BooleanOptionalAction, default=False)
+	parser.add_argument("--seed", type=int, default=42)
+	parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+	parser.add_argument("--users-dir", help=argparse.SUPPRESS)
+	parser.add_argument("--cold", action="store_true", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child:
+		child(args)
+	else:
+		print(json.dumps(main(args), indent=2))
@@ -0,0 +1,63 @@
+"""
+Build the FAISS index from the cached embedding matrix without loading it into RAM:
+vectors are streamed from a memory map in chunks, FAISS uses every core, progress is
+checkpointed so an interrupted build resumes, and the index + sidecar are renamed into place.
+
+	python -m scripts.build_index                        # EMBED_STORAGE's index type
+	python -m scripts.build_index --storage int8 --threads 16
+	python -m scripts.build_index --force                # rebuild after the embeddings/parquet changed
+	python -m scripts.build_index --verify               # only check the existing index against its sidecar
+"""
+import argparse
+import os
+import sys
+import time
+import faiss
+import numpy as np
+from app import settings
+from app.similarity_search import (CACHE_PATH, EMBED_PATH, INDEX_FILES, build_index, check_index_meta,
+								   index_file_name)
+
+
+def main(args):
+	storage = args.storage or settings.embed_storage
+	index_path = os.path.join(CACHE_PATH, args.file_name or index_file_name(storage))
+
+	if os.path.exists(index_path) and not args.force:
+		index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+		try:
+			meta = check_index_meta(index_path, index)
+		except ValueError as e:
+			print(f"{e}", file=sys.stderr)
+			return 1
+		print(f"{index_path} is up to date ({index.ntotal} vectors, built {meta.get('built_at', '?') if meta else 'without a sidecar'})")
+		return 0
+	if args.verify:
+		print(f"No index at {index_path}", file=sys.stderr)
+		return 1
+
+	embeddings = np.load(EMBED_PATH, mmap_mode="r")
+	print(f"Building {storage} index from {EMBED_PATH}: {embeddings.shape[0]} x {embeddings.shape[1]}, "
+		  f"{args.threads or os.cpu_count()} threads")
+	start = time.perf_counter()
+	index = build_index(embeddings, index_path, storage, args.chunk_size, args.threads, args.train_size,
+						resume=not args.no_resume, checkpoint_every=args.checkpoint_every)
+	print(f"Wrote {index_path}: {index.ntotal} vectors in {time.perf_counter() - start:.1f}s")
+	return 0
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--storage", choices=sorted(INDEX_FILES), help="default: EMBED_STORAGE")
+	parser.add_argument("--file-name", help="index file name inside CACHE_DIR")
+	parser.add_argument("--chunk-size", type=int, default=100000)
+	parser.add_argument("--threads", type=int, help="FAISS OpenMP threads (default: all cores)")
+	parser.add_argument("--train-size", type=int, default=100000, help="training sample for quantized index types")
+	parser.add_argument("--checkpoint-every", type=int, default=10, help="save progress every N chunks")
+	parser.add_argument("--no-resume", action="store_true", help="ignore a partial build left by an interrupted run")
+	parser.add_argument("--force", action="store_true", help="rebuild even if a matching index exists")
+	parser.add_argument("--verify", action="store_true", help="check the existing index and exit")
+	args = parser.parse_args()
+	if args.verify and args.force:
+		parser.error("--verify and --force are mutually exclusive")
+	sys.exit(main(args))
@@ -0,0 +1,42 @@
+"""
+Precompute the "related papers" graph: the k nearest neighbors of every paper, found with
+batched index searches on all cores and stored as a CSR int32 table next to the index
+(.cache/neighbors.npz, plus a .json sidecar fingerprinting the embeddings it was built from).
+The app only reads it: similar papers and the liked-papers feed are slice lookups, and a
+graph whose sidecar no longer matches the embeddings is ignored until it is rebuilt.
+
+	python -m scripts.build_neighbors --k 20
+	python -m scripts.build_neighbors --storage int8         # faster approximate pass over an SQ8 index
+	python -m scripts.build_neighbors --update               # only add rows appended since the last build
+"""
+import argparse
+import os
+import time
+import numpy as np
+from app import settings
+from app.neighbors import NEIGHBORS_FILE, NeighborGraph, build_neighbor_graph, save_neighbor_graph, update_neighbor_graph
+from app.similarity_search import CACHE_PATH, EMBED_PATH, INDEX_FILES, get_faiss_index
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--k", type=int, default=20)
+	parser.add_argument("--storage", choices=sorted(INDEX_FILES), help="index used for the k-NN pass (default: EMBED_STORAGE)")
+	parser.add_argument("--batch-size", type=int, default=4096)
+	parser.add_argument("--threads", type=int, help="FAISS OpenMP threads (default: all cores)")
+	parser.add_argument("--update", action="store_true", help="extend the existing graph to new rows instead of rebuilding")
+	args = parser.parse_args()
+
+	embeddings = np.load(EMBED_PATH, mmap_mode="r")
+	index = get_faiss_index(embeddings, storage=args.storage or settings.embed_storage)
+	path = os.path.join(CACHE_PATH, NEIGHBORS_FILE)
+
+	start = time.perf_counter()
+	if args.update and os.path.exists(path):
+		old = NeighborGraph.load(path)
+		graph = update_neighbor_graph(old, index, embeddings, args.batch_size)
+		print(f"Added {graph.n - old.n} papers to the neighbor graph in {time.perf_counter() - start:.1f}s")
+	else:
+		graph = build_neighbor_graph(index, embeddings, args.k, args.batch_size, args.threads)
+	save_neighbor_graph(graph)
+	print(f"Wrote {path}: {graph.n} papers, {len(graph.indices)} edges, {graph.nbytes / 2**20:.1f} MiB")
@@ -0,0 +1,24 @@
+"""
+Build the sharded index layout under .cache/shards, or rebuild individual shards in place.
+Running servers pick rebuilt shards up on their next refresh (hot-swap), no restart needed.
+--rebuild is refused once the embeddings/parquet changed: rebuild every shard then (and restart).
+
+	python -m scripts.build_shards --scheme year
+	python -m scripts.build_shards --scheme hash --shards 16
+	python -m scripts.build_shards --scheme year --rebuild 2024 2025
+"""
+import argparse
+import json
+from app import settings
+from app.shards import build_shards
+from app.similarity_search import load_data, load_embeddings
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--scheme", choices=["year", "hash"], default=settings.shard_scheme or "year")
+	parser.add_argument("--shards", type=int, default=settings.shard_count, help="hash buckets (scheme=hash)")
+	parser.add_argument("--rebuild", nargs="+", default=None, help="only rebuild these shard names")
+	args = parser.parse_args()
+	manifest = build_shards(load_data(), load_embeddings(), args.scheme, args.shards, only=args.rebuild)
+	print(json.dumps({n: {"count": s["count"], "version": s["version"]} for n, s in manifest["shards"].items()}, indent=2))
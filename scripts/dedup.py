@@ -0,0 +1,40 @@
+"""
+Near-duplicate pass over the corpus: batched FAISS range search finds every pair of papers
+whose embeddings are at least --min-similarity cosine-similar, clusters them, and writes a
+canonical-id array (.cache/canonical_ids.npy, lowest row id per cluster) plus cluster stats.
+`search` then keeps one version per cluster (COLLAPSE_DUPLICATES=true).
+
+	python -m scripts.dedup                          # DEDUP_SIMILARITY (0.97)
+	python -m scripts.dedup --min-similarity 0.95 --examples 10
+"""
+import argparse
+import json
+import numpy as np
+from app import settings
+from app.dedup import build_canonical_ids, save_canonical_ids
+from app.similarity_search import EMBED_PATH, INDEX_FILES, get_faiss_index, load_data
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--min-similarity", type=float, default=settings.dedup_similarity)
+	parser.add_argument("--storage", choices=sorted(INDEX_FILES), help="index used for the range search (default: EMBED_STORAGE)")
+	parser.add_argument("--batch-size", type=int, default=4096)
+	parser.add_argument("--threads", type=int, help="FAISS OpenMP threads (default: all cores)")
+	parser.add_argument("--examples", type=int, default=5, help="print this many of the largest clusters")
+	args = parser.parse_args()
+
+	embeddings = np.load(EMBED_PATH, mmap_mode="r")
+	index = get_faiss_index(embeddings, storage=args.storage or settings.embed_storage)
+	canonical = build_canonical_ids(index, embeddings, args.min_similarity, args.batch_size, args.threads)
+	stats = save_canonical_ids(canonical, args.min_similarity)
+	print(json.dumps(stats, indent=2))
+
+	if args.examples:
+		titles = load_data()["title"].astype(str).to_numpy()
+		sizes = np.bincount(canonical)
+		for root in np.argsort(-sizes)[:args.examples]:
+			if sizes[root] < 2:
+				break
+			members = np.flatnonzero(canonical == root)
+			print(f"\n[{sizes[root]}] " + "\n     ".join(titles[m][:100] for m in members[:5]))
@@ -0,0 +1,208 @@
+"""
+Ranking quality next to latency for `search`: recall@k, nDCG@k, intra-list diversity and
+latency percentiles per configuration, with parameter sweeps fanned out across processes.
+
+Query sets are JSON lines, one query per line, relevant papers as row ids and/or paper URLs:
+
+	{"query": "graph neural networks for molecules", "relevant": [1234, "https://paperswithcode.com/paper/..."]}
+
+Without one, a self-supervised set is drawn from the parquet: each sampled paper's title is
+the query and that paper is the single relevant result (title -> title+abstract retrieval).
+
+	python -m scripts.evaluate --self-supervised 500
+	python -m scripts.evaluate --queries labeled.jsonl --k 10 \\
+		--sweep fetch_k=25,50,100 lambda_param=0.5,0.7,0.9 index=flat,sq8,two_stage:256 --workers 4
+	python -m scripts.evaluate --self-supervised 300 --user alice --sweep blend_weight=0,0.25,0.5
+
+Query vectors are embedded once up front and shared by every configuration, so a sweep costs
+one embedding pass regardless of its size.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# search() keyword arguments a sweep may vary, with how to parse each value
+SEARCH_PARAMS = {"fetch_k": int, "lambda_param": float, "blend_weight": float, "use_mmr": lambda v: v.lower() in ("1", "true", "yes"),
+				 "mode": str, "top_k": int}
+# index specs: flat | fp16 | sq8 | two_stage:<dim>
+INDEX_KINDS = {"flat": "float32", "fp16": "float16", "sq8": "int8"}
+
+
+def load_query_set(path, df):
+	"""[(query, set(row ids))] from a JSON-lines file; URLs are mapped to row ids via `paper_url`."""
+	url_to_row = {u: i for i, u in enumerate(df["paper_url"].tolist())} if "paper_url" in df else {}
+	out = []
+	with open(path) as f:
+		for line in f:
+			if not line.strip():
+				continue
+			item = json.loads(line)
+			rel = {int(r) if isinstance(r, int) or str(r).isdigit() else url_to_row.get(r) for r in item["relevant"]}
+			rel.discard(None)
+			if rel:
+				out.append((item["query"], rel))
+	return out
+
+
+def self_supervised_set(df, n, seed=42):
+	"""Sample n papers with a title and an abstract; query = title, relevant = that row."""
+	ok = np.flatnonzero(df["title"].notna().to_numpy() & df["abstract"].notna().to_numpy())
+	rows = np.random.default_rng(seed).choice(ok, size=min(n, len(ok)), replace=False)
+	return [(str(df["title"].iloc[r]), {int(r)}) for r in rows]
+
+
+def recall_at_k(ranked, relevant, k):
+	return len(set(ranked[:k]) & relevant) / len(relevant)
+
+
+def ndcg_at_k(ranked, relevant, k):
+	dcg = sum(1.0 / np.log2(i + 2) for i, r in enumerate(ranked[:k]) if r in relevant)
+	idcg = sum(1.0 / np.log2(i + 2) for i in range(min(len(relevant), k)))
+	return dcg / idcg
+
+
+def intra_list_diversity(vecs):
+	"""Mean pairwise cosine distance within one result list (0 = identical items)."""
+	if len(vecs) < 2:
+		return 0.0
+	X = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+	S = X @ X.T
+	n = len(X)
+	return float(1.0 - (S.sum() - np.trace(S)) / (n * (n - 1)))
+
+
+def parse_sweep(specs):
+	"""["fetch_k=25,50", "index=flat,sq8"] -> list of config dicts (cartesian product)."""
+	axes = []
+	for spec in specs or []:
+		name, _, values = spec.partition("=")
+		if name != "index" and name not in SEARCH_PARAMS:
+			raise ValueError(f"cannot sweep {name!r}; choose from {sorted(SEARCH_PARAMS) + ['index']}")
+		parse = SEARCH_PARAMS.get(name, str)
+		axes.append([(name, parse(v)) for v in values.split(",")])
+	return [dict(combo) for combo in itertools.product(*axes)] or [{}]
+
+
+def _build_index(spec, embeddings):
+	from app.similarity_search import get_faiss_index, get_two_stage_index
+	if spec.startswith("two_stage:"):
+		return get_two_stage_index(embeddings, dim=int(spec.split(":", 1)[1]))
+	if spec not in INDEX_KINDS:
+		raise ValueError(f"index must be one of {sorted(INDEX_KINDS)} or two_stage:<dim>, got {spec!r}")
+	return get_faiss_index(embeddings, storage=INDEX_KINDS[spec])
+
+
+_worker = {}
+
+
+def _init_worker(queries, q_vecs, k, user):
+	from app import query as query_module
+	# every (query, config) pair must really run; whole-result cache hits would fake the latency
+	query_module.results_cache.maxsize = 0
+	query_module.results_cache.clear()
+	_worker.update(queries=queries, q_vecs=q_vecs, k=k, user=user, indexes={})
+
+
+def evaluate_config(config):
+	"""Run the query set through `search` with one configuration; returns its metrics row."""
+	from app.query import search
+	from app.similarity_search import load_embeddings
+	queries, q_vecs, k, user = _worker["queries"], _worker["q_vecs"], _worker["k"], _worker["user"]
+	embeddings = load_embeddings("float32")
+	spec = config.get("index", "flat")
+	if spec not in _worker["indexes"]:
+		_worker["indexes"][spec] = _build_index(spec, embeddings)
+	params = {name: v for name, v in config.items() if name in SEARCH_PARAMS}
+	top_k = params.pop("top_k", k)
+
+	# untimed warm-up: lazy loads (BM25 index, MMR buffers) would otherwise land in p99
+	search(queries[0][0], top_k=top_k, index=_worker["indexes"][spec], llm=False, user=user,
+		   query_embedding=None if q_vecs is None else q_vecs[0], **params)
+	recalls, ndcgs, ilds, lat = [], [], [], []
+	for i, (q, relevant) in enumerate(queries):
+		t0 = time.perf_counter()
+		_, _, I, _ = search(q, top_k=top_k, index=_worker["indexes"][spec], llm=False, user=user,
+							query_embedding=None if q_vecs is None else q_vecs[i], **params)
+		lat.append((time.perf_counter() - t0) * 1000)
+		ranked = [int(r) for r in I if r >= 0]
+		recalls.append(recall_at_k(ranked, relevant, top_k))
+		ndcgs.append(ndcg_at_k(ranked, relevant, top_k))
+		ilds.append(intra_list_diversity(embeddings[ranked]))
+
+	lat = np.asarray(lat)
+	return {
+		"config": dict(config, index=spec),
+		f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+		f"ndcg@{top_k}": round(float(np.mean(ndcgs)), 4),
+		"ild": round(float(np.mean(ilds)), 4),
+		"p50_ms": round(float(np.percentile(lat, 50)), 2),
+		"p95_ms": round(float(np.percentile(lat, 95)), 2),
+		"p99_ms": round(float(np.percentile(lat, 99)), 2),
+	}
+
+
+def _embed_queries(texts, batch_size=256):
+	from app.embeddings import get_provider
+	provider = get_provider()
+	return np.concatenate([provider.embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+
+def run(queries, configs, k=10, user=None, workers=1, precompute=True):
+	q_vecs = _embed_queries([q for q, _ in queries]) if precompute else None
+	if workers <= 1:
+		_init_worker(queries, q_vecs, k, user)
+		return [evaluate_config(c) for c in configs]
+	# build (and cache to disk) every index once here so workers only read them, never race to write
+	from app import settings
+	from app.lexical import get_bm25_index
+	from app.similarity_search import load_embeddings
+	for spec in sorted({c.get("index", "flat") for c in configs}):
+		_build_index(spec, load_embeddings("float32"))
+	if any(c.get("mode", settings.search_mode) != "dense" for c in configs):
+		get_bm25_index()
+	# each worker loads the corpus and its indexes once, then takes configs
+	with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(queries, q_vecs, k, user)) as pool:
+		return list(pool.map(evaluate_config, configs))
+
+
+def _print_table(rows):
+	metric_cols = [c for c in rows[0] if c != "config"]
+	config_cols = sorted({c for r in rows for c in r["config"]})
+	print("  ".join(f"{c:>14s}" for c in config_cols + metric_cols))
+	for r in rows:
+		cells = [str(r["config"].get(c, "")) for c in config_cols] + [str(r[c]) for c in metric_cols]
+		print("  ".join(f"{c:>14s}" for c in cells))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	source = parser.add_mutually_exclusive_group(required=True)
+	source.add_argument("--queries", help="JSON-lines query set with relevance labels")
+	source.add_argument("--self-supervised", type=int, metavar="N", help="sample N title -> paper pairs from the parquet")
+	parser.add_argument("--k", type=int, default=10)
+	parser.add_argument("--sweep", nargs="*", metavar="PARAM=V1,V2", help=f"grid over {sorted(SEARCH_PARAMS)} and index")
+	parser.add_argument("--user", help="personalize as this user (needed for blend_weight to matter)")
+	parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+	parser.add_argument("--no-precompute", action="store_true", help="let search() embed every query itself")
+	parser.add_argument("--seed", type=int, default=42)
+	parser.add_argument("--out", help="write the result rows as JSON")
+	args = parser.parse_args()
+
+	from app.similarity_search import load_data
+	df = load_data()
+	queries = load_query_set(args.queries, df) if args.queries else self_supervised_set(df, args.self_supervised, args.seed)
+	configs = parse_sweep(args.sweep)
+	if not args.user and any("blend_weight" in c for c in configs):
+		print("warning: blend_weight only affects personalized search; pass --user", file=sys.stderr)
+	print(f"{len(queries)} queries x {len(configs)} configs on {args.workers} worker(s)", file=sys.stderr)
+
+	rows = run(queries, configs, args.k, args.user, args.workers, precompute=not args.no_precompute)
+	_print_table(rows)
+	if args.out:
+		with open(args.out, "w") as f:
+			json.dump(rows, f, indent=2)
@@ -0,0 +1,188 @@
+"""
+Local stand-in for the two OpenAI endpoints the app calls (embeddings and responses), so
+ingestion, search and the LLM summary can be benchmarked offline. Latency and the share of
+requests answered with 429 (or stalled, to simulate a slow upstream) are configurable; embeddings are deterministic per input text.
+
+	python -m scripts.fake_openai --port 8900 --latency-ms 80 --rate-429 0.05
+	OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=fake streamlit run app/ui_app.py
+
+Or in-process (what scripts.bench_suite does):
+
+	server = FakeOpenAI(latency_ms=50).start()
+	os.environ["OPENAI_BASE_URL"] = server.base_url
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+
+def fake_embedding(text, dim=1536):
+	"""Unit vector seeded by the text, so the same input always maps to the same vector."""
+	seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+	v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+	return v / np.linalg.norm(v)
+
+
+class FakeOpenAI:
+	"""
+	Threaded HTTP server speaking just enough of the OpenAI API for the SDK:
+	POST /v1/embeddings and POST /v1/responses.
+
+	latency_ms: base delay per request, plus per_item_ms for every embedded text
+	rate_429:   probability a request is rejected with 429 and a Retry-After header
+	slow_rate:  probability a request stalls for an extra slow_ms (a slow-upstream tail)
+	"""
+
+	def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, per_item_ms=0.0, rate_429=0.0,
+				 retry_after=0.05, dim=1536, seed=42, slow_rate=0.0, slow_ms=0.0):
+		self.latency_ms = latency_ms
+		self.per_item_ms = per_item_ms
+		self.rate_429 = rate_429
+		self.retry_after = retry_after
+		self.slow_rate = slow_rate
+		self.slow_ms = slow_ms
+		self.dim = dim
+		self._rng = random.Random(seed)
+		self._rng_lock = threading.Lock()
+		self.counts = {"embeddings": 0, "responses": 0, "429": 0, "slow": 0}
+		self._server = ThreadingHTTPServer((host, port), self._handler())
+		self._server.daemon_threads = True
+		self._thread = None
+
+	@property
+	def base_url(self):
+		host, port = self._server.server_address[:2]
+		return f"http://{host}:{port}/v1"
+
+	def start(self):
+		self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._server.shutdown()
+		self._server.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
+		return False
+
+	def _throttled(self):
+		with self._rng_lock:
+			return self._rng.random() < self.rate_429
+
+	def _sleep(self, ms):
+		with self._rng_lock:
+			slow = self._rng.random() < self.slow_rate
+		if slow:
+			self.counts["slow"] += 1
+			ms += self.slow_ms
+		time.sleep(ms / 1000)
+
+	def _embeddings(self, body):
+		inputs = body.get("input", [])
+		if isinstance(inputs, str):
+			inputs = [inputs]
+		dim = body.get("dimensions") or self.dim
+		self._sleep(self.latency_ms + self.per_item_ms * len(inputs))
+		# the SDK asks for base64 (packed float32) unless the caller picks a format
+		if body.get("encoding_format") == "base64":
+			encode = lambda v: base64.b64encode(v.tobytes()).decode("ascii")
+		else:
+			encode = lambda v: v.tolist()
+		return {
+			"object": "list",
+			"model": body.get("model", "text-embedding-3-small"),
+			"data": [{"object": "embedding", "index": i, "embedding": encode(fake_embedding(str(t), dim))}
+					 for i, t in enumerate(inputs)],
+			"usage": {"prompt_tokens": sum(len(str(t).split()) for t in inputs),
+					  "total_tokens": sum(len(str(t).split()) for t in inputs)},
+		}
+
+	def _responses(self, body):
+		self._sleep(self.latency_ms)
+		prompt = json.dumps(body.get("input", ""))
+		text = f"Offline summary ({len(prompt)} prompt chars)."
+		return {
+			"id": f"resp_{zlib.crc32(prompt.encode()):08x}",
+			"object": "response",
+			"created_at": int(time.time()),
+			"model": body.get("model", "gpt-5"),
+			"status": "completed",
+			"output": [{
+				"type": "message", "id": "msg_fake", "status": "completed", "role": "assistant",
+				"content": [{"type": "output_text", "text": text, "annotations": []}],
+			}],
+			"parallel_tool_calls": False,
+			"tool_choice": "auto",
+			"tools": [],
+			"usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4,
+					  "total_tokens": (len(prompt) + len(text)) // 4},
+		}
+
+	def _handler(self):
+		server = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = "HTTP/1.1"
+
+			def log_message(self, *args):
+				pass
+
+			def _send(self, status, payload, headers=None):
+				data = json.dumps(payload).encode()
+				self.send_response(status)
+				self.send_header("Content-Type", "application/json")
+				self.send_header("Content-Length", str(len(data)))
+				for k, v in (headers or {}).items():
+					self.send_header(k, v)
+				self.end_headers()
+				self.wfile.write(data)
+
+			def do_POST(self):
+				body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+				path = self.path.rstrip("/")
+				route = {"/v1/embeddings": ("embeddings", server._embeddings),
+						 "/v1/responses": ("responses", server._responses)}.get(path)
+				if route is None:
+					self._send(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+					return
+				if server._throttled():
+					server.counts["429"] += 1
+					self._send(429, {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_error"}},
+							   {"Retry-After": str(server.retry_after)})
+					return
+				server.counts[route[0]] += 1
+				self._send(200, route[1](body))
+
+		return Handler
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8900)
+	parser.add_argument("--latency-ms", type=float, default=0.0)
+	parser.add_argument("--per-item-ms", type=float, default=0.0)
+	parser.add_argument("--rate-429", type=float, default=0.0)
+	parser.add_argument("--slow-rate", type=float, default=0.0)
+	parser.add_argument("--slow-ms", type=float, default=0.0)
+	parser.add_argument("--dim", type=int, default=1536)
+	args = parser.parse_args()
+	server = FakeOpenAI(args.host, args.port, args.latency_ms, args.per_item_ms, args.rate_429, dim=args.dim,
+						slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+	print(f"Fake OpenAI listening on {server.base_url}")
+	try:
+		server._server.serve_forever()
+	except KeyboardInterrupt:
+		server.stop()
@@ -3,9 +3,8 @@ import os
 import numpy as np
 import faiss
 from app import settings
-from app.api import create_embeddings as create_openai_embeddings
+from app.api import create_embeddings as create_provider_embeddings
 from app.similarity_search import get_faiss_index as create_faiss_index
-# from fastembed import TextEmbedding
 
 ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
 DATA_PATH = os.path.join(ROOT, "data")
@@ -22,8 +21,9 @@ def load_data(file_path=DATA_PATH+"paperswithcode.parquet"):
 	data = pd.read_parquet(file_path)
 	return data
 
-def create_embeddings(data, model=settings.openai_embed_model, use_cache=True):
-	return create_openai_embeddings(data, model=model, use_cache=use_cache)
+def create_embeddings(data, provider=None, model=None, use_cache=True):
+	"""Embed `content` with the configured provider (EMBED_PROVIDER=openai|fastembed)."""
+	return create_provider_embeddings(data, model=model, use_cache=use_cache, provider=provider)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,40 @@
+"""
+Publish the current build outputs (parquet, embeddings, FAISS index, plus BM25 / neighbor /
+dedup files if built) as a versioned snapshot under .cache/versions, and optionally make it
+the one every process serves. Running processes hot-swap to it within INDEX_POLL_SECONDS.
+
+	python -m scripts.build_index && python -m scripts.publish_version --activate
+	python -m scripts.publish_version --list
+	python -m scripts.publish_version --activate-only 20251002-0315   # roll back
+	python -m scripts.publish_version --prune 3
+"""
+import argparse
+import json
+from app.similarity_search import INDEX_FILES
+from app.versions import current_version, list_versions, prune_versions, publish_version, set_current
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--name", help="version name (default: timestamp)")
+	parser.add_argument("--storage", choices=sorted(INDEX_FILES), help="index/embedding storage to snapshot (default: EMBED_STORAGE)")
+	parser.add_argument("--activate", action="store_true", help="point CURRENT at the new version")
+	parser.add_argument("--activate-only", metavar="VERSION", help="point CURRENT at an already published version")
+	parser.add_argument("--list", action="store_true")
+	parser.add_argument("--prune", type=int, metavar="KEEP", help="delete all but the newest KEEP versions (never CURRENT)")
+	args = parser.parse_args()
+
+	if args.list:
+		current = current_version()
+		for v in list_versions():
+			print(f"{'*' if v == current else ' '} {v}")
+	elif args.activate_only:
+		set_current(args.activate_only)
+		print(f"CURRENT -> {args.activate_only}")
+	elif args.prune is not None:
+		print(f"Removed: {prune_versions(args.prune) or 'nothing'}")
+	else:
+		manifest = publish_version(args.name, args.storage, activate=args.activate)
+		print(json.dumps(manifest, indent=2))
+		if args.activate:
+			print(f"CURRENT -> {manifest['version']}")
@@ -0,0 +1,36 @@
+"""
+Precompute each user's "new papers for you" list (shown on the Liked Papers page) from their
+liked-paper interests and recent searches. Meant to run nightly, e.g. from cron:
+
+	15 3 * * *  cd /srv/paper-search && python -m scripts.recommend_users --workers 8
+
+	python -m scripts.recommend_users --users alice bob --k 30 --no-write   # dry run
+
+Prints a report with users/sec and where the time went (load, compute, write).
+"""
+import argparse
+import json
+from app.recommend import HISTORY_QUERIES, recommend_all
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--users", nargs="+", help="only these users (default: everyone)")
+	parser.add_argument("--k", type=int, default=20, help="papers per user")
+	parser.add_argument("--per-vector", type=int, default=50, help="index hits per profile vector before fusion")
+	parser.add_argument("--history", type=int, default=HISTORY_QUERIES, help="recent distinct searches per profile (0 = likes only)")
+	parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+	parser.add_argument("--chunk-size", type=int, default=64, help="users per batched index search")
+	parser.add_argument("--mmr", action=argparse.BooleanOptionalAction, default=True, help="diversify each list with MMR")
+	parser.add_argument("--lambda", dest="lambda_param", type=float, default=0.7, help="MMR relevance/diversity trade-off")
+	parser.add_argument("--write", action=argparse.BooleanOptionalAction, default=True)
+	parser.add_argument("--users-dir", help="user store to read and write (default: .users)")
+	args = parser.parse_args()
+	if args.users_dir:
+		from app import users
+		users.USERS_DIR = args.users_dir
+
+	report = recommend_all(args.users, k=args.k, per_vector=args.per_vector, history=args.history,
+						   workers=args.workers, chunk_size=args.chunk_size, write=args.write,
+						   use_mmr=args.mmr, lambda_param=args.lambda_param)
+	print(json.dumps(report, indent=2))
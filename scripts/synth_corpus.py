@@ -0,0 +1,75 @@
+"""
+Synthetic corpus in the app's on-disk layout: a fake-metadata `paperswithcode.parquet` in
+DATA_DIR and the matching embedding matrix at the provider's .npy cache path in CACHE_DIR,
+so every loader (`load_data`, `load_embeddings`, `get_faiss_index`, BM25) runs unchanged.
+
+	python -m scripts.synth_corpus --n 100000 --out /tmp/synth            # clustered vectors
+	python -m scripts.synth_corpus --n 1000000 --kind random --out /tmp/synth_1m
+	DATA_DIR=/tmp/synth/data CACHE_DIR=/tmp/synth/cache streamlit run app/ui_app.py
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from scripts.bench_lexical import synthetic_corpus
+from scripts.bench_quantize import synthetic_embeddings
+
+TOPICS = ("graph neural networks", "diffusion models", "time series forecasting", "object detection",
+		  "reinforcement learning", "language models", "speech recognition", "federated learning",
+		  "anomaly detection", "recommender systems", "3d reconstruction", "protein structure")
+
+
+def synthetic_vectors(n, d=1536, kind="clustered", seed=42, chunk=100000):
+	"""(n, d) float32 unit vectors: `clustered` (realistic neighbourhoods) or iid `random`."""
+	if kind == "clustered":
+		return synthetic_embeddings(n, d, seed=seed)
+	if kind != "random":
+		raise ValueError(f"kind must be 'clustered' or 'random', got {kind!r}")
+	rng = np.random.default_rng(seed)
+	X = np.empty((n, d), dtype=np.float32)
+	for i in range(0, n, chunk):
+		block = rng.standard_normal((min(chunk, n - i), d), dtype=np.float32)
+		X[i:i + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+	return X
+
+
+def synthetic_metadata(n, seed=42, vocab_size=50000):
+	"""Fake PwC rows with the columns the app reads: title, abstract, content, urls, date."""
+	rng = np.random.default_rng(seed)
+	df = synthetic_corpus(n, vocab_size=vocab_size, doc_len=60, seed=seed)
+	topics = np.array(TOPICS)[rng.integers(0, len(TOPICS), size=n)]
+	df["title"] = [f"{t} {w}" for t, w in zip(topics, df["title"].str.slice(0, 40))]
+	ids = np.arange(n)
+	df["paper_url"] = [f"https://paperswithcode.com/paper/synthetic-{i}" for i in ids]
+	# a fifth of the papers have no PDF, like the real dump
+	df["url_pdf"] = np.where(rng.random(n) < 0.8, [f"https://arxiv.org/pdf/synthetic.{i}.pdf" for i in ids], None)
+	days = rng.integers(0, 365 * 12, size=n)
+	df["date"] = (pd.Timestamp("2025-09-01") - pd.to_timedelta(days, unit="D")).strftime("%Y-%m-%d")
+	df["content"] = df["title"] + "\n" + df["abstract"]
+	return df
+
+
+def write_corpus(out_dir, n, d=1536, kind="clustered", seed=42, cache_name="openai_text_embedding_3_small"):
+	"""
+	Write `out_dir/data/paperswithcode.parquet` and `out_dir/cache/<cache_name>.npy`.
+	Point DATA_DIR / CACHE_DIR at those two directories to run the app on the result.
+	Returns (data_dir, cache_dir).
+	"""
+	data_dir, cache_dir = os.path.join(out_dir, "data"), os.path.join(out_dir, "cache")
+	os.makedirs(data_dir, exist_ok=True)
+	os.makedirs(cache_dir, exist_ok=True)
+	synthetic_metadata(n, seed).to_parquet(os.path.join(data_dir, "paperswithcode.parquet"), index=False)
+	np.save(os.path.join(cache_dir, f"{cache_name}.npy"), synthetic_vectors(n, d, kind, seed))
+	return data_dir, cache_dir
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--n", type=int, default=100000)
+	parser.add_argument("--dim", type=int, default=1536)
+	parser.add_argument("--kind", choices=("clustered", "random"), default="clustered")
+	parser.add_argument("--seed", type=int, default=42)
+	parser.add_argument("--out", required=True)
+	args = parser.parse_args()
+	data_dir, cache_dir = write_corpus(args.out, args.n, args.dim, args.kind, args.seed)
+	print(f"DATA_DIR={data_dir}\nCACHE_DIR={cache_dir}")
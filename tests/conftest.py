@@ -0,0 +1,41 @@
+import os
+import tempfile
+import pytest
+
+# settings are read when `app` is first imported: point data, cache and the API at throwaway values first
+_TMP = tempfile.mkdtemp(prefix="paper_recommender_tests_")
+os.environ["DATA_DIR"] = os.path.join(_TMP, "data")
+os.environ["CACHE_DIR"] = os.path.join(_TMP, "cache")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.update({"EMBED_PROVIDER": "openai", "SHARD_SCHEME": "", "TRUNCATE_DIM": "0", "RETRIEVAL_SERVER": "",
+				   "METRICS_ENABLED": "true", "TRACE_QUERIES": "false"})
+os.makedirs(os.environ["CACHE_DIR"], exist_ok=True)
+
+
+@pytest.fixture(scope="session")
+def corpus():
+	"""Small synthetic corpus in DATA_DIR / CACHE_DIR plus a fake OpenAI endpoint for query embeddings."""
+	from app import settings
+	from app.similarity_search import CACHE_PATH, DATA_PATH
+	from scripts.fake_openai import FakeOpenAI
+	from scripts.synth_corpus import write_corpus
+	write_corpus(os.path.dirname(DATA_PATH), n=400, seed=3)
+	assert os.path.dirname(DATA_PATH) == os.path.dirname(CACHE_PATH)
+	server = FakeOpenAI(dim=1536).start()  # the default provider (openai text-embedding-3-small)
+	old = settings.openai_base_url
+	settings.openai_base_url = server.base_url
+	try:
+		yield server
+	finally:
+		settings.openai_base_url = old
+		server.stop()
+
+
+@pytest.fixture
+def users_dir(tmp_path, monkeypatch):
+	"""Account files in a temp dir instead of the repo's .users/."""
+	from app import users
+	monkeypatch.setattr(users, "USERS_DIR", str(tmp_path / "users"))
+	monkeypatch.setattr(users, "_interests", {})
+	os.makedirs(users.USERS_DIR)
+	return users.USERS_DIR
@@ -0,0 +1,23 @@
+import pytest
+from fastapi import HTTPException
+from app import settings
+from app.api import _check_admin
+
+
+def test_admin_disabled_without_token(monkeypatch):
+	monkeypatch.setattr(settings, "admin_token", None)
+	with pytest.raises(HTTPException, match="disabled"):
+		_check_admin("anything")
+
+
+@pytest.mark.parametrize("token", [None, "", "s3cre", "s3cret ", "S3CRET"])
+def test_admin_rejects_wrong_token(monkeypatch, token):
+	monkeypatch.setattr(settings, "admin_token", "s3cret")
+	with pytest.raises(HTTPException) as e:
+		_check_admin(token)
+	assert e.value.status_code == 403
+
+
+def test_admin_accepts_token(monkeypatch):
+	monkeypatch.setattr(settings, "admin_token", "s3cret")
+	_check_admin("s3cret")
@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+import numpy as np
+import pandas as pd
+import pytest
+from openai import OpenAI, RateLimitError
+from scripts import bench_suite
+from scripts.fake_openai import FakeOpenAI, fake_embedding
+from scripts.synth_corpus import synthetic_vectors, write_corpus
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+@pytest.fixture
+def server():
+	with FakeOpenAI(dim=32) as s:
+		yield s
+
+
+def test_fake_embeddings_are_deterministic(server):
+	client = OpenAI(api_key="fake", base_url=server.base_url, max_retries=0)
+	resp = client.embeddings.create(model="text-embedding-3-small", input=["graph networks", "diffusion"])
+	got = np.array([d.embedding for d in resp.data], dtype=np.float32)
+	np.testing.assert_allclose(got, [fake_embedding("graph networks", 32), fake_embedding("diffusion", 32)], rtol=1e-6)
+	np.testing.assert_allclose(np.linalg.norm(got, axis=1), 1.0, rtol=1e-5)
+	# the dimensions parameter overrides the server default, as with text-embedding-3
+	resp = client.embeddings.create(model="text-embedding-3-small", input="graph networks", dimensions=8)
+	assert len(resp.data[0].embedding) == 8
+	assert server.counts["embeddings"] == 2
+
+
+def test_fake_responses_endpoint(server):
+	client = OpenAI(api_key="fake", base_url=server.base_url, max_retries=0)
+	resp = client.responses.create(model="gpt-5", input="Summarize these papers")
+	assert resp.output_text.startswith("Offline summary")
+	assert server.counts["responses"] == 1
+
+
+def test_fake_server_throttles_and_rejects_unknown_paths():
+	with FakeOpenAI(dim=8, rate_429=1.0, retry_after=0) as server:
+		client = OpenAI(api_key="fake", base_url=server.base_url, max_retries=0)
+		with pytest.raises(RateLimitError):
+			client.embeddings.create(model="text-embedding-3-small", input="x")
+		assert server.counts["429"] == 1 and server.counts["embeddings"] == 0
+		req = urllib.request.Request(server.base_url + "/nope", data=b"{}", method="POST")
+		with pytest.raises(urllib.error.HTTPError) as e:
+			urllib.request.urlopen(req)
+		assert e.value.code == 404
+
+
+def test_synthetic_corpus_layout(tmp_path):
+	data_dir, cache_dir = write_corpus(str(tmp_path), n=200, d=32, seed=1)
+	df = pd.read_parquet(os.path.join(data_dir, "paperswithcode.parquet"))
+	X = np.load(os.path.join(cache_dir, "openai_text_embedding_3_small.npy"))
+	assert len(df) == 200 and X.shape == (200, 32)
+	assert {"title", "abstract", "paper_url", "url_pdf", "date"} <= set(df.columns)
+	assert df["paper_url"].is_unique
+	np.testing.assert_allclose(np.linalg.norm(X, axis=1), 1.0, rtol=1e-4)
+	np.testing.assert_array_equal(X, synthetic_vectors(200, 32, seed=1))
+	R = synthetic_vectors(50, 16, kind="random", seed=1)
+	np.testing.assert_allclose(np.linalg.norm(R, axis=1), 1.0, rtol=1e-5)
+	with pytest.raises(ValueError):
+		synthetic_vectors(10, 4, kind="gaussian")
+
+
+def test_latency_summary():
+	out = bench_suite._latency([1.0, 2.0, 3.0, 4.0])
+	assert out["p50_ms"] == 2.5 and out["mean_ms"] == 2.5
+	assert out["qps_per_s"] == 400.0
+	assert bench_suite._timed(lambda i: None, 3)["p99_ms"] >= 0
+
+
+def test_compare_flags_regressions(capsys):
+	base = {"commit": "a", "results": {"search": {"dense": {"p50_ms": 10.0, "qps_per_s": 100.0}}, "ntotal": 5,
+									  "ingest": {"docs_per_s": 50.0, "elapsed_s": 2.0}}}
+	new = {"commit": "b", "results": {"search": {"dense": {"p50_ms": 12.0, "qps_per_s": 95.0}}, "ntotal": 9,
+									 "ingest": {"docs_per_s": 40.0, "elapsed_s": 1.0}}}
+	# p50 +20% and docs/s -20% regress; qps -5% is within the threshold, elapsed improved
+	assert bench_suite.compare(base, new, threshold=0.10) == 2
+	out = capsys.readouterr().out
+	assert "search.dense.p50_ms" in out and "ntotal" not in out
+	assert bench_suite.compare(base, base) == 0
+
+
+def test_suite_runs_end_to_end(tmp_path):
+	"""The whole harness in a fresh process (it must set DATA_DIR etc. before `app` is imported)."""
+	out = str(tmp_path / "result.json")
+	env = {k: v for k, v in os.environ.items() if k not in ("DATA_DIR", "CACHE_DIR", "OPENAI_BASE_URL")}
+	subprocess.run([sys.executable, "-m", "scripts.bench_suite", "--n", "1000", "--queries", "5",
+					"--only", "index", "search", "mmr", "users", "--out", out],
+				   cwd=ROOT, env=env, check=True, capture_output=True, timeout=300)
+	with open(out) as f:
+		report = json.load(f)
+	assert list(report["results"]) == ["index", "search", "mmr", "users"]
+	assert report["results"]["index"]["ntotal"] == 1000
+	assert report["results"]["search"]["dense"]["p50_ms"] > 0
+	# one embedding call per distinct query (then the query-embedding cache), summaries from the fake LLM
+	assert 0 < report["fake_openai"]["embeddings"] <= 5
+	assert report["fake_openai"]["responses"] > 0
+	assert not os.path.exists(os.path.join(ROOT, "bench_results", os.path.basename(out)))
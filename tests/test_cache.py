@@ -0,0 +1,71 @@
+import threading
+from app.cache import LRUCache, normalize_query
+
+
+def test_normalize_query():
+	assert normalize_query("  Graph   Neural\tNetworks ") == "graph neural networks"
+	assert normalize_query(None) == ""
+
+
+def test_lru_evicts_least_recently_used():
+	cache = LRUCache(maxsize=2)
+	cache.put("a", 1)
+	cache.put("b", 2)
+	assert cache.get("a") == 1  # "b" is now the oldest
+	cache.put("c", 3)
+	assert "b" not in cache
+	assert cache.get("a") == 1 and cache.get("c") == 3
+	assert len(cache) == 2
+
+
+def test_lru_stats_and_saved_time():
+	cache = LRUCache(maxsize=4)
+	cache.put("q", "result", cost_ms=120.0)
+	cache.get("q")
+	cache.get("q")
+	assert cache.get("missing", "default") == "default"
+	stats = cache.stats()
+	assert (stats["hits"], stats["misses"], stats["saved_ms"]) == (2, 1, 240.0)
+	assert stats["hit_rate"] == round(2 / 3, 4)
+
+
+def test_lru_replace_keeps_position_and_adds_cost():
+	cache = LRUCache(maxsize=2)
+	cache.put("a", 1, cost_ms=10.0)
+	cache.put("b", 2)
+	cache.replace("a", 10, extra_cost_ms=5.0)
+	cache.put("c", 3)  # "a" was not touched by replace, so it is still the oldest
+	assert "a" not in cache
+	cache.replace("a", 11)  # evicted: no-op
+	assert "a" not in cache
+	cache.put("d", 4, cost_ms=10.0)
+	cache.replace("d", 40, extra_cost_ms=5.0)
+	assert cache.get("d") == 40
+	assert cache.stats()["saved_ms"] == 15.0
+
+
+def test_lru_disabled_and_clear():
+	cache = LRUCache(maxsize=0)
+	cache.put("a", 1)
+	assert len(cache) == 0
+	cache = LRUCache(maxsize=3)
+	cache.put("a", 1)
+	cache.clear()
+	assert cache.get("a") is None
+
+
+def test_lru_concurrent_puts_stay_bounded():
+	cache = LRUCache(maxsize=50)
+
+	def worker(t):
+		for i in range(500):
+			cache.put((t, i), i)
+			cache.get((t, i - 1))
+
+	threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert len(cache) == 50
+	assert cache.hits + cache.misses == 8 * 500
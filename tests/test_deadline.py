@@ -0,0 +1,123 @@
+import threading
+import time
+import pytest
+from app import deadline as deadline_mod, metrics
+from app.deadline import Deadline, DeadlineExceeded
+
+
+def _count(name, **labels):
+	return metrics.snapshot()["counters"].get(f"{name}{labels if labels else ''}", 0)
+
+
+def _wait_for(cond, timeout=5.0):
+	end = time.monotonic() + timeout
+	while not cond():
+		if time.monotonic() > end:
+			return False
+		time.sleep(0.01)
+	return True
+
+
+def test_no_deadline_runs_inline():
+	d = Deadline(None)
+	assert not d.enabled and d.remaining_ms() == float("inf")
+	assert d.call("llm", lambda: threading.current_thread().name) == threading.current_thread().name
+	assert d.fits("mmr", reserve_ms=1e9)
+
+
+def test_budget_is_the_stage_share_capped_by_what_is_left():
+	d = Deadline(1000)
+	assert 0 < d.budget_ms("embed") <= 400
+	assert d.budget_ms("llm") == pytest.approx(d.remaining_ms(), abs=5)
+
+
+def test_late_call_raises_and_hands_over_its_result():
+	got = []
+	d = Deadline(100)
+	with pytest.raises(DeadlineExceeded):
+		d.call("llm", lambda: time.sleep(0.3) or "late", on_late=got.append)
+	assert not got
+	assert _wait_for(lambda: got == ["late"])
+
+
+def test_stage_learns_its_duration(monkeypatch):
+	monkeypatch.setattr(deadline_mod, "_stage_ms", {})
+	d = Deadline(10000)
+	with d.stage("mmr"):
+		time.sleep(0.05)
+	assert deadline_mod.expected_ms("mmr") >= 50
+	assert d.fits("mmr") and not d.fits("mmr", reserve_ms=d.remaining_ms())
+	d.skip("mmr")
+	assert d.degraded and d.skipped == ["mmr"]
+
+
+def test_overrunning_mmr_is_skipped_and_not_cached(corpus, monkeypatch):
+	from app.query import results_cache, search
+	monkeypatch.setitem(deadline_mod._stage_ms, "mmr", 1e6)
+	results_cache.clear()
+	skips = _count("deadline_skips_total", stage="mmr")
+	results = search("attention mechanisms", top_k=5, llm=False, mode="dense", deadline_ms=5000, record=False)[0]
+	assert _count("deadline_skips_total", stage="mmr") == skips + 1
+	assert len(results_cache) == 0
+	# the retrieval order, as without MMR
+	plain = search("attention mechanisms", top_k=5, use_mmr=False, llm=False, mode="dense", deadline_ms=0, record=False)[0]
+	assert [r["idx"] for r in results] == [r["idx"] for r in plain]
+
+
+def test_mmr_must_fit_together_with_personalization(corpus, users_dir, monkeypatch):
+	from app import users
+	from app.query import search
+	from app.versions import use_context
+	users.create_user("alice", "x")
+	with use_context() as ctx:
+		for i in range(6):
+			users.like_paper("alice", ctx.df.iloc[i].to_dict())
+	search("speech recognition", llm=False, mode="dense", deadline_ms=0, record=False)  # embed outside the deadline
+	monkeypatch.setitem(deadline_mod._stage_ms, "personalize", 6000.0)
+	monkeypatch.setitem(deadline_mod._stage_ms, "mmr", 6000.0)
+	personalize, mmr = _count("deadline_skips_total", stage="personalize"), _count("deadline_skips_total", stage="mmr")
+	search("speech recognition", top_k=4, llm=False, mode="dense", user="alice", deadline_ms=10000, record=False)
+	# each fits on its own, both don't: MMR goes, personalization stays
+	assert _count("deadline_skips_total", stage="personalize") == personalize
+	assert _count("deadline_skips_total", stage="mmr") == mmr + 1
+
+
+def test_late_explanation_is_stored_with_the_cached_results(corpus, monkeypatch):
+	from app import query
+	calls = []
+
+	def slow_explain(q, items, slo_ms=None):
+		calls.append(q)
+		time.sleep(0.5)
+		return "late explanation"
+
+	monkeypatch.setattr(query, "llm_explain", slow_explain)
+	query.search("protein folding", llm=False, mode="dense", deadline_ms=0, record=False)  # embed outside the deadline
+	query.results_cache.clear()
+	late = _count("deadline_late_results_total", stage="llm")
+	results, _, _, explanation = query.search("protein folding", llm=True, mode="dense", deadline_ms=300, record=False)
+	assert results and explanation is None
+	assert len(query.results_cache) == 1  # only the explanation was late: the results are cached
+	assert _wait_for(lambda: _count("deadline_late_results_total", stage="llm") == late + 1)
+	explanation = query.search("protein folding", llm=True, mode="dense", deadline_ms=300, record=False)[3]
+	assert explanation == "late explanation" and len(calls) == 1
+
+
+@pytest.mark.parametrize("failure", ["error", "timeout"])
+def test_embedding_failure_falls_back_to_lexical(corpus, monkeypatch, failure):
+	from app import query
+
+	def embed(q, **kwargs):
+		if failure == "timeout":
+			time.sleep(0.5)
+		raise RuntimeError("embedding endpoint down")
+
+	monkeypatch.setattr(query, "get_query_embedding", embed)
+	query.query_embeddings.clear()
+	query.results_cache.clear()
+	fallbacks = _count("search_fallback_total", requested="dense", used="lexical")
+	results = query.search("graph neural networks", top_k=5, llm=False, mode="dense", deadline_ms=500, record=False)[0]
+	lexical = query.search("graph neural networks", top_k=5, llm=False, mode="lexical", deadline_ms=0, record=False)[0]
+	assert [r["idx"] for r in results] == [r["idx"] for r in lexical]
+	assert _count("search_fallback_total", requested="dense", used="lexical") == fallbacks + 1
+	assert len(query.results_cache) == 1  # the lexical search's own entry; the fallback wasn't cached
@@ -0,0 +1,68 @@
+import faiss
+import numpy as np
+from app.dedup import build_canonical_ids, cluster_labels, cluster_stats, collapse
+
+
+def test_cluster_labels_min_row_per_component():
+	# components {0, 2, 5}, {1, 4}, {3}
+	src, dst = np.array([2, 5, 1]), np.array([5, 0, 4])
+	assert cluster_labels(6, src, dst).tolist() == [0, 1, 0, 3, 1, 0]
+	assert cluster_labels(3, np.array([], dtype=np.int64), np.array([], dtype=np.int64)).tolist() == [0, 1, 2]
+
+
+def test_cluster_labels_long_chain():
+	n = 50
+	labels = cluster_labels(n, np.arange(n - 1)[::-1].copy(), np.arange(1, n)[::-1].copy())
+	assert (labels == 0).all()
+
+
+def test_collapse_keeps_best_ranked_member():
+	canonical = np.array([0, 1, 0, 3, 1, 0])
+	ids, dist = collapse([5, 4, 0, 3, 2, 1], np.arange(6.0), canonical=canonical)
+	assert ids.tolist() == [5, 4, 3]
+	assert dist.tolist() == [0.0, 1.0, 3.0]
+
+
+def test_collapse_keeps_padding_and_out_of_range_ids():
+	canonical = np.array([0, 0, 2])
+	ids, = collapse([1, -1, 0, 7, -1], canonical=canonical)
+	assert ids.tolist() == [1, -1, 7, -1]
+	ids, = collapse(np.array([], dtype=np.int64), canonical=canonical)
+	assert len(ids) == 0
+
+
+def test_build_canonical_ids_finds_near_duplicates():
+	rng = np.random.default_rng(0)
+	X = rng.standard_normal((40, 16)).astype(np.float32)
+	X[7] = X[3] + 1e-3
+	X[30] = X[3] + 2e-3
+	X /= np.linalg.norm(X, axis=1, keepdims=True)
+	index = faiss.IndexFlatL2(16)
+	index.add(X)
+	canonical = build_canonical_ids(index, X, min_similarity=0.99, batch_size=8)
+	assert canonical[7] == canonical[30] == canonical[3] == 3
+	assert (canonical[np.setdiff1d(np.arange(40), [7, 30])] == np.setdiff1d(np.arange(40), [7, 30])).all()
+	stats = cluster_stats(canonical)
+	assert stats["duplicate_clusters"] == 1
+	assert stats["collapsed_rows"] == 2
+
+
+def test_canonical_ids_ignored_after_corpus_change(tmp_path, monkeypatch):
+	from app import dedup, similarity_search
+	embed_path, data_path = str(tmp_path / "emb.npy"), str(tmp_path / "data.parquet")
+	np.save(embed_path, np.zeros((4, 2), dtype=np.float32))
+	with open(data_path, "wb") as f:
+		f.write(b"rows")
+	monkeypatch.setattr(similarity_search, "EMBED_PATH", embed_path)
+	monkeypatch.setattr(similarity_search, "LOAD_PATH", data_path)
+	monkeypatch.setattr(dedup, "CACHE_PATH", str(tmp_path))
+	dedup.get_canonical_ids.cache_clear()
+	try:
+		stats = dedup.save_canonical_ids(np.array([0, 0, 2, 3], dtype=np.int32), 0.97)
+		assert set(stats["sources"]) == {"embeddings", "data"}
+		assert dedup.get_canonical_ids().tolist() == [0, 0, 2, 3]
+		np.save(embed_path, np.ones((5, 2), dtype=np.float32))  # corpus rebuilt: row ids no longer line up
+		dedup.get_canonical_ids.cache_clear()
+		assert dedup.get_canonical_ids() is None
+	finally:
+		dedup.get_canonical_ids.cache_clear()
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+import pytest
+from app import embeddings, settings
+from app.embeddings import (EmbeddingProvider, FastEmbedProvider, OpenAIProvider, embed_corpus, embedding_cache_path,
+							get_provider)
+
+
+class CountingProvider(EmbeddingProvider):
+	"""Deterministic 4-dim vectors; counts the texts it was asked to embed."""
+	name = "counting"
+
+	def __init__(self, model="toy-1"):
+		super().__init__(model)
+		self.calls = []
+
+	@property
+	def dim(self):
+		return 4
+
+	def embed(self, texts):
+		texts = list(texts)
+		self.calls.append(len(texts))
+		return np.asarray([[len(t), i, 0, 1] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def test_openai_metadata_and_cache_name():
+	small, large = OpenAIProvider("text-embedding-3-small"), OpenAIProvider("text-embedding-3-large")
+	assert small.metadata() == {"provider": "openai", "model": "text-embedding-3-small", "dim": 1536}
+	assert large.dim == 3072 and OpenAIProvider("some-new-model").dim == 1536
+	assert small.cache_name == "openai_text_embedding_3_small"
+	assert CountingProvider("org/model-v2").cache_name == "counting_org_model_v2"
+	assert OpenAIProvider().model == settings.openai_embed_model
+
+
+def test_get_provider_is_cached_per_name_and_model():
+	a = get_provider("openai")
+	assert get_provider("openai") is a and get_provider() is a  # EMBED_PROVIDER=openai in the tests
+	assert get_provider("openai", "text-embedding-3-large") is not a
+	assert get_provider("openai", "text-embedding-3-large").dim == 3072
+	toy = CountingProvider()
+	assert get_provider(toy) is toy  # instances pass through
+	with pytest.raises(ValueError, match="Unknown embedding provider"):
+		get_provider("nope")
+
+
+def test_embedding_cache_path_follows_the_provider(tmp_path, monkeypatch):
+	monkeypatch.setattr(embeddings, "CACHE_PATH", str(tmp_path))
+	assert embedding_cache_path("openai") == os.path.join(str(tmp_path), "openai_text_embedding_3_small.npy")
+	assert embedding_cache_path(CountingProvider()) == os.path.join(str(tmp_path), "counting_toy_1.npy")
+
+
+def test_embed_corpus_caches_and_resumes(tmp_path, monkeypatch):
+	monkeypatch.setattr(embeddings, "CACHE_PATH", str(tmp_path))
+	texts = [f"text {i}" * (i % 3 + 1) for i in range(10)]
+	provider = CountingProvider()
+	first = embed_corpus(provider, texts[:6], chunk_size=4)
+	assert provider.calls == [4, 2] and first.shape == (6, 4)
+	assert np.load(embedding_cache_path(provider)).shape == (6, 4)
+	# a longer corpus embeds only what the checkpoint doesn't have
+	full = embed_corpus(provider, texts, chunk_size=4)
+	assert provider.calls == [4, 2, 4] and full.shape == (10, 4)
+	np.testing.assert_array_equal(full[:6], first)
+	np.testing.assert_array_equal(full[:, 0], [len(t) for t in texts])
+	# fully cached: no calls; use_cache=False re-embeds everything
+	np.testing.assert_array_equal(embed_corpus(provider, texts), full)
+	assert provider.calls == [4, 2, 4]
+	embed_corpus(provider, texts, use_cache=False, chunk_size=20)
+	assert provider.calls == [4, 2, 4, 10]
+
+
+def test_openai_provider_embeds_through_the_api(corpus):
+	from scripts.fake_openai import fake_embedding
+	provider = OpenAIProvider("text-embedding-3-small")
+	batch = provider.embed(["graph neural networks", "protein folding"])
+	assert batch.shape == (2, 1536) and batch.dtype == np.float32
+	np.testing.assert_allclose(batch[0], fake_embedding("graph neural networks"), rtol=1e-5, atol=1e-6)
+	np.testing.assert_allclose(provider.embed_query("protein folding"), batch[1], rtol=1e-5, atol=1e-6)
+
+
+def test_fastembed_metadata_without_loading_the_model():
+	pytest.importorskip("fastembed")
+	prequantized = FastEmbedProvider("BAAI/bge-base-en-v1.5")  # its Hugging Face source is already the -Q build
+	assert prequantized.metadata() == {"provider": "fastembed", "model": "BAAI/bge-base-en-v1.5", "dim": 768}
+	assert prequantized.cache_name == "fastembed_BAAI_bge_base_en_v1.5"
+	large = FastEmbedProvider("BAAI/bge-large-en-v1.5")
+	assert large.dim == 1024 and large.cache_name == "fastembed_BAAI_bge_large_en_v1.5_int8"
+	assert FastEmbedProvider("BAAI/bge-large-en-v1.5", quantize=False).cache_name == "fastembed_BAAI_bge_large_en_v1.5"
+	assert large._encoder is None  # metadata never loads the ONNX session
+	with pytest.raises(ValueError, match="does not support"):
+		FastEmbedProvider("no/such-model")
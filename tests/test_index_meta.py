@@ -0,0 +1,60 @@
+import faiss
+import numpy as np
+import pytest
+from app.similarity_search import check_index_meta, source_fingerprints, write_index_meta
+
+DIM = 1536  # the default provider (openai text-embedding-3-small)
+
+
+def _index(n=10, d=DIM, seed=0):
+	index = faiss.IndexFlatL2(d)
+	index.add(np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32))
+	return index
+
+
+@pytest.fixture
+def sources(tmp_path):
+	embed_path, data_path = str(tmp_path / "emb.npy"), str(tmp_path / "data.parquet")
+	np.save(embed_path, np.zeros((10, 4), dtype=np.float32))
+	with open(data_path, "wb") as f:
+		f.write(b"rows")
+	return embed_path, data_path
+
+
+def test_check_index_meta_accepts_matching_sidecar(tmp_path, sources):
+	path, index = str(tmp_path / "faiss.index"), _index()
+	write_index_meta(path, index, sources=source_fingerprints(*sources))
+	meta = check_index_meta(path, index, embed_path=sources[0], data_path=sources[1])
+	assert meta["ntotal"] == 10
+	assert meta["index_dim"] == DIM
+
+
+def test_check_index_meta_rejects_wrong_dim_and_count(tmp_path):
+	path = str(tmp_path / "faiss.index")
+	with pytest.raises(ValueError, match="dimension"):
+		check_index_meta(path, _index(d=8))  # no sidecar: only the dimension is checked
+	assert check_index_meta(path, _index()) is None
+	index = _index()
+	write_index_meta(path, index, sources={})
+	index.add(np.zeros((1, DIM), dtype=np.float32))
+	with pytest.raises(ValueError, match="holds 11 vectors"):
+		check_index_meta(path, index)
+
+
+def test_check_index_meta_rejects_other_provider(tmp_path):
+	import json
+	path, index = str(tmp_path / "faiss.index"), _index()
+	meta = write_index_meta(path, index, sources={})
+	with open(path + ".json", "w") as f:
+		json.dump(dict(meta, model="some-other-model"), f)
+	with pytest.raises(ValueError, match="provider"):
+		check_index_meta(path, index)
+
+
+def test_check_index_meta_rejects_changed_sources(tmp_path, sources):
+	path, index = str(tmp_path / "faiss.index"), _index()
+	write_index_meta(path, index, sources=source_fingerprints(*sources))
+	np.save(sources[0], np.ones((10, 4), dtype=np.float32))
+	with pytest.raises(ValueError, match="embeddings"):
+		check_index_meta(path, index, embed_path=sources[0], data_path=sources[1])
+	assert check_index_meta(path, index, check_sources=False, embed_path=sources[0], data_path=sources[1])
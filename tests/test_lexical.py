@@ -0,0 +1,107 @@
+import math
+import numpy as np
+import pytest
+from app.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCS = [
+	"graph neural networks for molecules",
+	"graph graph graph partitioning",
+	"diffusion models for image synthesis",
+	"a survey of neural networks",
+	"",
+]
+
+
+def _bm25(index, query, doc, k1=1.2, b=0.75):
+	"""Textbook Okapi BM25 of one document, for comparison with the vectorized scorer."""
+	toks = [tokenize(d) for d in DOCS]
+	avgdl = sum(map(len, toks)) / len(toks)
+	score = 0.0
+	for term in set(tokenize(query)):
+		df = sum(term in t for t in toks)
+		if not df:
+			continue
+		tf = toks[doc].count(term)
+		idf = math.log1p((len(toks) - df + 0.5) / (df + 0.5))
+		score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(toks[doc]) / avgdl))
+	return score
+
+
+def test_tokenize_drops_stopwords_keeps_digits():
+	assert tokenize("The ResNet-50 and GPT 2 models") == ["resnet", "50", "gpt", "2", "models"]
+	assert tokenize(None) == []
+
+
+@pytest.mark.parametrize("query", ["graph", "graph neural", "neural networks molecules", "diffusion"])
+def test_bm25_matches_reference_scores(query):
+	index = BM25Index.build(DOCS)
+	scores, ids = index.search(query, k=10)
+	expected = {d: _bm25(index, query, d) for d in range(len(DOCS))}
+	assert list(ids) == sorted((d for d, s in expected.items() if s > 0), key=lambda d: (-expected[d], d))[:len(ids)]
+	np.testing.assert_allclose(scores, [expected[int(d)] for d in ids], rtol=1e-5)
+	assert all(np.diff(scores) <= 0)
+
+
+def test_bm25_unknown_terms_and_k():
+	index = BM25Index.build(DOCS)
+	scores, ids = index.search("transformers", k=5)
+	assert len(scores) == len(ids) == 0
+	assert len(index.search("graph", k=0)[1]) == 0
+	assert len(index.search("graph networks", k=1)[1]) == 1
+
+
+def test_bm25_dense_and_sparse_accumulation_agree():
+	# many docs containing both terms switch `search` to the dense bincount path
+	docs = [f"alpha beta w{i}" if i % 2 else f"alpha w{i}" for i in range(200)]
+	index = BM25Index.build(docs)
+	scores, ids = index.search("alpha beta", k=200)
+	assert len(ids) == 200
+	assert set(ids[:100].tolist()) == set(range(1, 200, 2))
+	assert scores[0] > scores[-1]
+
+
+def test_bm25_save_load_roundtrip(tmp_path):
+	index = BM25Index.build(DOCS)
+	path = str(tmp_path / "bm25.npz")
+	index.save(path)
+	loaded = BM25Index.load(path)
+	assert loaded.terms == index.terms
+	for query in ("graph", "neural networks"):
+		for a, b in zip(index.search(query), loaded.search(query)):
+			np.testing.assert_array_equal(a, b)
+
+
+def test_rrf_fuses_by_reciprocal_rank():
+	ids, scores = reciprocal_rank_fusion([[1, 2, 3], [3, 1, -1]], k=10, rrf_k=60)
+	assert ids.tolist() == [1, 3, 2]
+	np.testing.assert_allclose(scores, [1 / 61 + 1 / 62, 1 / 63 + 1 / 61, 1 / 62], rtol=1e-6)
+
+
+def test_rrf_skips_padding_and_truncates():
+	ids, _ = reciprocal_rank_fusion([[-1, 5, 6], [7]], k=2)
+	assert -1 not in ids.tolist()
+	assert len(ids) == 2
+	ids, scores = reciprocal_rank_fusion([], k=3)
+	assert len(ids) == len(scores) == 0
+
+
+def test_bm25_cache_rebuilt_after_parquet_change(tmp_path, monkeypatch):
+	import pandas as pd
+	from app import lexical, similarity_search
+	data_path = str(tmp_path / "papers.parquet")
+	pd.DataFrame({"title": ["graph networks", "diffusion"], "abstract": ["", ""]}).to_parquet(data_path)
+	monkeypatch.setattr(similarity_search, "LOAD_PATH", data_path)
+	monkeypatch.setattr(lexical, "CACHE_PATH", str(tmp_path))
+	similarity_search.load_data.cache_clear()
+	lexical.get_bm25_index.cache_clear()
+	try:
+		assert lexical.get_bm25_index().n_docs == 2
+		pd.DataFrame({"title": ["a", "b", "diffusion"], "abstract": ["", "", ""]}).to_parquet(data_path)
+		similarity_search.load_data.cache_clear()
+		lexical.get_bm25_index.cache_clear()
+		index = lexical.get_bm25_index()
+		assert index.n_docs == 3
+		assert index.search("diffusion")[1].tolist() == [2]
+	finally:
+		similarity_search.load_data.cache_clear()
+		lexical.get_bm25_index.cache_clear()
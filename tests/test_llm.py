@@ -0,0 +1,92 @@
+from datetime import date
+from types import SimpleNamespace
+import pytest
+from app import llm, settings
+from app.llm import SYSTEM_PROMPT, _abstract_budgets, build_prompt, choose_plan, count_tokens
+
+
+def _items(n, words=400):
+	return [{"title": f"Paper {i}", "abstract": " ".join(f"word{i}_{j}" for j in range(words)),
+			 "paper_url": f"https://papers/{i}", "date": "2024-05-01"} for i in range(n)]
+
+
+def test_abstract_budgets_share_and_redistribute():
+	assert _abstract_budgets([100, 100, 100], 150) == [50, 50, 50]
+	# the short abstract keeps all of it; what it leaves goes to the long ones
+	assert _abstract_budgets([10, 500, 500], 300) == [10, 145, 145]
+	assert _abstract_budgets([1000, 1000], 5000, cap=375) == [375, 375]
+	assert _abstract_budgets([50, 50], -20) == [0, 0]
+	assert sum(_abstract_budgets([30, 700, 90, 400], 512)) <= 512
+
+
+def test_prompt_fits_the_budget_and_keeps_every_paper():
+	items = _items(8)
+	prompt, tokens = build_prompt("graph neural networks", items, budget=1500, today=date(2025, 3, 1))
+	assert tokens == count_tokens(prompt) <= 1500
+	assert prompt.startswith("Current month: 03/2025\nUser query: graph neural networks\n")
+	for it in items:
+		assert it["title"] in prompt and it["paper_url"] in prompt
+	assert "…" in prompt  # abstracts were clipped to fit
+	# a loose budget clips nothing but the per-abstract cap
+	loose, _ = build_prompt("q", _items(2, words=20), budget=100000)
+	assert "…" not in loose and "word1_19" in loose
+	# titles and URLs go in even when nothing is left for abstracts
+	tight, _ = build_prompt("q", items, budget=10)
+	assert all(it["paper_url"] in tight for it in items) and "word0_0" not in tight
+
+
+def test_missing_fields_are_spelled_out():
+	prompt, _ = build_prompt("q", [{"title": "T", "abstract": None}], budget=500)
+	assert "Title: T | Date: None\nAbstract: \nURL: None" in prompt
+
+
+@pytest.fixture
+def auto(monkeypatch):
+	monkeypatch.setattr(llm, "_latency", {})
+	monkeypatch.setattr(settings, "llm_effort", "auto")
+	monkeypatch.setattr(settings, "llm_latency_slo_ms", 15000.0)
+	monkeypatch.setattr(settings, "openai_fast_model", None)
+
+
+def test_auto_effort_drops_to_low_from_seven_papers(auto):
+	main = settings.openai_chat_model
+	assert choose_plan(6) == (main, "medium")
+	assert choose_plan(7) == (main, "low")
+	assert choose_plan(13) == (main, "low")
+	assert choose_plan(20) == (main, "minimal")
+	assert choose_plan(7, slo_ms=30000) == (main, "medium")
+	assert choose_plan(100) == (main, "minimal")  # nothing fits: the fastest option
+
+
+def test_auto_uses_the_fast_model_when_the_main_one_cannot_fit(auto, monkeypatch):
+	monkeypatch.setattr(settings, "openai_fast_model", "fast-model")
+	assert choose_plan(30) == ("fast-model", "minimal")
+	assert choose_plan(6)[0] == settings.openai_chat_model
+
+
+def test_fixed_effort_ignores_the_slo(monkeypatch):
+	monkeypatch.setattr(settings, "llm_effort", "high")
+	assert choose_plan(50, slo_ms=1) == (settings.openai_chat_model, "high")
+
+
+def test_observed_latency_moves_the_plan(auto):
+	main = settings.openai_chat_model
+	for _ in range(30):
+		llm._record(main, "medium", 6, 3000.0 + 6 * 3000.0, 100, None)  # medium is slower than assumed
+	assert choose_plan(6) == (main, "low")
+
+
+def test_every_call_sends_the_same_cacheable_prefix(auto, monkeypatch):
+	calls = []
+
+	class Client:
+		responses = SimpleNamespace(create=lambda **kw: calls.append(kw) or SimpleNamespace(output_text="ok", usage=None))
+
+	monkeypatch.setattr(llm, "get_client", lambda **kw: Client())
+	assert llm.llm_explain("diffusion models", _items(3)) == "ok"
+	llm.llm_explain("protein folding", _items(5))
+	first, second = calls
+	assert first["input"][0] == second["input"][0] == {"role": "system", "content": [{"type": "input_text", "text": SYSTEM_PROMPT}]}
+	assert first["prompt_cache_key"] == second["prompt_cache_key"] == llm.PROMPT_CACHE_KEY
+	assert "diffusion models" not in SYSTEM_PROMPT and "diffusion models" in first["input"][1]["content"][0]["text"]
+	assert first["reasoning"] == {"effort": "medium"}
@@ -0,0 +1,124 @@
+import json
+import threading
+import pytest
+from fastapi import HTTPException
+from app import metrics, settings
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+	"""Empty metric registries for one test (the process-wide ones other tests count deltas on stay as they were)."""
+	for name in ("_histograms", "_counters", "_gauges"):
+		monkeypatch.setattr(metrics, name, {})
+	monkeypatch.setattr(metrics, "_enabled", True)
+
+
+def test_counters_add_up_per_label_set(fresh):
+	metrics.incr("searches_total", mode="dense")
+	metrics.incr("searches_total", 2, mode="dense")
+	metrics.incr("searches_total", mode="lexical")
+	metrics.incr("cache_hits_total")
+	counters = metrics.snapshot()["counters"]
+	assert counters == {"searches_total{'mode': 'dense'}": 3, "searches_total{'mode': 'lexical'}": 1, "cache_hits_total": 1}
+	# label order doesn't make a new series
+	metrics.incr("openai_errors_total", op="embed", status=429)
+	metrics.incr("openai_errors_total", status=429, op="embed")
+	assert metrics.snapshot()["counters"]["openai_errors_total{'op': 'embed', 'status': 429}"] == 2
+
+
+def test_counters_are_thread_safe(fresh):
+	def work():
+		for _ in range(1000):
+			metrics.incr("hits_total")
+
+	threads = [threading.Thread(target=work) for _ in range(8)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert metrics.snapshot()["counters"]["hits_total"] == 8000
+
+
+def test_histogram_snapshot_quantiles(fresh):
+	for ms in [0.5] * 50 + [7] * 45 + [20000] * 5:
+		metrics.observe("stage_ms", ms, stage="embed")
+	h = metrics.snapshot()["histograms"]["stage_ms{stage=embed}"]
+	assert h["count"] == 100 and h["mean_ms"] == pytest.approx((25 + 315 + 100000) / 100)
+	assert (h["p50_ms"], h["p95_ms"], h["p99_ms"]) == (1, 10, 30000)
+	metrics.observe("stage_ms", 10 ** 6, stage="llm")  # past the last bucket
+	assert metrics.snapshot()["histograms"]["stage_ms{stage=llm}"]["p50_ms"] == float("inf")
+
+
+def test_prometheus_text_format(fresh):
+	metrics.observe("stage_ms", 3, stage="mmr")
+	metrics.observe("stage_ms", 70000, stage="mmr")
+	metrics.incr("search_fallback_total", requested="dense", used="lexical")
+	metrics.set_gauge("service_ready", 1)
+	metrics.incr("weird_total", label='a "quoted"\\ value\n')
+	lines = metrics.render_prometheus().splitlines()
+	assert lines[0] == "# TYPE stage_seconds histogram"
+	assert 'stage_seconds_bucket{stage="mmr",le="0.0025"} 0' in lines
+	assert 'stage_seconds_bucket{stage="mmr",le="0.005"} 1' in lines
+	assert 'stage_seconds_bucket{stage="mmr",le="60.0"} 1' in lines  # buckets are cumulative
+	assert 'stage_seconds_bucket{stage="mmr",le="+Inf"} 2' in lines
+	assert 'stage_seconds_sum{stage="mmr"} 70.003' in lines and 'stage_seconds_count{stage="mmr"} 2' in lines
+	assert "# TYPE search_fallback_total counter" in lines
+	assert 'search_fallback_total{requested="dense",used="lexical"} 1' in lines
+	assert "# TYPE service_ready gauge" in lines and "service_ready 1" in lines
+	assert 'weird_total{label="a \\"quoted\\"\\\\ value\\n"} 1' in lines
+	# one TYPE line per metric name, before its samples
+	types = [line for line in lines if line.startswith("# TYPE")]
+	assert len(types) == len(set(types)) == 4
+
+
+def test_disabled_records_nothing(fresh):
+	metrics.set_enabled(False)
+	try:
+		metrics.incr("x_total")
+		metrics.observe("stage_ms", 1.0)
+		metrics.set_gauge("g", 1)
+		with metrics.span("mmr"):
+			pass
+		assert metrics.snapshot() == {"histograms": {}, "counters": {}, "gauges": {}}
+		assert metrics.render_prometheus() == "\n"
+	finally:
+		metrics.set_enabled(True)
+
+
+def test_spans_and_timed_land_in_stage_ms(fresh):
+	@metrics.timed("rerank")
+	def f():
+		return 1
+
+	with metrics.span("mmr"):
+		pass
+	assert f() == 1
+	assert set(metrics.snapshot()["histograms"]) == {"stage_ms{stage=mmr}", "stage_ms{stage=rerank}"}
+
+
+def test_query_trace_collects_spans(fresh, tmp_path, monkeypatch):
+	monkeypatch.setattr(settings, "trace_queries", True)
+	monkeypatch.setattr(settings, "cache_dir", str(tmp_path))
+	with metrics.trace_query("graph nets", mode="dense") as trace:
+		with metrics.span("embed"):
+			pass
+		with metrics.trace_query("nested") as inner:
+			assert inner is None  # one trace per query
+		metrics.annotate(cache="miss")
+	with open(tmp_path / settings.trace_file) as f:
+		(line,) = f.readlines()
+	logged = json.loads(line)
+	assert logged["query"] == "graph nets" and logged["mode"] == "dense" and logged["cache"] == "miss"
+	assert [s["stage"] for s in logged["spans"]] == ["embed"] and logged["total_ms"] >= 0
+	assert trace is not None
+
+
+def test_metrics_endpoint_formats(fresh):
+	from app.api import metrics_endpoint
+	metrics.incr("searches_total", mode="dense")
+	text = metrics_endpoint()
+	assert text.media_type.startswith("text/plain") and b'searches_total{mode="dense"} 1' in text.body
+	assert json.loads(metrics_endpoint(format="json").body)["counters"] == {"searches_total{'mode': 'dense'}": 1}
+	with pytest.raises(HTTPException) as e:
+		metrics_endpoint(format="xml")
+	assert e.value.status_code == 400
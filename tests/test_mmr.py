@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from app.mmr import MMREngine, MMRState, batched_mmr, l2_normalize, maximal_marginal_relevance
+
+
+def _reference_mmr(q, X, k, lam):
+	"""Plain greedy MMR over cosine similarities."""
+	q, X = l2_normalize(q[None])[0], l2_normalize(X)
+	sim_q, sim = X @ q, X @ X.T
+	selected = []
+	while len(selected) < min(k, len(X)):
+		scores = sim_q.copy() if not selected else lam * sim_q - (1 - lam) * sim[:, selected].max(axis=1)
+		scores[selected] = -np.inf
+		selected.append(int(np.argmax(scores)))
+	return selected
+
+
+@pytest.fixture
+def block():
+	rng = np.random.default_rng(1)
+	B, n, d = 4, 60, 24
+	return rng.standard_normal((B, d)).astype(np.float32), rng.standard_normal((B, n, d)).astype(np.float32)
+
+
+@pytest.mark.parametrize("use_gram", [False, True])
+@pytest.mark.parametrize("lam", [0.0, 0.5, 0.7, 1.0])
+def test_engine_matches_reference(block, use_gram, lam):
+	Q, X = block
+	out = MMREngine().select(Q, X, top_k=10, lambda_param=lam, use_gram=use_gram)
+	for b in range(len(Q)):
+		assert out[b].tolist() == _reference_mmr(Q[b], X[b], 10, lam)
+
+
+def test_engine_matches_state(block):
+	Q, X = block
+	engine = MMREngine()
+	for k in (1, 5, 20, 60, 80):
+		out = engine.select(Q, X, top_k=k)  # reused buffers across calls of different shapes
+		for b in range(len(Q)):
+			assert out[b].tolist() == MMRState(Q[b], X[b]).extend(k)
+
+
+def test_state_resume_equals_fresh_selection(block):
+	Q, X = block
+	state = MMRState(Q[0], X[0], lambda_param=0.6)
+	first = list(state.extend(5))
+	resumed = state.extend(20)
+	assert resumed[:5] == first
+	assert resumed == MMRState(Q[0], X[0], lambda_param=0.6).extend(20)
+	assert state.extend(3) == first[:3]
+
+
+def test_relevance_override(block):
+	Q, X = block
+	relevance = np.linspace(1, 0, X.shape[1], dtype=np.float32)
+	out = MMREngine().select(Q[:1], X[:1], top_k=8, relevance=relevance[None])
+	assert out[0].tolist() == MMRState(Q[0], X[0], relevance=relevance).extend(8)
+	assert out[0, 0] == 0
+
+
+def test_valid_mask_pads_with_minus_one(block):
+	Q, X = block
+	valid = np.zeros(X.shape[:2], dtype=bool)
+	valid[:, :3] = True
+	out = batched_mmr(Q, X, top_k=5, valid=valid)
+	assert (out[:, 3:] == -1).all()
+	assert set(out[:, :3].ravel().tolist()) == {0, 1, 2}
+
+
+def test_single_query_wrapper(block):
+	Q, X = block
+	assert maximal_marginal_relevance(Q[0], X[0], top_k=7) == _reference_mmr(Q[0], X[0], 7, 0.7)
+	assert maximal_marginal_relevance(Q[0], X[0, :0], top_k=7) == []
+	with pytest.raises(ValueError):
+		maximal_marginal_relevance(Q[0], X, top_k=7)
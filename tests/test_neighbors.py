@@ -0,0 +1,94 @@
+import faiss
+import numpy as np
+from app.neighbors import NeighborGraph, build_neighbor_graph, feed_from_papers, similar_papers, update_neighbor_graph
+
+
+def _corpus(n=120, d=12, seed=0):
+	X = np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+	X /= np.linalg.norm(X, axis=1, keepdims=True)
+	index = faiss.IndexFlatL2(d)
+	index.add(X)
+	return X, index
+
+
+def _exact_knn(X, i, k):
+	d = ((X - X[i]) ** 2).sum(axis=1)
+	d[i] = np.inf
+	return np.argsort(d, kind="stable")[:k]
+
+
+def test_graph_matches_exact_knn():
+	X, index = _corpus()
+	graph = build_neighbor_graph(index, X, k=5, batch_size=16, progress=False)
+	assert graph.n == len(X)
+	for i in (0, 17, 119):
+		ids, dist = graph.neighbors(i)
+		assert ids.tolist() == _exact_knn(X, i, 5).tolist()
+		assert (np.diff(dist.astype(np.float32)) >= 0).all()
+		assert i not in ids
+	assert graph.neighbors(len(X))[0].size == 0
+	assert graph.neighbors(3, k=2)[0].tolist() == graph.neighbors(3)[0][:2].tolist()
+
+
+def test_dense_roundtrip_and_save_load(tmp_path):
+	X, index = _corpus()
+	graph = build_neighbor_graph(index, X, k=4, progress=False)
+	I, D = graph.to_dense()
+	again = NeighborGraph.from_dense(I, D, graph.k)
+	np.testing.assert_array_equal(again.indptr, graph.indptr)
+	np.testing.assert_array_equal(again.indices, graph.indices)
+	path = str(tmp_path / "neighbors.npz")
+	graph.save(path)
+	loaded = NeighborGraph.load(path)
+	assert (loaded.n, loaded.k) == (graph.n, graph.k)
+	np.testing.assert_array_equal(loaded.indices, graph.indices)
+	np.testing.assert_array_equal(loaded.distances, graph.distances)
+
+
+def test_from_dense_drops_padding():
+	I = np.array([[1, 2, -1], [-1, -1, -1], [0, -1, -1]])
+	graph = NeighborGraph.from_dense(I, np.zeros(I.shape, dtype=np.float32), 3)
+	assert graph.indptr.tolist() == [0, 2, 2, 3]
+	assert graph.neighbors(1)[0].size == 0
+
+
+def test_update_adds_new_rows():
+	X, index = _corpus(n=100)
+	old = build_neighbor_graph(index, X[:80], k=5, progress=False)  # index already holds all 100 rows
+	graph = update_neighbor_graph(old, index, X, batch_size=8)
+	assert graph.n == 100
+	for i in (85, 99):
+		assert graph.neighbors(i)[0].tolist() == _exact_knn(X, i, 5).tolist()
+	assert update_neighbor_graph(graph, index, X) is graph
+
+
+def test_similar_and_feed():
+	X, index = _corpus()
+	graph = build_neighbor_graph(index, X, k=5, progress=False)
+	assert similar_papers(4, k=3, graph=graph).tolist() == graph.neighbors(4)[0][:3].tolist()
+	liked = [4, 9]
+	feed = feed_from_papers(liked, k=6, graph=graph, exclude=[int(graph.neighbors(4)[0][0])])
+	assert len(feed) <= 6
+	assert not set(feed.tolist()) & {4, 9, int(graph.neighbors(4)[0][0])}
+	assert set(feed.tolist()) <= set(graph.neighbors(4)[0].tolist()) | set(graph.neighbors(9)[0].tolist())
+	assert feed_from_papers([], graph=graph).size == 0
+
+
+def test_graph_ignored_after_embeddings_change(tmp_path, monkeypatch):
+	from app import neighbors, similarity_search
+	X, index = _corpus(n=20)
+	embed_path = str(tmp_path / "emb.npy")
+	np.save(embed_path, X)
+	monkeypatch.setattr(similarity_search, "EMBED_PATH", embed_path)
+	monkeypatch.setattr(similarity_search, "LOAD_PATH", str(tmp_path / "missing.parquet"))
+	monkeypatch.setattr(neighbors, "CACHE_PATH", str(tmp_path))
+	neighbors.get_neighbor_graph.cache_clear()
+	try:
+		meta = neighbors.save_neighbor_graph(build_neighbor_graph(index, X, k=3, progress=False))
+		assert set(meta["sources"]) == {"embeddings"}
+		assert neighbors.get_neighbor_graph().n == 20
+		np.save(embed_path, X[::-1].copy())
+		neighbors.get_neighbor_graph.cache_clear()
+		assert neighbors.get_neighbor_graph() is None
+	finally:
+		neighbors.get_neighbor_graph.cache_clear()
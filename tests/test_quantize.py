@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pytest
+from app.quantize import QuantizedEmbeddings, compressed_path, load_quantized, quantize_embeddings
+
+
+def _unit(n=300, d=32, seed=0):
+	X = np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+	return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("storage, tol", [("float16", 1e-3), ("int8", 2e-2)])
+def test_quantize_roundtrip(storage, tol):
+	X = _unit()
+	q = quantize_embeddings(X, storage, chunk_size=64)
+	assert q.storage == storage and q.shape == X.shape and len(q) == len(X)
+	assert np.abs(q[:] - X).max() < tol
+	np.testing.assert_array_equal(q[[5, 2]], q[:][[5, 2]])
+	assert q[3].dtype == np.float32
+	assert q.nbytes < X.nbytes
+	with pytest.raises(ValueError):
+		quantize_embeddings(X, "int4")
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8"])
+def test_codes_rebuilt_after_embeddings_change(tmp_path, storage):
+	embed_path = str(tmp_path / "emb.npy")
+	X = _unit(seed=1)
+	np.save(embed_path, X)
+	q = load_quantized(embed_path, storage)
+	assert isinstance(q, QuantizedEmbeddings)
+	assert np.abs(q[:] - X).max() < 2e-2
+	assert os.path.exists(compressed_path(embed_path, storage) + ".json")
+
+	Y = _unit(seed=2)  # the float32 matrix is rewritten (e.g. re-embedded corpus)
+	np.save(embed_path, Y)
+	q = load_quantized(embed_path, storage)
+	assert np.abs(q[:] - Y).max() < 2e-2
+	assert np.abs(q[:] - X).max() > 0.5
+
+
+def test_codes_without_sidecar_rebuilt_once(tmp_path, capsys):
+	embed_path = str(tmp_path / "emb.npy")
+	X = _unit(seed=3)
+	np.save(embed_path, X)
+	path = compressed_path(embed_path, "float16")
+	np.save(path, _unit(seed=4).astype(np.float16))  # codes from before sidecars: origin unknown
+	np.testing.assert_allclose(load_quantized(embed_path, "float16")[:], X, atol=1e-3)
+	capsys.readouterr()
+	load_quantized(embed_path, "float16")
+	assert "compressing" not in capsys.readouterr().out.lower()
@@ -0,0 +1,124 @@
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from app import users
+from app.mmr import batched_mmr
+from app.recommend import _merge, _rerank_lists, recommend_all
+from app.rerank import Features
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def test_merge_fuses_ranks_and_excludes_liked():
+	I = np.array([[5, 1, 2], [1, 7, 5]])
+	ids, scores = _merge(I, np.array([1.0, 0.5]), np.array([2]), k=10)
+	# 1: 1/2 + 0.5/1, 5: 1/1 + 0.5/3, 7: 0.5/2
+	assert ids.tolist() == [5, 1, 7]
+	np.testing.assert_allclose(scores, [1 + 0.5 / 3, 1.0, 0.25])
+	canonical = np.array([0, 1, 2, 3, 4, 1, 6, 2])  # 5 is a version of 1, 7 one of the liked 2
+	ids, _ = _merge(I, np.array([1.0, 0.5]), np.array([2]), k=10, canonical=canonical)
+	assert ids.tolist() == [5]
+	assert _merge(np.array([[-1, -1]]), np.array([1.0]), np.array([], dtype=np.int64), k=3)[0].size == 0
+
+
+def test_rerank_lists_is_one_batch_over_the_fused_lists():
+	rng = np.random.default_rng(0)
+	X = rng.standard_normal((60, 8)).astype(np.float32)
+	X /= np.linalg.norm(X, axis=1, keepdims=True)
+	X[1] = X[0]  # a near-copy of the top paper
+	features = Features.from_df(pd.DataFrame({"date": ["2024-01-01"] * 60, "url_pdf": [None] * 60}))
+	lists = [(np.arange(10), 1.0 / np.arange(1, 11)), (np.array([30, 20]), np.array([2.0, 1.0]))]
+	profiles = [(X[:2], np.array([1.0, 0.5]), []), (X[20:21], np.array([1.0]), [])]
+	plain = _rerank_lists(lists, profiles, 4, X, features, use_mmr=False, lambda_param=0.7)
+	assert plain[0][0].tolist() == [0, 1, 2, 3] and plain[0][1].tolist() == [1.0, 0.5, 1 / 3, 0.25]
+	assert plain[1][0].tolist() == [30, 20] and plain[1][1].tolist() == [2.0, 1.0]  # short rows aren't padded out
+	diverse = _rerank_lists(lists, profiles, 4, X, features, use_mmr=True, lambda_param=0.5)
+	assert diverse[0][0][0] == 0 and 1 not in diverse[0][0]  # the copy gives way to the next papers
+	assert diverse[0][1][0] == 1.0
+
+
+def _seed_users(df):
+	users.create_user("liker", "x")
+	for i in range(5):
+		users.like_paper("liker", df.iloc[i].to_dict())
+	users.create_user("searcher", "x")
+	users.add_search_history("searcher", "graph neural networks", [])
+	users.create_user("newcomer", "x")
+
+
+def test_recommend_all_writes_each_list_to_its_own_file(corpus, users_dir):
+	from app.query import recommended_papers
+	from app.versions import use_context
+	with use_context() as ctx:
+		df = ctx.df
+	_seed_users(df)
+	before = users.get_user_data("liker")
+	report = recommend_all(k=8, workers=1, progress=False)
+	assert (report["users"], report["with_profile"], report["written"]) == (3, 2, 2)
+	assert users.get_user_data("liker") == before  # likes and history untouched
+	assert sorted(os.listdir(users_dir)) == sorted(["liker.json", "liker.interests.npz", "liker.recs.json",
+													"searcher.json", "searcher.recs.json", "newcomer.json"])
+	recs = users.get_recommendations("liker")
+	assert recs["profile_version"] == users.get_profile_version("liker") and len(recs["papers"]) == 8
+	liked = {p["paper_url"] for p in users.get_liked_papers("liker")}
+	assert not liked & {p["paper_url"] for p in recs["papers"]}
+	assert users.get_recommendations("newcomer") is None and recommended_papers("newcomer") is None
+	items = recommended_papers("liker")["papers"]
+	assert [it["paper_url"] for it in items] == [p["paper_url"] for p in recs["papers"]]
+	assert all(it["title"] == df.iloc[it["idx"]]["title"] for it in items)
+	assert users.list_users() == ["liker", "newcomer", "searcher"]
+
+
+def test_failed_write_keeps_the_previous_list(users_dir, monkeypatch):
+	users.create_user("alice", "x")
+	assert users.set_recommendations("alice", [{"idx": 3, "paper_url": "u3", "score": 1.0}], 1, "c1")
+
+	def boom(*args, **kwargs):
+		raise OSError("disk full")
+
+	monkeypatch.setattr(users.json, "dump", boom)
+	with pytest.raises(OSError):
+		users.set_recommendations("alice", [{"idx": 4, "paper_url": "u4", "score": 1.0}], 2, "c1")
+	monkeypatch.setattr(users.json, "dump", json.dump)
+	assert users.get_recommendations("alice")["papers"] == [{"idx": 3, "paper_url": "u3", "score": 1.0}]
+	assert not users.set_recommendations("nobody", [], 0)
+
+
+def test_nightly_script_with_forked_workers(corpus, users_dir):
+	"""The job as cron runs it: a fresh process forking two workers, one user per chunk."""
+	from app.versions import use_context
+	with use_context() as ctx:
+		_seed_users(ctx.df)
+	proc = subprocess.run([sys.executable, "-m", "scripts.recommend_users", "--workers", "2", "--chunk-size", "1",
+						   "--k", "5", "--users-dir", users_dir],
+						  cwd=ROOT, env=dict(os.environ), check=True, capture_output=True, text=True, timeout=300)
+	report = json.loads(proc.stdout[proc.stdout.index("{"):])
+	assert report["workers"] == 2 and report["written"] == 2
+	assert len(users.get_recommendations("searcher")["papers"]) == 5
+	with use_context() as ctx:
+		assert users.get_recommendations("liker")["corpus"] == ctx.corpus_version
+
+
+def test_each_chunk_is_diversified_in_one_batched_mmr_call(corpus, users_dir, monkeypatch):
+	from app import rerank
+	from app.versions import use_context
+	with use_context() as ctx:
+		_seed_users(ctx.df)
+	calls = []
+
+	def counting(query_vecs, doc_vecs, **kwargs):
+		calls.append(doc_vecs.shape[0])
+		return batched_mmr(query_vecs, doc_vecs, **kwargs)
+
+	monkeypatch.setattr(rerank, "batched_mmr", counting)
+	recommend_all(k=5, workers=1, chunk_size=2, write=False, progress=False)
+	assert calls == [1, 1]  # chunks (liker, newcomer) and (searcher,); newcomer has no profile
+	calls.clear()
+	recommend_all(k=5, workers=1, chunk_size=3, write=False, progress=False)
+	assert calls == [2]
+	recommend_all(k=5, workers=1, write=False, progress=False, use_mmr=False)
+	assert calls == [2]
@@ -0,0 +1,118 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+from app import settings
+from app.pool import CandidatePool
+from app.rerank import Features, Personalization, TimeDecay, base_relevance, default_chain, rerank, score
+from app.users import blend_user_scores
+
+
+def _unit(x):
+	return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def corpus():
+	rng = np.random.default_rng(0)
+	n, d = 300, 16
+	X = _unit(rng.standard_normal((n, d)))
+	df = pd.DataFrame({
+		"date": pd.date_range("2000-01-01", periods=n, freq="30D").strftime("%Y-%m-%d"),
+		"url_pdf": np.where(rng.random(n) < 0.5, "https://example.org/a.pdf", None),
+	})
+	return X, df, Features.from_df(df)
+
+
+def _pools(X, rng, B=6, n=40):
+	Q = _unit(rng.standard_normal((B, X.shape[1])))
+	I = np.stack([np.argsort(((X - q) ** 2).sum(axis=1))[:n] for q in Q])
+	V = X[I]
+	D = ((V - Q[:, None]) ** 2).sum(axis=2).astype(np.float32)
+	return Q, I, D, V
+
+
+def test_features_from_df():
+	df = pd.DataFrame({"date": ["1970-01-11", "not a date", None], "url_pdf": ["x.pdf", "", None]})
+	f = Features.from_df(df)
+	assert f["days"].tolist() == [10, -1, -1]
+	assert f["has_pdf"].tolist() == [True, False, False]
+	assert "citations" not in f
+
+
+def test_default_chain_is_a_no_op(corpus):
+	X, df, features = corpus
+	Q, I, D, V = _pools(X, np.random.default_rng(1))
+	scores, changed = score(I, D, features, default_chain(), vectors=V)
+	assert not changed
+	np.testing.assert_allclose(scores, 1.0 - D / 2.0)
+
+
+def test_personalization_keeps_the_distance_blend_order(corpus):
+	X, df, features = corpus
+	Q, I, D, V = _pools(X, np.random.default_rng(2))
+	interests = X[:3]
+	scores, changed = score(I, D, features, [Personalization(0.25)], vectors=V, interests=interests)
+	assert changed
+	for b in range(len(I)):
+		old = np.argsort(blend_user_scores(interests, V[b], D[b], 0.25), kind="stable")
+		assert (np.argsort(-scores[b], kind="stable") == old).all()
+
+
+def test_recency_prefers_newer_papers(corpus):
+	X, df, features = corpus
+	ids = np.array([[10, 290]])  # same distance, 280 * 30 days apart
+	scores, _ = score(ids, np.zeros((1, 2), np.float32), features, [TimeDecay(0.1, 365)], today=date(2025, 1, 1))
+	assert scores[0, 1] > scores[0, 0]
+
+
+def test_lexical_relevance_keeps_fused_order_on_cosine_scale(corpus):
+	X, df, features = corpus
+	rng = np.random.default_rng(3)
+	Q, I, _, V = _pools(X, rng)
+	fused = np.sort(rng.random(I.shape).astype(np.float32), axis=1)[:, ::-1]
+	D = 1.0 - fused / fused[:, :1]
+	valid = np.ones(I.shape, dtype=bool)
+	rel = base_relevance(D, valid, "lexical", V, Q)
+	sim = np.einsum("bnd,bd->bn", V, Q)
+	assert (np.diff(rel, axis=1) <= 1e-6).all()
+	np.testing.assert_allclose(rel[:, 0], sim.max(axis=1), rtol=1e-5)
+	np.testing.assert_allclose(rel[:, -1], sim.min(axis=1), rtol=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid", "lexical"])
+@pytest.mark.parametrize("use_mmr", [True, False])
+def test_batched_rerank_matches_pool(corpus, monkeypatch, mode, use_mmr):
+	X, df, features = corpus
+	monkeypatch.setattr(settings, "recency_weight", 0.05)
+	monkeypatch.setattr(settings, "pdf_weight", 0.01)
+	Q, I, D, V = _pools(X, np.random.default_rng(4))
+	if mode != "dense":
+		D = (D / D.max(axis=1, keepdims=True)).astype(np.float32)
+	batched = rerank(I, D, V, Q, 10, features, use_mmr=use_mmr, mode=mode)
+	for b in range(len(I)):
+		pool = CandidatePool("q", mode, 0, Q[b], I[b], D[b], V[b])
+		assert (pool.rank(10, I.shape[1], use_mmr, df=df, embeddings=X, features=features) == batched[b]).all()
+
+
+def test_rerank_pads_short_rows(corpus):
+	X, df, features = corpus
+	Q, I, D, V = _pools(X, np.random.default_rng(5), B=2, n=8)
+	I[1, 3:] = -1
+	out = rerank(I, D, V, Q, 5, features, use_mmr=False, chain=[TimeDecay(0.05, 365)])
+	assert (out[1, 3:] == -1).all() and (out[1, :3] >= 0).all()
+
+
+@pytest.mark.parametrize("mode", ["lexical", "hybrid"])
+def test_anonymous_mmr_keeps_the_fused_order(corpus, mode):
+	X, df, features = corpus
+	Q, I, _, V = _pools(X, np.random.default_rng(6), B=1)
+	# BM25 ranks the candidates least similar to the query first
+	I, V = I[:, ::-1].copy(), V[:, ::-1].copy()
+	D = np.linspace(0.0, 0.9, I.shape[1], dtype=np.float32)[None]
+	pool = CandidatePool("q", mode, 0, Q[0], I[0], D[0], V[0])
+	assert pool.rank(1, I.shape[1], use_mmr=True, df=df, embeddings=X, features=features)[0] == I[0, 0]
+	assert rerank(I, D, V, Q, 1, features, mode=mode)[0, 0] == I[0, 0]
+	# with lambda = 1 MMR is the relevance order: the fused one
+	top = pool.rank(5, I.shape[1], use_mmr=True, lambda_param=1.0, df=df, embeddings=X, features=features)
+	assert (top == I[0, :5]).all()
@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid", "lexical"])
+def test_search_end_to_end(corpus, mode):
+	from app.query import search
+	results, df, I, explanation = search("graph neural networks", top_k=5, llm=False, mode=mode, record=False)
+	assert 0 < len(results) <= 5
+	assert explanation is None
+	assert len({r["paper_url"] for r in results}) == len(results)
+	for r in results:
+		assert df.iloc[r["idx"]]["title"] == r["title"]
+
+
+def test_search_result_cache(corpus):
+	from app.query import results_cache, search
+	results_cache.clear()
+	first = search("diffusion models", top_k=5, llm=False, mode="dense", record=False)[0]
+	hits = results_cache.hits
+	second = search("  Diffusion   models ", top_k=5, llm=False, mode="dense", record=False)[0]
+	assert results_cache.hits == hits + 1
+	assert [r["idx"] for r in first] == [r["idx"] for r in second]
+
+
+def test_more_results_extend_the_same_list(corpus):
+	from app.query import search
+	five = search("object detection", top_k=5, llm=False, mode="dense", record=False)[0]
+	ten = search("object detection", top_k=10, llm=False, mode="dense", record=False)[0]
+	assert [r["idx"] for r in ten[:5]] == [r["idx"] for r in five]
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import threading
+import pytest
+from app import metrics, settings
+from app.serving import SESSION_TOKEN_KEY, RetrievalClient, RetrievalServer, parse_address
+
+
+def _count(name, **labels):
+	return metrics.snapshot()["counters"].get(f"{name}{labels if labels else ''}", 0)
+
+
+@pytest.fixture
+def sidecar(corpus):
+	"""A RetrievalServer on a unix socket, served from a thread of this process."""
+	workdir = tempfile.mkdtemp(prefix="sidecar_")  # short path: unix socket names are limited to ~100 bytes
+	address = os.path.join(workdir, "retrieval.sock")
+	server = RetrievalServer(address)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	client = RetrievalClient(address)
+	for _ in range(200):
+		if os.path.exists(address):
+			break
+		threading.Event().wait(0.01)
+	yield server, client
+	client.close()  # the server thread stays blocked in accept() until the test process exits
+
+
+def test_parse_address():
+	assert parse_address("127.0.0.1:7001") == ("127.0.0.1", 7001)
+	assert parse_address(":7001") == ("127.0.0.1", 7001)
+	assert parse_address("/tmp/x.sock") == "/tmp/x.sock"
+	with pytest.raises(ValueError, match="RETRIEVAL_AUTHKEY"):
+		RetrievalServer("127.0.0.1:7001", authkey="")
+
+
+def test_remote_search_matches_local(sidecar):
+	from app.query import search
+	_, client = sidecar
+	assert client.call("ping") == "pong"
+	results, df, I, explanation = client.search("graph neural networks", top_k=5, llm=False, mode="dense", record=False)
+	local = search("graph neural networks", top_k=5, llm=False, mode="dense", record=False)
+	assert df is None and explanation is None
+	assert [r["idx"] for r in results] == I == [r["idx"] for r in local[0]]
+	with pytest.raises(ValueError):
+		client.search("x", index=object())
+
+
+def test_session_pool_is_kept_in_the_sidecar(sidecar):
+	from app.query import results_cache
+	server, client = sidecar
+	session = {}
+	results_cache.clear()
+	client.search("contrastive learning", top_k=5, llm=False, mode="dense", session=session, record=False)
+	token = session[SESSION_TOKEN_KEY]
+	assert set(session) == {SESSION_TOKEN_KEY}  # the pool itself stays in the server
+	reuse = _count("candidate_pool_total", result="reuse")
+	ten = client.search("contrastive learning", top_k=10, llm=False, mode="dense", session=session, record=False)[0]
+	assert _count("candidate_pool_total", result="reuse") == reuse + 1  # "more results": no second fetch
+	assert session[SESSION_TOKEN_KEY] == token and len(ten) == 10
+	# another session gets its own pool
+	other = {}
+	client.search("contrastive learning", top_k=10, llm=False, mode="hybrid", session=other, record=False)
+	assert other[SESSION_TOKEN_KEY] != token and client.stats()["sessions"] == 2
+
+
+def test_similar_many_is_one_round_trip(sidecar, tmp_path, monkeypatch):
+	from app import neighbors
+	from app.query import related_papers
+	from app.versions import use_context
+	server, client = sidecar
+	monkeypatch.setattr(neighbors, "CACHE_PATH", str(tmp_path))
+	neighbors.get_neighbor_graph.cache_clear()
+	try:
+		with use_context() as ctx:
+			_, embeddings, index = ctx.lookup()
+			neighbors.save_neighbor_graph(neighbors.build_neighbor_graph(index, embeddings, k=6, progress=False))
+		neighbors.get_neighbor_graph.cache_clear()
+		requests = server.requests
+		lists = client.similar_many([3, 40, 7], k=4)
+		assert server.requests == requests + 1
+		ids = [[r["idx"] for r in items] for items in lists]
+		assert ids == [[r["idx"] for r in related_papers(uid, k=4)] for uid in (3, 40, 7)]
+		assert all(len(items) == 4 for items in ids)
+		assert [r["idx"] for r in client.similar(40, k=4)] == ids[1]
+	finally:
+		neighbors.get_neighbor_graph.cache_clear()
+
+
+def test_errors_and_admin_requests(sidecar, monkeypatch):
+	_, client = sidecar
+	with pytest.raises(RuntimeError, match="unknown method"):
+		client.call("nope")
+	monkeypatch.setattr(settings, "admin_token", None)
+	with pytest.raises(RuntimeError, match="PermissionError"):
+		client.index_status(token="x")
+	monkeypatch.setattr(settings, "admin_token", "secret")
+	with pytest.raises(RuntimeError, match="bad admin token"):
+		client.index_status(token="guess")
+	assert "active" in client.index_status(token="secret")
+	assert client.call("ping") == "pong"  # the connection survives errors
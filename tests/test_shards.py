@@ -0,0 +1,98 @@
+import json
+import os
+import faiss
+import numpy as np
+import pandas as pd
+import pytest
+from app.shards import MANIFEST, ShardedIndex, build_shards, read_manifest
+from app.similarity_search import source_fingerprints
+
+
+@pytest.fixture
+def corpus(tmp_path):
+	rng = np.random.default_rng(0)
+	n, d = 400, 1536
+	X = rng.standard_normal((n, d)).astype(np.float32)
+	df = pd.DataFrame({"date": pd.Series(pd.date_range("2019-01-01", periods=n, freq="5D")).dt.strftime("%Y-%m-%d"),
+					   "title": [f"paper {i}" for i in range(n)]})
+	embed_path, data_path = str(tmp_path / "emb.npy"), str(tmp_path / "papers.parquet")
+	np.save(embed_path, X)
+	df.to_parquet(data_path)
+	shard_dir = str(tmp_path / "shards")
+	return X, df, shard_dir, (embed_path, data_path)
+
+
+def _sources(paths):
+	return source_fingerprints(*paths)
+
+
+def test_sharded_search_matches_flat(corpus):
+	X, df, shard_dir, paths = corpus
+	manifest = build_shards(df, X, "year", shard_dir=shard_dir, sources=_sources(paths))
+	assert manifest["ntotal"] == len(X) and len(manifest["shards"]) > 1
+	assert manifest["sources"] == _sources(paths)
+	index = ShardedIndex.load(shard_dir, sources=_sources(paths))
+	flat = faiss.IndexFlatL2(X.shape[1])
+	flat.add(X)
+	D, I = index.search(X[:5] + 0.01, 10)
+	D0, I0 = flat.search(X[:5] + 0.01, 10)
+	np.testing.assert_array_equal(I, I0)
+	np.testing.assert_allclose(D, D0, rtol=1e-4)
+
+
+def test_partial_rebuild_with_same_sources(corpus):
+	X, df, shard_dir, paths = corpus
+	build_shards(df, X, "year", shard_dir=shard_dir, sources=_sources(paths))
+	index = ShardedIndex.load(shard_dir, sources=_sources(paths))
+	before = index.version
+	manifest = build_shards(df, X, "year", shard_dir=shard_dir, only=["2020"], sources=_sources(paths))
+	assert manifest["shards"]["2020"]["version"] == 2
+	assert sorted(f for f in os.listdir(shard_dir) if f.startswith("shard_2020")) == sorted(
+		[manifest["shards"]["2020"]["index"], manifest["shards"]["2020"]["ids"]])
+	os.utime(os.path.join(shard_dir, MANIFEST), ns=(1, 1))  # mtime always differs from load time
+	assert index.refresh() == ["2020"]
+	assert index.version != before
+
+
+def test_partial_rebuild_refused_after_corpus_change(corpus):
+	X, df, shard_dir, paths = corpus
+	build_shards(df, X, "year", shard_dir=shard_dir, sources=_sources(paths))
+	np.save(paths[0], X[::-1].copy())  # corpus rebuilt: row ids moved
+	with pytest.raises(ValueError, match="embeddings"):
+		build_shards(df, X[::-1], "year", shard_dir=shard_dir, only=["2020"], sources=_sources(paths))
+	assert read_manifest(shard_dir)["shards"]["2020"]["version"] == 1
+	# a full rebuild is fine and records the new fingerprints
+	assert build_shards(df, X[::-1], "year", shard_dir=shard_dir, sources=_sources(paths))["sources"] == _sources(paths)
+
+
+def test_partial_rebuild_refused_without_recorded_sources(corpus):
+	X, df, shard_dir, paths = corpus
+	build_shards(df, X, "year", shard_dir=shard_dir, sources=_sources(paths))
+	path = os.path.join(shard_dir, MANIFEST)
+	manifest = read_manifest(shard_dir)
+	del manifest["sources"]
+	with open(path, "w") as f:
+		json.dump(manifest, f)
+	with pytest.raises(ValueError, match="doesn't record"):
+		build_shards(df, X, "year", shard_dir=shard_dir, only=["2020"], sources=_sources(paths))
+
+
+def test_load_refused_after_corpus_change(corpus):
+	X, df, shard_dir, paths = corpus
+	build_shards(df, X, "year", shard_dir=shard_dir, sources=_sources(paths))
+	df.iloc[::-1].to_parquet(paths[1])
+	with pytest.raises(ValueError, match="data"):
+		ShardedIndex.load(shard_dir, sources=_sources(paths))
+	assert ShardedIndex.load(shard_dir, check_sources=False).ntotal == len(X)
+
+
+def test_refresh_ignores_shards_of_another_corpus(corpus):
+	X, df, shard_dir, paths = corpus
+	build_shards(df, X, "year", shard_dir=shard_dir, sources=_sources(paths))
+	index = ShardedIndex.load(shard_dir, sources=_sources(paths))
+	before = index.version
+	np.save(paths[0], X[::-1].copy())
+	build_shards(df, X[::-1], "year", shard_dir=shard_dir, sources=_sources(paths))
+	os.utime(os.path.join(shard_dir, MANIFEST), ns=(1, 1))
+	assert index.refresh() == []
+	assert index.version == before
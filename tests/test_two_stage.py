@@ -0,0 +1,102 @@
+import os
+import faiss
+import numpy as np
+import pytest
+from app import settings, similarity_search
+from app.similarity_search import TwoStageIndex, _truncate, get_default_index, get_truncated_index
+
+
+def _matryoshka(n, d, seed=0):
+	"""Unit vectors whose leading components carry most of the variance, as in text-embedding-3."""
+	rng = np.random.default_rng(seed)
+	X = (rng.standard_normal((n, d)) / np.sqrt(1.0 + np.arange(d) / 8.0)).astype(np.float32)
+	return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def _queries(X, n, seed=1):
+	rng = np.random.default_rng(seed)
+	Q = X[rng.integers(0, len(X), size=n)] + 0.05 * rng.standard_normal((n, X.shape[1])).astype(np.float32)
+	return (Q / np.linalg.norm(Q, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _recall(I, truth):
+	return np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(I, truth)])
+
+
+def _flat(X):
+	index = faiss.IndexFlatL2(X.shape[1])
+	index.add(X)
+	return index
+
+
+def test_two_stage_recall_against_exact_search():
+	X = _matryoshka(3000, 256)
+	Q = _queries(X, 100)
+	k = 10
+	D_exact, truth = _flat(X).search(Q, k)
+	coarse = faiss.IndexFlatIP(64)
+	coarse.add(_truncate(X, 64))
+	_, coarse_only = coarse.search(_truncate(Q, 64), k)
+	D, I = TwoStageIndex(coarse, X, pool_factor=8).search(Q, k)
+	assert _recall(I, truth) >= 0.95
+	assert _recall(I, truth) >= _recall(coarse_only, truth)  # the exact re-score recovers what truncation loses
+	# returned distances are the exact squared L2 ones, in ascending order
+	np.testing.assert_allclose(D, ((X[I] - Q[:, None]) ** 2).sum(axis=2), rtol=1e-4, atol=1e-5)
+	assert (np.diff(D, axis=1) >= 0).all()
+	# a wider pool never loses recall; truncation to all dims is the exact search
+	assert _recall(TwoStageIndex(coarse, X, pool_factor=32).search(Q, k)[1], truth) >= _recall(I, truth)
+	full = faiss.IndexFlatIP(256)
+	full.add(_truncate(X, 256))
+	D_full, I_full = TwoStageIndex(full, X, pool_factor=2).search(Q, k)
+	assert _recall(I_full, truth) == 1.0
+	np.testing.assert_allclose(D_full, D_exact, rtol=1e-4, atol=1e-5)
+
+
+@pytest.fixture
+def truncation(corpus, tmp_path, monkeypatch):
+	"""The synthetic corpus's embeddings, with truncated indexes built into a temp cache dir."""
+	from app.similarity_search import load_embeddings
+	monkeypatch.setattr(similarity_search, "CACHE_PATH", str(tmp_path))
+	get_default_index.cache_clear()
+	try:
+		yield np.asarray(load_embeddings(), dtype=np.float32)
+	finally:
+		get_default_index.cache_clear()
+
+
+def test_truncated_index_is_cached_with_its_sidecar(truncation, tmp_path):
+	index = get_truncated_index(truncation, 256)
+	path = str(tmp_path / "faiss_index_d256.index")
+	assert os.path.exists(path) and os.path.exists(similarity_search._meta_path(path))
+	assert index.d == 256 and index.ntotal == len(truncation)
+	cached = get_truncated_index(truncation, 256)
+	assert cached is not index and cached.ntotal == index.ntotal
+	np.testing.assert_array_equal(cached.search(_truncate(truncation[:3], 256), 5)[1],
+								  index.search(_truncate(truncation[:3], 256), 5)[1])
+	os.replace(path, str(tmp_path / "faiss_index_d128.index"))
+	os.replace(similarity_search._meta_path(path), similarity_search._meta_path(str(tmp_path / "faiss_index_d128.index")))
+	with pytest.raises(ValueError):
+		get_truncated_index(truncation, 128)  # a 256-dim index under the 128-dim name
+
+
+def test_default_index_recall_with_truncation_on_and_off(truncation, monkeypatch):
+	Q = _queries(truncation, 50)
+	k = 10
+	monkeypatch.setattr(settings, "truncate_dim", 0)
+	exact = get_default_index()
+	assert not isinstance(exact, TwoStageIndex)
+	_, truth = exact.search(Q, k)
+	assert _recall(truth, _flat(truncation).search(Q, k)[1]) == 1.0
+	get_default_index.cache_clear()
+	monkeypatch.setattr(settings, "truncate_dim", 512)
+	monkeypatch.setattr(settings, "two_stage_pool", 8)
+	two_stage = get_default_index()
+	assert isinstance(two_stage, TwoStageIndex) and two_stage.dim == 512 and two_stage.ntotal == exact.ntotal
+	_, I = two_stage.search(Q, k)
+	# the synthetic vectors aren't Matryoshka-trained, so a third of the dims keeps less than real ones do
+	assert _recall(I, truth) >= 0.75 and (I[:, 0] == truth[:, 0]).all()
+	coarse_only = two_stage.coarse.search(_truncate(Q, 512), k)[1]
+	assert _recall(I, truth) >= _recall(coarse_only, truth)
+	# a pool as large as the corpus re-scores everything: the exact result
+	monkeypatch.setattr(two_stage, "pool_factor", two_stage.ntotal)
+	assert _recall(two_stage.search(Q, k)[1], truth) == 1.0
@@ -0,0 +1,78 @@
+import pytest
+from fastapi import HTTPException
+from app.typeahead import PHRASE, TITLE, PrefixIndex, suggest
+
+TITLES = (
+	["Graph Neural Networks for Molecules"] * 3
+	+ ["Graph neural networks survey", "Graph Attention Networks", "Graphene sensors", "Diffusion Models Beat GANs"]
+	+ [f"Graph neural networks study {i}" for i in range(5)]
+	+ [None, ""]
+)
+
+
+def test_prefix_range_is_exact():
+	index = PrefixIndex.build(TITLES, min_phrase_count=5)
+	lo, hi = index.prefix_range("graph")
+	keys = [index.key(i) for i in range(len(index))]
+	assert keys == sorted(keys)
+	assert [k for k in keys if k.startswith("graph")] == keys[lo:hi]
+	assert index.prefix_range("zzz")[0] == index.prefix_range("zzz")[1]
+
+
+def test_complete_phrases_before_titles():
+	index = PrefixIndex.build(TITLES, min_phrase_count=5)
+	out = index.complete("graph n", k=3)
+	assert out[0] == ("graph neural networks", PHRASE, -1)
+	assert all(kind == TITLE and row >= 0 for _, kind, row in out[1:])
+	# titles: shorter first
+	assert len(out[1][0]) <= len(out[2][0])
+	assert index.complete("graphe") == [("graphene sensors", TITLE, 5)]
+	assert index.complete("transformer") == []
+	assert index.complete("graph", k=0) == [] and index.complete("graph", k=-3) == []
+
+
+def test_rows_point_at_source_titles():
+	index = PrefixIndex.build(TITLES)
+	for key, kind, row in index.complete("diff", k=5):
+		if kind == TITLE:
+			assert TITLES[row].lower() == key
+
+
+def test_save_load_roundtrip(tmp_path):
+	index = PrefixIndex.build(TITLES, min_phrase_count=2)
+	path = str(tmp_path / "typeahead.npz")
+	index.save(path)
+	loaded = PrefixIndex.load(path)
+	assert len(loaded) == len(index)
+	assert loaded.complete("graph", k=5) == index.complete("graph", k=5)
+
+
+def test_index_rebuilt_after_parquet_change(tmp_path, monkeypatch):
+	import pandas as pd
+	from app import similarity_search, typeahead
+	data_path = str(tmp_path / "papers.parquet")
+	pd.DataFrame({"title": ["Graph Attention Networks"]}).to_parquet(data_path)
+	monkeypatch.setattr(similarity_search, "LOAD_PATH", data_path)
+	monkeypatch.setattr(typeahead, "CACHE_PATH", str(tmp_path))
+	similarity_search.load_data.cache_clear()
+	typeahead.get_typeahead_index.cache_clear()
+	try:
+		assert typeahead.get_typeahead_index().complete("graph") == [("graph attention networks", TITLE, 0)]
+		pd.DataFrame({"title": ["Diffusion Models", "Graph Transformers"]}).to_parquet(data_path)
+		similarity_search.load_data.cache_clear()
+		typeahead.get_typeahead_index.cache_clear()
+		assert typeahead.get_typeahead_index().complete("graph") == [("graph transformers", TITLE, 1)]
+	finally:
+		similarity_search.load_data.cache_clear()
+		typeahead.get_typeahead_index.cache_clear()
+
+
+@pytest.mark.parametrize("k", [0, -1])
+def test_suggest_rejects_k_below_one(k):
+	from app.api import suggest_endpoint
+	index = PrefixIndex.build(TITLES, min_phrase_count=5)
+	with pytest.raises(ValueError, match="at least 1"):
+		suggest("graph", k=k, index=index)
+	with pytest.raises(HTTPException) as e:
+		suggest_endpoint("graph", k=k)
+	assert e.value.status_code == 400
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app import users
+
+
+def _corpus(d=16, per=12, seed=0):
+	"""Two tight clusters of unit vectors (rows 0..per-1 and per..2*per-1) with their paper URLs."""
+	rng = np.random.default_rng(seed)
+	centers = np.eye(d, dtype=np.float32)[:2]
+	X = np.concatenate([c + 0.05 * rng.standard_normal((per, d)) for c in centers]).astype(np.float32)
+	X /= np.linalg.norm(X, axis=1, keepdims=True)
+	df = pd.DataFrame({"paper_url": [f"https://papers/{i}" for i in range(len(X))], "title": [f"p{i}" for i in range(len(X))]})
+	return X, df, centers
+
+
+def _like(username, df, rows):
+	for i in rows:
+		users.like_paper(username, {"paper_url": df["paper_url"][i], "title": df["title"][i]})
+
+
+def test_fold_in_moves_the_nearest_interest():
+	centroids = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+	counts = np.array([3, 1])
+	new, new_counts = users._fold_in(centroids, counts, np.array([[0.0, 1.0], [1.0, 0.2]], dtype=np.float32))
+	assert new_counts.tolist() == [4, 2]
+	np.testing.assert_allclose(new[0], [1.0, 0.05])  # moved 1/4 of the way toward [1, 0.2]
+	np.testing.assert_allclose(new[1], [0.0, 1.0])
+	assert counts.tolist() == [3, 1] and centroids[0].tolist() == [1.0, 0.0]  # inputs untouched
+
+
+def test_interests_follow_the_liked_clusters(users_dir):
+	X, df, centers = _corpus()
+	assert users.compute_user_interests("alice", X, df) is None  # no account yet
+	users.create_user("alice", "x")
+	assert users.compute_user_interests("alice", X, df) is None  # no likes
+	_like("alice", df, [0, 1, 2, 12, 13, 14])
+	interests = users.compute_user_interests("alice", X, df, max_interests=2, corpus="c1")
+	assert interests.shape == (2, X.shape[1])
+	sims = users._normalize_rows(interests) @ centers.T
+	assert sorted(np.argmax(sims, axis=1).tolist()) == [0, 1] and (sims.max(axis=1) > 0.95).all()
+
+
+def test_interests_cached_per_profile_version_and_space(users_dir, monkeypatch):
+	X, df, _ = _corpus()
+	users.create_user("bob", "x")
+	_like("bob", df, [0, 1, 12])
+	first = users.compute_user_interests("bob", X, df, max_interests=2, corpus="c1")
+	monkeypatch.setattr(users, "_interests", {})  # a new process: loaded from the .interests.npz file
+	monkeypatch.setattr(users, "_fit_interests", lambda *a: pytest.fail("refit of unchanged likes"))
+	np.testing.assert_array_equal(users.compute_user_interests("bob", X, df, max_interests=2, corpus="c1"), first)
+	with pytest.raises(pytest.fail.Exception):
+		users.compute_user_interests("bob", X, df, max_interests=2, corpus="c2")  # another corpus: no carry-over
+
+
+def test_new_likes_are_folded_in_once_enough(users_dir, monkeypatch):
+	X, df, _ = _corpus()
+	monkeypatch.setattr(users, "REFIT_LIKES_PER_INTEREST", 2)
+	users.create_user("carol", "x")
+	_like("carol", df, [0, 1, 12, 13])
+	before = users.compute_user_interests("carol", X, df, max_interests=2, corpus="c1")
+	fit = users._fit_interests
+	monkeypatch.setattr(users, "_fit_interests", lambda *a: pytest.fail("refit instead of fold-in"))
+	_like("carol", df, [2])
+	after = users.compute_user_interests("carol", X, df, max_interests=2, corpus="c1")
+	assert users._interests["carol"]["counts"].sum() == 5
+	assert np.abs(after - before).max() > 0
+	# an unlike can't be folded out: it refits
+	monkeypatch.setattr(users, "_fit_interests", fit)
+	users.unlike_paper("carol", df["paper_url"][2])
+	assert users.compute_user_interests("carol", X, df, max_interests=2, corpus="c1").shape[0] == 2
+
+
+def test_get_user_interests_reads_the_user_file_once(users_dir, monkeypatch):
+	X, df, _ = _corpus()
+	users.create_user("dave", "x")
+	_like("dave", df, [0, 12])
+	reads = []
+	get_user_data = users.get_user_data
+	monkeypatch.setattr(users, "get_user_data", lambda name: reads.append(name) or get_user_data(name))
+	version, interests = users.get_user_interests("dave", X, df, corpus="c1")
+	assert reads == ["dave"]
+	assert version == users.get_profile_version("dave") == 2
+	assert interests is not None and interests.shape[1] == X.shape[1]
+	assert users.get_user_interests("nobody", X, df, corpus="c1") == (0, None)
+
+
+def test_search_reads_the_profile_once(corpus, users_dir, monkeypatch):
+	from app.query import search
+	from app.versions import use_context
+	users.create_user("erin", "x")
+	with use_context() as ctx:
+		_like("erin", ctx.df, range(4))
+	reads = []
+	get_user_data = users.get_user_data
+	monkeypatch.setattr(users, "get_user_data", lambda name: reads.append(name) or get_user_data(name))
+	search("reinforcement learning", top_k=5, llm=False, mode="dense", user="erin", deadline_ms=0, record=False)
+	assert len(reads) == 2  # interests + profile version, then the history write
@@ -0,0 +1,97 @@
+import os
+import threading
+import pytest
+from app import settings, versions
+
+
+@pytest.fixture
+def published(corpus, tmp_path, monkeypatch):
+	"""Empty VERSIONS_DIR and fresh module state, with the synthetic corpus's build outputs in CACHE_DIR."""
+	from app.similarity_search import get_lookup_table
+	get_lookup_table()  # builds the index (and its sidecar) on first use
+	vdir = str(tmp_path / "versions")
+	monkeypatch.setattr(versions, "VERSIONS_DIR", vdir)
+	monkeypatch.setattr(versions, "CURRENT_FILE", os.path.join(vdir, "CURRENT"))
+	monkeypatch.setattr(versions, "_active", None)
+	monkeypatch.setattr(versions, "_status", dict(versions._status, active=None, loading=None, error=None))
+	monkeypatch.setattr(versions, "_pointer", {"mtime": None, "checked": 0.0})
+	monkeypatch.setattr(settings, "index_poll_seconds", 0.0)
+	return vdir
+
+
+def test_publish_and_serve(published):
+	with versions.use_context() as ctx:
+		assert isinstance(ctx, versions.GlobalContext)  # no CURRENT yet: the global loaders
+	manifest = versions.publish_version("v1", storage="float32", activate=True)
+	assert {"data", "embeddings", "index", "index_meta"} <= set(manifest["files"])
+	assert versions.current_version() == "v1" and versions.list_versions() == ["v1"]
+	with versions.use_context() as ctx:
+		assert ctx.version == "v1" and ctx.refs == 1
+		assert len(ctx.df) == ctx.index.ntotal == manifest["ntotal"]
+		assert ctx.corpus_version == "v1"
+	assert ctx.refs == 0 and not ctx.retired
+	with pytest.raises(ValueError):
+		versions.publish_version("v1", storage="float32")
+	with pytest.raises(ValueError):
+		versions.set_current("nope")
+
+
+def test_refcounts_are_per_search(published):
+	versions.publish_version("v1", storage="float32", activate=True)
+	with versions.use_context() as a, versions.use_context() as b:
+		assert a is b and a.refs == 2
+		with pytest.raises(RuntimeError):
+			with versions.use_context() as c:
+				assert c.refs == 3
+				raise RuntimeError("search failed")
+		assert a.refs == 2  # released on error too
+	assert a.refs == 0
+
+
+def test_swap_retires_the_old_version_after_its_last_search(published):
+	versions.publish_version("v1", storage="float32", activate=True)
+	held, release = threading.Event(), threading.Event()
+
+	def search():
+		with versions.use_context() as ctx:
+			held.set()
+			release.wait(10)
+			assert len(ctx.df) and ctx.index.ntotal  # still usable mid-search
+
+	t = threading.Thread(target=search)
+	t.start()
+	assert held.wait(10)
+	old = versions.active_context()
+	versions.publish_version("v2", storage="float32")
+	versions.set_current("v2")
+	versions.active_context()  # notices the new pointer and reloads in the background
+	for _ in range(500):
+		if versions.status()["active"] == "v2":
+			break
+		threading.Event().wait(0.02)
+	assert versions.status()["active"] == "v2"
+	with versions.use_context() as ctx:
+		assert ctx.version == "v2"
+	assert old.retired and not old.closed and old.refs == 1  # the in-flight search keeps it alive
+	release.set()
+	t.join(10)
+	assert old.closed and "df" not in old.__dict__
+
+
+def test_reload_failure_keeps_serving(published):
+	versions.publish_version("v1", storage="float32", activate=True)
+	versions.active_context()
+	versions.publish_version("v2", storage="float32")
+	os.remove(os.path.join(published, "v2", os.path.basename(versions._source_files("float32")["index"])))
+	status = versions.reload("v2", wait=True)
+	assert status["active"] == "v1" and "v2" in status["error"] and status["loading"] is None
+	assert versions.reload("v1", wait=True)["active"] == "v1"  # already active: no-op
+
+
+def test_prune_keeps_current(published):
+	for v in ("v1", "v2", "v3"):
+		versions.publish_version(v, storage="float32")
+		os.utime(os.path.join(published, v, versions.MANIFEST), ns=(int(v[1]) * 10**9,) * 2)
+	versions.set_current("v1")
+	assert versions.prune_versions(keep=1) == ["v2"]
+	assert versions.list_versions() == ["v1", "v3"]
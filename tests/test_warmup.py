@@ -0,0 +1,95 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+from app import metrics, settings, users, warmup
+
+
+def _count(name, **labels):
+	return metrics.snapshot()["counters"].get(f"{name}{labels if labels else ''}", 0)
+
+
+def _history(username, *queries, days_ago=0):
+	"""Append searches to a user's history as if they were run `days_ago` days ago."""
+	data = users.get_user_data(username)
+	ts = (datetime.now() - timedelta(days=days_ago)).isoformat()
+	data["search_history"].extend({"query": q, "timestamp": ts, "results_count": 5, "top_result": None} for q in queries)
+	users._save_user_data(username, data)
+
+
+@pytest.fixture
+def cold(monkeypatch):
+	"""This process as if it had just started: not ready, no warmup thread yet."""
+	monkeypatch.setattr(warmup, "_status", {"ready": False, "state": "cold", "started_at": None, "finished_at": None,
+											"report": None})
+	monkeypatch.setattr(warmup, "_thread", None)
+
+
+def test_popular_queries_rank_recent_searches_across_users(users_dir):
+	users.create_user("alice", "x")
+	users.create_user("bob", "x")
+	_history("alice", "Graph Neural Networks", "diffusion models", "graph neural networks")
+	_history("bob", "graph  neural networks", "diffusion models", "protein folding")
+	_history("bob", "old topic", "old topic", "old topic", "old topic", days_ago=30)
+	assert warmup.popular_queries(3, days=7) == [("Graph Neural Networks", 3), ("diffusion models", 2),
+												 ("protein folding", 1)]
+	assert warmup.popular_queries(1, days=0) == [("old topic", 4)]  # 0: no cutoff
+	assert warmup.popular_queries(10, days=7)[-1] == ("protein folding", 1)
+
+
+def test_run_replays_the_query_log_and_reports_ready(corpus, users_dir, cold, monkeypatch):
+	from app import query
+	users.create_user("alice", "x")
+	_history("alice", "speech recognition", "speech recognition", "reinforcement learning")
+	before = users.get_search_history("alice")
+	explained = []
+	monkeypatch.setattr(query, "llm_explain", lambda q, items, slo_ms=None: explained.append(q) or f"about {q}")
+	monkeypatch.setattr(settings, "shared_mmap", True)  # page in the index file too
+	query.results_cache.clear()
+	searched = _count("warmup_queries_total", result="searched")
+	assert not warmup.ready() and warmup.status()["state"] == "cold"
+	report = warmup.run(n=5, seconds=60, llm_calls=1, threads=2)
+	assert warmup.ready() and warmup.status()["state"] == "ready" and warmup.status()["report"] == report
+	assert (report["queries"], report["explained"], report["searched"], report["errors"]) == (2, 1, 1, 0)
+	assert report["pages_mb"] >= 2  # at least the 400 x 1536 float32 index
+	assert explained == ["speech recognition"]  # only the most frequent query gets an explanation
+	assert _count("warmup_queries_total", result="searched") == searched + 1
+	assert users.get_search_history("alice") == before  # a replay isn't recorded as a search
+	# the UI's default search is now a cache hit, with the pre-generated explanation
+	hits = _count("result_cache_total", result="hit")
+	assert query.search("speech recognition", record=False)[3] == "about speech recognition"
+	assert _count("result_cache_total", result="hit") == hits + 1 and len(explained) == 1
+
+
+def test_failed_warmup_still_reports_ready(corpus, users_dir, cold, monkeypatch):
+	def boom(ctx):
+		raise OSError("disk gone")
+
+	monkeypatch.setattr(warmup, "touch_pages", boom)
+	report = warmup.run(n=5, seconds=1)
+	assert warmup.ready() and report["error"] == "OSError: disk gone"
+
+
+def test_out_of_time_queries_are_skipped(corpus, users_dir, cold):
+	users.create_user("alice", "x")
+	_history("alice", "one", "two", "three")
+	report = warmup.run(n=5, seconds=0)
+	assert warmup.ready() and report["queries"] == 3 and report["skipped"] == 3 and report["searched"] == 0
+
+
+def test_start_runs_once_in_the_background(corpus, users_dir, cold, monkeypatch):
+	from app.api import ready_endpoint
+	release = threading.Event()
+	runs = []
+
+	def run(**kwargs):
+		runs.append(kwargs)
+		release.wait(10)
+		warmup._status.update(ready=True, state="ready")
+
+	monkeypatch.setattr(warmup, "run", run)
+	thread = warmup.start(n=3)
+	assert warmup.start() is thread
+	assert ready_endpoint().status_code == 503
+	release.set()
+	thread.join(10)
+	assert runs == [{"n": 3}] and ready_endpoint().status_code == 200